@@ -0,0 +1,116 @@
+"""
+Micro-benchmark: per-request CPU of the old list response path vs. json_response.
+
+Run from the backend directory:
+    python -m benchmarks.bench_json_response --rows 100 --requests 2000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+from services.fast_json import RecordSerializer, json_response
+
+SEVERITIES = ["low", "medium", "high", "critical"]
+STATUSES = ["open", "in_progress", "resolved", "closed"]
+COLUMNS = [
+    "id", "title", "description", "severity", "status", "source", "agent_id", "details",
+    "created_at", "updated_at", "resolved_at", "fingerprint", "occurrence_count", "last_seen_at", "case_id"
+]
+
+class Record:
+    """Stands in for an ORM incident: plain attributes, one per column."""
+
+def make_rows(count, rng):
+    """Rows shaped like paginate() output for the incidents table."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        created_at = start + timedelta(seconds=rng.randint(0, 86400 * 30))
+        rows.append({
+            "id": i + 1,
+            "title": f"Suspicious login burst on host-{rng.randint(1, 500)}",
+            "description": "Multiple failed authentication attempts followed by a success from a new location",
+            "severity": rng.choice(SEVERITIES),
+            "status": rng.choice(STATUSES),
+            "source": "edr",
+            "agent_id": rng.randint(1, 50),
+            "details": {
+                "source_ip": f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                "mitre": [{"tactic": "Credential Access", "technique": "Brute Force", "technique_id": "T1110"}],
+                "failed_attempts": rng.randint(5, 500)
+            },
+            "created_at": created_at,
+            "updated_at": created_at + timedelta(minutes=5),
+            "resolved_at": None,
+            "fingerprint": f"{rng.getrandbits(128):032x}",
+            "occurrence_count": rng.randint(1, 20),
+            "last_seen_at": created_at + timedelta(minutes=10),
+            "case_id": rng.randint(1, 100)
+        })
+    return rows
+
+def make_request(accept_encoding):
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": "/api/incidents", "headers": headers})
+
+def cpu_per_request(build, requests):
+    start = time.process_time()
+    for _ in range(requests):
+        build()
+    return (time.process_time() - start) / requests
+
+def run(row_count, request_count, seed):
+    rng = random.Random(seed)
+    rows = make_rows(row_count, rng)
+    records = []
+    for row in rows:
+        record = Record()
+        record.__dict__.update(row)
+        records.append(record)
+    serializer = RecordSerializer(COLUMNS)
+    plain, gzipped = make_request(""), make_request("gzip, deflate, br")
+
+    results = {
+        # What list_page and the record endpoints did before
+        "old list (jsonable_encoder + JSONResponse)": cpu_per_request(
+            lambda: JSONResponse(content=jsonable_encoder(rows)).body, request_count
+        ),
+        "old records (getattr per column + jsonable_encoder)": cpu_per_request(
+            lambda: JSONResponse(content=jsonable_encoder(
+                [{name: getattr(record, name) for name in COLUMNS} for record in records]
+            )).body, request_count
+        ),
+        "fast list (orjson + ETag)": cpu_per_request(lambda: json_response(plain, rows).body, request_count),
+        "fast records (RecordSerializer + orjson + ETag)": cpu_per_request(
+            lambda: json_response(plain, serializer.many(records)).body, request_count
+        ),
+        "fast list, compressed": cpu_per_request(lambda: json_response(gzipped, rows).body, request_count),
+    }
+    sizes = {
+        "uncompressed": len(json_response(plain, rows).body),
+        "compressed": len(json_response(gzipped, rows).body),
+        "encoding": json_response(gzipped, rows).headers.get("content-encoding", "none"),
+    }
+    return results, sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="Rows per response (page size)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results, sizes = run(args.rows, args.requests, args.seed)
+    baseline = results["old list (jsonable_encoder + JSONResponse)"]
+    print(f"rows={args.rows} requests={args.requests}")
+    for name, seconds in results.items():
+        print(f"{name:52s} {seconds * 1e6:9.1f} us/request  {baseline / seconds:5.1f}x")
+    print(f"body: {sizes['uncompressed']:,} bytes, {sizes['compressed']:,} bytes with {sizes['encoding']}")
+
+if __name__ == "__main__":
+    main()
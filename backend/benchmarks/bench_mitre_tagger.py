@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: MitreTagger automaton vs. a per-keyword `in` loop.
+
+Run from the backend directory:
+    python -m benchmarks.bench_mitre_tagger --texts 20000 --extra-keywords 2000
+"""
+import argparse
+import json
+import random
+import time
+
+from services.mitre_tagger import MitreTagger, DEFAULT_MITRE_MAP_PATH
+
+FILLER = (
+    "user session process connection host request service login file network "
+    "alert event source destination port packet agent kernel module registry "
+    "account policy token failed success blocked allowed inbound outbound"
+).split()
+
+def load_map():
+    with open(DEFAULT_MITRE_MAP_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def add_synthetic_keywords(mitre_map, count, rng):
+    """Grow the map with synthetic keywords to model a larger feed."""
+    techniques = [(tactic, technique) for tactic, t in mitre_map.items() for technique in t]
+    for i in range(count):
+        tactic, technique = rng.choice(techniques)
+        mitre_map[tactic][technique].append(f"indicator{i} {rng.choice(FILLER)}")
+    return mitre_map
+
+def make_texts(mitre_map, count, rng):
+    keywords = [kw for techniques in mitre_map.values() for kws in techniques.values() for kw in kws]
+    texts = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(15, 40))]
+        for _ in range(rng.randint(0, 2)):
+            words.insert(rng.randrange(len(words)), rng.choice(keywords))
+        texts.append(" ".join(words))
+    return texts
+
+def naive_tag(mitre_map, text):
+    text = text.lower()
+    tags = []
+    for tactic, techniques in mitre_map.items():
+        for technique, keywords in techniques.items():
+            for keyword in keywords:
+                if keyword.lower() in text:
+                    tags.append((tactic, technique))
+                    break
+    return tags
+
+def run(text_count, extra_keywords, seed):
+    rng = random.Random(seed)
+    mitre_map = add_synthetic_keywords(load_map(), extra_keywords, rng)
+    texts = make_texts(mitre_map, text_count, rng)
+
+    start = time.perf_counter()
+    tagger = MitreTagger(mitre_map)
+    tagger.tag("warm up")
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tagged = sum(1 for tags in tagger.tag_many(texts) if tags)
+    automaton_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    naive_tagged = sum(1 for text in texts if naive_tag(mitre_map, text))
+    naive_time = time.perf_counter() - start
+
+    return {
+        "keywords": tagger.keyword_count,
+        "texts": text_count,
+        "build_seconds": build_time,
+        "automaton_texts_per_sec": text_count / automaton_time,
+        "naive_texts_per_sec": text_count / naive_time,
+        "speedup": naive_time / automaton_time,
+        "tagged": tagged,
+        "naive_tagged": naive_tagged,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--texts", type=int, default=20000)
+    parser.add_argument("--extra-keywords", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    result = run(args.texts, args.extra_keywords, args.seed)
+    print(f"keywords={result['keywords']} texts={result['texts']}")
+    print(f"build:     {result['build_seconds'] * 1000:.1f} ms")
+    print(f"automaton: {result['automaton_texts_per_sec']:,.0f} texts/sec ({result['tagged']} tagged)")
+    print(f"naive:     {result['naive_texts_per_sec']:,.0f} texts/sec ({result['naive_tagged']} tagged, substring matches)")
+    print(f"speedup:   {result['speedup']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Micro-benchmark: compiled RuleEngine vs. naive per-event dict interpretation.
+
+Run from the backend directory:
+    python -m benchmarks.bench_rule_engine --rules 3000 --events 50000
+"""
+import argparse
+import random
+import time
+
+from services.rule_engine import RuleEngine, WINDOW_KEYS
+
+EVENT_TYPES = [f"event_{i}" for i in range(40)]
+SEVERITIES = ["low", "medium", "high", "critical"]
+SOURCES = ["firewall", "edr", "ids", "proxy", "auth", "dns", "cloudtrail", "syslog"]
+
+def make_rules(count, rng):
+    rules = []
+    for i in range(count):
+        conditions = {"event_type": rng.choice(EVENT_TYPES)}
+        if rng.random() < 0.5:
+            conditions["severity"] = rng.sample(SEVERITIES, 2)
+        if rng.random() < 0.5:
+            conditions["confidence"] = round(rng.uniform(0.5, 0.95), 2)
+        if rng.random() < 0.3:
+            conditions["failed_attempts"] = rng.randint(3, 10)
+            conditions["timeframe"] = 300
+        if rng.random() < 0.2:
+            conditions["details.port"] = {"$in": [22, 3389, 445]}
+        rules.append((f"rule-{i}", conditions, [{"type": "create_incident", "severity": "high"}]))
+    return rules
+
+def make_events(count, rng):
+    events = []
+    for _ in range(count):
+        events.append({
+            "event_type": rng.choice(EVENT_TYPES),
+            "severity": rng.choice(SEVERITIES),
+            "source": rng.choice(SOURCES),
+            "agent_id": str(rng.randint(1, 200)),
+            "confidence": rng.random(),
+            "failed_attempts": rng.randint(0, 12),
+            "details": {"port": rng.choice([22, 80, 443, 445, 3389, 8080])},
+        })
+    return events
+
+def naive_lookup(event, field):
+    value = event
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def naive_match(event, conditions):
+    """Interpret a condition dict from scratch for one event."""
+    for field, spec in conditions.items():
+        if field in WINDOW_KEYS:
+            continue
+        value = naive_lookup(event, field)
+        if isinstance(spec, dict):
+            for op, expected in spec.items():
+                if op == "$in" and value not in expected:
+                    return False
+        elif isinstance(spec, list):
+            if value not in spec:
+                return False
+        elif isinstance(spec, (int, float)) and not isinstance(spec, bool):
+            if not isinstance(value, (int, float)) or value < spec:
+                return False
+        elif value != spec:
+            return False
+    return True
+
+def run(rule_count, event_count, seed):
+    rng = random.Random(seed)
+    rules = make_rules(rule_count, rng)
+    events = make_events(event_count, rng)
+
+    engine = RuleEngine()
+    start = time.perf_counter()
+    for rule_id, conditions, actions in rules:
+        engine.upsert_rule(rule_id, rule_id, conditions, actions)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled_matches = sum(len(engine.evaluate(event)) for event in events)
+    compiled_time = time.perf_counter() - start
+
+    # The naive path is slow; time it on a sample and extrapolate
+    sample = events[: max(1, min(event_count, 2000))]
+    start = time.perf_counter()
+    naive_matches = 0
+    for event in sample:
+        for _, conditions, _ in rules:
+            if naive_match(event, conditions):
+                naive_matches += 1
+    naive_time = (time.perf_counter() - start) * len(events) / len(sample)
+
+    sample_compiled = sum(len(engine.evaluate(event)) for event in sample)
+    assert sample_compiled == naive_matches, (sample_compiled, naive_matches)
+
+    return {
+        "rules": rule_count,
+        "events": event_count,
+        "compile_seconds": compile_time,
+        "compiled_events_per_sec": event_count / compiled_time,
+        "naive_events_per_sec": event_count / naive_time,
+        "speedup": naive_time / compiled_time,
+        "matches": compiled_matches,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rules", type=int, default=3000)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    result = run(args.rules, args.events, args.seed)
+    print(f"rules={result['rules']} events={result['events']} matches={result['matches']}")
+    print(f"compile:  {result['compile_seconds'] * 1000:.1f} ms")
+    print(f"compiled: {result['compiled_events_per_sec']:,.0f} events/sec")
+    print(f"naive:    {result['naive_events_per_sec']:,.0f} events/sec")
+    print(f"speedup:  {result['speedup']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Synthetic data for benchmarks: agents, playbooks, rules and incidents.
+
+Incidents are modeled on src/data/mock-incidents.json (types, descriptions,
+source IPs, recommendations) and tagged from src/data/mitre-map.json. Rows
+are written straight into DATABASE_URL with multi-row INSERTs, so millions
+of incidents load in minutes.
+
+Run from the backend directory:
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.datagen --incidents 1000000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from services.incident_correlation import incident_fingerprint, mitre_techniques
+from services.mitre_tagger import DEFAULT_MITRE_MAP_PATH
+
+MOCK_INCIDENTS_PATH = os.path.join(os.path.dirname(DEFAULT_MITRE_MAP_PATH), "mock-incidents.json")
+
+SEVERITIES = ["low", "medium", "high", "critical"]
+SEVERITY_WEIGHTS = [40, 35, 18, 7]
+STATUSES = ["open", "in_progress", "resolved", "closed"]
+STATUS_WEIGHTS = [25, 15, 40, 20]
+SOURCES = ["edr", "ids", "firewall", "proxy", "auth", "cloudtrail"]
+AGENT_TYPES = ["network", "endpoint", "cloud"]
+EVENT_TYPES = ["failed_login", "malware_detected", "port_scan", "data_transfer", "privilege_change", "file_download"]
+ACTIONS = ["isolate_host", "block_ip", "scan", "collect_logs", "notify_team", "reset_credentials"]
+
+def load_templates():
+    with open(MOCK_INCIDENTS_PATH, encoding="utf-8") as f:
+        templates = json.load(f)
+    with open(DEFAULT_MITRE_MAP_PATH, encoding="utf-8") as f:
+        mitre_map = json.load(f)
+    techniques = [(tactic, technique) for tactic, entries in mitre_map.items() for technique in entries]
+    return templates, techniques
+
+class IncidentFactory:
+    """
+    Incidents varied from the mock templates: the IP, host, user and counts
+    change, so a share of them are lookalikes the correlator folds together.
+    """
+
+    def __init__(self, seed=42, agents=200, days=90):
+        self.rng = random.Random(seed)
+        self.templates, self.techniques = load_templates()
+        self.agents = agents
+        self.start = datetime.now(timezone.utc) - timedelta(days=days)
+        self.span = days * 86400
+
+    def source_ip(self):
+        rng = self.rng
+        if rng.random() < 0.6:
+            return f"10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        return f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+    def payload(self):
+        """A POST /api/incidents body."""
+        rng = self.rng
+        template = rng.choice(self.templates)
+        source_ip = self.source_ip()
+        tactic, technique = rng.choice(self.techniques)
+        description = (
+            f"{template['description']} (host WS-{rng.randrange(1, 5000)}, user u{rng.randrange(1, 20000)}, "
+            f"{rng.randrange(2, 500)} events from {source_ip})"
+        )
+        return {
+            "title": template["type"],
+            "description": description,
+            "severity": rng.choices(SEVERITIES, SEVERITY_WEIGHTS)[0],
+            "status": rng.choices(STATUSES[:2], (3, 1))[0],
+            "source": rng.choice(SOURCES),
+            "agent_id": str(rng.randint(1, self.agents)),
+            "details": {
+                "source_ip": source_ip,
+                "mitre": [{"tactic": template["mitreTactic"], "technique_id": template["mitreTechnique"]},
+                          {"tactic": tactic, "technique": technique}],
+                "recommendations": template["recommendations"],
+            },
+        }
+
+    def row(self, row_id):
+        """An incidents table row, with created/resolved times spread over the period."""
+        payload = self.payload()
+        rng = self.rng
+        created_at = self.start + timedelta(seconds=rng.randrange(self.span))
+        status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+        resolved_at = created_at + timedelta(seconds=rng.randrange(300, 86400 * 3)) if status in ("resolved", "closed") else None
+        return {
+            "id": row_id,
+            "title": payload["title"],
+            "description": payload["description"],
+            "severity": payload["severity"],
+            "status": status,
+            "source": payload["source"],
+            "agent_id": int(payload["agent_id"]),
+            "details": payload["details"],
+            "created_at": created_at,
+            "updated_at": resolved_at or created_at,
+            "resolved_at": resolved_at,
+            "fingerprint": incident_fingerprint(
+                payload["source"], payload["agent_id"], mitre_techniques(payload["details"]), payload["description"]
+            ),
+            "occurrence_count": 1,
+            "last_seen_at": created_at,
+        }
+
+def rule_conditions(rng):
+    conditions = {"event_type": rng.choice(EVENT_TYPES)}
+    if rng.random() < 0.5:
+        conditions["severity"] = rng.sample(SEVERITIES, 2)
+    if rng.random() < 0.4:
+        conditions["confidence"] = round(rng.uniform(0.5, 0.95), 2)
+    if rng.random() < 0.2:
+        conditions["failed_attempts"] = rng.randint(3, 10)
+        conditions["timeframe"] = 300
+    return conditions
+
+def rule_payload(rng, index):
+    """A POST /api/rules body."""
+    return {
+        "name": f"Synthetic rule {index}",
+        "description": "Generated for benchmarks",
+        "rule_type": rng.choice(["detection", "prevention", "response"]),
+        "conditions": rule_conditions(rng),
+        "actions": [{"type": "create_incident", "severity": rng.choice(SEVERITIES)}],
+        "is_active": True,
+    }
+
+def rule_event(rng, agents=200):
+    """An event for POST /api/rules/evaluate and /api/ingest."""
+    return {
+        "event_type": rng.choice(EVENT_TYPES),
+        "severity": rng.choice(SEVERITIES),
+        "source": rng.choice(SOURCES),
+        "agent_id": str(rng.randint(1, agents)),
+        "source_ip": f"10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(1, 255)}",
+        "confidence": rng.random(),
+        "failed_attempts": rng.randint(0, 12),
+    }
+
+def playbook_steps(rng):
+    count = rng.randint(2, 6)
+    steps = []
+    for i in range(count):
+        step = {"name": f"s{i}", "action": rng.choice(ACTIONS)}
+        if i:
+            step["depends_on"] = [f"s{rng.randrange(i)}"]
+        steps.append(step)
+    return steps
+
+def insert_chunked(conn, table, rows, chunk=10000):
+    for i in range(0, len(rows), chunk):
+        conn.execute(table.insert(), rows[i:i + chunk])
+
+def generate(agents=200, playbooks=50, rules=500, incidents=100000, seed=42, chunk=20000):
+    """
+    Fill the database with synthetic rows, after the existing ones.
+
+    Returns:
+        dict: Rows written per table and the time taken
+    """
+    from sqlalchemy import func, select
+    from database import Base, engine
+    from models.agent import Agent
+    from models.incident import Incident
+    from models.playbook import Playbook
+    from models.rule import Rule
+
+    Base.metadata.create_all(engine)
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        insert_chunked(conn, Agent.__table__, [
+            {
+                "name": f"agent-{i:05d}", "agent_type": rng.choice(AGENT_TYPES), "status": "active",
+                "version": f"2.{rng.randrange(10)}.{rng.randrange(10)}", "is_active": True,
+                "configuration": {}, "created_at": now, "updated_at": now,
+            }
+            for i in range(agents)
+        ])
+        agent_count = conn.execute(select(func.count()).select_from(Agent.__table__)).scalar()
+        insert_chunked(conn, Playbook.__table__, [
+            {
+                "name": f"Playbook {i}", "description": "Generated for benchmarks", "version": "1.0",
+                "steps": playbook_steps(rng), "parameters": {}, "created_at": now, "updated_at": now,
+            }
+            for i in range(playbooks)
+        ])
+        insert_chunked(conn, Rule.__table__, [
+            {**rule_payload(rng, i), "created_at": now, "updated_at": now} for i in range(rules)
+        ])
+        first_id = (conn.execute(select(func.max(Incident.__table__.c.id))).scalar() or 0) + 1
+
+    # Incidents in their own transactions so memory stays flat
+    factory = IncidentFactory(seed, agents=max(agent_count, 1))
+    table = Incident.__table__
+    for offset in range(0, incidents, chunk):
+        rows = [factory.row(first_id + offset + i) for i in range(min(chunk, incidents - offset))]
+        with engine.begin() as conn:
+            conn.execute(table.insert(), rows)
+    return {
+        "agents": agents,
+        "playbooks": playbooks,
+        "rules": rules,
+        "incidents": incidents,
+        "seconds": time.perf_counter() - started,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--playbooks", type=int, default=50)
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--incidents", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    result = generate(args.agents, args.playbooks, args.rules, args.incidents, args.seed)
+    print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+"""
+Reproducible load test: the API against a generated dataset and a stub Slack webhook.
+
+Starts the Slack stub and `uvicorn main:app` on a fresh SQLite database
+filled by benchmarks.datagen, runs each scenario at a fixed concurrency
+and writes throughput, latency percentiles and server memory to
+benchmarks/results/<time>-<commit>.json. Same seed, same requests.
+
+Run from the backend directory:
+    python -m benchmarks.load --incidents 1000000 --concurrency 32
+    python -m benchmarks.load --scenarios list_incidents,rule_evaluation --requests 5000
+    python -m benchmarks.load --url http://127.0.0.1:8000 --scenarios list_incidents
+    python -m benchmarks.load --compare results/a.json results/b.json
+
+Scenarios:
+    incident_storm   POST /api/incidents (a share of them duplicates)
+    list_incidents   GET /api/incidents with filters, following X-Next-Cursor
+    rule_evaluation  POST /api/rules/evaluate against --rules loaded rules
+    slack_burst      POST /api/alerts/slack?wait=false, then time until all were delivered
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import aiohttp
+
+from benchmarks.datagen import SEVERITIES, STATUSES, IncidentFactory, rule_event, rule_payload
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+SCENARIOS = ("incident_storm", "list_incidents", "rule_evaluation", "slack_burst")
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def process_memory(pid):
+    """Current and peak resident memory of a process, in MiB (Linux only)."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    memory["rss_mib" if name == "VmRSS" else "peak_rss_mib"] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return memory
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=30
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+async def run_requests(session, count, concurrency, make_request):
+    """
+    Send count requests from concurrency workers.
+
+    make_request(session, i) performs request i and returns the HTTP status.
+
+    Returns:
+        dict: Throughput, latency percentiles (ms) and status counts
+    """
+    latencies = []
+    statuses = {}
+    next_index = iter(range(count))
+
+    async def worker():
+        for i in next_index:
+            start = time.perf_counter()
+            try:
+                status = await make_request(session, i)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    ok = sum(n for status, n in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        "requests": count,
+        "ok": ok,
+        "errors": count - ok,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(count / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 2)
+            for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+        } if latencies else {},
+    }
+
+async def incident_storm(session, url, args, rng, stub_url):
+    factory = IncidentFactory(args.seed, agents=args.agents)
+    payloads = [factory.payload() for _ in range(max(1, args.requests // 4))]
+    # Three quarters are repeats, as alert storms are
+    order = [rng.randrange(len(payloads)) if i % 4 else i // 4 for i in range(args.requests)]
+
+    async def create(session, i):
+        async with session.post(f"{url}/api/incidents", json=payloads[order[i] % len(payloads)]) as response:
+            await response.read()
+            return response.status
+
+    return await run_requests(session, args.requests, args.concurrency, create)
+
+async def list_incidents(session, url, args, rng, stub_url):
+    queries = []
+    for _ in range(args.requests):
+        params = {"limit": rng.choice([50, 100, 500])}
+        pick = rng.random()
+        if pick < 0.3:
+            params["severity"] = rng.choice(SEVERITIES)
+        elif pick < 0.5:
+            params["status"] = rng.choice(STATUSES)
+        elif pick < 0.7:
+            params["agent_id"] = rng.randint(1, args.agents)
+        queries.append((params, rng.randint(1, 5)))
+    rows = [0]
+
+    async def browse(session, i):
+        # One "request" is a user paging through up to five pages
+        params, pages = queries[i]
+        params = dict(params)
+        status = 200
+        for _ in range(pages):
+            async with session.get(f"{url}/api/incidents", params=params) as response:
+                body = await response.read()
+                status = response.status
+                cursor = response.headers.get("X-Next-Cursor")
+            if status != 200:
+                break
+            rows[0] += len(json.loads(body))
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        return status
+
+    result = await run_requests(session, args.requests, args.concurrency, browse)
+    result["rows_read"] = rows[0]
+    return result
+
+async def rule_evaluation(session, url, args, rng, stub_url):
+    # The API compiles rules as they are created, so load them through it
+    rule_rng = random.Random(args.seed)
+    for i in range(args.rules):
+        async with session.post(f"{url}/api/rules", json=rule_payload(rule_rng, i)) as response:
+            await response.read()
+    events = [rule_event(rng, args.agents) for _ in range(args.requests)]
+    matches = [0]
+
+    async def evaluate(session, i):
+        async with session.post(f"{url}/api/rules/evaluate", json={"event": events[i], "dispatch": False}) as response:
+            body = await response.read()
+            if response.status == 200:
+                matches[0] += len(json.loads(body)["matches"])
+            return response.status
+
+    result = await run_requests(session, args.requests, args.concurrency, evaluate)
+    result["rules"] = args.rules
+    result["matches"] = matches[0]
+    return result
+
+async def slack_outcomes(session, url):
+    """Messages the API has finished with (sent or failed), from slack_messages_total on /metrics."""
+    async with session.get(f"{url}/metrics") as response:
+        if response.status != 200:
+            return None
+        text = await response.text()
+    done = 0
+    for line in text.splitlines():
+        if line.startswith("slack_messages_total{") and ('"sent"' in line or '"failed"' in line):
+            done += int(float(line.rsplit(" ", 1)[1]))
+    return done
+
+async def slack_burst(session, url, args, rng, stub_url):
+    if stub_url:
+        async with session.post(f"{stub_url}/reset") as response:
+            await response.read()
+    done_before = await slack_outcomes(session, url)
+
+    async def alert(session, i):
+        body = {
+            "message": f"Synthetic alert {i}",
+            "type": "incident",
+            "severity": rng.choice(SEVERITIES),
+        }
+        async with session.post(f"{url}/api/alerts/slack", params={"wait": "false"}, json=body) as response:
+            await response.read()
+            return response.status
+
+    started = time.perf_counter()
+    result = await run_requests(session, args.requests, args.concurrency, alert)
+    if done_before is None:
+        return result
+    # Messages are coalesced into fewer webhook calls, so count messages on the API side
+    deadline = time.monotonic() + args.drain_timeout
+    done = 0
+    while time.monotonic() < deadline:
+        done = (await slack_outcomes(session, url) or 0) - done_before
+        if done >= result["ok"]:
+            break
+        await asyncio.sleep(0.1)
+    result["delivered"] = done
+    result["delivered_seconds"] = round(time.perf_counter() - started, 3)
+    if stub_url:
+        async with session.get(f"{stub_url}/stats") as response:
+            result["webhook"] = await response.json()
+    return result
+
+SCENARIO_FUNCTIONS = {
+    "incident_storm": incident_storm,
+    "list_incidents": list_incidents,
+    "rule_evaluation": rule_evaluation,
+    "slack_burst": slack_burst,
+}
+
+async def wait_ready(url, process=None, path="/api/agents?limit=1", timeout=120.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                async with session.get(url + path) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+async def run_scenarios(url, args, server_pid=None, stub_url=None):
+    results = {}
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        for name in args.scenarios:
+            rng = random.Random(f"{args.seed}:{name}")
+            # Warm up connections and lazily built state
+            for _ in range(min(args.concurrency, 20)):
+                async with session.get(f"{url}/api/incidents", params={"limit": 1}) as response:
+                    await response.read()
+            before = process_memory(server_pid) if server_pid else {}
+            result = await SCENARIO_FUNCTIONS[name](session, url, args, rng, stub_url)
+            after = process_memory(server_pid) if server_pid else {}
+            if after:
+                result["server_memory"] = {
+                    "rss_before_mib": before.get("rss_mib"),
+                    "rss_after_mib": after.get("rss_mib"),
+                    "peak_rss_mib": after.get("peak_rss_mib"),
+                }
+            results[name] = result
+            print(summary_line(name, result), flush=True)
+    return results
+
+def summary_line(name, result):
+    latency = result.get("latency_ms", {})
+    memory = result.get("server_memory", {})
+    line = (
+        f"{name:16s} {result['throughput_rps'] or 0:9.1f} req/s  p50 {latency.get('p50', 0):8.2f} ms  "
+        f"p99 {latency.get('p99', 0):8.2f} ms  errors {result['errors']}"
+    )
+    if memory:
+        line += f"  rss {memory['rss_after_mib']} MiB"
+    return line
+
+def start_process(command, env, log_path):
+    log = open(log_path, "wb")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_process(process):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def run(args):
+    """
+    Run the scenarios, starting the stub and the API unless --url is given.
+
+    Returns:
+        dict: The report written to the results file
+    """
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {
+            name: getattr(args, name)
+            for name in ("incidents", "agents", "rules", "requests", "concurrency", "seed", "workers", "slack_latency_ms")
+        },
+    }
+    if args.url:
+        report["target"] = args.url
+        report["scenarios"] = asyncio.run(run_scenarios(args.url.rstrip("/"), args))
+        return report
+
+    workdir = tempfile.mkdtemp(prefix="secops-load-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        SLACK_WEBHOOK_URL=f"http://127.0.0.1:{args.stub_port}/webhook",
+        WINDOW_COUNTER_SNAPSHOT_PATH=os.path.join(workdir, "window_counters.db"),
+        IP_INTEL_DIR=os.path.join(workdir, "ip_intel"),
+        PYTHONUNBUFFERED="1",
+    )
+    print(f"generating data in {workdir}", flush=True)
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.datagen", "--agents", str(args.agents), "--rules", "0",
+         "--incidents", str(args.incidents), "--seed", str(args.seed)],
+        cwd=BACKEND_DIR, env=env, check=True
+    )
+    report["datagen_seconds"] = round(time.perf_counter() - started, 1)
+
+    stub = server = None
+    url = f"http://127.0.0.1:{args.port}"
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    try:
+        stub = start_process(
+            [sys.executable, "-m", "benchmarks.slack_stub", "--port", str(args.stub_port),
+             "--latency-ms", str(args.slack_latency_ms), "--rate-limit", str(args.slack_rate_limit),
+             "--seed", str(args.seed)],
+            env, os.path.join(workdir, "slack_stub.log")
+        )
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+                   "--log-level", "warning", "--no-access-log"]
+        if args.workers > 1:
+            command += ["--workers", str(args.workers)]
+        server = start_process(command, env, os.path.join(workdir, "server.log"))
+        asyncio.run(wait_ready(stub_url, stub, "/stats"))
+        asyncio.run(wait_ready(url, server))
+        report["target"] = "local"
+        # With --workers the measured pid is the supervisor, so memory is left out
+        server_pid = server.pid if args.workers == 1 else None
+        report["scenarios"] = asyncio.run(run_scenarios(url, args, server_pid, stub_url))
+    finally:
+        stop_process(server)
+        stop_process(stub)
+    report["logs"] = workdir
+    return report
+
+def compare(paths):
+    """Print each scenario's throughput and p99 for several result files, relative to the first."""
+    reports = []
+    for path in paths:
+        with open(path) as f:
+            reports.append(json.load(f))
+    names = [f"{r['git']['commit']}{'+' if r['git'].get('dirty') else ''}" for r in reports]
+    print(f"{'scenario':16s} {'metric':12s} " + " ".join(f"{name:>18s}" for name in names))
+    scenarios = [name for name in SCENARIOS if any(name in r.get("scenarios", {}) for r in reports)]
+    for scenario in scenarios:
+        for metric, read in (
+            ("req/s", lambda s: s.get("throughput_rps")),
+            ("p50 ms", lambda s: s.get("latency_ms", {}).get("p50")),
+            ("p99 ms", lambda s: s.get("latency_ms", {}).get("p99")),
+            ("errors", lambda s: s.get("errors")),
+            ("peak MiB", lambda s: s.get("server_memory", {}).get("peak_rss_mib")),
+        ):
+            values = [read(r["scenarios"][scenario]) if scenario in r.get("scenarios", {}) else None for r in reports]
+            base = values[0]
+            cells = []
+            for index, value in enumerate(values):
+                if value is None:
+                    cells.append(f"{'-':>18s}")
+                elif index and base and isinstance(value, (int, float)):
+                    cells.append(f"{value:>10} ({(value - base) / base:+6.1%})")
+                else:
+                    cells.append(f"{value:>18}")
+            print(f"{scenario:16s} {metric:12s} " + " ".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated, run in this order")
+    parser.add_argument("--incidents", type=int, default=100000, help="Incidents generated before the run")
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--rules", type=int, default=500, help="Rules created for rule_evaluation")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stub-port", type=int, default=8766)
+    parser.add_argument("--slack-latency-ms", type=float, default=80.0)
+    parser.add_argument("--slack-rate-limit", type=float, default=0.0)
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Seconds slack_burst waits for delivery")
+    parser.add_argument("--url", help="Run against this already running API instead")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="RESULTS", help="Compare result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIO_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = run(args)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{report['git']['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Local stand-in for a Slack incoming webhook, for load tests.
+
+Answers each POST after a latency drawn around --latency-ms, and a share
+of them (--rate-limit) with 429 and a Retry-After header, as Slack does
+under load. GET /stats returns what was received.
+
+Run from the backend directory:
+    python -m benchmarks.slack_stub --port 8099 --latency-ms 80 --rate-limit 0.02
+    SLACK_WEBHOOK_URL=http://127.0.0.1:8099/webhook uvicorn main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+class WebhookStub:
+    def __init__(self, latency_ms=80.0, jitter_ms=20.0, rate_limit=0.0, retry_after=1, seed=42):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        self.stats = {"received": 0, "accepted": 0, "rate_limited": 0, "invalid": 0, "blocks": 0, "bytes": 0}
+        self.started = time.monotonic()
+
+    async def webhook(self, request):
+        body = await request.read()
+        self.stats["received"] += 1
+        self.stats["bytes"] += len(body)
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self.stats["invalid"] += 1
+            return web.Response(status=400, text="invalid_payload")
+        if self.rng.random() < self.rate_limit:
+            self.stats["rate_limited"] += 1
+            return web.Response(status=429, text="rate_limited", headers={"Retry-After": str(self.retry_after)})
+        self.stats["accepted"] += 1
+        self.stats["blocks"] += len(payload.get("blocks") or [])
+        return web.Response(text="ok")
+
+    async def get_stats(self, request):
+        elapsed = time.monotonic() - self.started
+        return web.json_response(dict(self.stats, seconds=elapsed))
+
+    async def post_reset(self, request):
+        self.reset()
+        return web.json_response({"status": "reset"})
+
+def make_app(stub):
+    app = web.Application(client_max_size=4 * 1024 * 1024)
+    app.router.add_post("/webhook", stub.webhook)
+    app.router.add_get("/stats", stub.get_stats)
+    app.router.add_post("/reset", stub.post_reset)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stub = WebhookStub(args.latency_ms, args.jitter_ms, args.rate_limit, args.retry_after, args.seed)
+    web.run_app(make_app(stub), host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Replay a syslog capture at a syslog receiver as fast as possible (or at a fixed rate).
+
+Run from the backend directory:
+    python -m benchmarks.syslog_replay capture.log --proto udp --port 5514
+    python -m benchmarks.syslog_replay --synthetic 500000 --proto tcp --rate 50000
+
+The capture holds one syslog message per line. Compare the count sent with
+the receiver's counters at GET /api/syslog/stats to check for drops.
+"""
+import argparse
+import random
+import socket
+import time
+
+FIREWALL_ACTIONS = ["allow", "deny", "drop", "reset"]
+PROGRAMS = ["filterlog", "sshd", "kernel", "pf", "suricata"]
+
+def synthetic_messages(count, seed):
+    """Firewall-style messages in a mix of RFC 3164 and RFC 5424 formats."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        pri = rng.choice([134, 132, 131, 38, 86])
+        src = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        dst = f"192.168.{rng.randrange(4)}.{rng.randrange(1, 255)}"
+        body = (
+            f"action={rng.choice(FIREWALL_ACTIONS)} proto=tcp src={src} dst={dst} "
+            f"sport={rng.randrange(1024, 65535)} dport={rng.choice([22, 80, 443, 3389, 445])}"
+        )
+        program = rng.choice(PROGRAMS)
+        if i % 2:
+            messages.append(f"<{pri}>Oct 16 12:{i % 60:02d}:{i % 59:02d} fw01 {program}[{rng.randrange(100, 9999)}]: {body}")
+        else:
+            messages.append(
+                f"<{pri}>1 2026-10-16T12:00:{i % 60:02d}.{i % 1000:03d}Z fw01 {program} {rng.randrange(100, 9999)} "
+                f"FW [meta sequenceId=\"{i}\"] {body}"
+            )
+    return [m.encode() for m in messages]
+
+def load_capture(path):
+    with open(path, "rb") as f:
+        return [line.rstrip(b"\r\n") for line in f if line.strip()]
+
+def replay(messages, host, port, proto, rate, repeat):
+    """Send the messages and return (sent, bytes, seconds)."""
+    if proto == "udp":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((host, port))
+        send = sock.send
+    else:
+        sock = socket.create_connection((host, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # RFC 6587 octet-counting framing
+        messages = [b"%d %s" % (len(m), m) for m in messages]
+        send = sock.sendall
+
+    interval = 1.0 / rate if rate else 0.0
+    sent = sent_bytes = 0
+    start = time.perf_counter()
+    try:
+        for _ in range(repeat):
+            for message in messages:
+                if interval:
+                    delay = start + sent * interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                send(message)
+                sent += 1
+                sent_bytes += len(message)
+    finally:
+        sock.close()
+    return sent, sent_bytes, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("capture", nargs="?", help="File with one syslog message per line")
+    parser.add_argument("--synthetic", type=int, default=100000, help="Messages to generate when no capture is given")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5514)
+    parser.add_argument("--proto", choices=["udp", "tcp"], default="udp")
+    parser.add_argument("--rate", type=float, default=0, help="Messages per second (0 = as fast as possible)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    messages = load_capture(args.capture) if args.capture else synthetic_messages(args.synthetic, args.seed)
+    sent, sent_bytes, seconds = replay(messages, args.host, args.port, args.proto, args.rate, args.repeat)
+    print(f"sent {sent} messages ({sent_bytes / 1e6:.1f} MB) over {args.proto} in {seconds:.2f}s")
+    print(f"{sent / seconds:,.0f} msgs/sec")
+
+if __name__ == "__main__":
+    main()
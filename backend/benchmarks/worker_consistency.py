@@ -0,0 +1,200 @@
+"""
+Check that uvicorn workers never serve stale rules or playbooks after a write.
+
+Starts the API with several workers on a fresh SQLite database, then for
+each round writes through one connection and immediately reads through
+many new ones (so the reads land on different workers):
+
+- a rule is created, updated and deleted; after each step
+  POST /api/rules/evaluate and GET /api/rules/{id} must reflect it
+- a playbook is created, updated and deleted; GET /api/playbooks/{id}
+  must reflect it
+
+Any read showing the previous state is reported as stale and the exit
+status is 1.
+
+Run from the backend directory:
+    python -m benchmarks.worker_consistency --workers 4 --rounds 50
+    python -m benchmarks.worker_consistency --url http://127.0.0.1:8000 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+import aiohttp
+
+from benchmarks.load import start_process, stop_process, wait_ready
+
+class Checker:
+    def __init__(self, url, reads):
+        self.url = url
+        self.reads = reads
+        self.checked = 0
+        self.stale = []
+        self.pids = set()
+
+    def session(self):
+        # A new connection per request, so the kernel spreads them over the workers
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(force_close=True))
+
+    async def write(self, method, path, body=None):
+        async with self.session() as session:
+            async with session.request(method, self.url + path, json=body) as response:
+                if response.status >= 400:
+                    raise RuntimeError(f"{method} {path}: {response.status} {await response.text()}")
+                return await response.json()
+
+    async def read_all(self, label, method, path, body, expect):
+        """Issue the same read on many connections at once; expect(status, body) says whether it is fresh."""
+        async def read():
+            async with self.session() as session:
+                async with session.request(method, self.url + path, json=body) as response:
+                    return response.status, await response.json()
+
+        results = await asyncio.gather(*(read() for _ in range(self.reads)))
+        for status, data in results:
+            self.checked += 1
+            if not expect(status, data):
+                self.stale.append(f"{label}: {method} {path} -> {status} {str(data)[:200]}")
+
+    async def sample_workers(self):
+        # Concurrent like the reads, as an idle worker tends to win every sequential accept
+        async def sample():
+            async with self.session() as session:
+                async with session.get(self.url + "/api/shared-state/stats") as response:
+                    if response.status == 200:
+                        self.pids.add((await response.json()).get("pid"))
+
+        await asyncio.gather(*(sample() for _ in range(self.reads)))
+
+    async def rule_round(self, index):
+        event_type = f"consistency-{os.getpid()}-{index}"
+
+        def evaluate(event_type_, rule_id, matched):
+            def expect(status, data):
+                ids = [match["rule_id"] for match in data.get("matches", [])] if status == 200 else None
+                return ids is not None and (str(rule_id) in ids) == matched
+            return self.read_all(
+                f"rule {rule_id} {'matches' if matched else 'does not match'} {event_type_}",
+                "POST", "/api/rules/evaluate", {"event": {"event_type": event_type_}, "dispatch": False}, expect
+            )
+
+        rule = await self.write("POST", "/api/rules", {
+            "name": f"Consistency rule {index}",
+            "description": "worker consistency check",
+            "rule_type": "detection",
+            "conditions": {"event_type": event_type},
+            "actions": [{"type": "log"}],
+            "is_active": True,
+        })
+        rule_id = rule["id"]
+        await evaluate(event_type, rule_id, True)
+        await self.read_all(
+            f"rule {rule_id} created", "GET", f"/api/rules/{rule_id}", None,
+            lambda status, data: status == 200 and data.get("name") == f"Consistency rule {index}"
+        )
+
+        await self.write("PUT", f"/api/rules/{rule_id}", {
+            "name": f"Consistency rule {index} v2",
+            "description": "worker consistency check",
+            "rule_type": "detection",
+            "conditions": {"event_type": event_type + "-v2"},
+            "actions": [{"type": "log"}],
+            "is_active": True,
+        })
+        await evaluate(event_type, rule_id, False)
+        await evaluate(event_type + "-v2", rule_id, True)
+        await self.read_all(
+            f"rule {rule_id} updated", "GET", f"/api/rules/{rule_id}", None,
+            lambda status, data: status == 200 and data.get("name") == f"Consistency rule {index} v2"
+        )
+
+        await self.write("DELETE", f"/api/rules/{rule_id}")
+        await evaluate(event_type + "-v2", rule_id, False)
+        await self.read_all(
+            f"rule {rule_id} deleted", "GET", f"/api/rules/{rule_id}", None, lambda status, data: status == 404
+        )
+
+    async def playbook_round(self, index):
+        steps = [{"name": "scan", "action": "scan"}]
+        playbook = await self.write("POST", "/api/playbooks", {
+            "name": f"Consistency playbook {index}", "description": "", "version": "1", "steps": steps,
+        })
+        playbook_id = playbook["id"]
+        await self.read_all(
+            f"playbook {playbook_id} created", "GET", f"/api/playbooks/{playbook_id}", None,
+            lambda status, data: status == 200 and data.get("version") == "1"
+        )
+        await self.write("PUT", f"/api/playbooks/{playbook_id}", {
+            "name": f"Consistency playbook {index}", "description": "", "version": "2",
+            "steps": steps + [{"name": "collect", "action": "collect_logs"}],
+        })
+        await self.read_all(
+            f"playbook {playbook_id} updated", "GET", f"/api/playbooks/{playbook_id}", None,
+            lambda status, data: status == 200 and data.get("version") == "2" and len(data.get("steps", [])) == 2
+        )
+        await self.write("DELETE", f"/api/playbooks/{playbook_id}")
+        await self.read_all(
+            f"playbook {playbook_id} deleted", "GET", f"/api/playbooks/{playbook_id}", None,
+            lambda status, data: status == 404
+        )
+
+async def check(url, rounds, reads):
+    checker = Checker(url, reads)
+    await checker.sample_workers()
+    for index in range(rounds):
+        await checker.rule_round(index)
+        await checker.playbook_round(index)
+    await checker.sample_workers()
+    return checker
+
+def start_server(workdir, port, workers):
+    """Start the API with several workers, keeping its database and state files in workdir."""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'consistency.db')}",
+        SHARED_STATE_PATH=os.path.join(workdir, "shared_state.bin"),
+        WINDOW_COUNTER_SNAPSHOT_PATH=os.path.join(workdir, "window_counters.db"),
+        ANOMALY_STATE_PATH=os.path.join(workdir, "anomaly_state.bin"),
+        ARCHIVE_DIR=os.path.join(workdir, "archive"),
+        IP_INTEL_DIR=os.path.join(workdir, "ip_intel"),
+        SLACK_WEBHOOK_URL=os.environ.get("SLACK_WEBHOOK_URL", "http://127.0.0.1:9/unused"),
+        TASK_SCHEDULER_ENABLED="false",
+    )
+    return start_process(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env, os.path.join(workdir, "server.log")
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=16, help="Concurrent reads after each write")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--url", help="Check an API that is already running instead")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            workdir = tempfile.mkdtemp(prefix="secops-consistency-")
+            server = start_server(workdir, args.port, args.workers)
+            print(f"started {args.workers} workers, logs in {workdir}", flush=True)
+            asyncio.run(wait_ready(url, server))
+        checker = asyncio.run(check(url, args.rounds, args.reads))
+    finally:
+        stop_process(server)
+
+    print(f"workers answering: {len(checker.pids)}")
+    print(f"reads checked: {checker.checked}, stale: {len(checker.stale)}")
+    for line in checker.stale[:20]:
+        print(f"  {line}")
+    sys.exit(1 if checker.stale else 0)
+
+if __name__ == "__main__":
+    main()
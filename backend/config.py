@@ -1,14 +1,39 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     # Database settings
     DATABASE_URL: str = "sqlite:///./security_alerts.db"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a pooled connection is replaced
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_CACHE_SIZE_KB: int = 65536  # Page cache per connection
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_SIZE: int = 268435456
+    
+    # Multi-worker shared state settings
+    SHARED_STATE_PATH: Optional[str] = "./shared_state.bin"  # Change counters mapped by every worker on this host (None: per process)
+    SHARED_STATE_POLL_MS: int = 500  # Interval between background checks for changes made by other workers
+    SHARED_STATE_CACHE_ENTRIES: int = 10000  # Records per read-through cache
+    SEED_SAMPLE_DATA: bool = True  # Insert the sample agents, playbooks and rules into empty tables
     
     # API settings
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "Security Operations Platform"
     
+    # Response settings
+    RESPONSE_ETAGS: bool = True  # ETag / If-None-Match on list and record reads
+    RESPONSE_COMPRESS_MIN_BYTES: int = 1024  # Smaller bodies are sent uncompressed (0 disables compression)
+    RESPONSE_GZIP_LEVEL: int = 5
+    RESPONSE_BROTLI_QUALITY: int = 4  # Used when the brotli package is installed
+    
+    # Metrics settings
+    METRICS_ENABLED: bool = True  # Request and query timing, served at /metrics
+    METRICS_PROFILER_ENABLED: bool = False  # Allow GET /debug/profile (stack sampling)
+    METRICS_PROFILE_MAX_SECONDS: float = 60.0
+    
     # Security settings
     SECRET_KEY: str = "your-secret-key-here"  # Change in production
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
@@ -16,9 +41,178 @@ class Settings(BaseSettings):
     # Slack settings
     SLACK_WEBHOOK_URL: str
     SLACK_DEFAULT_CHANNEL: str = "security-alerts"
+    SLACK_POOL_SIZE: int = 10  # Max pooled connections to the webhook host
+    SLACK_KEEPALIVE_SECONDS: float = 30.0
+    SLACK_REQUEST_TIMEOUT: float = 10.0
+    SLACK_MAX_MESSAGE_CHARS: int = 40000  # Slack truncates message text beyond this
+    
+    # Slack delivery pipeline settings
+    SLACK_QUEUE_SIZE: int = 10000
+    SLACK_SENDER_WORKERS: int = 4
+    SLACK_BATCH_WINDOW_SECONDS: float = 2.0  # 0 disables coalescing
+    SLACK_MAX_BATCH_SIZE: int = 20
+    SLACK_MAX_RETRIES: int = 5  # Attempts per batch; 429 answers do not count
+    SLACK_MAX_RATE_LIMIT_SECONDS: float = 900.0  # Total Retry-After wait before a batch fails
+    SLACK_MAX_BACKOFF_SECONDS: float = 30.0
+    SLACK_DELIVERY_HISTORY: int = 10000  # Delivery records kept for polling
+    
+    # Sliding-window counter settings
+    WINDOW_COUNTER_BUCKETS: int = 12  # Time buckets per window
+    WINDOW_COUNTER_MAX_KEYS: int = 200000  # Exact keys per counter before falling back to a sketch
+    WINDOW_COUNTER_SKETCH_WIDTH: int = 65536
+    WINDOW_COUNTER_SKETCH_DEPTH: int = 4
+    WINDOW_COUNTER_SNAPSHOT_PATH: str = "./window_counters.db"
+    WINDOW_COUNTER_SNAPSHOT_SECONDS: float = 60.0
+    
+    # MITRE ATT&CK tagging (defaults to src/data/mitre-map.json)
+    MITRE_MAP_PATH: Optional[str] = None
+    
+    # Event ingestion pipeline settings
+    INGEST_QUEUE_MAX_EVENTS: int = 200000  # Queued events before POST /api/ingest answers 429
+    INGEST_WORKERS: int = 2
+    INGEST_BATCH_SIZE: int = 5000  # Rows per batched insert
+    INGEST_BATCH_MS: int = 50  # Max time a partial batch waits before it is written
+    INGEST_ENQUEUE_TIMEOUT: float = 0.5  # Seconds a request waits for queue space
+    INGEST_MAX_LINE_BYTES: int = 1048576
+    INGEST_MAX_INFLATED_BYTES: int = 268435456  # Decompressed size limit of one gzip body (413 beyond it)
+    
+    # Syslog receiver settings
+    SYSLOG_ENABLED: bool = False  # Run the receiver inside the API process
+    SYSLOG_HOST: str = "0.0.0.0"
+    SYSLOG_UDP_PORT: int = 5514  # 0 disables UDP
+    SYSLOG_TCP_PORT: int = 5514  # 0 disables TCP
+    SYSLOG_UDP_RCVBUF: int = 8388608  # Kernel receive buffer, capped by net.core.rmem_max
+    SYSLOG_MAX_MESSAGE_BYTES: int = 65536
+    SYSLOG_FLUSH_EVENTS: int = 2000
+    SYSLOG_FLUSH_MS: int = 20
+    SYSLOG_MAX_PENDING: int = 100000  # Parsed events held while the pipeline is full
+    
+    # Incident correlation settings
+    INCIDENT_DEDUP_TTL_SECONDS: float = 3600.0  # Duplicates fold into an incident until it is quiet this long
+    INCIDENT_DEDUP_MAX_ENTRIES: int = 100000  # Open incidents (and case keys) kept in memory
+    INCIDENT_DEDUP_FLUSH_SECONDS: float = 5.0  # Interval between batched occurrence counter writes
+    INCIDENT_CASE_WINDOW_SECONDS: float = 86400.0  # Incidents on the same agent or IP within this join one case
+    
+    # Playbook execution settings
+    PLAYBOOK_MAX_CONCURRENT_RUNS: int = 500
+    PLAYBOOK_ACTION_CONCURRENCY: int = 20  # Default concurrent executions per action type
+    PLAYBOOK_ACTION_TIMEOUT: float = 300.0  # Default seconds per step
+    PLAYBOOK_ACTION_LIMITS: Dict[str, int] = {}  # Per-action concurrency, e.g. {"scan": 4}
+    PLAYBOOK_ACTION_TIMEOUTS: Dict[str, float] = {}  # Per-action timeouts, e.g. {"scan": 1800}
+    PLAYBOOK_SIMULATE_ACTIONS: bool = False  # Run actions without a handler against the simulated backend (demo and testing only)
+    PLAYBOOK_SIMULATED_DELAY_SECONDS: float = 0.5
+    PLAYBOOK_PROGRESS_FLUSH_MS: int = 250
+    
+    # Task scheduler settings
+    TASK_SCHEDULER_ENABLED: bool = True
+    TASK_WORKERS: int = 50  # Tasks executed at once per process
+    TASK_CRITICAL_WORKERS: int = 5  # Extra slots only critical tasks may use
+    TASK_PROCESS_WORKERS: Optional[int] = None  # Process pool size for CPU-bound handlers (default: CPU count)
+    TASK_AGENT_CONCURRENCY: int = 4  # Running tasks per agent across all workers
+    TASK_POLL_MS: int = 500  # Interval between claims when no task was queued in-process
+    TASK_LEASE_SECONDS: float = 60.0
+    TASK_MAX_ATTEMPTS: int = 3
+    TASK_RETRY_BASE_SECONDS: float = 5.0
+    TASK_RETRY_MAX_SECONDS: float = 600.0
+    # Seconds of queueing each priority is credited with; critical always goes first
+    TASK_PRIORITY_HEAD_START: Dict[str, float] = {"critical": 1e9, "high": 3600.0, "medium": 600.0, "low": 0.0}
+    
+    # Analytics rollup settings
+    ANALYTICS_FLUSH_SECONDS: float = 2.0  # Interval between batched rollup writes
+    ANALYTICS_MINUTE_RETENTION_HOURS: float = 48.0  # Minute buckets older than this are pruned
+    
+    # Live feed settings
+    STREAM_RING_SIZE: int = 1000  # Events kept for Last-Event-ID resume
+    STREAM_CLIENT_BUFFER: int = 256  # Events buffered per client before it is dropped
+    STREAM_MAX_SUBSCRIBERS: int = 1000
+    STREAM_KEEPALIVE_SECONDS: float = 15.0
+    STREAM_RETRY_MS: int = 2000  # Reconnect delay suggested to SSE clients
+    
+    # IP intelligence settings
+    IP_INTEL_DIR: Optional[str] = "./ip_intel"  # One CIDR list per file, named after the file (blocklist.txt, ...)
+    IP_INTEL_RELOAD_SECONDS: float = 10.0  # Interval between checks for changed list files (0 disables)
+    IP_INTEL_MAX_BATCH: int = 10000  # Addresses per POST /api/ip-intel/lookup
+    
+    # Incident analysis settings
+    ANALYSIS_MODEL_URL: Optional[str] = None  # Takes {"prompt", "inputs"}, returns {"analysis"}; analysis is unavailable when unset
+    ANALYSIS_MODEL_NAME: Optional[str] = None  # Model behind ANALYSIS_MODEL_URL, part of the cache key (defaults to the URL)
+    ANALYSIS_MODEL_STUB: bool = False  # Without ANALYSIS_MODEL_URL, answer with a canned local analysis (development and tests only)
+    ANALYSIS_MODEL_TIMEOUT: float = 60.0
+    ANALYSIS_MODEL_CONCURRENCY: int = 8  # Model calls in flight per process
+    ANALYSIS_STUB_DELAY_SECONDS: float = 1.5
+    ANALYSIS_CACHE_TTL_SECONDS: float = 86400.0
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 50000  # Least recently used analyses beyond this are evicted
+    ANALYSIS_CACHE_MEMORY_ENTRIES: int = 2000
+    ANALYSIS_CACHE_FLUSH_SECONDS: float = 30.0  # Interval between hit count writes and evictions
+    ANALYSIS_BATCH_CONCURRENCY: int = 8  # Analyses in progress per batch request
+    ANALYSIS_MAX_BATCH: int = 500
+    
+    # Agent liveness settings
+    AGENT_HEARTBEAT_TIMEOUT_SECONDS: float = 30.0  # Silence before an active agent is marked inactive
+    AGENT_LIVENESS_TICK_SECONDS: float = 1.0  # Resolution of the deadline timing wheel
+    AGENT_LIVENESS_FLUSH_SECONDS: float = 5.0  # Interval between batched last_seen / status writes
+    AGENT_HEARTBEAT_MAX_BATCH: int = 50000  # Agent ids per POST /api/agents/heartbeats
+    
+    # Risk scoring settings
+    RISK_WEIGHTS: Dict[str, float] = {
+        "severity": 0.3, "asset_criticality": 0.2, "tactic": 0.15,
+        "recurrence": 0.1, "ip_reputation": 0.15, "agent_distrust": 0.1
+    }
+    RISK_DEFAULT_ASSET_CRITICALITY: float = 0.5  # For incidents and agents that do not set asset_criticality
+    RISK_RECURRENCE_CAP: int = 100  # Occurrences at which recurrence counts fully
+    RISK_IP_LIST_WEIGHTS: Dict[str, float] = {"allowlist": 0.0}  # IP intelligence list -> source address risk
+    RISK_IP_LISTED_DEFAULT: float = 0.9  # Risk for lists not named in RISK_IP_LIST_WEIGHTS
+    RISK_REFRESH_SECONDS: float = 5.0  # Interval between re-rankings of the open queue (0 disables)
+    RISK_REFRESH_OVERLAP_SECONDS: float = 30.0  # Re-read window for rows committed after a refresh started
+    RISK_AGENT_RELOAD_SECONDS: float = 60.0
+    RISK_PRUNE_SECONDS: float = 300.0  # Interval between checks for queued incidents deleted elsewhere
+    RISK_MAX_BATCH: int = 10000  # Incidents per POST /api/risk/score
+    
+    # Anomaly detection settings
+    ANOMALY_DETECTION_ENABLED: bool = True
+    ANOMALY_STATE_PATH: str = "./anomaly_state.bin"  # Memory-mapped baselines ("" keeps them in memory only)
+    ANOMALY_MAX_ENTITIES: int = 1048576  # Agents, source IPs and rules tracked at once (about 200 bytes each)
+    ANOMALY_BUCKET_SECONDS: int = 60  # Rates are events per bucket
+    ANOMALY_ALPHA: float = 0.02  # EWMA weight of each closed bucket
+    ANOMALY_SEASONAL_ALPHA: float = 0.1  # Weight of each bucket in its hour-of-week profile
+    ANOMALY_Z_THRESHOLD: float = 4.0
+    ANOMALY_Z_CRITICAL: float = 10.0  # Anomalies at or above this z-score raise critical incidents
+    ANOMALY_MIN_EVENTS: int = 20  # Events in a bucket before it can be anomalous
+    ANOMALY_WARMUP_BUCKETS: int = 60  # History an entity needs before it is judged
+    ANOMALY_COOLDOWN_SECONDS: int = 900  # Minimum time between anomalies of one entity
+    ANOMALY_IDLE_SECONDS: int = 1209600  # Entities unseen this long are evicted first when the table is full
+    ANOMALY_FLUSH_SECONDS: float = 30.0
+    
+    # Rule backtest settings
+    BACKTEST_WORKERS: Optional[int] = None  # Process pool size (default: CPU count)
+    BACKTEST_PARTITION_HOURS: float = 6.0  # History is split into partitions of this length, evaluated in parallel
+    BACKTEST_CHUNK_ROWS: int = 5000  # Rows fetched from the database at a time
+    BACKTEST_MAX_DAYS: int = 93  # Longest range one backtest may replay
+    BACKTEST_MAX_RULES: int = 100
+    BACKTEST_MAX_SAMPLES: int = 50  # Sample hits returned per rule
+    
+    # Retention settings
+    RETENTION_ENABLED: bool = True
+    RETENTION_DAYS: Dict[str, int] = {"incidents": 90, "tasks": 30, "security_alerts": 90}  # Age at which finished rows are archived
+    RETENTION_STATUSES: Dict[str, List[str]] = {
+        "incidents": ["resolved", "closed"],
+        "tasks": ["completed", "failed"],
+        "security_alerts": ["resolved", "closed"]
+    }
+    RETENTION_INTERVAL_SECONDS: float = 3600.0
+    RETENTION_BATCH_ROWS: int = 5000  # Rows read per archive segment
+    RETENTION_DELETE_ROWS: int = 500  # Rows deleted per transaction
+    RETENTION_PAUSE_MS: int = 50  # Pause between delete transactions, so other writers get the lock
+    ARCHIVE_DIR: str = "./archive"
+    ARCHIVE_BLOCK_ROWS: int = 256  # Rows compressed together; a lookup decompresses one block
+    ARCHIVE_GZIP_LEVEL: int = 6
+    ARCHIVE_ZSTD_LEVEL: int = 9  # Used when the zstandard package is installed
+    ARCHIVE_OPEN_SEGMENTS: int = 256  # Segment indexes kept memory-mapped
+    ARCHIVE_BLOCK_CACHE: int = 64  # Decompressed blocks kept for repeated lookups
     
     class Config:
         case_sensitive = True
         env_file = ".env"
+        extra = "ignore"  # .env may hold keys used by other tools
 
 settings = Settings() 
\ No newline at end of file
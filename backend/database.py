@@ -1,20 +1,128 @@
-from sqlalchemy import create_engine
+import asyncio
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from config import settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./security_alerts.db"
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Async drivers for the synchronous URLs used in settings
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def get_async_url(url: str) -> str:
+    """Return the async-driver equivalent of a database URL."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+def configure_sqlite(dbapi_connection, connection_record):
+    """
+    Tune every new SQLite connection.
+
+    WAL journaling lets readers run concurrently with the single writer,
+    synchronous=NORMAL is durable across application crashes in WAL mode,
+    and the busy timeout makes writers wait for the lock instead of failing.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Connection pool and driver options for an engine on the given URL."""
+    if is_sqlite_memory(url):
+        # A single shared connection, otherwise every connection gets its own database
+        return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+    options = {
+        # Explicit, as SQLite drivers otherwise default to no pooling
+        "poolclass": AsyncAdaptedQueuePool if is_async else QueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": not is_sqlite(url),
+    }
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+# Synchronous engine for scripts and maintenance commands
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine used by the API handlers
+ASYNC_DATABASE_URL = get_async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+if is_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", configure_sqlite)
+    event.listen(async_engine.sync_engine, "connect", configure_sqlite)
+
 Base = declarative_base()
 
+def utc_now() -> datetime:
+    """
+    Default for created_at columns.
+
+    Written by SQLAlchemy, so SQLite stores every row in one text format
+    (with microseconds), which keyset cursors compare directly. The
+    server_default (CURRENT_TIMESTAMP, no fraction) only fills rows
+    inserted outside SQLAlchemy.
+    """
+    return datetime.now(timezone.utc)
+
+async def init_db(attempts: int = 5):
+    """
+    Create the database tables.
+
+    Workers started together race to create them: the losers fail with
+    "table already exists" (or a lock timeout) and retry, and by then the
+    tables exist and are skipped.
+    """
+    for attempt in range(attempts):
+        try:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            return
+        except DBAPIError:
+            if attempt == attempts - 1:
+                raise
+            await asyncio.sleep(0.2 * (attempt + 1))
+
+async def close_db():
+    """Close all pooled connections."""
+    await async_engine.dispose()
+
 # Dependency
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
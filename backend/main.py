@@ -1,31 +1,57 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Header, Query, WebSocket, WebSocketDisconnect
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional, Dict, Any, Union
 from enum import Enum
-import uuid
-from datetime import datetime
-import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
 from services.slack_service import SlackService
+from services.slack_delivery import SlackDeliveryPipeline, SlackQueueFull
+from services.rule_engine import RuleEngine, RuleCompileError, CompiledRule
+from services.window_counter import WindowCounterStore
+from services.mitre_tagger import MitreTagger
+from services.ingestion import IngestionPipeline, IngestQueueFull, IngestError, IngestBodyTooLarge, NDJSONDecoder
+from services.syslog_receiver import SyslogReceiver
+from services.incident_correlation import IncidentCorrelator
+from services.playbook_engine import PlaybookEngine, PlaybookDefinitionError, build_dag
+from services.task_scheduler import TaskScheduler, PermanentTaskError
+from services.event_stream import Broadcaster, StreamFull
+from services.analytics_rollup import AnalyticsRollup, RESOLVED_STATUSES, rollup_state
+from services.search import SearchError, SearchUnavailable, ensure_search_index, search
+from services.agent_liveness import AgentLiveness, INACTIVE
+from services.incident_analysis import AnalysisCache, AnalysisError, AnalysisUnavailable
+from services.fast_json import DefaultResponse, RecordSerializer, json_response
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, instrument_engine, metrics, sample_stacks
+from services.ip_intel import IPIntel, SOURCE_IP_FIELDS, parse_ip
+from services.shared_state import SharedState
+from services.risk_scoring import RiskScorer
+from services.anomaly_detection import AnomalyDetector
+from services.rule_backtest import RuleBacktester
+from services.retention import ArchiveError, RetentionManager
+from config import settings
 from services.agent_service import AgentService
 from services.playbook_service import PlaybookService
 from services.incident_service import IncidentService
 from services.task_service import TaskService
 from services.rule_service import RuleService
-from models.agent import Agent, AgentCreate, AgentUpdate
-from models.playbook import Playbook, PlaybookCreate, PlaybookUpdate
-from models.incident import Incident, IncidentCreate, IncidentUpdate
-from models.task import Task, TaskCreate, TaskUpdate
-from models.rule import Rule, RuleCreate, RuleUpdate
-from models.alert import Alert, AlertCreate
+from services.alert_service import AlertService
+from services.notification_service import NotificationService
+from models.alert import Alert, AlertCreate, AlertUpdate
 from models.slack_notification import SlackNotification, SlackNotificationCreate
-from database import get_db, engine, Base
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from models.agent import Agent as AgentRecord
+from models.playbook import Playbook as PlaybookRecord
+from models.incident import Incident as IncidentRecord
+from models.task import Task as TaskRecord
+from models.rule import Rule as RuleRecord
+from models.case import IncidentCase as CaseRecord
+from models import SecurityAlert
+from services.pagination import PageQuery, PaginationError, paginate, MAX_PAGE_SIZE
+from database import AsyncSessionLocal, async_engine, engine, get_db, init_db, close_db
 
 # Create FastAPI app
-app = FastAPI(title="AI Security Alert System API")
+app = FastAPI(title="AI Security Alert System API", default_response_class=DefaultResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -34,15 +60,237 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+if settings.METRICS_ENABLED:
+    # Added last so it is the outermost middleware and times whole requests
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(engine)
+    instrument_engine(async_engine.sync_engine)
+
 # Initialize services
 slack_service = SlackService()
+slack_delivery = SlackDeliveryPipeline(slack_service)
 agent_service = AgentService()
 playbook_service = PlaybookService()
 incident_service = IncidentService()
 task_service = TaskService()
 rule_service = RuleService()
+alert_service = AlertService()
+notification_service = NotificationService()
+shared_state = SharedState()
+risk_scorer = RiskScorer(agents_generation=lambda: shared_state.generation("agents"))
+window_counters = WindowCounterStore()
+rule_engine = RuleEngine(counters=window_counters)
+
+def notify_slack_action(action: Dict[str, Any], match) -> None:
+    message = action.get("message") or f"Rule '{match.name}' matched event"
+    try:
+        slack_delivery.enqueue(
+            message=message,
+            channel=action.get("channel"),
+            type="rule",
+            severity=action.get("severity", "medium")
+        )
+    except SlackQueueFull as e:
+        print(f"Dropping Slack notification for rule {match.rule_id}: {str(e)}")
+
+rule_engine.dispatcher.register("notify_slack", notify_slack_action)
+mitre_tagger = MitreTagger.from_file()
+ip_intel = IPIntel()
+
+async def tag_ingested_events(events: List[Dict[str, Any]]) -> None:
+    # Runs before rule evaluation so rules can match on ip_intel.<list>
+    ip_intel.tag_events(events)
+
+async def evaluate_ingested_events(events: List[Dict[str, Any]]) -> None:
+    try:
+        # Pick up rules changed through another worker before the batch
+        await shared_state.sync("rules")
+    except Exception as e:
+        print(f"Error refreshing rules: {str(e)}")
+    rule_ids = []
+    for event in events:
+        matches = await rule_engine.process(event)
+        rule_ids.append([match.rule_id for match in matches])
+    if settings.ANOMALY_DETECTION_ENABLED:
+        await raise_anomaly_incidents(anomaly_detector.observe(events, rule_ids))
+
+ingestion = IngestionPipeline()
+ingestion.add_processor(tag_ingested_events)
+ingestion.add_processor(evaluate_ingested_events)
+syslog_receiver = SyslogReceiver(ingestion)
+incident_correlator = IncidentCorrelator()
+playbook_engine = PlaybookEngine()
+task_scheduler = TaskScheduler()
+incident_feed = Broadcaster()
+analytics_rollup = AnalyticsRollup()
+analysis_cache = AnalysisCache()
+agent_liveness = AgentLiveness()
+anomaly_detector = AnomalyDetector()
+rule_backtester = RuleBacktester()
+retention = RetentionManager()
+
+async def emit_agent_status_events(changes: List[Any]) -> None:
+    """Turn liveness changes into events, so rules can alert on agent_offline."""
+    events = [
+        {
+            "event_type": "agent_offline" if status == INACTIVE else "agent_online",
+            "source": "agent_liveness",
+            "severity": "high" if status == INACTIVE else "low",
+            "agent_id": agent_id,
+            "timestamp": last_seen,
+            "message": f"Agent {agent_id} {'stopped sending' if status == INACTIVE else 'resumed sending'} heartbeats"
+        }
+        for agent_id, status, last_seen in changes
+    ]
+    try:
+        await ingestion.submit(events)
+    except IngestQueueFull as e:
+        print(f"Dropping {len(events)} agent status events: {str(e)}")
+
+agent_liveness.add_listener(emit_agent_status_events)
+
+# Queue depths and in-flight work, read when /metrics is scraped
+metrics.gauge("ingest_queue_events", "Events queued for writing", lambda: ingestion.pending)
+metrics.gauge("slack_queue_messages", "Messages waiting to be batched for Slack", lambda: slack_delivery.queue.qsize() if slack_delivery.queue else 0)
+metrics.gauge("syslog_pending_events", "Parsed syslog events waiting for the ingestion queue", lambda: syslog_receiver.stats()["pending"])
+metrics.gauge("task_scheduler_running_tasks", "Tasks leased and running in this process", lambda: task_scheduler.active)
+metrics.gauge("playbook_active_runs", "Playbook runs in progress", lambda: playbook_engine.active_runs)
+metrics.gauge("incident_counter_pending_updates", "Occurrence and case counters not yet written", lambda: incident_correlator.get_stats()["pending_updates"])
+metrics.gauge("analytics_pending_cells", "Rollup cells not yet written", lambda: analytics_rollup.get_stats()["pending_cells"])
+metrics.gauge("stream_subscribers", "Live feed clients", lambda: incident_feed.subscriber_count)
+metrics.gauge("analysis_in_flight", "Model calls in progress", lambda: analysis_cache.get_stats()["in_flight"])
+metrics.gauge("agent_liveness_pending_writes", "Agents with last_seen or status not yet written", lambda: agent_liveness.get_stats()["pending_writes"])
+metrics.gauge("risk_queue_incidents", "Open incidents in the ranked risk queue", lambda: len(risk_scorer))
+metrics.gauge("anomaly_entities", "Agents, source IPs and rules with a rate baseline", lambda: len(anomaly_detector))
+
+async def run_playbook_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Task handler: run the task's playbook and fail the task if a step failed."""
+    playbook = await playbook_cache.get(task["playbook_id"])
+    if not playbook:
+        raise PermanentTaskError("Task has no playbook")
+    try:
+        run = playbook_engine.submit(task["id"], playbook["steps"], task["parameters"], task["agent_id"])
+    except PlaybookDefinitionError as e:
+        raise PermanentTaskError(f"Invalid playbook steps: {str(e)}")
+    result = await run
+    if result["status"] != "completed":
+        failed = [name for name, state in result["steps"].items() if state["status"] == "failed"]
+        raise RuntimeError(f"Playbook steps failed: {', '.join(failed)}")
+    return result
+
+task_scheduler.register("playbook", run_playbook_task)
+
+async def run_rule_backtest(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Task handler: backtest the rules in the task's parameters (see POST /api/rules/backtest)."""
+    try:
+        return await rule_backtester.run(**task["parameters"]["backtest"])
+    except ValueError as e:
+        raise PermanentTaskError(str(e))
+
+task_scheduler.register("rule_backtest", run_rule_backtest)
+
+background_tasks: List[asyncio.Task] = []
+
+async def snapshot_window_counters():
+    """Periodically evict idle counter keys and snapshot the counters to SQLite."""
+    while True:
+        await asyncio.sleep(settings.WINDOW_COUNTER_SNAPSHOT_SECONDS)
+        try:
+            window_counters.evict_idle()
+            rows = window_counters.export_rows()
+            await asyncio.to_thread(window_counters.snapshot, rows)
+        except Exception as e:
+            print(f"Error snapshotting window counters: {str(e)}")
+
+async def flush_incident_counters():
+    """Periodically write the occurrence counters of deduplicated incidents."""
+    while True:
+        await asyncio.sleep(settings.INCIDENT_DEDUP_FLUSH_SECONDS)
+        await incident_correlator.flush()
+
+async def flush_analytics_rollups():
+    """Periodically write the buffered analytics rollup deltas."""
+    while True:
+        await asyncio.sleep(settings.ANALYTICS_FLUSH_SECONDS)
+        await analytics_rollup.flush()
+
+async def flush_analysis_cache():
+    """Periodically write analysis cache hits and evict stale analyses."""
+    while True:
+        await asyncio.sleep(settings.ANALYSIS_CACHE_FLUSH_SECONDS)
+        await analysis_cache.flush()
+
+async def flush_anomaly_state():
+    """Periodically sync the memory-mapped anomaly baselines to disk."""
+    while True:
+        await asyncio.sleep(settings.ANOMALY_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(anomaly_detector.flush)
+        except Exception as e:
+            print(f"Error flushing anomaly state: {str(e)}")
+
+@app.on_event("startup")
+async def start_background_services():
+    await init_db()
+    try:
+        # Read off the loop but installed on it, before ingestion, syslog
+        # or the scheduler can count events
+        window_counters.install(await asyncio.to_thread(window_counters.load))
+    except Exception as e:
+        print(f"Error restoring window counters: {str(e)}")
+    async with async_engine.begin() as conn:
+        await ensure_search_index(conn)
+    if settings.SEED_SAMPLE_DATA:
+        try:
+            await asyncio.to_thread(seed_sample_data)
+        except Exception as e:
+            print(f"Error seeding sample data: {str(e)}")
+    await shared_state.start()
+    if settings.ANOMALY_DETECTION_ENABLED:
+        await asyncio.to_thread(anomaly_detector.open)
+    await risk_scorer.start()
+    await retention.start()
+    await slack_delivery.start()
+    await ip_intel.start()
+    await agent_liveness.start()
+    await ingestion.start()
+    await playbook_engine.start()
+    if settings.TASK_SCHEDULER_ENABLED:
+        await task_scheduler.start()
+    if settings.SYSLOG_ENABLED:
+        await syslog_receiver.start()
+    background_tasks.append(asyncio.create_task(snapshot_window_counters()))
+    background_tasks.append(asyncio.create_task(flush_incident_counters()))
+    background_tasks.append(asyncio.create_task(flush_analytics_rollups()))
+    background_tasks.append(asyncio.create_task(flush_analysis_cache()))
+    background_tasks.append(asyncio.create_task(flush_anomaly_state()))
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await syslog_receiver.stop()
+    await ingestion.stop()
+    anomaly_detector.close()
+    await incident_correlator.flush()
+    await analytics_rollup.flush()
+    await analysis_cache.close()
+    await task_scheduler.stop()
+    await rule_backtester.stop()
+    await retention.stop()
+    await playbook_engine.stop()
+    await ip_intel.stop()
+    await risk_scorer.stop()
+    await agent_liveness.stop()
+    window_counters.snapshot()
+    await slack_delivery.stop()
+    await slack_service.close()
+    await shared_state.stop()
+    await close_db()
 
 # Enums
 class AgentType(str, Enum):
@@ -85,6 +333,9 @@ class RuleType(str, Enum):
     RESPONSE = "response"
 
 # Pydantic models
+# Responses are built from the database rows, whose integer ids are sent as strings
+RECORD_CONFIG = ConfigDict(from_attributes=True, coerce_numbers_to_str=True)
+
 class AgentBase(BaseModel):
     name: str
     agent_type: AgentType
@@ -95,11 +346,20 @@ class AgentBase(BaseModel):
 class AgentCreate(AgentBase):
     pass
 
+class AgentUpdate(BaseModel):
+    name: Optional[str] = None
+    agent_type: Optional[AgentType] = None
+    status: Optional[AgentStatus] = None
+    version: Optional[str] = None
+    is_active: Optional[bool] = None
+
 class Agent(AgentBase):
+    model_config = RECORD_CONFIG
+
     id: str
     last_seen: Optional[datetime] = None
     created_at: datetime
-    updated_at: datetime
+    updated_at: Optional[datetime] = None
 
 class PlaybookBase(BaseModel):
     name: str
@@ -110,10 +370,18 @@ class PlaybookBase(BaseModel):
 class PlaybookCreate(PlaybookBase):
     pass
 
+class PlaybookUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    version: Optional[str] = None
+    steps: Optional[List[Dict[str, Any]]] = None
+
 class Playbook(PlaybookBase):
+    model_config = RECORD_CONFIG
+
     id: str
     created_at: datetime
-    updated_at: datetime
+    updated_at: Optional[datetime] = None
 
 class TaskBase(BaseModel):
     name: str
@@ -127,13 +395,24 @@ class TaskBase(BaseModel):
 class TaskCreate(TaskBase):
     pass
 
+class TaskUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[TaskStatus] = None
+    priority: Optional[TaskPriority] = None
+    agent_id: Optional[str] = None
+    playbook_id: Optional[str] = None
+    parameters: Optional[Dict[str, Any]] = None
+
 class Task(TaskBase):
+    model_config = RECORD_CONFIG
+
     id: str
     result: Optional[Dict[str, Any]] = None
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     created_at: datetime
-    updated_at: datetime
+    updated_at: Optional[datetime] = None
 
 class IncidentBase(BaseModel):
     title: str
@@ -141,17 +420,34 @@ class IncidentBase(BaseModel):
     severity: IncidentSeverity
     status: IncidentStatus
     source: str
-    agent_id: str
+    agent_id: Optional[str]
     details: Dict[str, Any] = {}
 
 class IncidentCreate(IncidentBase):
-    pass
+    # Set by the incident correlator
+    fingerprint: Optional[str] = None
+    case_id: Optional[int] = None
+
+class IncidentUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    severity: Optional[IncidentSeverity] = None
+    status: Optional[IncidentStatus] = None
+    source: Optional[str] = None
+    agent_id: Optional[str] = None
+    details: Optional[Dict[str, Any]] = None
 
 class Incident(IncidentBase):
+    model_config = RECORD_CONFIG
+
     id: str
     created_at: datetime
-    updated_at: datetime
+    updated_at: Optional[datetime] = None
     resolved_at: Optional[datetime] = None
+    fingerprint: Optional[str] = None
+    occurrence_count: int = 1
+    last_seen_at: Optional[datetime] = None
+    case_id: Optional[int] = None
 
 class RuleBase(BaseModel):
     name: str
@@ -164,16 +460,74 @@ class RuleBase(BaseModel):
 class RuleCreate(RuleBase):
     pass
 
+class RuleUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    rule_type: Optional[RuleType] = None
+    conditions: Optional[Dict[str, Any]] = None
+    actions: Optional[List[Dict[str, Any]]] = None
+    is_active: Optional[bool] = None
+
 class Rule(RuleBase):
+    model_config = RECORD_CONFIG
+
     id: str
     created_at: datetime
-    updated_at: datetime
+    updated_at: Optional[datetime] = None
 
 class IncidentSimulationRequest(BaseModel):
     agent_id: str
     severity: IncidentSeverity
     description: str
 
+class BacktestRule(BaseModel):
+    id: Optional[str] = None  # The id of a stored rule this candidate replaces
+    name: str = ""
+    conditions: Dict[str, Any]
+    actions: List[Dict[str, Any]] = []
+
+class BacktestRequest(BaseModel):
+    start: datetime
+    end: datetime
+    source: str = "events"  # events or incidents
+    rule_ids: List[int] = []  # Stored rules, as they are now
+    rules: List[BacktestRule] = []  # Candidate rules
+    samples: int = 5
+
+class RuleEvaluationRequest(BaseModel):
+    event: Dict[str, Any]
+    dispatch: bool = True
+
+class MitreTagRequest(BaseModel):
+    texts: List[str]
+
+class AnalysisRequest(BaseModel):
+    message: str = ""
+    refresh: bool = False
+
+class HeartbeatBatchRequest(BaseModel):
+    agent_ids: List[int]
+
+class BatchAnalysisRequest(BaseModel):
+    incident_ids: List[int]
+    message: str = ""
+
+class IPLookupRequest(BaseModel):
+    ips: List[str]
+
+class RiskAssessmentRequest(BaseModel):
+    incidentId: Union[int, str]
+
+class RiskScoreRequest(BaseModel):
+    incident_ids: List[int] = []
+    incidents: List[Dict[str, Any]] = []  # Scored as given, without reading the database
+    explain: bool = True
+
+class MitreKeywordsRequest(BaseModel):
+    tactic: str
+    technique: str
+    keywords: List[str]
+
 class AlertRequest(BaseModel):
     message: str
     channel: Optional[str] = None
@@ -187,115 +541,95 @@ class SlackNotificationRequest(BaseModel):
     type: str = "alert"
     severity: str = "medium"
 
-# In-memory storage
-agents: Dict[str, Agent] = {}
-playbooks: Dict[str, Playbook] = {}
-tasks: Dict[str, Task] = {}
-incidents: Dict[str, Incident] = {}
-rules: Dict[str, Rule] = {}
-
-# Helper functions
-def generate_id():
-    return str(uuid.uuid4())
-
-def get_current_time():
-    return datetime.now()
-
-# Sample data initialization
-def init_sample_data():
-    # Create sample agents
-    agent1 = Agent(
-        id=generate_id(),
-        name="Network Monitor Agent",
-        agent_type=AgentType.NETWORK,
-        status=AgentStatus.ACTIVE,
-        version="1.0.0",
-        is_active=True,
-        last_seen=get_current_time(),
-        created_at=get_current_time(),
-        updated_at=get_current_time()
-    )
-    agents[agent1.id] = agent1
-
-    agent2 = Agent(
-        id=generate_id(),
-        name="Endpoint Protection Agent",
-        agent_type=AgentType.ENDPOINT,
-        status=AgentStatus.ACTIVE,
-        version="1.0.0",
-        is_active=True,
-        last_seen=get_current_time(),
-        created_at=get_current_time(),
-        updated_at=get_current_time()
-    )
-    agents[agent2.id] = agent2
-
-    # Create sample playbooks
-    playbook1 = Playbook(
-        id=generate_id(),
-        name="Malware Detection Response",
-        description="Standard response to malware detection",
-        version="1.0.0",
-        steps=[
+# Sample data, written to the database once (SEED_SAMPLE_DATA)
+SAMPLE_AGENTS = [
+    {"name": "Network Monitor Agent", "agent_type": AgentType.NETWORK.value, "status": AgentStatus.ACTIVE.value, "version": "1.0.0"},
+    {"name": "Endpoint Protection Agent", "agent_type": AgentType.ENDPOINT.value, "status": AgentStatus.ACTIVE.value, "version": "1.0.0"},
+]
+
+SAMPLE_PLAYBOOKS = [
+    {
+        "name": "Malware Detection Response",
+        "description": "Standard response to malware detection",
+        "version": "1.0.0",
+        "steps": [
             {"name": "Isolate affected system", "action": "isolate", "parameters": {"duration": 3600}},
             {"name": "Scan for malware", "action": "scan", "parameters": {"scan_type": "full"}},
             {"name": "Collect logs", "action": "collect_logs", "parameters": {"log_types": ["system", "application"]}}
         ],
-        created_at=get_current_time(),
-        updated_at=get_current_time()
-    )
-    playbooks[playbook1.id] = playbook1
-
-    playbook2 = Playbook(
-        id=generate_id(),
-        name="Network Intrusion Response",
-        description="Response to network intrusion attempts",
-        version="1.0.0",
-        steps=[
+    },
+    {
+        "name": "Network Intrusion Response",
+        "description": "Response to network intrusion attempts",
+        "version": "1.0.0",
+        "steps": [
             {"name": "Block suspicious IP", "action": "block_ip", "parameters": {"duration": 86400}},
             {"name": "Analyze network traffic", "action": "analyze_traffic", "parameters": {"timeframe": 3600}},
             {"name": "Update firewall rules", "action": "update_firewall", "parameters": {"rule_type": "block"}}
         ],
-        created_at=get_current_time(),
-        updated_at=get_current_time()
-    )
-    playbooks[playbook2.id] = playbook2
-
-    # Create sample rules
-    rule1 = Rule(
-        id=generate_id(),
-        name="Malware Detection Rule",
-        description="Detect known malware signatures",
-        rule_type=RuleType.DETECTION,
-        conditions={"signature_match": True, "confidence": 0.8},
-        actions=[{"type": "create_incident", "severity": "high"}],
-        is_active=True,
-        created_at=get_current_time(),
-        updated_at=get_current_time()
-    )
-    rules[rule1.id] = rule1
-
-    rule2 = Rule(
-        id=generate_id(),
-        name="Brute Force Prevention",
-        description="Prevent brute force login attempts",
-        rule_type=RuleType.PREVENTION,
-        conditions={"failed_attempts": 5, "timeframe": 300},
-        actions=[{"type": "block_ip", "duration": 3600}],
-        is_active=True,
-        created_at=get_current_time(),
-        updated_at=get_current_time()
-    )
-    rules[rule2.id] = rule2
+    },
+]
+
+SAMPLE_RULES = [
+    {
+        "name": "Malware Detection Rule",
+        "description": "Detect known malware signatures",
+        "rule_type": RuleType.DETECTION.value,
+        "conditions": {"signature_match": True, "confidence": 0.8},
+        "actions": [{"type": "create_incident", "severity": "high"}],
+    },
+    {
+        "name": "Brute Force Prevention",
+        "description": "Prevent brute force login attempts",
+        "rule_type": RuleType.PREVENTION.value,
+        "conditions": {"event_type": "failed_login", "threshold": 5, "timeframe": 300, "group_by": "source_ip"},
+        "actions": [{"type": "block_ip", "duration": 3600}],
+    },
+]
+
+def seed_sample_data() -> int:
+    """
+    Insert the sample agents, playbooks and rules into the tables that are empty.
+
+    Runs under the shared state lock, so only the first of several workers
+    starting together seeds. Blocking; call through asyncio.to_thread.
 
-# Initialize sample data
-init_sample_data()
+    Returns:
+        int: Number of rows inserted
+    """
+    now = datetime.now(timezone.utc)
+    samples = (
+        (AgentRecord.__table__, [dict(row, is_active=True, last_seen=now, configuration={}) for row in SAMPLE_AGENTS]),
+        (PlaybookRecord.__table__, [dict(row, parameters={}) for row in SAMPLE_PLAYBOOKS]),
+        (RuleRecord.__table__, [dict(row, is_active=True) for row in SAMPLE_RULES]),
+    )
+    inserted = 0
+    with shared_state.locked(), engine.begin() as conn:
+        for table, rows in samples:
+            if conn.execute(select(table.c.id).limit(1)).first() is None:
+                conn.execute(table.insert(), [dict(row, created_at=now, updated_at=now) for row in rows])
+                inserted += len(rows)
+    return inserted
 
 # API Endpoints
 
 # Slack notification endpoints
+def enqueue_slack_delivery(message: str, channel: Optional[str], type: str, severity: str) -> JSONResponse:
+    try:
+        delivery_id = slack_delivery.enqueue(message=message, channel=channel, type=type, severity=severity)
+    except SlackQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse(
+        status_code=202,
+        content={"status": "queued", "delivery_id": delivery_id}
+    )
+
 @app.post("/api/slack/send", response_model=SlackNotification)
-async def send_slack_notification(notification: SlackNotificationRequest, db=Depends(get_db)):
+async def send_slack_notification(notification: SlackNotificationRequest, wait: bool = True, db=Depends(get_db)):
+    if not wait:
+        return enqueue_slack_delivery(
+            notification.message, notification.channel, notification.type, notification.severity
+        )
     try:
         # Create a notification object
         notification_data = SlackNotificationCreate(
@@ -323,27 +657,106 @@ async def send_slack_notification(notification: SlackNotificationRequest, db=Dep
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# List endpoints return one page of rows; the cursor of the next page is
+# sent in the X-Next-Cursor header so the body stays a plain list
+async def list_page(request: Request, db, model, page: PageQuery, serializer: RecordSerializer) -> Response:
+    try:
+        items, next_cursor = await paginate(db, model, page, serializer.names)
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_response(request, serializer.rows(items), headers=headers)
+
+# Records are returned through these rather than response_model validation,
+# in the shape of the response model the endpoint declares
+agent_serializer = RecordSerializer.for_model(AgentRecord, Agent)
+playbook_serializer = RecordSerializer.for_model(PlaybookRecord, Playbook)
+incident_serializer = RecordSerializer.for_model(IncidentRecord, Incident)
+task_serializer = RecordSerializer.for_model(TaskRecord, Task)
+rule_serializer = RecordSerializer.for_model(RuleRecord, Rule)
+alert_serializer = RecordSerializer.for_model(SecurityAlert, Alert)
+case_serializer = RecordSerializer.for_model(CaseRecord)
+
+# Rules, playbooks and agents live in the database; these keep each
+# worker's in-memory copies in step with writes made by any worker
+async def load_rules() -> None:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(RuleRecord))).scalars().all()
+    rule_engine.sync_rules(rows)
+
+async def load_playbook(playbook_id: int) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as db:
+        playbook = await db.get(PlaybookRecord, playbook_id)
+    return playbook_serializer.one(playbook) if playbook else None
+
+async def load_rule_record(rule_id: int) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as db:
+        rule = await db.get(RuleRecord, rule_id)
+    return rule_serializer.one(rule) if rule else None
+
+shared_state.register("rules", load_rules)
+shared_state.register("agents", agent_liveness.reconcile)
+playbook_cache = shared_state.cache("playbooks", load_playbook)
+rule_cache = shared_state.cache("rules", load_rule_record)
+
 # Agents
 @app.get("/api/agents", response_model=List[Agent])
-async def get_agents(db=Depends(get_db)):
-    return await agent_service.get_agents(db)
+async def get_agents(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, AgentRecord, page, agent_serializer)
 
 @app.post("/api/agents", response_model=Agent)
 async def create_agent(agent: AgentCreate, db=Depends(get_db)):
-    return await agent_service.create_agent(db, agent)
+    created_agent = await agent_service.create_agent(db, agent)
+    agent_liveness.track(created_agent.id, created_agent.status)
+    await shared_state.changed("agents")
+    return created_agent
+
+@app.get("/api/agents/liveness/stats")
+async def get_agent_liveness_stats():
+    return agent_liveness.get_stats()
+
+@app.post("/api/agents/heartbeats")
+async def record_heartbeats(request: HeartbeatBatchRequest):
+    """
+    Record heartbeats for many agents at once (for collectors relaying a fleet).
+
+    Heartbeats only update memory; last_seen is written in batches every
+    AGENT_LIVENESS_FLUSH_SECONDS.
+
+    Returns:
+        dict: Number of heartbeats recorded and the ids of unknown agents
+    """
+    if len(request.agent_ids) > settings.AGENT_HEARTBEAT_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.AGENT_HEARTBEAT_MAX_BATCH} agents per request")
+    recorded, unknown = agent_liveness.heartbeat_many(request.agent_ids)
+    if unknown:
+        found = await agent_liveness.discover(unknown)
+        if found:
+            recorded += agent_liveness.heartbeat_many([agent_id for agent_id in unknown if agent_id in found])[0]
+            unknown = [agent_id for agent_id in unknown if agent_id not in found]
+    return {"recorded": recorded, "unknown": unknown}
+
+@app.post("/api/agents/{agent_id}/heartbeat")
+async def record_heartbeat(agent_id: int):
+    if not agent_liveness.is_known(agent_id) and not await agent_liveness.discover([agent_id]):
+        raise HTTPException(status_code=404, detail="Agent not found")
+    agent_liveness.heartbeat_many([agent_id])
+    return {"agent_id": agent_id, "status": agent_liveness.get_status(agent_id)}
 
 @app.get("/api/agents/{agent_id}", response_model=Agent)
-async def get_agent(agent_id: int, db=Depends(get_db)):
+async def get_agent(agent_id: int, request: Request, db=Depends(get_db)):
     agent = await agent_service.get_agent(db, agent_id)
     if not agent:
         raise HTTPException(status_code=404, detail="Agent not found")
-    return agent
+    return json_response(request, agent_serializer.one(agent))
 
 @app.put("/api/agents/{agent_id}", response_model=Agent)
 async def update_agent(agent_id: int, agent: AgentUpdate, db=Depends(get_db)):
     updated_agent = await agent_service.update_agent(db, agent_id, agent)
     if not updated_agent:
         raise HTTPException(status_code=404, detail="Agent not found")
+    agent_liveness.track(updated_agent.id, updated_agent.status)
+    await shared_state.changed("agents")
     return updated_agent
 
 @app.delete("/api/agents/{agent_id}")
@@ -351,29 +764,44 @@ async def delete_agent(agent_id: int, db=Depends(get_db)):
     success = await agent_service.delete_agent(db, agent_id)
     if not success:
         raise HTTPException(status_code=404, detail="Agent not found")
+    agent_liveness.forget(agent_id)
+    await shared_state.changed("agents")
     return {"message": "Agent deleted successfully"}
 
 # Playbooks
+def validate_playbook_steps(steps: Optional[List[Dict[str, Any]]]) -> None:
+    if steps is None:
+        return
+    try:
+        build_dag(steps)
+    except PlaybookDefinitionError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid playbook steps: {str(e)}")
+
 @app.get("/api/playbooks", response_model=List[Playbook])
-async def get_playbooks(db=Depends(get_db)):
-    return await playbook_service.get_playbooks(db)
+async def get_playbooks(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, PlaybookRecord, page, playbook_serializer)
 
 @app.post("/api/playbooks", response_model=Playbook)
 async def create_playbook(playbook: PlaybookCreate, db=Depends(get_db)):
-    return await playbook_service.create_playbook(db, playbook)
+    validate_playbook_steps(playbook.steps)
+    created_playbook = await playbook_service.create_playbook(db, playbook)
+    await shared_state.changed("playbooks")
+    return created_playbook
 
 @app.get("/api/playbooks/{playbook_id}", response_model=Playbook)
-async def get_playbook(playbook_id: int, db=Depends(get_db)):
-    playbook = await playbook_service.get_playbook(db, playbook_id)
+async def get_playbook(playbook_id: int, request: Request):
+    playbook = await playbook_cache.get(playbook_id)
     if not playbook:
         raise HTTPException(status_code=404, detail="Playbook not found")
-    return playbook
+    return json_response(request, playbook)
 
 @app.put("/api/playbooks/{playbook_id}", response_model=Playbook)
 async def update_playbook(playbook_id: int, playbook: PlaybookUpdate, db=Depends(get_db)):
+    validate_playbook_steps(getattr(playbook, "steps", None))
     updated_playbook = await playbook_service.update_playbook(db, playbook_id, playbook)
     if not updated_playbook:
         raise HTTPException(status_code=404, detail="Playbook not found")
+    await shared_state.changed("playbooks")
     return updated_playbook
 
 @app.delete("/api/playbooks/{playbook_id}")
@@ -381,53 +809,554 @@ async def delete_playbook(playbook_id: int, db=Depends(get_db)):
     success = await playbook_service.delete_playbook(db, playbook_id)
     if not success:
         raise HTTPException(status_code=404, detail="Playbook not found")
+    await shared_state.changed("playbooks")
     return {"message": "Playbook deleted successfully"}
 
 # Incidents
+def publish_incident(event_type: str, incident: Any) -> None:
+    """Push an incident change to the live feed subscribers."""
+    if not isinstance(incident, dict):
+        incident = incident_serializer.one(incident)
+    incident_feed.publish(event_type, incident, severity=incident.get("severity"), agent_id=incident.get("agent_id"))
+
+async def report_incident(db, incident: IncidentCreate) -> Dict[str, Any]:
+    """Tag, deduplicate and store an incident, then publish it to the live feed."""
+    if "mitre" not in incident.details:
+        incident.details = {
+            **incident.details,
+            "mitre": mitre_tagger.tag_incident(incident.title, incident.description, incident.details)
+        }
+    if "ip_intel" not in incident.details:
+        source_ip = next((incident.details[field] for field in SOURCE_IP_FIELDS if incident.details.get(field)), None)
+        tags = ip_intel.lookup(source_ip) if source_ip else {}
+        if tags:
+            incident.details = {**incident.details, "ip_intel": tags}
+    record, duplicate = await incident_correlator.submit(
+        db, incident, lambda: incident_service.create_incident(db, incident)
+    )
+    if not duplicate:
+        analytics_rollup.record(None, rollup_state(record))
+    publish_incident("updated" if duplicate else "created", record)
+    return record
+
 @app.get("/api/incidents", response_model=List[Incident])
-async def get_incidents(db=Depends(get_db)):
-    return await incident_service.get_incidents(db)
+async def get_incidents(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, IncidentRecord, page, incident_serializer)
 
 @app.post("/api/incidents", response_model=Incident)
 async def create_incident(incident: IncidentCreate, db=Depends(get_db)):
-    return await incident_service.create_incident(db, incident)
+    """
+    Report an incident.
 
-@app.get("/api/incidents/{incident_id}", response_model=Incident)
-async def get_incident(incident_id: int, db=Depends(get_db)):
+    A repeat of an open incident (same source, agent, MITRE techniques and
+    description up to ids, numbers and timestamps) is not stored again: the
+    existing incident is returned with its occurrence_count incremented.
+    New incidents are grouped into a case with recent incidents on the same
+    agent or source IP.
+    """
+    return await report_incident(db, incident)
+
+def anomaly_incident(anomaly: Dict[str, Any]) -> IncidentCreate:
+    entity_type, entity = anomaly["entity_type"], anomaly["entity"]
+    if entity_type == "rule":
+        rule = rule_engine.get_rule(entity)
+        label = f"rule '{rule.name if rule else entity}'"
+    elif entity_type == "ip":
+        label = f"source IP {entity}"
+    else:
+        label = f"agent {entity}"
+    event = anomaly["event"]
+    details = {"anomaly": {key: value for key, value in anomaly.items() if key != "event"}}
+    if entity_type == "ip":
+        details["source_ip"] = entity
+    if entity_type != "agent" and event.get("agent_id") is not None:
+        # The triggering event's agent is only an example of the IP's or rule's traffic
+        details["agent_id"] = event["agent_id"]
+    return IncidentCreate(
+        title=f"Anomalous event rate for {label}",
+        description=(
+            f"{anomaly['count']} events for {label} in {anomaly['bucket_seconds']} seconds, "
+            f"expected {anomaly['expected']} at this hour of the week (z-score {anomaly['z_score']})"
+        ),
+        severity=IncidentSeverity.CRITICAL if anomaly["z_score"] >= settings.ANOMALY_Z_CRITICAL else IncidentSeverity.HIGH,
+        status=IncidentStatus.OPEN,
+        source="anomaly_detector",
+        agent_id=str(entity) if entity_type == "agent" else None,
+        details=details
+    )
+
+async def raise_anomaly_incidents(anomalies: List[Dict[str, Any]]) -> None:
+    if not anomalies:
+        return
+    async with AsyncSessionLocal() as db:
+        for anomaly in anomalies:
+            try:
+                await report_incident(db, anomaly_incident(anomaly))
+            except Exception as e:
+                # The session is reused for the rest of the batch
+                await db.rollback()
+                print(f"Error raising incident for anomalous {anomaly['entity_type']} {anomaly['entity']}: {str(e)}")
+
+@app.get("/api/anomalies/stats")
+async def get_anomaly_stats():
+    return anomaly_detector.get_stats()
+
+@app.get("/api/anomalies/baseline")
+async def get_anomaly_baseline(
+    entity_type: str = Query(..., pattern="^(agent|ip|rule)$"),
+    entity: str = Query(...)
+):
+    """The learned event rate of an agent, source IP or rule."""
+    baseline = anomaly_detector.baseline(entity_type, entity)
+    if baseline is None:
+        raise HTTPException(status_code=404, detail="No baseline for this entity")
+    return baseline
+
+@app.get("/api/incidents/correlation/stats")
+async def get_incident_correlation_stats():
+    return incident_correlator.get_stats()
+
+# Analysis
+@app.get("/api/analysis/stats")
+async def get_analysis_stats():
+    return analysis_cache.get_stats()
+
+@app.post("/api/incidents/analyze")
+async def analyze_incidents(request: BatchAnalysisRequest, db=Depends(get_db)):
+    """
+    Analyze a batch of incidents.
+
+    Lookalike incidents share one cached analysis, so a storm of similar
+    incidents costs about one model call.
+
+    Returns:
+        dict: One result per incident id, in request order; unknown ids and
+            failed analyses are {"incident_id", "error"}
+    """
+    if len(request.incident_ids) > settings.ANALYSIS_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.ANALYSIS_MAX_BATCH} incidents per request")
+    records = (await db.execute(
+        select(IncidentRecord).where(IncidentRecord.id.in_(set(request.incident_ids)))
+    )).scalars().all()
+    by_id = {record.id: incident_serializer.one(record) for record in records}
+    found = [by_id[incident_id] for incident_id in request.incident_ids if incident_id in by_id]
+    analyses = iter(await analysis_cache.analyze_many(found, request.message))
+    return {"results": [
+        {"incident_id": incident_id, **next(analyses)} if incident_id in by_id
+        else {"incident_id": incident_id, "error": "Incident not found"}
+        for incident_id in request.incident_ids
+    ]}
+
+@app.post("/api/incidents/{incident_id}/analyze")
+async def analyze_incident(incident_id: int, request: AnalysisRequest, db=Depends(get_db)):
+    """Analyze an incident with the model, or return the cached analysis of a lookalike."""
     incident = await incident_service.get_incident(db, incident_id)
     if not incident:
         raise HTTPException(status_code=404, detail="Incident not found")
-    return incident
+    try:
+        result = await analysis_cache.analyze(incident_serializer.one(incident), request.message, refresh=request.refresh)
+    except AnalysisUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AnalysisError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    return {"incident_id": incident_id, **result}
+
+# Risk scoring
+RISK_COLUMNS = ("id", "severity", "agent_id", "details", "occurrence_count")
+
+async def load_risk_inputs(db, incident_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    table = IncidentRecord.__table__
+    rows = (await db.execute(
+        select(*(table.c[name] for name in RISK_COLUMNS)).where(table.c.id.in_(set(incident_ids)))
+    )).mappings().all()
+    return {row["id"]: dict(row) for row in rows}
+
+@app.post("/assess-risk")
+async def assess_risk(request: RiskAssessmentRequest, db=Depends(get_db)):
+    """Score one incident (the RiskAssessmentResponse of the frontend)."""
+    try:
+        incident_id = int(request.incidentId)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    incidents = await load_risk_inputs(db, [incident_id])
+    if incident_id not in incidents:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    result = risk_scorer.score([incidents[incident_id]], explain=False)[0]
+    return {
+        "success": True,
+        "incidentId": str(incident_id),
+        "riskScore": result["risk_score"],
+        "riskLevel": result["risk_level"],
+        "recommendations": result["recommendations"],
+    }
+
+@app.post("/api/risk/score")
+async def score_incidents(request: RiskScoreRequest, db=Depends(get_db)):
+    """
+    Score a batch of incidents in one vectorized pass.
+
+    Args:
+        request: Ids of stored incidents and/or inline incidents (severity,
+            agent_id, occurrence_count and details as stored)
+
+    Returns:
+        dict: One result per stored incident id, in request order (unknown
+            ids get an error), then one per inline incident
+    """
+    if len(request.incident_ids) + len(request.incidents) > settings.RISK_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.RISK_MAX_BATCH} incidents per request")
+    stored = await load_risk_inputs(db, request.incident_ids) if request.incident_ids else {}
+    found = [stored[incident_id] for incident_id in request.incident_ids if incident_id in stored]
+    scored = iter(risk_scorer.score(found + request.incidents, explain=request.explain))
+    results = [
+        {"incident_id": incident_id, **next(scored)} if incident_id in stored
+        else {"incident_id": incident_id, "error": "Incident not found"}
+        for incident_id in request.incident_ids
+    ]
+    results.extend(scored)
+    return {"results": results}
+
+@app.get("/api/risk/queue")
+async def get_risk_queue(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    min_score: float = Query(0.0, ge=0, le=100)
+):
+    """
+    Open incidents ranked by risk, highest first.
+
+    The ranking is kept up to date every RISK_REFRESH_SECONDS from the
+    incidents that changed since the previous refresh.
+    """
+    incidents, total = risk_scorer.ranked(limit, offset, min_score)
+    return {"incidents": incidents, "total": total, "refreshed_at": risk_scorer.refreshed_at}
+
+@app.get("/api/risk/stats")
+async def get_risk_stats():
+    return risk_scorer.get_stats()
+
+@app.get("/api/incidents/{incident_id}", response_model=Incident)
+async def get_incident(incident_id: int, request: Request, db=Depends(get_db)):
+    incident = await incident_service.get_incident(db, incident_id)
+    if not incident:
+        return await archived_record(request, "incidents", incident_id, incident_serializer, "Incident not found")
+    return json_response(request, incident_serializer.one(incident))
 
 @app.put("/api/incidents/{incident_id}", response_model=Incident)
 async def update_incident(incident_id: int, incident: IncidentUpdate, db=Depends(get_db)):
+    # Rollup dimensions before the update, which may modify the same object
+    existing = await incident_service.get_incident(db, incident_id)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    previous = rollup_state(existing)
+    if incident.status in RESOLVED_STATUSES and existing.resolved_at is None:
+        # Stamped on the loaded row so it is saved in the same commit as the status
+        existing.resolved_at = datetime.now(timezone.utc)
     updated_incident = await incident_service.update_incident(db, incident_id, incident)
     if not updated_incident:
         raise HTTPException(status_code=404, detail="Incident not found")
+    incident_correlator.refresh(updated_incident)
+    analytics_rollup.record(previous, rollup_state(updated_incident))
+    publish_incident("updated", updated_incident)
     return updated_incident
 
 @app.delete("/api/incidents/{incident_id}")
 async def delete_incident(incident_id: int, db=Depends(get_db)):
+    # Read first so the rollups and filtered feed subscribers can account for it
+    incident = await incident_service.get_incident(db, incident_id)
     success = await incident_service.delete_incident(db, incident_id)
     if not success:
         raise HTTPException(status_code=404, detail="Incident not found")
+    incident_correlator.forget(incident_id)
+    risk_scorer.remove([incident_id])
+    if incident:
+        analytics_rollup.record(rollup_state(incident), None)
+    incident_feed.publish(
+        "deleted",
+        {"id": incident_id},
+        severity=getattr(incident, "severity", None),
+        agent_id=getattr(incident, "agent_id", None)
+    )
     return {"message": "Incident deleted successfully"}
 
+# Retention
+async def archived_record(
+    request: Request,
+    table: str,
+    record_id: int,
+    serializer: RecordSerializer,
+    detail: str
+) -> Response:
+    """Answer a lookup the database missed from the archive, or 404."""
+    try:
+        record = await asyncio.to_thread(retention.get, table, record_id)
+    except (ArchiveError, OSError) as e:
+        print(f"Error reading archived {table} row {record_id}: {str(e)}")
+        record = None
+    if record is None:
+        raise HTTPException(status_code=404, detail=detail)
+    return json_response(request, serializer.row(record), headers={"X-Archived": "true"})
+
+@app.post("/api/retention/run")
+async def run_retention():
+    """
+    Archive the rows that are due now instead of waiting for the next
+    RETENTION_INTERVAL_SECONDS. Answers 409 while a run is in progress.
+    """
+    results = await retention.run_once()
+    if results is None:
+        raise HTTPException(status_code=409, detail="An archive run is already in progress")
+    return {"tables": results}
+
+@app.get("/api/retention/stats")
+async def get_retention_stats():
+    return retention.get_stats()
+
+# Analytics
+@app.get("/api/analytics")
+async def get_analytics(
+    granularity: str = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    agent_id: Optional[int] = None,
+    severity: Optional[str] = None
+):
+    """
+    Incident totals, breakdowns by severity, status and MITRE tactic, and a
+    time series, answered from the pre-aggregated rollups.
+
+    Without since/until the totals cover all time.
+    """
+    try:
+        return await analytics_rollup.query(granularity, since, until, agent_id, severity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Search
+@app.get("/api/search")
+async def search_incidents_and_alerts(
+    request: Request,
+    q: str,
+    kind: Optional[str] = None,
+    severity: Optional[str] = None,
+    status: Optional[str] = None,
+    agent_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    syntax: str = Query("simple", pattern="^(simple|fts)$")
+):
+    """
+    Full-text search over incident titles, descriptions, sources and details
+    and alert messages, best matches first.
+
+    Matched terms are wrapped in <mark> in the title and snippet. The first
+    page also returns facet counts per kind, severity and status. Pass the
+    X-Next-Cursor response header back as cursor for the next page. With
+    syntax=fts, q is an FTS5 query (phrases, OR, NOT, NEAR, prefix*).
+    Archived incidents and alerts are included, with archived set.
+    """
+    filters = {"kind": kind, "severity": severity, "status": status, "agent_id": agent_id}
+    try:
+        async with async_engine.connect() as conn:
+            results, next_cursor, facets = await search(conn, q, filters, limit, cursor, syntax, archive=retention.searchable)
+    except SearchUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except SearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    content = {"results": results}
+    if facets is not None:
+        content["facets"] = facets
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return json_response(request, content, headers=headers)
+
+# Live incident feed
+def parse_stream_filter(value: Optional[str]) -> Optional[List[str]]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else None
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID must be an integer")
+
+@app.get("/api/stream/incidents")
+async def stream_incidents(
+    severity: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-Sent Events feed of incident changes (created, updated, deleted).
+
+    severity and agent_id take comma-separated values to filter on.
+    Reconnecting clients resume after their Last-Event-ID; a "reset" event
+    means events were missed and the client should reload its list.
+    """
+    try:
+        subscriber = incident_feed.subscribe(
+            parse_stream_filter(severity),
+            parse_stream_filter(agent_id),
+            parse_last_event_id(last_event_id_header or last_event_id)
+        )
+    except StreamFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return StreamingResponse(
+        incident_feed.sse(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/stream/incidents")
+async def stream_incidents_ws(
+    websocket: WebSocket,
+    severity: Optional[str] = None,
+    agent_id: Optional[str] = None,
+    last_event_id: Optional[int] = None
+):
+    """WebSocket variant of the incident feed; each message is one event as JSON."""
+    try:
+        subscriber = incident_feed.subscribe(parse_stream_filter(severity), parse_stream_filter(agent_id), last_event_id)
+    except StreamFull:
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            batch = await subscriber.next_batch(settings.STREAM_KEEPALIVE_SECONDS)
+            if batch is None:
+                # Too slow to keep up; the client resumes from its last event id
+                await websocket.close(code=1013)
+                return
+            for event in batch:
+                await websocket.send_text(event.text)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        incident_feed.unsubscribe(subscriber)
+
+@app.get("/api/stream/stats")
+async def get_stream_stats():
+    return incident_feed.get_stats()
+
+# Cases
+@app.get("/api/cases")
+async def get_cases(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, CaseRecord, page, case_serializer)
+
+@app.get("/api/cases/{case_id}")
+async def get_case(case_id: int, request: Request, db=Depends(get_db)):
+    """Get a case with the first page of its incidents, newest first."""
+    case = await db.get(CaseRecord, case_id)
+    if not case:
+        raise HTTPException(status_code=404, detail="Case not found")
+    incidents = (await db.execute(
+        select(IncidentRecord)
+        .where(IncidentRecord.case_id == case_id)
+        .order_by(IncidentRecord.created_at.desc(), IncidentRecord.id.desc())
+        .limit(MAX_PAGE_SIZE)
+    )).scalars().all()
+    return json_response(request, {**case_serializer.one(case), "incidents": incident_serializer.many(incidents)})
+
+# MITRE ATT&CK tagging
+@app.post("/api/mitre/tag")
+async def tag_mitre(request: MitreTagRequest):
+    """
+    Tag a batch of texts (incident descriptions, raw log lines, ...) with
+    MITRE ATT&CK tactics and techniques.
+
+    Returns:
+        dict: One list of tags per input text, in input order
+    """
+    return {"results": mitre_tagger.tag_many(request.texts)}
+
+@app.post("/api/mitre/keywords")
+async def add_mitre_keywords(request: MitreKeywordsRequest):
+    """Add keywords for a technique to the tagger at runtime."""
+    added = mitre_tagger.add_keywords(request.tactic, request.technique, request.keywords)
+    return {"added": added, "keywords": mitre_tagger.keyword_count}
+
+# Shared state
+@app.get("/api/shared-state/stats")
+async def get_shared_state_stats():
+    """Generations loaded by this worker and read-through cache counters."""
+    return shared_state.get_stats()
+
+# Metrics
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request, query, Slack and queue metrics in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/profile", include_in_schema=False)
+async def profile_stacks(seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, ge=1)):
+    """
+    Sample the stacks of this process for a while (METRICS_PROFILER_ENABLED).
+
+    Returns:
+        Folded stacks with sample counts, for flamegraph.pl or speedscope
+    """
+    if not settings.METRICS_PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    if seconds > settings.METRICS_PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.METRICS_PROFILE_MAX_SECONDS} seconds")
+    stacks = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000)
+    return Response(content=stacks, media_type="text/plain")
+
+# IP intelligence
+@app.get("/api/ip-intel/stats")
+async def get_ip_intel_stats():
+    return ip_intel.get_stats()
+
+@app.post("/api/ip-intel/lookup")
+async def lookup_ips(request: IPLookupRequest):
+    """
+    Look up a batch of addresses in the IP intelligence lists.
+
+    Returns:
+        dict: One {list: label} dict per address, in input order
+    """
+    if len(request.ips) > settings.IP_INTEL_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {settings.IP_INTEL_MAX_BATCH} addresses per request")
+    return {"results": ip_intel.lookup_many(request.ips)}
+
+@app.post("/api/ip-intel/reload")
+async def reload_ip_intel():
+    """Reload the list files now instead of waiting for the watcher."""
+    try:
+        await ip_intel.reload()
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Error loading lists: {str(e)}")
+    return ip_intel.get_stats()
+
+@app.get("/api/ip-intel/{ip}")
+async def lookup_ip(ip: str):
+    """The lists containing an address, with each list's label for it."""
+    if parse_ip(ip) is None:
+        raise HTTPException(status_code=400, detail="Not an IP address")
+    return {"ip": ip, "lists": ip_intel.lookup(ip)}
+
 # Tasks
 @app.get("/api/tasks", response_model=List[Task])
-async def get_tasks(db=Depends(get_db)):
-    return await task_service.get_tasks(db)
+async def get_tasks(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, TaskRecord, page, task_serializer)
 
 @app.post("/api/tasks", response_model=Task)
 async def create_task(task: TaskCreate, db=Depends(get_db)):
-    return await task_service.create_task(db, task)
+    created = await task_service.create_task(db, task)
+    task_scheduler.notify()
+    return created
+
+@app.get("/api/tasks/scheduler/stats")
+async def get_task_scheduler_stats():
+    return task_scheduler.get_stats()
 
 @app.get("/api/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: int, db=Depends(get_db)):
+async def get_task(task_id: int, request: Request, db=Depends(get_db)):
     task = await task_service.get_task(db, task_id)
     if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
-    return task
+        return await archived_record(request, "tasks", task_id, task_serializer, "Task not found")
+    return json_response(request, task_serializer.one(task))
 
 @app.put("/api/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: int, task: TaskUpdate, db=Depends(get_db)):
@@ -441,29 +1370,72 @@ async def delete_task(task_id: int, db=Depends(get_db)):
     success = await task_service.delete_task(db, task_id)
     if not success:
         raise HTTPException(status_code=404, detail="Task not found")
+    if not task_scheduler.cancel(task_id):
+        playbook_engine.cancel(task_id)
     return {"message": "Task deleted successfully"}
 
+@app.post("/api/tasks/{task_id}/run", status_code=202)
+async def run_task(task_id: int, db=Depends(get_db)):
+    """
+    Run the task's playbook now instead of waiting for its turn in the queue.
+
+    Steps run as a DAG: a step starts once the steps in its depends_on have
+    completed, and independent steps run concurrently. Progress is written
+    to the task's status, started_at, completed_at and result as it happens.
+    """
+    task = await db.get(TaskRecord, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    playbook = await db.get(PlaybookRecord, task.playbook_id) if task.playbook_id else None
+    if not playbook:
+        raise HTTPException(status_code=400, detail="Task has no playbook")
+    validate_playbook_steps(playbook.steps)
+    if not await task_scheduler.run_now(task.id):
+        raise HTTPException(status_code=409, detail=f"Task {task.id} is not pending")
+    return {"task_id": task.id, "status": "running"}
+
+@app.post("/api/tasks/{task_id}/cancel")
+async def cancel_task(task_id: int):
+    if not (task_scheduler.cancel(task_id) or playbook_engine.cancel(task_id)):
+        raise HTTPException(status_code=404, detail="Task is not running")
+    return {"task_id": task_id, "status": "cancelling"}
+
 # Rules
+def validate_rule_conditions(conditions: Optional[Dict[str, Any]]) -> None:
+    if conditions is None:
+        return
+    try:
+        CompiledRule("validation", "validation", 0, conditions, [])
+    except RuleCompileError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid rule conditions: {str(e)}")
+
 @app.get("/api/rules", response_model=List[Rule])
-async def get_rules(db=Depends(get_db)):
-    return await rule_service.get_rules(db)
+async def get_rules(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, RuleRecord, page, rule_serializer)
 
 @app.post("/api/rules", response_model=Rule)
 async def create_rule(rule: RuleCreate, db=Depends(get_db)):
-    return await rule_service.create_rule(db, rule)
+    validate_rule_conditions(rule.conditions)
+    db_rule = await rule_service.create_rule(db, rule)
+    rule_engine.load_rule(db_rule)
+    await shared_state.changed("rules")
+    return db_rule
 
 @app.get("/api/rules/{rule_id}", response_model=Rule)
-async def get_rule(rule_id: int, db=Depends(get_db)):
-    rule = await rule_service.get_rule(db, rule_id)
+async def get_rule(rule_id: int, request: Request):
+    rule = await rule_cache.get(rule_id)
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
-    return rule
+    return json_response(request, rule)
 
 @app.put("/api/rules/{rule_id}", response_model=Rule)
 async def update_rule(rule_id: int, rule: RuleUpdate, db=Depends(get_db)):
+    validate_rule_conditions(getattr(rule, "conditions", None))
     updated_rule = await rule_service.update_rule(db, rule_id, rule)
     if not updated_rule:
         raise HTTPException(status_code=404, detail="Rule not found")
+    rule_engine.load_rule(updated_rule)
+    await shared_state.changed("rules")
     return updated_rule
 
 @app.delete("/api/rules/{rule_id}")
@@ -471,22 +1443,163 @@ async def delete_rule(rule_id: int, db=Depends(get_db)):
     success = await rule_service.delete_rule(db, rule_id)
     if not success:
         raise HTTPException(status_code=404, detail="Rule not found")
+    rule_engine.remove_rule(str(rule_id))
+    await shared_state.changed("rules")
     return {"message": "Rule deleted successfully"}
 
+@app.post("/api/rules/evaluate")
+async def evaluate_rules(request: RuleEvaluationRequest):
+    """
+    Evaluate an event against the active rules.
+
+    Args:
+        request: The event to evaluate, and whether to dispatch the actions
+            of the matching rules; without dispatch it is a dry run that
+            does not count the event towards any threshold
+
+    Returns:
+        dict: The matching rules and their actions
+    """
+    await shared_state.sync("rules")
+    if request.dispatch:
+        matches = await rule_engine.process(request.event)
+    else:
+        matches = rule_engine.evaluate(request.event, count=False)
+    return {"matches": [match.to_dict() for match in matches]}
+
+@app.post("/api/rules/backtest")
+async def backtest_rules(request: BacktestRequest, wait: bool = False, db=Depends(get_db)):
+    """
+    Replay a time range of stored events or incidents through a rule set.
+
+    Args:
+        request: The range (by creation time), the source, stored rules by
+            id and candidate rules (a candidate with the id of a stored rule
+            stands in for it), and the sample hits to keep per rule
+        wait: Run the backtest now and return its result, instead of
+            queueing it as a task (HTTP 202); the task's result holds the
+            same once it completed
+
+    Returns:
+        dict: Per rule the matches, matches per hour and sample hits
+            (wait), or the id of the queued task
+    """
+    # Naive times are UTC
+    start, end = (value if value.tzinfo else value.replace(tzinfo=timezone.utc) for value in (request.start, request.end))
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > timedelta(days=settings.BACKTEST_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"At most {settings.BACKTEST_MAX_DAYS} days per backtest")
+    if request.source not in ("events", "incidents"):
+        raise HTTPException(status_code=400, detail="source must be events or incidents")
+    if not 0 <= request.samples <= settings.BACKTEST_MAX_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"samples must be between 0 and {settings.BACKTEST_MAX_SAMPLES}")
+    rules: Dict[str, Dict[str, Any]] = {}
+    if request.rule_ids:
+        stored = (await db.execute(select(RuleRecord).where(RuleRecord.id.in_(set(request.rule_ids))))).scalars().all()
+        missing = set(request.rule_ids) - {rule.id for rule in stored}
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Rules not found: {', '.join(map(str, sorted(missing)))}")
+        for rule in stored:
+            rules[str(rule.id)] = {"id": str(rule.id), "name": rule.name, "conditions": rule.conditions, "actions": rule.actions or []}
+    for index, candidate in enumerate(request.rules, start=1):
+        validate_rule_conditions(candidate.conditions)
+        rule_id = candidate.id or f"candidate-{index}"
+        rules[rule_id] = {"id": rule_id, "name": candidate.name or rule_id, "conditions": candidate.conditions, "actions": candidate.actions}
+    if not rules:
+        raise HTTPException(status_code=400, detail="No rules to backtest")
+    if len(rules) > settings.BACKTEST_MAX_RULES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BACKTEST_MAX_RULES} rules per backtest")
+    backtest = {
+        "rules": list(rules.values()),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "source": request.source,
+        "samples": request.samples,
+    }
+    if wait:
+        return await rule_backtester.run(**backtest)
+
+    async with async_engine.begin() as conn:
+        result = await conn.execute(TaskRecord.__table__.insert().values(
+            name="Rule backtest",
+            description=f"Backtest {len(rules)} rules on {request.source} from {backtest['start']} to {backtest['end']}",
+            status="pending",
+            priority="low",
+            parameters={"handler": "rule_backtest", "backtest": backtest}
+        ))
+    task_scheduler.notify()
+    return JSONResponse(status_code=202, content={"task_id": result.inserted_primary_key[0], "status": "pending"})
+
+@app.get("/api/rules/backtest/stats")
+async def get_backtest_stats():
+    return rule_backtester.get_stats()
+
+# Event ingestion
+@app.post("/api/ingest", status_code=202)
+async def ingest_events(request: Request, source: Optional[str] = None):
+    """
+    Ingest newline-delimited JSON events in bulk.
+
+    The body is parsed as it streams in and may be gzip-compressed
+    (Content-Encoding: gzip). Events are queued and written in batches in
+    the background, and evaluated against the active rules on the way.
+    Invalid lines are skipped and reported.
+
+    Args:
+        request: The request whose body holds one JSON event per line
+        source: Default source for events that do not name one
+
+    Returns:
+        dict: Number of accepted and rejected events and the first parse errors
+    """
+    gzip = "gzip" in request.headers.get("content-encoding", "").lower()
+    decoder = NDJSONDecoder(gzip=gzip)
+    accepted = 0
+    try:
+        async for chunk in request.stream():
+            events = decoder.feed(chunk)
+            await ingestion.submit(events, source)
+            accepted += len(events)
+        events = decoder.close()
+        await ingestion.submit(events, source)
+        accepted += len(events)
+    except IngestBodyTooLarge as e:
+        raise HTTPException(status_code=413, detail={"message": str(e), "accepted": accepted})
+    except IngestError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "accepted": accepted})
+    except IngestQueueFull as e:
+        # Events before the failing chunk are queued; the client resends from there
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": "1"},
+            content={"detail": str(e), "accepted": accepted, "rejected": decoder.error_count}
+        )
+    return {"accepted": accepted, "rejected": decoder.error_count, "errors": decoder.errors}
+
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+    return dict(ingestion.stats, pending=ingestion.pending)
+
+@app.get("/api/syslog/stats")
+async def get_syslog_stats():
+    """Per-source received, parse error and drop counters of the syslog receiver."""
+    return syslog_receiver.stats()
+
 # Alerts
 @app.get("/api/alerts", response_model=List[Alert])
-async def get_alerts(db=Depends(get_db)):
-    return await alert_service.get_alerts(db)
+async def get_alerts(request: Request, page: PageQuery = Depends(), db=Depends(get_db)):
+    return await list_page(request, db, SecurityAlert, page, alert_serializer)
 
 @app.post("/api/alerts", response_model=Alert)
 async def create_alert(alert: AlertCreate, db=Depends(get_db)):
     return await alert_service.create_alert(db, alert)
 
 @app.get("/api/alerts/{alert_id}", response_model=Alert)
-async def get_alert(alert_id: int, db=Depends(get_db)):
+async def get_alert(alert_id: int, request: Request, db=Depends(get_db)):
     alert = await alert_service.get_alert(db, alert_id)
     if not alert:
-        raise HTTPException(status_code=404, detail="Alert not found")
+        return await archived_record(request, "security_alerts", alert_id, alert_serializer, "Alert not found")
     return alert
 
 @app.put("/api/alerts/{alert_id}", response_model=Alert)
@@ -504,16 +1617,21 @@ async def delete_alert(alert_id: int, db=Depends(get_db)):
     return {"message": "Alert deleted successfully"}
 
 @app.post("/api/alerts/slack")
-async def send_slack_alert(alert: AlertRequest):
+async def send_slack_alert(alert: AlertRequest, wait: bool = True):
     """
     Send a notification to Slack.
     
     Args:
         alert: AlertRequest containing message, channel, type, and severity
+        wait: If False, queue the message for batched background delivery
+            and return a delivery id immediately (HTTP 202)
         
     Returns:
         dict: Response indicating success or failure
     """
+    if not wait:
+        return enqueue_slack_delivery(alert.message, alert.channel, alert.type, alert.severity)
+
     success = await slack_service.send_message(
         message=alert.message,
         channel=alert.channel,
@@ -529,6 +1647,18 @@ async def send_slack_alert(alert: AlertRequest):
     
     return {"status": "success", "message": "Notification sent successfully"}
 
+@app.get("/api/slack/deliveries/{delivery_id}")
+async def get_slack_delivery(delivery_id: str):
+    """
+    Get the status of a queued Slack delivery.
+
+    Status is one of queued, sending, sent or failed.
+    """
+    delivery = slack_delivery.get_delivery(delivery_id)
+    if not delivery:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    return delivery
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
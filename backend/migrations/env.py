@@ -0,0 +1,46 @@
+"""
+Alembic environment.
+
+Migrations run on the synchronous engine from database.py, so they use
+settings.DATABASE_URL and the same SQLite pragmas as the API. SQLite
+cannot alter most constraints in place, so migrations are rendered in
+batch mode (the table is copied).
+"""
+from alembic import context
+from config import settings
+from database import Base, engine
+from services.search import SEARCH_TABLE
+import models  # noqa: F401 - registers every table on Base.metadata
+
+def include_object(object, name, type_, reflected, compare_to):
+    # The full-text index and its shadow tables are created by services/search.py
+    if type_ == "table" and reflected and compare_to is None:
+        return not name.startswith(SEARCH_TABLE)
+    return True
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=settings.DATABASE_URL,
+        target_metadata=Base.metadata,
+        literal_binds=True,
+        render_as_batch=True,
+        include_object=include_object,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online() -> None:
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=Base.metadata,
+            render_as_batch=True,
+            include_object=include_object,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
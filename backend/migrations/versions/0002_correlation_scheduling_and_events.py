@@ -0,0 +1,242 @@
+"""Incident correlation, task leases, events, rules and analytics
+
+Adds the columns, tables and indexes that were only created by
+create_all on new databases, and gives existing tasks a schedule_key so
+they keep their place in the claim order.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 09:30:00
+"""
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+from config import settings
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def backfill_schedule_keys() -> None:
+    """Key existing tasks like models.task.schedule_key would have when they were created."""
+    tasks = sa.table(
+        "tasks",
+        sa.column("id", sa.Integer()),
+        sa.column("priority", sa.String()),
+        sa.column("created_at", sa.DateTime(timezone=True)),
+        sa.column("schedule_key", sa.Float()),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(tasks.c.id, tasks.c.priority, tasks.c.created_at)).all()
+    now = datetime.now(timezone.utc).timestamp()
+    keys = []
+    for task_id, priority, created_at in rows:
+        if created_at is not None and created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        created = created_at.timestamp() if created_at is not None else now
+        keys.append({"task_id": task_id, "key": created - settings.TASK_PRIORITY_HEAD_START.get(priority or "medium", 0.0)})
+    if keys:
+        bind.execute(tasks.update().where(tasks.c.id == sa.bindparam("task_id")).values(schedule_key=sa.bindparam("key")), keys)
+
+def upgrade() -> None:
+    op.create_table(
+        "events",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("event_type", sa.String(), nullable=True),
+        sa.Column("source", sa.String(), nullable=True),
+        sa.Column("severity", sa.String(), nullable=True),
+        sa.Column("agent_id", sa.String(), nullable=True),
+        sa.Column("source_ip", sa.String(), nullable=True),
+        sa.Column("message", sa.String(), nullable=True),
+        sa.Column("data", sa.JSON(), nullable=True),
+        sa.Column("occurred_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.PrimaryKeyConstraint("id")
+    )
+    with op.batch_alter_table("events", schema=None) as batch_op:
+        batch_op.create_index("ix_events_created_at_id", ["created_at", "id"], unique=False)
+        batch_op.create_index("ix_events_source_ip_created_at", ["source_ip", "created_at"], unique=False)
+
+    op.create_table(
+        "incident_analyses",
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("fingerprint", sa.String(), nullable=False),
+        sa.Column("prompt_version", sa.String(), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.Float(), nullable=False),
+        sa.Column("expires_at", sa.Float(), nullable=False),
+        sa.Column("last_used_at", sa.Float(), nullable=False),
+        sa.Column("hits", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("key")
+    )
+    with op.batch_alter_table("incident_analyses", schema=None) as batch_op:
+        batch_op.create_index("ix_incident_analyses_expires_at", ["expires_at"], unique=False)
+        batch_op.create_index("ix_incident_analyses_last_used_at", ["last_used_at"], unique=False)
+
+    op.create_table(
+        "incident_cases",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(), nullable=False),
+        sa.Column("severity", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("incident_count", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id")
+    )
+    with op.batch_alter_table("incident_cases", schema=None) as batch_op:
+        batch_op.create_index("ix_incident_cases_created_at_id", ["created_at", "id"], unique=False)
+        batch_op.create_index(batch_op.f("ix_incident_cases_id"), ["id"], unique=False)
+        batch_op.create_index("ix_incident_cases_status_created_at_id", ["status", "created_at", "id"], unique=False)
+
+    op.create_table(
+        "incident_rollups",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("granularity", sa.String(), nullable=False),
+        sa.Column("bucket", sa.Integer(), nullable=False),
+        sa.Column("severity", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("agent_id", sa.Integer(), nullable=False),
+        sa.Column("tactic", sa.String(), nullable=False),
+        sa.Column("incident_count", sa.Integer(), nullable=False),
+        sa.Column("resolved_count", sa.Integer(), nullable=False),
+        sa.Column("resolution_seconds", sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("granularity", "bucket", "severity", "status", "agent_id", "tactic", name="uq_incident_rollups_cell")
+    )
+    with op.batch_alter_table("incident_rollups", schema=None) as batch_op:
+        batch_op.create_index("ix_incident_rollups_granularity_tactic_bucket", ["granularity", "tactic", "bucket"], unique=False)
+
+    op.create_table(
+        "rules",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("rule_type", sa.String(), nullable=False),
+        sa.Column("conditions", sa.JSON(), nullable=False),
+        sa.Column("actions", sa.JSON(), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id")
+    )
+    with op.batch_alter_table("rules", schema=None) as batch_op:
+        batch_op.create_index("ix_rules_created_at_id", ["created_at", "id"], unique=False)
+        batch_op.create_index(batch_op.f("ix_rules_id"), ["id"], unique=False)
+
+    op.create_table(
+        "slack_notifications",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("message", sa.String(), nullable=False),
+        sa.Column("channel", sa.String(), nullable=True),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("severity", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id")
+    )
+    with op.batch_alter_table("slack_notifications", schema=None) as batch_op:
+        batch_op.create_index(batch_op.f("ix_slack_notifications_id"), ["id"], unique=False)
+
+    with op.batch_alter_table("incidents", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("fingerprint", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("occurrence_count", sa.Integer(), server_default="1", nullable=False))
+        batch_op.add_column(sa.Column("last_seen_at", sa.DateTime(timezone=True), nullable=True))
+        batch_op.add_column(sa.Column("case_id", sa.Integer(), nullable=True))
+        batch_op.create_index("ix_incidents_agent_id_created_at_id", ["agent_id", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_incidents_agent_id_status_created_at_id", ["agent_id", "status", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_incidents_case_id", ["case_id"], unique=False)
+        batch_op.create_index("ix_incidents_created_at_id", ["created_at", "id"], unique=False)
+        batch_op.create_index("ix_incidents_fingerprint_status", ["fingerprint", "status"], unique=False)
+        batch_op.create_index("ix_incidents_severity_created_at_id", ["severity", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_incidents_status_created_at_id", ["status", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_incidents_status_severity_created_at_id", ["status", "severity", "created_at", "id"], unique=False)
+        batch_op.create_foreign_key("fk_incidents_case_id_incident_cases", "incident_cases", ["case_id"], ["id"])
+
+    with op.batch_alter_table("security_alerts", schema=None) as batch_op:
+        batch_op.create_index("ix_security_alerts_created_at_id", ["created_at", "id"], unique=False)
+        batch_op.create_index("ix_security_alerts_severity_created_at_id", ["severity", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_security_alerts_status_created_at_id", ["status", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_security_alerts_status_severity_created_at_id", ["status", "severity", "created_at", "id"], unique=False)
+
+    with op.batch_alter_table("tasks", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("schedule_key", sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column("not_before", sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column("attempts", sa.Integer(), server_default="0", nullable=False))
+        batch_op.add_column(sa.Column("lease_owner", sa.String(), nullable=True))
+        batch_op.add_column(sa.Column("lease_expires_at", sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column("last_error", sa.String(), nullable=True))
+        batch_op.create_index("ix_tasks_agent_id_created_at_id", ["agent_id", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_tasks_agent_id_status_created_at_id", ["agent_id", "status", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_tasks_created_at_id", ["created_at", "id"], unique=False)
+        batch_op.create_index("ix_tasks_status_created_at_id", ["status", "created_at", "id"], unique=False)
+        batch_op.create_index("ix_tasks_status_lease_expires_at", ["status", "lease_expires_at"], unique=False)
+        batch_op.create_index("ix_tasks_status_schedule_key", ["status", "schedule_key"], unique=False)
+    backfill_schedule_keys()
+
+def downgrade() -> None:
+    with op.batch_alter_table("tasks", schema=None) as batch_op:
+        batch_op.drop_index("ix_tasks_status_schedule_key")
+        batch_op.drop_index("ix_tasks_status_lease_expires_at")
+        batch_op.drop_index("ix_tasks_status_created_at_id")
+        batch_op.drop_index("ix_tasks_created_at_id")
+        batch_op.drop_index("ix_tasks_agent_id_status_created_at_id")
+        batch_op.drop_index("ix_tasks_agent_id_created_at_id")
+        batch_op.drop_column("last_error")
+        batch_op.drop_column("lease_expires_at")
+        batch_op.drop_column("lease_owner")
+        batch_op.drop_column("attempts")
+        batch_op.drop_column("not_before")
+        batch_op.drop_column("schedule_key")
+
+    with op.batch_alter_table("security_alerts", schema=None) as batch_op:
+        batch_op.drop_index("ix_security_alerts_status_severity_created_at_id")
+        batch_op.drop_index("ix_security_alerts_status_created_at_id")
+        batch_op.drop_index("ix_security_alerts_severity_created_at_id")
+        batch_op.drop_index("ix_security_alerts_created_at_id")
+
+    with op.batch_alter_table("incidents", schema=None) as batch_op:
+        batch_op.drop_constraint("fk_incidents_case_id_incident_cases", type_="foreignkey")
+        batch_op.drop_index("ix_incidents_status_severity_created_at_id")
+        batch_op.drop_index("ix_incidents_status_created_at_id")
+        batch_op.drop_index("ix_incidents_severity_created_at_id")
+        batch_op.drop_index("ix_incidents_fingerprint_status")
+        batch_op.drop_index("ix_incidents_created_at_id")
+        batch_op.drop_index("ix_incidents_case_id")
+        batch_op.drop_index("ix_incidents_agent_id_status_created_at_id")
+        batch_op.drop_index("ix_incidents_agent_id_created_at_id")
+        batch_op.drop_column("case_id")
+        batch_op.drop_column("last_seen_at")
+        batch_op.drop_column("occurrence_count")
+        batch_op.drop_column("fingerprint")
+
+    with op.batch_alter_table("slack_notifications", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_slack_notifications_id"))
+
+    op.drop_table("slack_notifications")
+    with op.batch_alter_table("rules", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_rules_id"))
+        batch_op.drop_index("ix_rules_created_at_id")
+
+    op.drop_table("rules")
+    with op.batch_alter_table("incident_rollups", schema=None) as batch_op:
+        batch_op.drop_index("ix_incident_rollups_granularity_tactic_bucket")
+
+    op.drop_table("incident_rollups")
+    with op.batch_alter_table("incident_cases", schema=None) as batch_op:
+        batch_op.drop_index("ix_incident_cases_status_created_at_id")
+        batch_op.drop_index(batch_op.f("ix_incident_cases_id"))
+        batch_op.drop_index("ix_incident_cases_created_at_id")
+
+    op.drop_table("incident_cases")
+    with op.batch_alter_table("incident_analyses", schema=None) as batch_op:
+        batch_op.drop_index("ix_incident_analyses_last_used_at")
+        batch_op.drop_index("ix_incident_analyses_expires_at")
+
+    op.drop_table("incident_analyses")
+    with op.batch_alter_table("events", schema=None) as batch_op:
+        batch_op.drop_index("ix_events_source_ip_created_at")
+        batch_op.drop_index("ix_events_created_at_id")
+
+    op.drop_table("events")
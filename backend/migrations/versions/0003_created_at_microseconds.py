@@ -0,0 +1,31 @@
+"""Store every SQLite created_at with microseconds
+
+Rows inserted through CURRENT_TIMESTAMP lack the fraction that rows
+written by SQLAlchemy have, so their text did not sort like their time
+against rows of the same second and did not compare equal to bound
+datetimes. Keyset cursors compare the text (see services/pagination.py).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-16 10:00:00
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+TABLES = ("agents", "playbooks", "incidents", "tasks", "rules", "events", "incident_cases", "slack_notifications")
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    for table in TABLES:
+        op.execute(
+            f"UPDATE {table} SET created_at = replace(created_at, 'T', ' ') || '.000000' "
+            "WHERE length(created_at) = 19"
+        )
+
+def downgrade() -> None:
+    pass
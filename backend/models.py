@@ -1,31 +0,0 @@
-from sqlalchemy import Column, Integer, String, DateTime, Enum as SQLEnum
-from sqlalchemy.ext.declarative import declarative_base
-from datetime import datetime
-import enum
-
-Base = declarative_base()
-
-class AlertType(str, enum.Enum):
-    INTRUSION = "intrusion"
-    MALWARE = "malware"
-    UNAUTHORIZED_ACCESS = "unauthorized_access"
-    DATA_BREACH = "data_breach"
-    SYSTEM_FAILURE = "system_failure"
-
-class SeverityLevel(str, enum.Enum):
-    LOW = "low"
-    MEDIUM = "medium"
-    HIGH = "high"
-    CRITICAL = "critical"
-
-class SecurityAlert(Base):
-    __tablename__ = "security_alerts"
-
-    id = Column(Integer, primary_key=True, index=True)
-    message = Column(String, nullable=False)
-    alert_type = Column(SQLEnum(AlertType), nullable=False)
-    severity = Column(SQLEnum(SeverityLevel), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    slack_message_id = Column(String, nullable=True)
-    status = Column(String, default="pending") 
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+Database models.
+
+Every model module is imported here so the relationships between them
+resolve whichever model is used first.
+"""
+from models.agent import Agent
+from models.alert import AlertType, SecurityAlert, SeverityLevel
+from models.analysis import IncidentAnalysis
+from models.analytics import IncidentRollup
+from models.case import IncidentCase
+from models.event import Event
+from models.incident import Incident
+from models.playbook import Playbook
+from models.rule import Rule
+from models.slack_notification import SlackNotificationRecord
+from models.task import Task
@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from ..database import Base
+from database import Base, utc_now
 
 class Agent(Base):
     __tablename__ = "agents"
@@ -14,8 +14,9 @@ class Agent(Base):
     last_seen = Column(DateTime(timezone=True))
     is_active = Column(Boolean, default=True)
     configuration = Column(JSON)  # Agent-specific configuration
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
-    incidents = relationship("Incident", back_populates="agent") 
\ No newline at end of file
+    incidents = relationship("Incident", back_populates="agent")
+    tasks = relationship("Task", back_populates="agent")
\ No newline at end of file
@@ -0,0 +1,62 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index, Enum as SQLEnum
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+from typing import Optional
+import enum
+from database import Base
+
+class AlertType(str, enum.Enum):
+    INTRUSION = "intrusion"
+    MALWARE = "malware"
+    UNAUTHORIZED_ACCESS = "unauthorized_access"
+    DATA_BREACH = "data_breach"
+    SYSTEM_FAILURE = "system_failure"
+
+class SeverityLevel(str, enum.Enum):
+    LOW = "low"
+    MEDIUM = "medium"
+    HIGH = "high"
+    CRITICAL = "critical"
+
+class SecurityAlert(Base):
+    __tablename__ = "security_alerts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message = Column(String, nullable=False)
+    alert_type = Column(SQLEnum(AlertType), nullable=False)
+    severity = Column(SQLEnum(SeverityLevel), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    slack_message_id = Column(String, nullable=True)
+    status = Column(String, default="pending")
+
+    # Keyset pagination indexes, one per list filter combination
+    __table_args__ = (
+        Index("ix_security_alerts_created_at_id", "created_at", "id"),
+        Index("ix_security_alerts_severity_created_at_id", "severity", "created_at", "id"),
+        Index("ix_security_alerts_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_security_alerts_status_severity_created_at_id", "status", "severity", "created_at", "id"),
+    ) 
+
+class AlertBase(BaseModel):
+    message: str
+    alert_type: AlertType
+    severity: SeverityLevel
+    status: str = "pending"
+
+class AlertCreate(AlertBase):
+    pass
+
+class AlertUpdate(BaseModel):
+    message: Optional[str] = None
+    alert_type: Optional[AlertType] = None
+    severity: Optional[SeverityLevel] = None
+    status: Optional[str] = None
+
+class Alert(AlertBase):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    slack_message_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Float, JSON, Index
+from database import Base
+
+class IncidentAnalysis(Base):
+    """
+    A cached model analysis, keyed by incident fingerprint and prompt version.
+
+    Times are epoch seconds. last_used_at drives LRU eviction once the
+    cache holds more than ANALYSIS_CACHE_MAX_ENTRIES rows.
+    """
+    __tablename__ = "incident_analyses"
+
+    key = Column(String, primary_key=True)  # Hash of prompt version and fingerprint
+    fingerprint = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    result = Column(JSON, nullable=False)
+    created_at = Column(Float, nullable=False)
+    expires_at = Column(Float, nullable=False)
+    last_used_at = Column(Float, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_incident_analyses_last_used_at", "last_used_at"),
+        Index("ix_incident_analyses_expires_at", "expires_at"),
+    )
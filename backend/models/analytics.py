@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, Float, Index, UniqueConstraint
+from database import Base
+
+class IncidentRollup(Base):
+    """
+    Incident counts pre-aggregated per time bucket and dimension.
+
+    Incidents are counted in the bucket of their creation time, under
+    their current severity and status, so a status change moves one
+    incident between two rows of the same bucket. granularity "all" has a
+    single bucket (0) holding the all-time totals. Each incident is counted
+    once under tactic "*" and once under each MITRE tactic it was tagged
+    with; agent_id 0 stands for incidents without an agent.
+    """
+    __tablename__ = "incident_rollups"
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String, nullable=False)  # minute, hour, day, all
+    bucket = Column(Integer, nullable=False)  # Bucket start, epoch seconds
+    severity = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    agent_id = Column(Integer, nullable=False, default=0)
+    tactic = Column(String, nullable=False, default="*")
+    incident_count = Column(Integer, nullable=False, default=0)
+    resolved_count = Column(Integer, nullable=False, default=0)  # Incidents with a resolution time
+    resolution_seconds = Column(Float, nullable=False, default=0.0)  # Sum of their resolution times
+
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket", "severity", "status", "agent_id", "tactic", name="uq_incident_rollups_cell"),
+        Index("ix_incident_rollups_granularity_tactic_bucket", "granularity", "tactic", "bucket"),
+    )
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from database import Base, utc_now
+
+class IncidentCase(Base):
+    __tablename__ = "incident_cases"
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String, nullable=False)  # Title of the incident that opened the case
+    severity = Column(String, nullable=False)  # Highest severity of its incidents
+    status = Column(String, nullable=False)  # open, in_progress, resolved, closed
+    incident_count = Column(Integer, nullable=False, default=1)
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Relationships
+    incidents = relationship("Incident", back_populates="case")
+
+    __table_args__ = (
+        Index("ix_incident_cases_created_at_id", "created_at", "id"),
+        Index("ix_incident_cases_status_created_at_id", "status", "created_at", "id"),
+    )
\ No newline at end of file
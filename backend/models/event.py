@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from database import Base, utc_now
+
+class Event(Base):
+    __tablename__ = "events"
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String)
+    source = Column(String)  # Log source the event came from (syslog, edr, ...)
+    severity = Column(String)
+    agent_id = Column(String)  # As reported by the sender, not necessarily a known agent
+    source_ip = Column(String)
+    message = Column(String)
+    data = Column(JSON)  # The full event as received
+    occurred_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_events_created_at_id", "created_at", "id"),
+        Index("ix_events_source_ip_created_at", "source_ip", "created_at"),
+    )
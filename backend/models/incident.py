@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from ..database import Base
+from database import Base, utc_now
 
 class Incident(Base):
     __tablename__ = "incidents"
@@ -14,9 +14,27 @@ class Incident(Base):
     source = Column(String)  # Where the incident was detected
     agent_id = Column(Integer, ForeignKey("agents.id"))
     details = Column(JSON)  # Additional incident details
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     resolved_at = Column(DateTime(timezone=True))
+    fingerprint = Column(String)  # Identifies duplicates, see services/incident_correlation.py
+    occurrence_count = Column(Integer, nullable=False, default=1, server_default="1")
+    last_seen_at = Column(DateTime(timezone=True))  # Time of the latest duplicate
+    case_id = Column(Integer, ForeignKey("incident_cases.id"))
 
     # Relationships
-    agent = relationship("Agent", back_populates="incidents") 
\ No newline at end of file
+    agent = relationship("Agent", back_populates="incidents")
+    case = relationship("IncidentCase", back_populates="incidents")
+
+    # Keyset pagination indexes, one per list filter combination
+    __table_args__ = (
+        Index("ix_incidents_created_at_id", "created_at", "id"),
+        Index("ix_incidents_severity_created_at_id", "severity", "created_at", "id"),
+        Index("ix_incidents_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_incidents_agent_id_created_at_id", "agent_id", "created_at", "id"),
+        Index("ix_incidents_status_severity_created_at_id", "status", "severity", "created_at", "id"),
+        Index("ix_incidents_agent_id_status_created_at_id", "agent_id", "status", "created_at", "id"),
+        # Duplicate lookup and case membership
+        Index("ix_incidents_fingerprint_status", "fingerprint", "status"),
+        Index("ix_incidents_case_id", "case_id"),
+    ) 
\ No newline at end of file
@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, JSON
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from ..database import Base
+from database import Base, utc_now
 
 class Playbook(Base):
     __tablename__ = "playbooks"
@@ -12,7 +12,7 @@ class Playbook(Base):
     version = Column(String, nullable=False)
     steps = Column(JSON, nullable=False)  # List of steps with their configurations
     parameters = Column(JSON)  # Expected parameters and their types
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, Index
+from sqlalchemy.sql import func
+from database import Base, utc_now
+
+class Rule(Base):
+    __tablename__ = "rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    description = Column(String)
+    rule_type = Column(String, nullable=False)  # detection, prevention, response
+    conditions = Column(JSON, nullable=False)  # Compiled by services.rule_engine
+    actions = Column(JSON, nullable=False)  # List of actions to dispatch on match
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_rules_created_at_id", "created_at", "id"),
+    )
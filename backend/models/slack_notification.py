@@ -1,6 +1,20 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
 from typing import Optional
 from datetime import datetime
+from database import Base, utc_now
+
+class SlackNotificationRecord(Base):
+    __tablename__ = "slack_notifications"
+
+    id = Column(Integer, primary_key=True, index=True)
+    message = Column(String, nullable=False)
+    channel = Column(String)
+    type = Column(String, nullable=False, default="alert")
+    severity = Column(String, nullable=False, default="medium")
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 class SlackNotificationBase(BaseModel):
     message: str
@@ -12,9 +26,8 @@ class SlackNotificationCreate(SlackNotificationBase):
     pass
 
 class SlackNotification(SlackNotificationBase):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     created_at: datetime
-    updated_at: datetime
-
-    class Config:
-        orm_mode = True 
\ No newline at end of file
+    updated_at: Optional[datetime] = None
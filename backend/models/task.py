@@ -1,7 +1,22 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON
+import time
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from ..database import Base
+from config import settings
+from database import Base, utc_now
+
+def schedule_key(priority) -> float:
+    """
+    Claim order of a task queued now: the time minus its priority's head start.
+
+    Tasks are claimed in ascending key order, so a task waiting longer than
+    the difference in head starts overtakes newer tasks of a higher priority.
+    """
+    priority = getattr(priority, "value", priority) or "medium"
+    return time.time() - settings.TASK_PRIORITY_HEAD_START.get(priority, 0.0)
+
+def _default_schedule_key(context) -> float:
+    return schedule_key(context.get_current_parameters().get("priority"))
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -17,9 +32,27 @@ class Task(Base):
     result = Column(JSON)
     started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=utc_now, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Scheduling, see services/task_scheduler.py (times are epoch seconds)
+    schedule_key = Column(Float, default=_default_schedule_key)
+    not_before = Column(Float)  # Retry backoff: not claimed before this time
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    lease_owner = Column(String)
+    lease_expires_at = Column(Float)
+    last_error = Column(String)
 
     # Relationships
     agent = relationship("Agent", back_populates="tasks")
-    playbook = relationship("Playbook", back_populates="tasks") 
\ No newline at end of file
+    playbook = relationship("Playbook", back_populates="tasks")
+
+    # Keyset pagination indexes, one per list filter combination
+    __table_args__ = (
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_tasks_agent_id_created_at_id", "agent_id", "created_at", "id"),
+        Index("ix_tasks_agent_id_status_created_at_id", "agent_id", "status", "created_at", "id"),
+        # Claim order and lease expiry
+        Index("ix_tasks_status_schedule_key", "status", "schedule_key"),
+        Index("ix_tasks_status_lease_expires_at", "status", "lease_expires_at"),
+    ) 
\ No newline at end of file
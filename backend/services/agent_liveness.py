@@ -0,0 +1,387 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import bindparam, or_, select, update
+from config import settings
+from database import async_engine
+from models.agent import Agent
+
+ACTIVE = "active"
+INACTIVE = "inactive"
+STATUS_CHUNK = 10000  # Agent ids per conditional status UPDATE (bound parameter limit)
+
+# Receives the (agent_id, new status, last seen epoch seconds) changes of one sweep or heartbeat batch
+ChangeListener = Callable[[List[Tuple[int, str, Optional[float]]]], Awaitable[None]]
+
+class AgentLiveness:
+    """
+    Heartbeat tracking for the agent fleet.
+
+    A heartbeat only updates memory: the agent's last-seen time and its
+    slot in a timing wheel of deadlines (one slot per
+    AGENT_LIVENESS_TICK_SECONDS). Each tick expires the slots that have
+    passed, so the cost of a sweep is the number of agents going silent,
+    not the fleet size. Agents that miss AGENT_HEARTBEAT_TIMEOUT_SECONDS
+    are marked inactive; their next heartbeat marks them active again.
+    Agents in any other status (maintenance) are tracked but never flipped.
+
+    last_seen is written every AGENT_LIVENESS_FLUSH_SECONDS with one
+    batched UPDATE, however many heartbeats arrived in between. With
+    several workers each one sees only part of the heartbeats, so the
+    database decides status changes: an expired agent is only set inactive
+    if its stored last_seen (written by any worker) is older than the
+    timeout too, and an inactive agent is set active again by the flush
+    of its heartbeat. Both are conditional UPDATEs, so exactly one worker
+    makes each change and passes it to the listeners, in batches.
+    """
+
+    def __init__(self, timeout_seconds: Optional[float] = None, tick_seconds: Optional[float] = None):
+        self.timeout_seconds = timeout_seconds or settings.AGENT_HEARTBEAT_TIMEOUT_SECONDS
+        self.tick_seconds = tick_seconds or settings.AGENT_LIVENESS_TICK_SECONDS
+        self._status: Dict[int, str] = {}
+        self._last_seen: Dict[int, float] = {}
+        # Timing wheel: slot number -> agents whose deadline falls in it
+        self._slots: Dict[int, Set[int]] = {}
+        self._slot_of: Dict[int, int] = {}
+        self._swept_slot = int(time.time() / self.tick_seconds)
+        self._pending_seen: Dict[int, float] = {}
+        self._listeners: List[ChangeListener] = []
+        self._task: Optional[asyncio.Task] = None
+        self.loaded = False
+        self.stats = {"heartbeats": 0, "unknown": 0, "expired": 0, "recovered": 0, "flushed": 0}
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        self._listeners.append(listener)
+
+    def is_known(self, agent_id: int) -> bool:
+        return agent_id in self._status
+
+    def get_status(self, agent_id: int) -> Optional[str]:
+        return self._status.get(agent_id)
+
+    def _schedule(self, agent_id: int, deadline: float) -> None:
+        slot = int(deadline / self.tick_seconds) + 1
+        previous = self._slot_of.get(agent_id)
+        if previous == slot:
+            return
+        if previous is not None:
+            agents = self._slots.get(previous)
+            if agents is not None:
+                agents.discard(agent_id)
+                if not agents:
+                    del self._slots[previous]
+        self._slots.setdefault(slot, set()).add(agent_id)
+        self._slot_of[agent_id] = slot
+
+    def _unschedule(self, agent_id: int) -> None:
+        slot = self._slot_of.pop(agent_id, None)
+        if slot is not None:
+            agents = self._slots.get(slot)
+            if agents is not None:
+                agents.discard(agent_id)
+                if not agents:
+                    del self._slots[slot]
+
+    def track(self, agent_id: int, status: str, last_seen: Optional[float] = None) -> None:
+        """
+        Start tracking an agent, or take a status set through the API.
+
+        An active agent gets a full timeout from now, also when loaded after
+        a restart: heartbeats sent while the API was down were not missed
+        by the agent.
+        """
+        self._status[agent_id] = status
+        if last_seen is not None:
+            self._last_seen[agent_id] = last_seen
+        if status == ACTIVE:
+            self._schedule(agent_id, time.time() + self.timeout_seconds)
+        else:
+            self._unschedule(agent_id)
+
+    def forget(self, agent_id: int) -> None:
+        self._unschedule(agent_id)
+        self._status.pop(agent_id, None)
+        self._last_seen.pop(agent_id, None)
+        self._pending_seen.pop(agent_id, None)
+
+    async def load(self) -> int:
+        """
+        Track every agent in the database.
+
+        Returns:
+            int: Number of agents loaded
+        """
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(select(Agent.id, Agent.status, Agent.last_seen))).all()
+        for agent_id, status, last_seen in rows:
+            if agent_id not in self._status:
+                self.track(agent_id, status, last_seen.timestamp() if last_seen is not None else None)
+        self.loaded = True
+        return len(rows)
+
+    async def discover(self, agent_ids: Iterable[int]) -> Set[int]:
+        """
+        Look up agents this process has not seen (created through another worker).
+
+        Returns:
+            set: The ids that exist, now tracked
+        """
+        missing = {agent_id for agent_id in agent_ids if agent_id not in self._status}
+        if not missing:
+            return set()
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(
+                select(Agent.id, Agent.status, Agent.last_seen).where(Agent.id.in_(missing))
+            )).all()
+        for agent_id, status, last_seen in rows:
+            self.track(agent_id, status, last_seen.timestamp() if last_seen is not None else None)
+        return {row[0] for row in rows}
+
+    async def reconcile(self) -> Tuple[int, int]:
+        """
+        Take over agent changes made through other workers.
+
+        Agents deleted elsewhere are forgotten and new ones tracked. A
+        status set elsewhere is taken unless both statuses are active or
+        inactive: those flips are settled by sweep and flush.
+
+        Returns:
+            tuple: Number of agents tracked or updated, and forgotten
+        """
+        known = set(self._status)
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(select(Agent.id, Agent.status, Agent.last_seen))).all()
+        present = set()
+        updated = 0
+        for agent_id, status, last_seen in rows:
+            present.add(agent_id)
+            current = self._status.get(agent_id)
+            if current == status or (current in (ACTIVE, INACTIVE) and status in (ACTIVE, INACTIVE)):
+                continue
+            self.track(agent_id, status, last_seen.timestamp() if last_seen is not None else None)
+            updated += 1
+        gone = known - present
+        for agent_id in gone:
+            self.forget(agent_id)
+        self.loaded = True
+        return updated, len(gone)
+
+    def heartbeat_many(self, agent_ids: Iterable[int], seen_at: Optional[float] = None) -> Tuple[int, List[int]]:
+        """
+        Record heartbeats.
+
+        An inactive agent is active again here at once; the change is
+        written, and passed to the listeners, by the next flush.
+
+        Returns:
+            tuple: Number of heartbeats recorded and the ids of unknown agents
+        """
+        now = time.time() if seen_at is None else seen_at
+        deadline = now + self.timeout_seconds
+        status, last_seen, pending_seen = self._status, self._last_seen, self._pending_seen
+        recorded = 0
+        unknown: List[int] = []
+        for agent_id in agent_ids:
+            current = status.get(agent_id)
+            if current is None:
+                unknown.append(agent_id)
+                continue
+            recorded += 1
+            last_seen[agent_id] = now
+            pending_seen[agent_id] = now
+            if current == INACTIVE:
+                status[agent_id] = ACTIVE
+                current = ACTIVE
+            if current == ACTIVE:
+                self._schedule(agent_id, deadline)
+        self.stats["heartbeats"] += recorded
+        self.stats["unknown"] += len(unknown)
+        return recorded, unknown
+
+    def _due(self, now: float) -> List[int]:
+        """Take the agents whose deadline has passed off the timing wheel."""
+        current_slot = int(now / self.tick_seconds)
+        slots = self._slots
+        if len(slots) < current_slot - self._swept_slot:
+            due_slots = sorted(slot for slot in slots if slot <= current_slot)
+        else:
+            due_slots = [slot for slot in range(self._swept_slot + 1, current_slot + 1) if slot in slots]
+        due: List[int] = []
+        for slot in due_slots:
+            for agent_id in slots.pop(slot):
+                del self._slot_of[agent_id]
+                due.append(agent_id)
+        self._swept_slot = max(self._swept_slot, current_slot)
+        return due
+
+    async def sweep(self, now: Optional[float] = None) -> List[Tuple[int, str, Optional[float]]]:
+        """
+        Mark the agents whose deadline has passed inactive.
+
+        An agent is only set inactive if no worker has written a recent
+        last_seen for it; otherwise it is rescheduled from the stored time.
+
+        Returns:
+            list: The (agent_id, INACTIVE, last seen) changes made here
+        """
+        now = time.time() if now is None else now
+        due = self._due(now)
+        if not due:
+            return []
+        table = Agent.__table__
+        cutoff = datetime.fromtimestamp(now - self.timeout_seconds, tz=timezone.utc)
+        try:
+            flipped: Dict[int, Any] = {}
+            rows = []
+            async with async_engine.begin() as conn:
+                for start in range(0, len(due), STATUS_CHUNK):
+                    chunk = due[start:start + STATUS_CHUNK]
+                    flipped.update((await conn.execute(
+                        update(table)
+                        .where(
+                            table.c.id.in_(chunk),
+                            table.c.status == ACTIVE,
+                            or_(table.c.last_seen.is_(None), table.c.last_seen < cutoff)
+                        )
+                        .values(status=INACTIVE)
+                        .returning(table.c.id, table.c.last_seen)
+                    )).all())
+                    others = [agent_id for agent_id in chunk if agent_id not in flipped]
+                    if others:
+                        rows += (await conn.execute(
+                            select(table.c.id, table.c.status, table.c.last_seen).where(table.c.id.in_(others))
+                        )).all()
+        except Exception as e:
+            # Retry on the next tick
+            for agent_id in due:
+                self._schedule(agent_id, now)
+            print(f"Error expiring agents: {str(e)}")
+            return []
+
+        expired: List[Tuple[int, str, Optional[float]]] = []
+        for agent_id, last_seen in flipped.items():
+            self._status[agent_id] = INACTIVE
+            seen_at = last_seen.timestamp() if last_seen is not None else self._last_seen.get(agent_id)
+            expired.append((agent_id, INACTIVE, seen_at))
+        present = set(flipped)
+        for agent_id, status, last_seen in rows:
+            present.add(agent_id)
+            if status == ACTIVE and last_seen is not None:
+                # Heartbeats went to another worker
+                seen_at = max(last_seen.timestamp(), self._last_seen.get(agent_id, 0.0))
+                self._last_seen[agent_id] = seen_at
+                self._status[agent_id] = ACTIVE
+                self._schedule(agent_id, max(seen_at + self.timeout_seconds, now))
+            else:
+                # Set inactive by another worker, or put in maintenance
+                self._status[agent_id] = status
+        for agent_id in set(due) - present:
+            self.forget(agent_id)
+        if expired:
+            self.stats["expired"] += len(expired)
+            self._notify(expired)
+        return expired
+
+    def _notify(self, changes: List[Tuple[int, str, Optional[float]]]) -> None:
+        for listener in self._listeners:
+            task = asyncio.get_running_loop().create_task(listener(changes))
+            task.add_done_callback(self._listener_done)
+
+    @staticmethod
+    def _listener_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error in agent liveness listener: {str(task.exception())}")
+
+    async def flush(self) -> int:
+        """
+        Write buffered last_seen times.
+
+        Agents stored as inactive whose heartbeat is being written are set
+        active again in the same transaction, and those changes are passed
+        to the listeners.
+
+        Returns:
+            int: Number of agents updated
+        """
+        seen, self._pending_seen = self._pending_seen, {}
+        if not seen:
+            return 0
+        table = Agent.__table__
+        cutoff = datetime.fromtimestamp(time.time() - self.timeout_seconds, tz=timezone.utc)
+        recovered: List[Tuple[int, str, Optional[float]]] = []
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(
+                    update(table).where(table.c.id == bindparam("agent_id")).values(last_seen=bindparam("seen")),
+                    [
+                        {"agent_id": agent_id, "seen": datetime.fromtimestamp(seen_at, tz=timezone.utc)}
+                        for agent_id, seen_at in seen.items()
+                    ]
+                )
+                ids = list(seen)
+                for start in range(0, len(ids), STATUS_CHUNK):
+                    rows = (await conn.execute(
+                        update(table)
+                        .where(
+                            table.c.id.in_(ids[start:start + STATUS_CHUNK]),
+                            table.c.status == INACTIVE,
+                            table.c.last_seen >= cutoff
+                        )
+                        .values(status=ACTIVE)
+                        .returning(table.c.id)
+                    )).scalars().all()
+                    recovered.extend((agent_id, ACTIVE, seen[agent_id]) for agent_id in rows)
+        except Exception as e:
+            # Keep the newer values when the next flush retries
+            for agent_id, seen_at in seen.items():
+                self._pending_seen[agent_id] = max(seen_at, self._pending_seen.get(agent_id, seen_at))
+            print(f"Error flushing agent liveness: {str(e)}")
+            return 0
+        for agent_id, _, _ in recovered:
+            if self._status.get(agent_id) == INACTIVE:
+                self._status[agent_id] = ACTIVE
+        if recovered:
+            self.stats["recovered"] += len(recovered)
+            self._notify(recovered)
+        self.stats["flushed"] += len(seen)
+        return len(seen)
+
+    async def start(self) -> None:
+        try:
+            await self.load()
+        except Exception as e:
+            print(f"Error loading agents for liveness tracking: {str(e)}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        last_flush = time.monotonic()
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            try:
+                await self.sweep()
+                if time.monotonic() - last_flush >= settings.AGENT_LIVENESS_FLUSH_SECONDS:
+                    last_flush = time.monotonic()
+                    await self.flush()
+            except Exception as e:
+                print(f"Error in agent liveness loop: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for status in self._status.values():
+            counts[status] = counts.get(status, 0) + 1
+        return dict(
+            self.stats,
+            agents=len(self._status),
+            by_status=counts,
+            scheduled=len(self._slot_of),
+            pending_writes=len(self._pending_seen)
+        )
@@ -0,0 +1,20 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.agent import Agent
+from services.crud import CrudService
+
+class AgentService(CrudService):
+    model = Agent
+
+    async def create_agent(self, db: AsyncSession, agent: BaseModel) -> Agent:
+        return await self.create(db, agent)
+
+    async def get_agent(self, db: AsyncSession, agent_id: int) -> Optional[Agent]:
+        return await self.get(db, agent_id)
+
+    async def update_agent(self, db: AsyncSession, agent_id: int, agent: BaseModel) -> Optional[Agent]:
+        return await self.update(db, agent_id, agent)
+
+    async def delete_agent(self, db: AsyncSession, agent_id: int) -> bool:
+        return await self.delete(db, agent_id)
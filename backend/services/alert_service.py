@@ -0,0 +1,20 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.alert import SecurityAlert
+from services.crud import CrudService
+
+class AlertService(CrudService):
+    model = SecurityAlert
+
+    async def create_alert(self, db: AsyncSession, alert: BaseModel) -> SecurityAlert:
+        return await self.create(db, alert)
+
+    async def get_alert(self, db: AsyncSession, alert_id: int) -> Optional[SecurityAlert]:
+        return await self.get(db, alert_id)
+
+    async def update_alert(self, db: AsyncSession, alert_id: int, alert: BaseModel) -> Optional[SecurityAlert]:
+        return await self.update(db, alert_id, alert)
+
+    async def delete_alert(self, db: AsyncSession, alert_id: int) -> bool:
+        return await self.delete(db, alert_id)
@@ -0,0 +1,339 @@
+"""
+Incremental incident rollups for the analytics dashboard.
+
+Rebuild the rollups from the incidents table (with the API stopped):
+
+    python -m services.analytics_rollup
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import settings
+from database import async_engine, engine
+from models.analytics import IncidentRollup
+from models.incident import Incident
+
+# Bucket size in seconds per granularity; "all" has a single bucket
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400, "all": None}
+RESOLVED_STATUSES = ("resolved", "closed")
+ALL_TACTICS = "*"
+WRITE_CHUNK_ROWS = 5000
+PRUNE_INTERVAL_SECONDS = 3600.0
+
+# (created epoch, severity, status, agent_id, tactics, resolution seconds)
+RollupState = Tuple[float, str, str, int, Tuple[str, ...], Optional[float]]
+# (granularity, bucket, severity, status, agent_id, tactic)
+CellKey = Tuple[str, int, str, str, int, str]
+
+def incident_tactics(details: Optional[Dict[str, Any]]) -> Tuple[str, ...]:
+    """Distinct MITRE tactics from the tags in incident details."""
+    tags = (details or {}).get("mitre") or []
+    tactics = []
+    for tag in tags:
+        tactic = tag.get("tactic") if isinstance(tag, dict) else None
+        if tactic and tactic not in tactics:
+            tactics.append(tactic)
+    return tuple(tactics)
+
+def _epoch(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        # SQLite hands back naive datetimes for UTC values
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+    return float(value)
+
+def _value(value: Any) -> Any:
+    return getattr(value, "value", value)
+
+def rollup_state(incident: Any) -> RollupState:
+    """The rollup dimensions of an incident row, ORM object or dict."""
+    get = incident.get if isinstance(incident, dict) else lambda name: getattr(incident, name, None)
+    created = _epoch(get("created_at")) or time.time()
+    status = _value(get("status")) or "open"
+    resolved = _epoch(get("resolved_at"))
+    resolution = max(resolved - created, 0.0) if resolved is not None and status in RESOLVED_STATUSES else None
+    return (
+        created,
+        _value(get("severity")) or "unknown",
+        status,
+        get("agent_id") or 0,
+        incident_tactics(get("details")),
+        resolution
+    )
+
+def rollup_cells(state: RollupState, minute_cutoff: float) -> Iterable[CellKey]:
+    """Every rollup cell an incident is counted in."""
+    created, severity, status, agent_id, tactics, _ = state
+    for granularity, size in GRANULARITIES.items():
+        if size is None:
+            bucket = 0
+        else:
+            bucket = int(created // size * size)
+            if granularity == "minute" and bucket < minute_cutoff:
+                # Pruned already, or about to be
+                continue
+        for tactic in (ALL_TACTICS,) + tactics:
+            yield (granularity, bucket, severity, status, agent_id, tactic)
+
+def _add(deltas: Dict[CellKey, List[float]], state: RollupState, sign: int, minute_cutoff: float) -> None:
+    resolution = state[5]
+    for cell in rollup_cells(state, minute_cutoff):
+        delta = deltas.get(cell)
+        if delta is None:
+            delta = deltas[cell] = [0, 0, 0.0]
+        delta[0] += sign
+        if resolution is not None:
+            delta[1] += sign
+            delta[2] += sign * resolution
+
+def _minute_cutoff() -> float:
+    return time.time() - settings.ANALYTICS_MINUTE_RETENTION_HOURS * 3600
+
+def _rows(deltas: Dict[CellKey, List[float]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "granularity": granularity, "bucket": bucket, "severity": severity, "status": status,
+            "agent_id": agent_id, "tactic": tactic,
+            "incident_count": count, "resolved_count": resolved, "resolution_seconds": seconds
+        }
+        for (granularity, bucket, severity, status, agent_id, tactic), (count, resolved, seconds) in deltas.items()
+        if count or resolved or seconds
+    ]
+
+def upsert_statement(dialect: str):
+    """INSERT ... ON CONFLICT that adds the row's counts to an existing cell."""
+    insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+    statement = insert(IncidentRollup.__table__)
+    table = IncidentRollup.__table__
+    return statement.on_conflict_do_update(
+        index_elements=["granularity", "bucket", "severity", "status", "agent_id", "tactic"],
+        set_={
+            "incident_count": table.c.incident_count + statement.excluded.incident_count,
+            "resolved_count": table.c.resolved_count + statement.excluded.resolved_count,
+            "resolution_seconds": table.c.resolution_seconds + statement.excluded.resolution_seconds,
+        }
+    )
+
+class AnalyticsRollup:
+    """
+    Keeps the incident_rollups table in step with the incidents table.
+
+    Incident changes are turned into counter deltas per rollup cell and
+    buffered in memory; flush() applies them with one upsert per batch
+    (every ANALYTICS_FLUSH_SECONDS from the API). Queries read only the
+    rollup rows, so their cost depends on the requested range and the
+    number of severities, statuses, agents and tactics, not on the number
+    of incidents.
+    """
+
+    def __init__(self):
+        self._pending: Dict[CellKey, List[float]] = {}
+        self._last_prune = 0.0
+        self.stats = {"changes": 0, "flushes": 0, "cells_written": 0}
+
+    def record(self, old: Optional[RollupState], new: Optional[RollupState]) -> None:
+        """
+        Count an incident change: creation (old is None), update or deletion
+        (new is None).
+        """
+        if old == new:
+            return
+        cutoff = _minute_cutoff()
+        if old is not None:
+            _add(self._pending, old, -1, cutoff)
+        if new is not None:
+            _add(self._pending, new, 1, cutoff)
+        self.stats["changes"] += 1
+
+    async def flush(self) -> int:
+        """
+        Write the buffered deltas.
+
+        Returns:
+            int: Number of rollup cells updated
+        """
+        prune = time.monotonic() - self._last_prune > PRUNE_INTERVAL_SECONDS
+        if not self._pending and not prune:
+            return 0
+        pending, self._pending = self._pending, {}
+        rows = _rows(pending)
+        try:
+            async with async_engine.begin() as conn:
+                if rows:
+                    statement = upsert_statement(async_engine.dialect.name)
+                    for start in range(0, len(rows), WRITE_CHUNK_ROWS):
+                        await conn.execute(statement, rows[start:start + WRITE_CHUNK_ROWS])
+                if prune:
+                    await conn.execute(prune_statement())
+                    self._last_prune = time.monotonic()
+        except Exception as e:
+            # Put the deltas back so the next flush retries them
+            for cell, (count, resolved, seconds) in pending.items():
+                delta = self._pending.setdefault(cell, [0, 0, 0.0])
+                delta[0] += count
+                delta[1] += resolved
+                delta[2] += seconds
+            print(f"Error flushing analytics rollups: {str(e)}")
+            return 0
+        self.stats["flushes"] += 1
+        self.stats["cells_written"] += len(rows)
+        return len(rows)
+
+    async def query(
+        self,
+        granularity: str = "day",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        agent_id: Optional[int] = None,
+        severity: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Summary, breakdowns and a time series of incidents.
+
+        The summary and breakdowns cover since..until when given (at the
+        granularity's resolution), otherwise all time. The series has one
+        point per non-empty bucket of the granularity.
+
+        Raises:
+            ValueError: For an unknown granularity
+        """
+        if granularity not in GRANULARITIES or GRANULARITIES[granularity] is None:
+            raise ValueError(f"granularity must be one of: {', '.join(g for g, s in GRANULARITIES.items() if s)}")
+        await self.flush()
+        table = IncidentRollup.__table__
+        ranged = since is not None or until is not None
+
+        def cells(summary_granularity: str):
+            query = select(
+                table.c.tactic, table.c.severity, table.c.status,
+                func.sum(table.c.incident_count).label("incidents"),
+                func.sum(table.c.resolved_count).label("resolved"),
+                func.sum(table.c.resolution_seconds).label("seconds")
+            ).where(table.c.granularity == summary_granularity)
+            return _filtered(query, since, until, agent_id, severity).group_by(table.c.tactic, table.c.severity, table.c.status)
+
+        series_query = _filtered(
+            select(table.c.bucket, func.sum(table.c.incident_count).label("incidents"))
+            .where(table.c.granularity == granularity, table.c.tactic == ALL_TACTICS),
+            since, until, agent_id, severity
+        ).group_by(table.c.bucket).order_by(table.c.bucket)
+
+        async with async_engine.connect() as conn:
+            breakdown = (await conn.execute(cells(granularity if ranged else "all"))).fetchall()
+            series = (await conn.execute(series_query)).fetchall()
+
+        by_severity: Dict[str, int] = {}
+        by_status: Dict[str, int] = {}
+        by_tactic: Dict[str, int] = {}
+        total = resolved = 0
+        seconds = 0.0
+        for row in breakdown:
+            if row.tactic != ALL_TACTICS:
+                by_tactic[row.tactic] = by_tactic.get(row.tactic, 0) + row.incidents
+                continue
+            total += row.incidents
+            resolved += row.resolved
+            seconds += row.seconds
+            by_severity[row.severity] = by_severity.get(row.severity, 0) + row.incidents
+            by_status[row.status] = by_status.get(row.status, 0) + row.incidents
+        average = seconds / resolved if resolved else None
+        return {
+            "summary": {
+                "totalIncidents": total,
+                "criticalIncidents": by_severity.get("critical", 0),
+                "resolvedIncidents": sum(by_status.get(status, 0) for status in RESOLVED_STATUSES),
+                "averageResolutionSeconds": average,
+                "averageResolutionTime": format_duration(average),
+            },
+            "by_severity": {key: value for key, value in by_severity.items() if value},
+            "by_status": {key: value for key, value in by_status.items() if value},
+            "by_tactic": {key: value for key, value in by_tactic.items() if value},
+            "granularity": granularity,
+            "series": [
+                {"bucket": datetime.fromtimestamp(row.bucket, tz=timezone.utc), "incidents": row.incidents}
+                for row in series if row.incidents
+            ]
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, pending_cells=len(self._pending))
+
+def _filtered(query, since, until, agent_id, severity):
+    table = IncidentRollup.__table__
+    if since is not None:
+        query = query.where(table.c.bucket >= int(_epoch(since)))
+    if until is not None:
+        query = query.where(table.c.bucket < int(_epoch(until)))
+    if agent_id is not None:
+        query = query.where(table.c.agent_id == agent_id)
+    if severity is not None:
+        query = query.where(table.c.severity == severity)
+    return query
+
+def prune_statement():
+    """Drop expired minute buckets and cells that went back to zero."""
+    table = IncidentRollup.__table__
+    return delete(table).where(
+        ((table.c.granularity == "minute") & (table.c.bucket < int(_minute_cutoff())))
+        | ((table.c.incident_count == 0) & (table.c.resolved_count == 0))
+    )
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "n/a"
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h {minutes}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h"
+
+def rebuild(batch_size: int = 10000) -> int:
+    """
+    Recompute every rollup from the incidents table.
+
+    Incidents are streamed in batches and aggregated in memory, and the
+    rollups are replaced in one transaction with multi-row upserts. Run it
+    with the API stopped, or its buffered deltas are counted twice.
+
+    Returns:
+        int: Number of incidents counted
+    """
+    deltas: Dict[CellKey, List[float]] = {}
+    cutoff = _minute_cutoff()
+    count = 0
+    columns = (
+        Incident.created_at, Incident.severity, Incident.status,
+        Incident.agent_id, Incident.details, Incident.resolved_at
+    )
+    IncidentRollup.__table__.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(select(*columns))
+        for row in result:
+            _add(deltas, rollup_state(row._asdict()), 1, cutoff)
+            count += 1
+    rows = _rows(deltas)
+    statement = upsert_statement(engine.dialect.name)
+    with engine.begin() as conn:
+        conn.execute(delete(IncidentRollup.__table__))
+        for start in range(0, len(rows), WRITE_CHUNK_ROWS):
+            conn.execute(statement, rows[start:start + WRITE_CHUNK_ROWS])
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the incident analytics rollups")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Incidents read per batch")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    count = rebuild(args.batch_size)
+    print(f"Rolled up {count} incidents in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
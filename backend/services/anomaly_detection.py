@@ -0,0 +1,449 @@
+import hashlib
+import math
+import mmap
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from config import settings
+from services.ip_intel import SOURCE_IP_FIELDS
+
+try:
+    import fcntl
+except ImportError:  # Windows: no file locking
+    fcntl = None
+
+HOURS_PER_WEEK = 168
+# The epoch fell on a Thursday; hour 0 of the week is Monday 00:00 UTC
+_EPOCH_HOUR_OF_WEEK = 72
+
+# Hour-of-week profiles hold rate factors in 1/32 steps: 32 is the entity's
+# mean rate, 255 almost eight times it
+PROFILE_ONE = 32
+PROFILE_MAX = 255
+
+ENTITY = np.dtype([
+    ("key", "<u8"),  # Hash of (entity type, value)
+    ("bucket", "<i8"),  # Current bucket
+    ("alerted", "<i8"),  # Bucket of the latest anomaly
+    ("count", "<f4"),  # Events in the current bucket
+    ("m1", "<f4"),  # EWMA of the deseasonalized rate
+    ("m2", "<f4"),  # EWMA of its square
+    ("n", "<u4"),  # Buckets since first seen
+    ("profile", "u1", (HOURS_PER_WEEK,)),
+])
+
+MAGIC = 0x314D4F4E41434553  # "SECANOM1"
+VERSION = 1
+HEADER = np.dtype([
+    ("magic", "<u8"), ("version", "<u8"), ("bucket_seconds", "<u8"),
+    ("max_entities", "<u8"), ("size", "<u8"), ("reserved", "<u8", (3,)),
+])
+
+_NEVER = np.iinfo(np.int64).min // 2
+
+# Numbered state files tried when ANOMALY_STATE_PATH is locked by another worker
+MAX_WORKER_STATE_FILES = 64
+
+def entity_key(entity_type: str, value: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(f"{entity_type}\x1f{value}".encode(), digest_size=8).digest(), "little")
+
+def worker_state_paths(path: str) -> List[str]:
+    """The state file and the numbered siblings taken by further workers (anomaly_state.1.bin, ...)."""
+    root, ext = os.path.splitext(path)
+    return [path] + [f"{root}.{number}{ext}" for number in range(1, MAX_WORKER_STATE_FILES)]
+
+def hour_of_week(buckets: np.ndarray, bucket_seconds: int) -> np.ndarray:
+    return (buckets * bucket_seconds // 3600 + _EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+
+def event_entities(event: Dict[str, Any], rule_ids: Iterable[str] = ()) -> List[Tuple[str, str]]:
+    """The (entity type, value) pairs whose rates an event counts toward."""
+    entities = []
+    agent_id = event.get("agent_id")
+    if agent_id is not None and agent_id != "":
+        entities.append(("agent", str(agent_id)))
+    source_ip = next((event[field] for field in SOURCE_IP_FIELDS if event.get(field)), None)
+    if source_ip:
+        entities.append(("ip", str(source_ip)))
+    entities.extend(("rule", str(rule_id)) for rule_id in rule_ids)
+    return entities
+
+class AnomalyDetector:
+    """
+    Online anomaly detection over per-entity event rates.
+
+    Events are counted per entity (agent, source IP and matched rule) in
+    buckets of ANOMALY_BUCKET_SECONDS. When an entity moves on to a new
+    bucket, the closed bucket is folded into an EWMA of the rate and of its
+    square (mean and variance) after dividing out the entity's hour-of-week
+    profile, and the profile itself moves toward the observed rate. Empty
+    buckets in between decay the moments in closed form, so every update
+    is O(1) however sparse the entity.
+
+    The running count of the current bucket is checked on every batch
+    against the seasonal expectation, and a z-score of ANOMALY_Z_THRESHOLD
+    or more (with at least ANOMALY_MIN_EVENTS events and
+    ANOMALY_WARMUP_BUCKETS of history) is reported once per
+    ANOMALY_COOLDOWN_SECONDS. The variance is floored at the expected count
+    (as for a Poisson rate), so quiet entities need a real burst to alert.
+
+    State is a fixed-size table of ANOMALY_MAX_ENTITIES rows (about 200
+    bytes each) with an open-addressing index, in a memory-mapped file at
+    ANOMALY_STATE_PATH: pages are only resident once touched, the kernel
+    writes them back, and flush() syncs them every ANOMALY_FLUSH_SECONDS,
+    so baselines survive restarts. When the table is full, entities idle
+    for ANOMALY_IDLE_SECONDS and then the least recently seen are evicted.
+    The table is mapped by open(), not on construction.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entities: Optional[int] = None, bucket_seconds: Optional[int] = None):
+        self.path = path if path is not None else settings.ANOMALY_STATE_PATH
+        self.max_entities = max_entities or settings.ANOMALY_MAX_ENTITIES
+        self.bucket_seconds = int(bucket_seconds or settings.ANOMALY_BUCKET_SECONDS)
+        self.index_slots = 1 << max(2 * self.max_entities - 1, 1).bit_length()
+        self.persistent = False
+        self.state_path: Optional[str] = None
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self.stats = {
+            "events": 0, "observations": 0, "created": 0, "evicted": 0,
+            "untracked": 0, "anomalies": 0, "flushes": 0
+        }
+
+    def _layout(self) -> Tuple[int, int, int]:
+        rows_offset = HEADER.itemsize
+        index_offset = rows_offset + self.max_entities * ENTITY.itemsize
+        index_offset += -index_offset % 8
+        return rows_offset, index_offset, index_offset + self.index_slots * 8
+
+    def open(self) -> None:
+        """
+        Map the state table, from the state file when there is one.
+
+        Workers on one host cannot share a state file. A worker that finds
+        ANOMALY_STATE_PATH locked by another one takes the first free
+        numbered sibling (anomaly_state.1.bin, ...), so each worker keeps
+        and persists the baselines of the events it receives itself.
+        """
+        if self._map is not None:
+            return
+        rows_offset, index_offset, size = self._layout()
+        if self.path:
+            for path in worker_state_paths(self.path):
+                try:
+                    self._map = self._map_file(path, size)
+                except (OSError, ValueError) as e:
+                    print(f"Error mapping anomaly state file {path}, baselines of this worker are not persisted: {str(e)}")
+                    break
+                if self._map is not None:
+                    if path != self.path:
+                        print(f"Anomaly state file {self.path} is in use by another worker, this worker keeps its baselines in {path}")
+                    self.state_path = path
+                    break
+            else:
+                print(f"All {MAX_WORKER_STATE_FILES} anomaly state files of {self.path} are in use, baselines of this worker are not persisted")
+        if self._map is None:
+            # Anonymous memory is also only allocated as it is touched
+            self._map = mmap.mmap(-1, size)
+        self._header = np.frombuffer(self._map, dtype=HEADER, count=1)[0:1]
+        self.entities = np.frombuffer(self._map, dtype=ENTITY, count=self.max_entities, offset=rows_offset)
+        self.index = np.frombuffer(self._map, dtype="<i8", count=self.index_slots, offset=index_offset)
+        header = self._header[0]
+        if (header["magic"] != MAGIC or header["version"] != VERSION
+                or header["bucket_seconds"] != self.bucket_seconds or header["max_entities"] != self.max_entities):
+            if header["magic"] == MAGIC:
+                print("Anomaly state file was written with other settings, starting new baselines")
+            self.index.fill(-1)
+            self._header[0] = (MAGIC, VERSION, self.bucket_seconds, self.max_entities, 0, (0, 0, 0))
+
+    def _map_file(self, path: str, size: int) -> Optional[mmap.mmap]:
+        """Map path, or return None if another process holds it."""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    return None
+            if os.fstat(fd).st_size != size:
+                # A new file, or one sized for other settings (its header no longer matches)
+                os.ftruncate(fd, size)
+            mapped = mmap.mmap(fd, size)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self.persistent = True
+        return mapped
+
+    def __len__(self) -> int:
+        return int(self._header["size"][0]) if self._map is not None else 0
+
+    def _lookup(self, keys: np.ndarray) -> np.ndarray:
+        """Rows of the given keys, -1 for keys not tracked."""
+        mask = self.index_slots - 1
+        stored = self.entities["key"]
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        slots = (keys & np.uint64(mask)).astype(np.int64)
+        pending = np.arange(len(keys))
+        while len(pending):
+            found = self.index[slots[pending]]
+            hit = (found >= 0) & (stored[np.maximum(found, 0)] == keys[pending])
+            rows[pending[hit]] = found[hit]
+            pending = pending[found >= 0][~hit[found >= 0]]
+            slots[pending] = (slots[pending] + 1) & mask
+        return rows
+
+    def _index_rows(self, keys: np.ndarray, rows: np.ndarray) -> None:
+        """Add rows to the index by linear probing, one round per probe step for the whole batch."""
+        mask = self.index_slots - 1
+        slots = (keys & np.uint64(mask)).astype(np.int64)
+        pending = np.arange(len(keys))
+        while len(pending):
+            targets = slots[pending]
+            free = self.index[targets] < 0
+            # Of several keys probing the same free slot, the first takes it
+            _, first = np.unique(targets[free], return_index=True)
+            winners = pending[free][first]
+            self.index[slots[winners]] = rows[winners]
+            placed = np.zeros(len(keys), dtype=bool)
+            placed[winners] = True
+            pending = pending[~placed[pending]]
+            slots[pending] = (slots[pending] + 1) & mask
+
+    def _insert(self, keys: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+        """
+        Start tracking new keys, each from the given bucket.
+
+        Returns:
+            np.ndarray: Their rows (-1 for keys there is no room for)
+        """
+        size = len(self)
+        if size + len(keys) > self.max_entities:
+            self._evict(len(keys), int(buckets.max()))
+            size = len(self)
+        room = min(len(keys), self.max_entities - size)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        rows[:room] = np.arange(size, size + room)
+        self.stats["untracked"] += len(keys) - room
+        if room:
+            new = self.entities[size:size + room]
+            new["key"] = keys[:room]
+            new["bucket"] = buckets[:room]
+            new["alerted"] = _NEVER
+            new["count"] = 0
+            new["m1"] = 0
+            new["m2"] = 0
+            new["n"] = 0
+            new["profile"] = PROFILE_ONE
+            self._index_rows(keys[:room], rows[:room])
+            self._header["size"][0] = size + room
+            self.stats["created"] += room
+        return rows
+
+    def _evict(self, needed: int, bucket: int) -> None:
+        """Drop idle entities, then the least recently seen, to leave room for needed new ones."""
+        size = len(self)
+        last = self.entities["bucket"][:size]
+        keep = np.flatnonzero(last >= bucket - settings.ANOMALY_IDLE_SECONDS // self.bucket_seconds)
+        # Leave some headroom so a full table is not compacted on every batch
+        budget = max(min(size, int(self.max_entities * 0.9)) - needed, 0)
+        if len(keep) > budget:
+            keep = np.sort(keep[np.argpartition(-last[keep], budget - 1)[:budget]]) if budget else keep[:0]
+        # keep is ascending, so rows only move toward the front and chunks never overwrite rows still to be moved
+        for start in range(0, len(keep), 65536):
+            chunk = keep[start:start + 65536]
+            self.entities[start:start + len(chunk)] = self.entities[chunk]
+        self.index.fill(-1)
+        self._index_rows(self.entities["key"][:len(keep)].copy(), np.arange(len(keep)))
+        self._header["size"][0] = len(keep)
+        self.stats["evicted"] += size - len(keep)
+
+    def _close_buckets(self, rows: np.ndarray, closed: np.ndarray, current: np.ndarray) -> None:
+        """Fold the closed bucket of each row (and the empty buckets up to current) into its baseline."""
+        entities = self.entities
+        alpha = settings.ANOMALY_ALPHA
+        count = entities["count"][rows].astype(np.float64)
+        m1 = entities["m1"][rows].astype(np.float64)
+        m2 = entities["m2"][rows].astype(np.float64)
+        n = entities["n"][rows].astype(np.float64)
+        hours = hour_of_week(closed, self.bucket_seconds)
+        profile = entities["profile"][rows, hours].astype(np.float64)
+        factor = np.maximum(profile, 1.0) / PROFILE_ONE
+        rate = count / factor
+        # Plain averages until there are 1 / alpha buckets, then exponential weights
+        weight = np.maximum(alpha, 1.0 / (n + 1.0))
+        m1 += weight * (rate - m1)
+        m2 += weight * (rate * rate - m2)
+        n += 1.0
+        baseline = m1 > 0
+        if baseline.any():
+            target = np.minimum(count[baseline] / m1[baseline] * PROFILE_ONE, PROFILE_MAX)
+            updated = profile[baseline] + settings.ANOMALY_SEASONAL_ALPHA * (target - profile[baseline])
+            entities["profile"][rows[baseline], hours[baseline]] = np.clip(np.rint(updated), 1, PROFILE_MAX)
+        # Each empty bucket scales both moments by (1 - weight)
+        gaps = (current - closed - 1).astype(np.float64)
+        averaged = np.clip(np.floor(1.0 / alpha) - n, 0.0, gaps)
+        decay = n / (n + averaged) * np.power(1.0 - alpha, gaps - averaged)
+        entities["m1"][rows] = m1 * decay
+        entities["m2"][rows] = m2 * decay
+        entities["n"][rows] = np.minimum(n + gaps, np.iinfo(np.uint32).max)
+        entities["count"][rows] = 0
+        entities["bucket"][rows] = current
+
+    def _update(self, rows: np.ndarray, buckets: np.ndarray, counts: np.ndarray):
+        """Add counts to distinct rows and score their current buckets."""
+        entities = self.entities
+        current = entities["bucket"][rows]
+        # Late events count toward the entity's newest bucket
+        buckets = np.maximum(buckets, current)
+        moved = buckets > current
+        if moved.any():
+            self._close_buckets(rows[moved], current[moved], buckets[moved])
+        count = entities["count"][rows].astype(np.float64) + counts
+        entities["count"][rows] = count
+        hours = hour_of_week(buckets, self.bucket_seconds)
+        factor = np.maximum(entities["profile"][rows, hours], 1) / PROFILE_ONE
+        m1 = entities["m1"][rows].astype(np.float64)
+        m2 = entities["m2"][rows].astype(np.float64)
+        expected = m1 * factor
+        variance = np.maximum(np.maximum(m2 - m1 * m1, 0.0) * factor * factor, np.maximum(expected, 1.0))
+        z_scores = (count - expected) / np.sqrt(variance)
+        cooldown = max(settings.ANOMALY_COOLDOWN_SECONDS // self.bucket_seconds, 1)
+        anomalous = (
+            (z_scores >= settings.ANOMALY_Z_THRESHOLD)
+            & (count >= settings.ANOMALY_MIN_EVENTS)
+            & (entities["n"][rows] >= settings.ANOMALY_WARMUP_BUCKETS)
+            & (buckets - entities["alerted"][rows] >= cooldown)
+        )
+        entities["alerted"][rows[anomalous]] = buckets[anomalous]
+        return anomalous, count, expected, z_scores, buckets, hours
+
+    def observe(
+        self,
+        events: Sequence[Dict[str, Any]],
+        rule_ids: Optional[Sequence[Iterable[str]]] = None,
+        now: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Count a batch of events toward the rates of their agents, source IPs and matched rules.
+
+        Args:
+            events: Events as ingested; a numeric "timestamp" (epoch
+                seconds) places an event in its bucket, else the current time
+            rule_ids: Per event, the ids of the rules it matched
+            now: Time for events without a timestamp (defaults to the current time)
+
+        Returns:
+            list: One anomaly per entity whose current rate is anomalous
+        """
+        now = time.time() if now is None else now
+        keys, buckets, refs = [], [], []
+        bucket_seconds = self.bucket_seconds
+        for position, event in enumerate(events):
+            timestamp = event.get("timestamp")
+            if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool) or not math.isfinite(timestamp):
+                timestamp = now
+            bucket = int(timestamp // bucket_seconds)
+            for entity in event_entities(event, rule_ids[position] if rule_ids is not None else ()):
+                keys.append(entity_key(*entity))
+                buckets.append(bucket)
+                refs.append((entity, position))
+        self.stats["events"] += len(events)
+        if not keys:
+            return []
+        self.stats["observations"] += len(keys)
+        keys = np.array(keys, dtype=np.uint64)
+        buckets = np.array(buckets, dtype=np.int64)
+        rows = self._lookup(keys)
+        missing = rows < 0
+        if missing.any():
+            new_keys, inverse = np.unique(keys[missing], return_inverse=True)
+            first = np.full(len(new_keys), np.iinfo(np.int64).max)
+            np.minimum.at(first, inverse, buckets[missing])
+            evicted = self.stats["evicted"]
+            rows[missing] = self._insert(new_keys, first)[inverse]
+            if self.stats["evicted"] != evicted:
+                # Eviction moved rows
+                rows = self._lookup(keys)
+        tracked = np.flatnonzero(rows >= 0)
+        # One group per (row, bucket); a row with events in several buckets is updated once per bucket, in order
+        order = tracked[np.lexsort((buckets[tracked], rows[tracked]))]
+        group_rows, group_buckets = rows[order], buckets[order]
+        starts = np.flatnonzero(np.r_[True, (group_rows[1:] != group_rows[:-1]) | (group_buckets[1:] != group_buckets[:-1])])
+        counts = np.diff(np.r_[starts, len(order)]).astype(np.float64)
+        row_starts = np.r_[True, group_rows[starts][1:] != group_rows[starts][:-1]]
+        rank = np.arange(len(starts)) - np.maximum.accumulate(np.where(row_starts, np.arange(len(starts)), 0))
+        anomalies = []
+        for step in range(int(rank.max()) + 1 if len(rank) else 0):
+            groups = np.flatnonzero(rank == step)
+            anomalous, count, expected, z_scores, bucket_ids, hours = self._update(
+                group_rows[starts[groups]], group_buckets[starts[groups]], counts[groups]
+            )
+            for index in np.flatnonzero(anomalous):
+                (entity_type, entity), position = refs[order[starts[groups[index]]]]
+                anomalies.append({
+                    "entity_type": entity_type,
+                    "entity": entity,
+                    "count": int(count[index]),
+                    "expected": round(float(expected[index]), 2),
+                    "z_score": round(float(z_scores[index]), 2),
+                    "bucket_start": datetime.fromtimestamp(int(bucket_ids[index]) * bucket_seconds, tz=timezone.utc).isoformat(),
+                    "bucket_seconds": bucket_seconds,
+                    "hour_of_week": int(hours[index]),
+                    "event": events[position],
+                })
+        self.stats["anomalies"] += len(anomalies)
+        return anomalies
+
+    def baseline(self, entity_type: str, value: Any) -> Optional[Dict[str, Any]]:
+        """The learned rate of one entity, None if it is not tracked."""
+        if self._map is None:
+            return None
+        row = int(self._lookup(np.array([entity_key(entity_type, value)], dtype=np.uint64))[0])
+        if row < 0:
+            return None
+        entity = self.entities[row]
+        m1, m2 = float(entity["m1"]), float(entity["m2"])
+        return {
+            "entity_type": entity_type,
+            "entity": str(value),
+            "bucket_seconds": self.bucket_seconds,
+            "mean": round(m1, 3),
+            "stddev": round(math.sqrt(max(m2 - m1 * m1, 0.0)), 3),
+            "buckets": int(entity["n"]),
+            "current_count": int(entity["count"]),
+            "current_bucket_start": datetime.fromtimestamp(int(entity["bucket"]) * self.bucket_seconds, tz=timezone.utc).isoformat(),
+            "hour_of_week_factors": [round(int(value) / PROFILE_ONE, 3) for value in entity["profile"]],
+        }
+
+    def flush(self) -> None:
+        """Write the mapped state back to disk (a no-op for in-memory state)."""
+        if self.persistent:
+            self._map.flush()
+            self.stats["flushes"] += 1
+
+    def close(self) -> None:
+        if self._map is None:
+            return
+        self.flush()
+        # The array views must go before the mapping can be closed
+        del self._header, self.entities, self.index
+        self._map.close()
+        self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self.persistent = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            entities=len(self),
+            max_entities=self.max_entities,
+            bucket_seconds=self.bucket_seconds,
+            persistent=self.persistent,
+            path=self.state_path
+        )
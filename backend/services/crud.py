@@ -0,0 +1,64 @@
+from enum import Enum
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+from sqlalchemy import Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+def integer_id(value: Any) -> Optional[int]:
+    """An id sent as a string (the API models declare ids as str) as an integer, or None."""
+    if isinstance(value, str):
+        return int(value) if value.strip().lstrip("-").isdigit() else None
+    return value
+
+class CrudService:
+    """
+    Create, read, update and delete for one table.
+
+    Request models are written column by column: fields without a column
+    are ignored, enums are stored by value and ids sent as strings (the API
+    models declare them as str) are stored as integers.
+    """
+
+    model: Any = None
+
+    def _values(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        columns = self.model.__table__.c
+        values = {}
+        for name, value in data.items():
+            if name == "id" or name not in columns:
+                continue
+            if isinstance(value, Enum):
+                value = value.value
+            if isinstance(value, str) and isinstance(columns[name].type, Integer):
+                value = integer_id(value)
+            values[name] = value
+        return values
+
+    async def create(self, db: AsyncSession, data: BaseModel) -> Any:
+        record = self.model(**self._values(data.model_dump()))
+        db.add(record)
+        await db.commit()
+        # Load the server defaults (created_at)
+        await db.refresh(record)
+        return record
+
+    async def get(self, db: AsyncSession, record_id: int) -> Optional[Any]:
+        return await db.get(self.model, record_id)
+
+    async def update(self, db: AsyncSession, record_id: int, data: BaseModel) -> Optional[Any]:
+        record = await db.get(self.model, record_id)
+        if record is None:
+            return None
+        for name, value in self._values(data.model_dump(exclude_unset=True)).items():
+            setattr(record, name, value)
+        await db.commit()
+        await db.refresh(record)
+        return record
+
+    async def delete(self, db: AsyncSession, record_id: int) -> bool:
+        record = await db.get(self.model, record_id)
+        if record is None:
+            return False
+        await db.delete(record)
+        await db.commit()
+        return True
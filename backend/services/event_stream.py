@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+from fastapi.encoders import jsonable_encoder
+from config import settings
+
+try:
+    import orjson
+    def json_dumps(value: Any) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:  # pragma: no cover - orjson is optional
+    def json_dumps(value: Any) -> str:
+        return json.dumps(value, separators=(",", ":"))
+
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+class StreamFull(Exception):
+    """Raised when the broadcaster has no room for another subscriber."""
+
+class StreamEvent:
+    """One published event, serialized once for every subscriber and transport."""
+
+    __slots__ = ("id", "type", "severity", "agent_id", "text", "sse")
+
+    def __init__(self, event_id: int, event_type: str, payload: Any, severity: Any, agent_id: Any):
+        self.id = event_id
+        self.type = event_type
+        self.severity = None if severity is None else str(getattr(severity, "value", severity))
+        self.agent_id = None if agent_id is None else str(agent_id)
+        # WebSocket clients get the JSON text, SSE clients the ready-made frame
+        self.text = json_dumps({"id": event_id, "type": event_type, "data": jsonable_encoder(payload)})
+        self.sse = f"id: {event_id}\nevent: {event_type}\ndata: {self.text}\n\n".encode()
+
+class Subscriber:
+    """
+    A client's bounded buffer of events.
+
+    The broadcaster never waits on a subscriber: when the buffer is full the
+    subscriber is dropped and its stream ends, and the client reconnects
+    with the id of the last event it got.
+    """
+
+    def __init__(self, severities: Optional[Set[str]], agent_ids: Optional[Set[str]], buffer_size: int):
+        self.severities = severities
+        self.agent_ids = agent_ids
+        self.buffer_size = buffer_size
+        self.dropped = False
+        self._buffer: Deque[StreamEvent] = deque()
+        self._ready = asyncio.Event()
+
+    def matches(self, event: StreamEvent) -> bool:
+        if self.severities is not None and event.severity not in self.severities:
+            return False
+        if self.agent_ids is not None and event.agent_id not in self.agent_ids:
+            return False
+        return True
+
+    def push(self, event: StreamEvent) -> bool:
+        if len(self._buffer) >= self.buffer_size:
+            self.dropped = True
+            self._ready.set()
+            return False
+        self._buffer.append(event)
+        self._ready.set()
+        return True
+
+    async def next_batch(self, timeout: float) -> Optional[List[StreamEvent]]:
+        """
+        Wait for events.
+
+        Returns:
+            list: The buffered events, empty if none arrived within the
+                timeout, or None once the subscriber was dropped
+        """
+        if not self._buffer and not self.dropped:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        if self.dropped:
+            return None
+        batch = list(self._buffer)
+        self._buffer.clear()
+        return batch
+
+class Broadcaster:
+    """
+    In-process pub/sub for live feeds.
+
+    Each published event gets an increasing id and is serialized once; the
+    bytes are handed to every matching subscriber. The last STREAM_RING_SIZE
+    events are kept in a ring buffer so a reconnecting client can resume
+    after the last id it got (SSE Last-Event-ID). Ids start from the
+    startup time in milliseconds, so ids from before a restart are older
+    than the ring and make the client reload instead.
+    """
+
+    def __init__(self, ring_size: Optional[int] = None, buffer_size: Optional[int] = None):
+        self.buffer_size = buffer_size or settings.STREAM_CLIENT_BUFFER
+        self._ring: Deque[StreamEvent] = deque(maxlen=ring_size or settings.STREAM_RING_SIZE)
+        self._subscribers: Set[Subscriber] = set()
+        self._next_id = int(time.time() * 1000)
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "replayed": 0}
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, payload: Any, severity: Any = None, agent_id: Any = None) -> StreamEvent:
+        self._next_id += 1
+        event = StreamEvent(self._next_id, event_type, payload, severity, agent_id)
+        self._ring.append(event)
+        self.stats["published"] += 1
+        dropped = []
+        for subscriber in self._subscribers:
+            if not subscriber.matches(event):
+                continue
+            if subscriber.push(event):
+                self.stats["delivered"] += 1
+            else:
+                dropped.append(subscriber)
+        for subscriber in dropped:
+            self._subscribers.discard(subscriber)
+            self.stats["dropped"] += 1
+        return event
+
+    def subscribe(
+        self,
+        severities: Optional[Iterable[str]] = None,
+        agent_ids: Optional[Iterable[Any]] = None,
+        last_event_id: Optional[int] = None
+    ) -> Subscriber:
+        """
+        Add a subscriber, with the events after last_event_id already buffered.
+
+        When last_event_id is older than the ring buffer a "reset" event is
+        buffered first: the client missed events and should reload.
+
+        Raises:
+            StreamFull: If STREAM_MAX_SUBSCRIBERS clients are connected
+        """
+        if len(self._subscribers) >= settings.STREAM_MAX_SUBSCRIBERS:
+            raise StreamFull(f"{len(self._subscribers)} clients are already subscribed")
+        subscriber = Subscriber(
+            set(severities) if severities else None,
+            {str(agent_id) for agent_id in agent_ids} if agent_ids else None,
+            self.buffer_size
+        )
+        if last_event_id is not None:
+            # Replay and registration happen without awaiting, so no event falls in between
+            oldest = self._ring[0].id if self._ring else self._next_id + 1
+            missed = [event for event in self._ring if event.id > last_event_id and subscriber.matches(event)]
+            if last_event_id < oldest - 1 or last_event_id > self._next_id or len(missed) > self.buffer_size:
+                # An id of its own: the client resumes after it, and no published event shares it
+                self._next_id += 1
+                subscriber.push(StreamEvent(self._next_id, "reset", {"last_event_id": last_event_id}, None, None))
+            else:
+                for event in missed:
+                    subscriber.push(event)
+                self.stats["replayed"] += len(missed)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    async def sse(self, subscriber: Subscriber):
+        """Server-Sent Events body for a subscriber, with keepalive comments."""
+        try:
+            yield f"retry: {int(settings.STREAM_RETRY_MS)}\n\n".encode()
+            while True:
+                batch = await subscriber.next_batch(settings.STREAM_KEEPALIVE_SECONDS)
+                if batch is None:
+                    return
+                yield b"".join(event.sse for event in batch) if batch else SSE_KEEPALIVE
+        finally:
+            self.unsubscribe(subscriber)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            subscribers=len(self._subscribers),
+            buffered=len(self._ring),
+            last_event_id=self._next_id
+        )
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import json
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union, get_args, get_origin
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from config import settings
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+    DefaultResponse = JSONResponse
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is used without it
+    brotli = None
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize trusted content (rows, dicts of columns) to JSON bytes.
+
+    orjson handles datetimes, enums and nested JSON columns natively, so
+    the content does not go through jsonable_encoder first. Anything it
+    cannot serialize falls back to the encoder FastAPI would have used.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(content)
+        except TypeError:
+            pass
+    return json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+
+def _is_str_field(annotation: Any) -> bool:
+    return annotation is str or (get_origin(annotation) is Union and str in get_args(annotation))
+
+class RecordSerializer:
+    """
+    Turns ORM objects into dicts in the shape of their response model.
+
+    The column list and getter are built once per model, so serializing a
+    record is one attrgetter call rather than response-model validation of
+    data that came out of our own database. Only the columns the response
+    model declares are returned, and numbers in its str fields (the ids)
+    are sent as strings, as its coerce_numbers_to_str config would.
+    """
+
+    def __init__(self, names: Sequence[str], as_str: Sequence[str] = ()):
+        self.names = tuple(names)
+        self.as_str = tuple(name for name in as_str if name in self.names)
+        getter = attrgetter(*self.names)
+        self._values = getter if len(self.names) > 1 else (lambda record: (getter(record),))
+
+    @classmethod
+    def for_model(cls, model: Any, response_model: Any = None) -> "RecordSerializer":
+        """
+        Args:
+            model: The ORM model
+            response_model: The pydantic model the endpoints declare, or None
+                to return every column as stored
+
+        Returns:
+            RecordSerializer: The serializer for the model's records
+        """
+        columns = [column.key for column in model.__mapper__.column_attrs]
+        if response_model is None:
+            return cls(columns)
+        fields = response_model.model_fields
+        names = [name for name in columns if name in fields]
+        return cls(names, [name for name in names if _is_str_field(fields[name].annotation)])
+
+    def _coerce(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        for name in self.as_str:
+            value = values.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[name] = str(value)
+        return values
+
+    def one(self, record: Any) -> Dict[str, Any]:
+        return self._coerce(dict(zip(self.names, self._values(record))))
+
+    def many(self, records: Iterable[Any]) -> List[Dict[str, Any]]:
+        names, values = self.names, self._values
+        return self.rows([dict(zip(names, values(record))) for record in records])
+
+    def row(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a dict of column values (an archived row) like a record."""
+        return self._coerce({name: values[name] for name in self.names if name in values})
+
+    def rows(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Coerce dicts already holding only these names (a page) in place."""
+        if self.as_str:
+            for row in rows:
+                self._coerce(row)
+        return rows
+
+def preferred_encoding(accept_encoding: str) -> Optional[str]:
+    """br or gzip, whichever the client accepts and we can produce, br first."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" match
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == opaque
+        for tag in if_none_match.split(",")
+    )
+
+def json_response(
+    request: Request,
+    content: Any,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    The fast response path for hot read endpoints.
+
+    The content is serialized once with orjson and tagged with a weak ETag
+    of the body. A request whose If-None-Match holds that ETag gets an
+    empty 304. Bodies of RESPONSE_COMPRESS_MIN_BYTES or more are compressed
+    with br (when the brotli package is installed) or gzip, as the client
+    accepts.
+    """
+    body = dumps(content)
+    response_headers = dict(headers or {})
+    if settings.RESPONSE_ETAGS and status_code == 200:
+        etag = 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        response_headers["ETag"] = etag
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=response_headers)
+
+    min_bytes = settings.RESPONSE_COMPRESS_MIN_BYTES
+    if min_bytes and len(body) >= min_bytes:
+        response_headers["Vary"] = "Accept-Encoding"
+        encoding = preferred_encoding(request.headers.get("accept-encoding", ""))
+        if encoding == "br":
+            body = brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+    return Response(content=body, status_code=status_code, headers=response_headers, media_type="application/json")
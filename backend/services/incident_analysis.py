@@ -0,0 +1,370 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import aiohttp
+from sqlalchemy import bindparam, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import settings
+from database import AsyncSessionLocal, async_engine
+from models.analysis import IncidentAnalysis
+from services.incident_correlation import normalize_description
+
+# Bump whenever ANALYSIS_PROMPT changes, so cached analyses of the old prompt are not served
+PROMPT_VERSION = "1"
+
+# Same prompt as src/ai/flows/analyze-security-incident.ts
+ANALYSIS_PROMPT = """You are a security analyst. Analyze the following security incident and the user's message and provide a summarized analysis of potential threats and vulnerabilities.
+
+Incident Time: {time}
+Source IP: {sourceIp}
+Threat Level: {threatLevel}
+Description: {description}
+
+User Message: {message}
+
+Analysis:"""
+
+# Prompt text and inputs -> analysis text
+Analyzer = Callable[[str, Dict[str, str]], Awaitable[str]]
+
+class AnalysisError(Exception):
+    """Raised when the model call fails or returns no analysis."""
+
+class AnalysisUnavailable(AnalysisError):
+    """Raised when no analysis model is configured."""
+
+def analysis_inputs(incident: Dict[str, Any], message: str = "") -> Dict[str, str]:
+    """Prompt inputs for an incident, named like the frontend flow's schema."""
+    details = incident.get("details") or {}
+    created_at = incident.get("created_at")
+    return {
+        "time": created_at.isoformat() if hasattr(created_at, "isoformat") else str(created_at or ""),
+        "sourceIp": str(details.get("source_ip") or details.get("sourceIp") or ""),
+        "threatLevel": str(incident.get("severity") or ""),
+        "description": incident.get("description") or incident.get("title") or "",
+        "message": message or ""
+    }
+
+def analysis_fingerprint(inputs: Dict[str, str]) -> str:
+    """
+    Fingerprint the prompt inputs of an analysis.
+
+    The incident time is left out and the description and message are
+    normalized like duplicate detection does (ids, numbers and timestamps
+    masked), so lookalike incidents from the same source share an analysis.
+    """
+    parts = [
+        inputs["threatLevel"].lower(),
+        inputs["sourceIp"],
+        normalize_description(inputs["description"]),
+        normalize_description(inputs["message"])
+    ]
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+def cache_key(fingerprint: str, model: str, prompt_version: str = PROMPT_VERSION) -> str:
+    """Cache key of an analysis; analyses of another model or prompt are never served."""
+    return hashlib.blake2b(f"{model}\x1f{prompt_version}\x1f{fingerprint}".encode(), digest_size=16).hexdigest()
+
+async def stub_analyzer(prompt: str, inputs: Dict[str, str]) -> str:
+    """Offline model: a canned analysis after a short delay."""
+    delay = settings.ANALYSIS_STUB_DELAY_SECONDS
+    if delay:
+        await asyncio.sleep(delay)
+    return (
+        f"{inputs['threatLevel'] or 'Unknown'} severity activity from {inputs['sourceIp'] or 'an unknown source'}: "
+        f"{inputs['description']}\n\n"
+        "1. Verify the source of the alert\n"
+        "2. Check whether this is a false positive\n"
+        "3. If confirmed, start the incident response playbook"
+    )
+
+class ModelClient:
+    """
+    Client for the analysis model endpoint at ANALYSIS_MODEL_URL.
+
+    The endpoint takes {"prompt", "inputs"} and returns {"analysis"}. The
+    HTTP session keeps its connections alive between calls.
+    """
+
+    def __init__(self, url: Optional[str] = None, name: Optional[str] = None):
+        self.url = url or settings.ANALYSIS_MODEL_URL
+        # Part of the cache key: analyses of one model are not served for another
+        self.model_id = name or settings.ANALYSIS_MODEL_NAME or self.url
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.ANALYSIS_MODEL_CONCURRENCY),
+                timeout=aiohttp.ClientTimeout(total=settings.ANALYSIS_MODEL_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def __call__(self, prompt: str, inputs: Dict[str, str]) -> str:
+        session = await self.get_session()
+        async with session.post(self.url, json={"prompt": prompt, "inputs": inputs}) as response:
+            if response.status != 200:
+                raise AnalysisError(f"Model returned HTTP {response.status}")
+            body = await response.json(content_type=None)
+        analysis = body.get("analysis") if isinstance(body, dict) else None
+        if not analysis:
+            raise AnalysisError("Model returned no analysis")
+        return analysis
+
+def model_identity(analyzer: Optional[Analyzer]) -> Optional[str]:
+    """The name an analyzer's results are cached under."""
+    if analyzer is None:
+        return None
+    if analyzer is stub_analyzer:
+        return "stub"
+    model_id = getattr(analyzer, "model_id", None)
+    if model_id:
+        return model_id
+    return f"{getattr(analyzer, '__module__', '')}.{getattr(analyzer, '__qualname__', type(analyzer).__qualname__)}"
+
+def upsert_statement(dialect: str):
+    """INSERT of a cache row that replaces an existing row with the same key."""
+    insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+    statement = insert(IncidentAnalysis.__table__)
+    return statement.on_conflict_do_update(
+        index_elements=["key"],
+        set_={
+            column: statement.excluded[column]
+            for column in ("result", "created_at", "expires_at", "last_used_at", "hits")
+        }
+    )
+
+class AnalysisCache:
+    """
+    Incident analyses cached by fingerprint, with one model call per fingerprint.
+
+    Results are kept in SQLite (incident_analyses) for
+    ANALYSIS_CACHE_TTL_SECONDS, with the most recently used
+    ANALYSIS_CACHE_MEMORY_ENTRIES also in an in-memory LRU map. Concurrent
+    requests for the same fingerprint share one in-flight call, so a storm
+    of lookalike incidents costs a single model call. Model calls are
+    limited to ANALYSIS_MODEL_CONCURRENCY at a time.
+
+    Cache hits only record their use in memory; flush() writes the use
+    times with one batched UPDATE, then deletes expired rows and the least
+    recently used rows beyond ANALYSIS_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, analyzer: Optional[Analyzer] = None, model: Optional[str] = None):
+        if analyzer is None:
+            if settings.ANALYSIS_MODEL_URL:
+                analyzer = ModelClient()
+            elif settings.ANALYSIS_MODEL_STUB:
+                analyzer = stub_analyzer
+        self.analyzer = analyzer
+        self.model = model or model_identity(analyzer)
+        self.ttl_seconds = settings.ANALYSIS_CACHE_TTL_SECONDS
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Key -> (hits, last use) not yet written
+        self._pending_uses: Dict[str, Tuple[int, float]] = {}
+        self._model_slots = asyncio.Semaphore(settings.ANALYSIS_MODEL_CONCURRENCY)
+        self.stats = {
+            "memory_hits": 0, "db_hits": 0, "coalesced": 0, "misses": 0,
+            "model_calls": 0, "model_errors": 0, "evicted": 0
+        }
+
+    def _remember(self, key: str, result: Dict[str, Any], expires_at: float) -> None:
+        self._memory[key] = (result, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > settings.ANALYSIS_CACHE_MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _used(self, key: str, now: float) -> None:
+        hits, _ = self._pending_uses.get(key, (0, now))
+        self._pending_uses[key] = (hits + 1, now)
+
+    async def analyze(self, incident: Dict[str, Any], message: str = "", refresh: bool = False) -> Dict[str, Any]:
+        """
+        Analyze an incident, from the cache when possible.
+
+        Args:
+            incident: Incident columns (severity, description, details, created_at, ...)
+            message: The analyst's question, part of the prompt and the fingerprint
+            refresh: Call the model even if a cached analysis exists
+
+        Returns:
+            dict: analysis, fingerprint, model, prompt_version, created_at
+                and cached, False when the analysis comes from a model call
+                made for this request or a concurrent one
+
+        Raises:
+            AnalysisUnavailable: If no model is configured
+            AnalysisError: If the model call fails
+        """
+        if self.analyzer is None:
+            raise AnalysisUnavailable(
+                "No analysis model configured: set ANALYSIS_MODEL_URL (or ANALYSIS_MODEL_STUB for development)"
+            )
+        inputs = analysis_inputs(incident, message)
+        fingerprint = analysis_fingerprint(inputs)
+        key = cache_key(fingerprint, self.model)
+        now = time.time()
+
+        if not refresh:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._used(key, now)
+                self.stats["memory_hits"] += 1
+                return {**entry[0], "cached": True}
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.create_task(self._load(key, fingerprint, inputs, refresh))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        # Shielded so a caller disconnecting does not cancel the call for the others
+        result, cached = await asyncio.shield(task)
+        return {**result, "cached": cached}
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every waiter has gone
+            task.exception()
+
+    async def _load(self, key: str, fingerprint: str, inputs: Dict[str, str], refresh: bool) -> Tuple[Dict[str, Any], bool]:
+        now = time.time()
+        if not refresh:
+            async with AsyncSessionLocal() as db:
+                row = (await db.execute(
+                    select(IncidentAnalysis.result, IncidentAnalysis.expires_at)
+                    .where(IncidentAnalysis.key == key, IncidentAnalysis.expires_at > now)
+                )).first()
+            if row is not None:
+                self._remember(key, row.result, row.expires_at)
+                self._used(key, now)
+                self.stats["db_hits"] += 1
+                return row.result, True
+
+        self.stats["misses"] += 1
+        async with self._model_slots:
+            self.stats["model_calls"] += 1
+            try:
+                analysis = await self.analyzer(ANALYSIS_PROMPT.format(**inputs), inputs)
+            except AnalysisError:
+                self.stats["model_errors"] += 1
+                raise
+            except Exception as e:
+                self.stats["model_errors"] += 1
+                raise AnalysisError(f"Model call failed: {str(e)}") from e
+
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        result = {
+            "analysis": analysis,
+            "fingerprint": fingerprint,
+            "model": self.model,
+            "prompt_version": PROMPT_VERSION,
+            "created_at": now
+        }
+        self._remember(key, result, expires_at)
+        self._pending_uses.pop(key, None)
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(upsert_statement(async_engine.dialect.name), [{
+                    "key": key,
+                    "fingerprint": fingerprint,
+                    "prompt_version": PROMPT_VERSION,
+                    "result": result,
+                    "created_at": now,
+                    "expires_at": expires_at,
+                    "last_used_at": now,
+                    "hits": 0
+                }])
+        except Exception as e:
+            # The analysis is still served from memory
+            print(f"Error storing incident analysis: {str(e)}")
+        return result, False
+
+    async def analyze_many(
+        self,
+        incidents: Sequence[Dict[str, Any]],
+        message: str = "",
+        concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze a batch of incidents, at most `concurrency` at a time.
+
+        Lookalike incidents in the batch share one model call.
+
+        Returns:
+            list: One result per incident, in input order; failed analyses
+                are {"error": ...}
+        """
+        slots = asyncio.Semaphore(concurrency or settings.ANALYSIS_BATCH_CONCURRENCY)
+
+        async def run(incident: Dict[str, Any]) -> Dict[str, Any]:
+            async with slots:
+                try:
+                    return await self.analyze(incident, message)
+                except AnalysisError as e:
+                    return {"error": str(e)}
+
+        return await asyncio.gather(*(run(incident) for incident in incidents))
+
+    async def flush(self) -> int:
+        """
+        Write buffered cache hits and evict expired and least recently used rows.
+
+        Returns:
+            int: Number of rows evicted
+        """
+        uses, self._pending_uses = self._pending_uses, {}
+        table = IncidentAnalysis.__table__
+        now = time.time()
+        try:
+            async with async_engine.begin() as conn:
+                if uses:
+                    await conn.execute(
+                        update(table)
+                        .where(table.c.key == bindparam("cache_key"))
+                        .values(hits=table.c.hits + bindparam("extra"), last_used_at=bindparam("used_at")),
+                        [{"cache_key": key, "extra": hits, "used_at": used_at} for key, (hits, used_at) in uses.items()]
+                    )
+                evicted = (await conn.execute(delete(table).where(table.c.expires_at <= now))).rowcount
+                excess = (await conn.execute(select(func.count()).select_from(table))).scalar() - settings.ANALYSIS_CACHE_MAX_ENTRIES
+                if excess > 0:
+                    oldest = select(table.c.key).order_by(table.c.last_used_at).limit(excess).scalar_subquery()
+                    evicted += (await conn.execute(delete(table).where(table.c.key.in_(oldest)))).rowcount
+        except Exception as e:
+            for key, (hits, used_at) in uses.items():
+                pending, latest = self._pending_uses.get(key, (0, used_at))
+                self._pending_uses[key] = (pending + hits, max(latest, used_at))
+            print(f"Error flushing incident analysis cache: {str(e)}")
+            return 0
+        self.stats["evicted"] += evicted
+        return evicted
+
+    async def close(self) -> None:
+        await self.flush()
+        if isinstance(self.analyzer, ModelClient):
+            await self.analyzer.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["memory_hits"] + self.stats["db_hits"] + self.stats["coalesced"] + self.stats["misses"]
+        return dict(
+            self.stats,
+            hit_ratio=(lookups - self.stats["misses"]) / lookups if lookups else 0.0,
+            memory_entries=len(self._memory),
+            in_flight=len(self._inflight),
+            prompt_version=PROMPT_VERSION,
+            model=self.model
+        )
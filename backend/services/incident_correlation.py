@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database import async_engine
+from models.case import IncidentCase
+from models.incident import Incident
+from services.crud import integer_id
+
+OPEN_STATUSES = ("open", "in_progress")
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+# Incident fields kept in memory so duplicates can be answered without a read
+SNAPSHOT_FIELDS = (
+    "id", "title", "description", "severity", "status", "source", "agent_id",
+    "details", "created_at", "updated_at", "resolved_at", "case_id", "fingerprint"
+)
+
+_IPV4 = r"\d{1,3}(?:\.\d{1,3}){3}"
+# Values that differ between repeats of the same incident: ids, hashes,
+# timestamps and numbers. IP addresses are kept, with any port masked.
+_VOLATILE = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|\d{4}-\d{2}-\d{2}[t ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:z|[+-]\d{2}:?\d{2})?"
+    r"|\d{2}:\d{2}:\d{2}"
+    rf"|(?P<ip>{_IPV4})(?::\d+)?"
+    r"|0x[0-9a-f]+|\b[0-9a-f]{16,}\b|\d+"
+)
+_SPACES = re.compile(r"\s+")
+
+def normalize_description(text: Optional[str]) -> str:
+    """Lowercase a description and mask the parts that vary between repeats."""
+    if not text:
+        return ""
+    masked = _VOLATILE.sub(lambda m: m.group("ip") or "#", text.lower())
+    return _SPACES.sub(" ", masked).strip()
+
+def incident_fingerprint(
+    source: Optional[str],
+    agent_id: Any,
+    techniques: Iterable[str],
+    description: Optional[str]
+) -> str:
+    """
+    Fingerprint an incident for duplicate detection.
+
+    Incidents from the same source and agent, tagged with the same MITRE
+    techniques and with the same description once volatile values are
+    masked, get the same fingerprint.
+    """
+    parts = [
+        source or "",
+        "" if agent_id is None else str(agent_id),
+        ",".join(sorted(set(techniques))),
+        normalize_description(description)
+    ]
+    return hashlib.blake2b("\x1f".join(parts).encode(), digest_size=16).hexdigest()
+
+def mitre_techniques(details: Optional[Dict[str, Any]]) -> List[str]:
+    """Technique ids (or names) from the MITRE tags in incident details."""
+    tags = (details or {}).get("mitre") or []
+    return [
+        tag.get("technique_id") or tag.get("technique") or ""
+        for tag in tags if isinstance(tag, dict)
+    ]
+
+def case_keys(agent_id: Any, details: Optional[Dict[str, Any]]) -> List[str]:
+    """Entities whose incidents are grouped into the same case."""
+    keys = []
+    if agent_id is not None and agent_id != "":
+        keys.append(f"agent:{agent_id}")
+    source_ip = (details or {}).get("source_ip")
+    if source_ip:
+        keys.append(f"ip:{source_ip}")
+    return keys
+
+class _OpenIncident:
+    __slots__ = ("snapshot", "count", "last_seen")
+
+    def __init__(self, snapshot: Dict[str, Any], count: int, last_seen: float):
+        self.snapshot = snapshot
+        self.count = count
+        self.last_seen = last_seen
+
+class _OpenCase:
+    __slots__ = ("case_id", "severity", "last_seen")
+
+    def __init__(self, case_id: int, severity: str, last_seen: float):
+        self.case_id = case_id
+        self.severity = severity
+        self.last_seen = last_seen
+
+class IncidentCorrelator:
+    """
+    Folds duplicate incidents into the open incident they repeat and groups
+    related incidents into cases.
+
+    Open incidents are indexed by fingerprint in an LRU map whose entries
+    expire INCIDENT_DEDUP_TTL_SECONDS after their last occurrence. A
+    duplicate only bumps an occurrence counter in memory; the counters are
+    written with one batched UPDATE every INCIDENT_DEDUP_FLUSH_SECONDS. On
+    an index miss (after a restart, or when another worker created the
+    incident) the open incident is looked up by fingerprint in the database.
+
+    Incidents sharing an agent or a source IP within
+    INCIDENT_CASE_WINDOW_SECONDS belong to the same case.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        case_window_seconds: Optional[float] = None
+    ):
+        self.ttl_seconds = ttl_seconds or settings.INCIDENT_DEDUP_TTL_SECONDS
+        self.max_entries = max_entries or settings.INCIDENT_DEDUP_MAX_ENTRIES
+        self.case_window_seconds = case_window_seconds or settings.INCIDENT_CASE_WINDOW_SECONDS
+        self._open: "OrderedDict[str, _OpenIncident]" = OrderedDict()
+        self._fingerprints: Dict[Any, str] = {}
+        self._cases: "OrderedDict[str, _OpenCase]" = OrderedDict()
+        # Fingerprint -> [lock, number of holders and waiters]
+        self._locks: Dict[str, List[Any]] = {}
+        # Writes not yet flushed: incident id -> (extra occurrences, last seen)
+        # and case id -> (extra incidents, severity)
+        self._pending_occurrences: Dict[Any, Tuple[int, datetime]] = {}
+        self._pending_cases: Dict[int, Tuple[int, str]] = {}
+        self.stats = {
+            "received": 0, "created": 0, "deduplicated": 0,
+            "index_hits": 0, "database_hits": 0, "cases_created": 0
+        }
+
+    # Open incident index
+
+    def _lookup(self, fingerprint: str, now: float) -> Optional[_OpenIncident]:
+        entry = self._open.get(fingerprint)
+        if entry is None:
+            return None
+        if now - entry.last_seen > self.ttl_seconds:
+            self._drop(fingerprint)
+            return None
+        self._open.move_to_end(fingerprint)
+        return entry
+
+    def _remember(self, fingerprint: str, snapshot: Dict[str, Any], count: int, now: float) -> _OpenIncident:
+        entry = _OpenIncident(snapshot, count, now)
+        self._open[fingerprint] = entry
+        self._open.move_to_end(fingerprint)
+        self._fingerprints[snapshot["id"]] = fingerprint
+        while len(self._open) > self.max_entries:
+            self._drop(next(iter(self._open)))
+        return entry
+
+    def _drop(self, fingerprint: str) -> None:
+        entry = self._open.pop(fingerprint, None)
+        if entry is not None:
+            self._fingerprints.pop(entry.snapshot["id"], None)
+
+    def forget(self, incident_id: Any) -> None:
+        """Stop folding duplicates into an incident (it was resolved, closed or deleted)."""
+        fingerprint = self._fingerprints.get(incident_id)
+        if fingerprint is not None:
+            self._drop(fingerprint)
+
+    def refresh(self, incident: Any) -> None:
+        """
+        Update the snapshot returned for duplicates of an incident after it was edited.
+
+        An incident that is no longer open is forgotten instead.
+        """
+        fingerprint = self._fingerprints.get(incident.id)
+        if fingerprint is None:
+            return
+        if _value(incident.status) not in OPEN_STATUSES:
+            self._drop(fingerprint)
+            return
+        entry = self._open.get(fingerprint)
+        if entry is not None:
+            entry.snapshot = _snapshot(incident)
+
+    @asynccontextmanager
+    async def _locked(self, fingerprint: str) -> AsyncIterator[None]:
+        # The lock is shared by everyone waiting on the fingerprint and only
+        # dropped by the last of them, so a late waiter cannot get a new one
+        entry = self._locks.get(fingerprint)
+        if entry is None:
+            entry = self._locks[fingerprint] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[fingerprint]
+
+    async def _find_open(self, db: AsyncSession, fingerprint: str) -> Optional[Incident]:
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+        query = (
+            select(Incident)
+            .where(Incident.fingerprint == fingerprint, Incident.status.in_(OPEN_STATUSES))
+            .where((Incident.last_seen_at >= since) | (Incident.created_at >= since))
+            .order_by(Incident.id.desc())
+            .limit(1)
+        )
+        return (await db.execute(query)).scalars().first()
+
+    # Cases
+
+    async def _assign_case(self, db: AsyncSession, incident: Any, now: float) -> Tuple[_OpenCase, bool]:
+        """
+        The case an incident joins, and whether it is new.
+
+        A new case is only flushed for its id: it is committed together with
+        the incident, so a failed insert leaves no empty case behind.
+        """
+        for key in case_keys(incident.agent_id, incident.details):
+            entry = self._cases.get(key)
+            if entry is not None and now - entry.last_seen <= self.case_window_seconds:
+                return entry, False
+        agent_id = integer_id(incident.agent_id)
+        if agent_id is not None:
+            case = await self._find_case(db, agent_id, now)
+            if case is not None:
+                return case, False
+        record = IncidentCase(
+            title=incident.title,
+            severity=_value(incident.severity),
+            status="open",
+            incident_count=1
+        )
+        db.add(record)
+        await db.flush()
+        return _OpenCase(record.id, record.severity, now), True
+
+    def _join_case(self, incident: Any, case: _OpenCase, new: bool, now: float) -> None:
+        # Only called once the incident is committed
+        if new:
+            self.stats["cases_created"] += 1
+        else:
+            severity = max(case.severity, _value(incident.severity), key=lambda s: SEVERITY_RANK.get(s, 0))
+            case.severity = severity
+            case.last_seen = now
+            count, _ = self._pending_cases.get(case.case_id, (0, severity))
+            self._pending_cases[case.case_id] = (count + 1, severity)
+        for key in case_keys(incident.agent_id, incident.details):
+            self._cases[key] = case
+            self._cases.move_to_end(key)
+        while len(self._cases) > self.max_entries:
+            self._cases.popitem(last=False)
+
+    async def _find_case(self, db: AsyncSession, agent_id: int, now: float) -> Optional[_OpenCase]:
+        since = datetime.now(timezone.utc) - timedelta(seconds=self.case_window_seconds)
+        query = (
+            select(IncidentCase.id, IncidentCase.severity)
+            .join(Incident, Incident.case_id == IncidentCase.id)
+            .where(Incident.agent_id == agent_id, Incident.created_at >= since)
+            .where(IncidentCase.status.in_(OPEN_STATUSES))
+            .order_by(Incident.created_at.desc())
+            .limit(1)
+        )
+        row = (await db.execute(query)).first()
+        return _OpenCase(row.id, row.severity, now) if row else None
+
+    # Entry point
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        incident: Any,
+        create: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Fold an incident into an open duplicate, or create it.
+
+        Args:
+            db: The database session
+            incident: The IncidentCreate to correlate; its fingerprint and
+                case_id are set before it is created
+            create: Coroutine factory that inserts the incident and returns the row
+
+        Returns:
+            tuple: The incident (the existing one for a duplicate, with its
+                updated occurrence_count) and whether it was a duplicate
+        """
+        self.stats["received"] += 1
+        fingerprint = incident_fingerprint(
+            incident.source, incident.agent_id, mitre_techniques(incident.details), incident.description
+        )
+        now = time.monotonic()
+        entry = self._lookup(fingerprint, now)
+        if entry is None:
+            async with self._locked(fingerprint):
+                entry = self._lookup(fingerprint, now)
+                if entry is None:
+                    existing = await self._find_open(db, fingerprint)
+                    if existing is None:
+                        incident.fingerprint = fingerprint
+                        case, new_case = await self._assign_case(db, incident, now)
+                        incident.case_id = case.case_id
+                        try:
+                            created = await create()
+                        except Exception:
+                            await db.rollback()
+                            raise
+                        self._join_case(incident, case, new_case, now)
+                        self._remember(fingerprint, _snapshot(created), 1, now)
+                        self.stats["created"] += 1
+                        return dict(_snapshot(created), occurrence_count=1), False
+                    entry = self._remember(fingerprint, _snapshot(existing), existing.occurrence_count or 1, now)
+                    self.stats["database_hits"] += 1
+                else:
+                    self.stats["index_hits"] += 1
+        else:
+            self.stats["index_hits"] += 1
+
+        entry.count += 1
+        entry.last_seen = now
+        seen_at = datetime.now(timezone.utc)
+        incident_id = entry.snapshot["id"]
+        extra, _ = self._pending_occurrences.get(incident_id, (0, seen_at))
+        self._pending_occurrences[incident_id] = (extra + 1, seen_at)
+        self.stats["deduplicated"] += 1
+        return dict(entry.snapshot, occurrence_count=entry.count, last_seen_at=seen_at), True
+
+    async def flush(self) -> int:
+        """
+        Write the buffered occurrence and case counters.
+
+        Returns:
+            int: Number of incidents and cases updated
+        """
+        occurrences, self._pending_occurrences = self._pending_occurrences, {}
+        cases, self._pending_cases = self._pending_cases, {}
+        if not occurrences and not cases:
+            return 0
+        try:
+            async with async_engine.begin() as conn:
+                if occurrences:
+                    await conn.execute(
+                        update(Incident.__table__)
+                        .where(Incident.__table__.c.id == bindparam("incident_id"))
+                        .values(
+                            occurrence_count=Incident.__table__.c.occurrence_count + bindparam("extra"),
+                            last_seen_at=bindparam("seen_at")
+                        ),
+                        [
+                            {"incident_id": incident_id, "extra": extra, "seen_at": seen_at}
+                            for incident_id, (extra, seen_at) in occurrences.items()
+                        ]
+                    )
+                if cases:
+                    await conn.execute(
+                        update(IncidentCase.__table__)
+                        .where(IncidentCase.__table__.c.id == bindparam("case"))
+                        .values(
+                            incident_count=IncidentCase.__table__.c.incident_count + bindparam("extra"),
+                            severity=bindparam("case_severity")
+                        ),
+                        [
+                            {"case": case_id, "extra": extra, "case_severity": severity}
+                            for case_id, (extra, severity) in cases.items()
+                        ]
+                    )
+        except Exception as e:
+            # Put the counts back so the next flush retries them
+            for incident_id, (extra, seen_at) in occurrences.items():
+                pending, latest = self._pending_occurrences.get(incident_id, (0, seen_at))
+                self._pending_occurrences[incident_id] = (pending + extra, max(latest, seen_at))
+            for case_id, (extra, severity) in cases.items():
+                pending, latest = self._pending_cases.get(case_id, (0, severity))
+                self._pending_cases[case_id] = (pending + extra, latest)
+            print(f"Error flushing incident counters: {str(e)}")
+            return 0
+        return len(occurrences) + len(cases)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            open_incidents=len(self._open),
+            pending_updates=len(self._pending_occurrences) + len(self._pending_cases)
+        )
+
+def _value(value: Any) -> Any:
+    return getattr(value, "value", value)
+
+def _snapshot(incident: Any) -> Dict[str, Any]:
+    return {name: _value(getattr(incident, name, None)) for name in SNAPSHOT_FIELDS}
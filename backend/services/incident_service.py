@@ -0,0 +1,20 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.incident import Incident
+from services.crud import CrudService
+
+class IncidentService(CrudService):
+    model = Incident
+
+    async def create_incident(self, db: AsyncSession, incident: BaseModel) -> Incident:
+        return await self.create(db, incident)
+
+    async def get_incident(self, db: AsyncSession, incident_id: int) -> Optional[Incident]:
+        return await self.get(db, incident_id)
+
+    async def update_incident(self, db: AsyncSession, incident_id: int, incident: BaseModel) -> Optional[Incident]:
+        return await self.update(db, incident_id, incident)
+
+    async def delete_incident(self, db: AsyncSession, incident_id: int) -> bool:
+        return await self.delete(db, incident_id)
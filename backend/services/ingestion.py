@@ -0,0 +1,281 @@
+import asyncio
+import json
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import settings
+from database import async_engine
+from models.event import Event
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is optional
+    json_loads = json.loads
+
+MAX_REPORTED_ERRORS = 10
+
+class IngestQueueFull(Exception):
+    """Raised when the ingestion queue has no room for more events."""
+
+class IngestError(ValueError):
+    """Raised when a request body cannot be decoded."""
+
+class IngestBodyTooLarge(IngestError):
+    """Raised when a compressed body inflates past INGEST_MAX_INFLATED_BYTES."""
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse an epoch-seconds or ISO 8601 timestamp; None if absent or invalid."""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+        if isinstance(value, str):
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+def normalize_event(event: Dict[str, Any], source: Optional[str] = None) -> Dict[str, Any]:
+    """Map a received event onto the columns of the events table."""
+    get = event.get
+    agent_id = get("agent_id")
+    return {
+        "event_type": get("event_type") or get("type"),
+        "source": get("source") or source,
+        "severity": get("severity"),
+        "agent_id": None if agent_id is None else str(agent_id),
+        "source_ip": get("source_ip") or get("sourceIp") or get("src_ip"),
+        "message": get("message") or get("description"),
+        "data": event,
+        "occurred_at": parse_timestamp(get("timestamp"))
+    }
+
+async def write_events(rows: List[Dict[str, Any]]) -> None:
+    """
+    Write normalized events in one transaction, outside the ORM unit of work.
+
+    The rows go to the driver as one executemany of a single prepared
+    INSERT. A multi-row INSERT ... VALUES was measured about 8x slower for
+    a 5000-row batch on SQLite, because SQLAlchemy compiles the whole statement.
+    """
+    async with async_engine.begin() as conn:
+        await conn.execute(Event.__table__.insert(), rows)
+
+class NDJSONDecoder:
+    """
+    Incrementally decodes a newline-delimited JSON body.
+
+    Chunks are fed as they arrive from the network; only the trailing
+    incomplete line is buffered between chunks. Gzip-compressed bodies
+    (including multi-member streams) are inflated on the fly, at most
+    INGEST_MAX_INFLATED_BYTES per body. Lines that are not JSON objects are
+    counted and skipped.
+    """
+
+    def __init__(self, gzip: bool = False, max_line_bytes: Optional[int] = None, max_inflated_bytes: Optional[int] = None):
+        self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzip else None
+        self._buffer = b""
+        self._received = False
+        self.max_line_bytes = max_line_bytes or settings.INGEST_MAX_LINE_BYTES
+        self.max_inflated_bytes = max_inflated_bytes or settings.INGEST_MAX_INFLATED_BYTES
+        self.inflated_bytes = 0
+        self.line_number = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def _inflate(self, chunk: bytes) -> bytes:
+        parts = []
+        try:
+            while True:
+                # Never inflate more than one byte past the limit, so a gzip bomb stops early
+                room = self.max_inflated_bytes - self.inflated_bytes
+                data = self._inflater.decompress(chunk, room + 1)
+                self.inflated_bytes += len(data)
+                if self.inflated_bytes > self.max_inflated_bytes:
+                    raise IngestBodyTooLarge(f"Body inflates to more than {self.max_inflated_bytes} bytes")
+                parts.append(data)
+                if self._inflater.unconsumed_tail:
+                    chunk = self._inflater.unconsumed_tail
+                elif self._inflater.eof and self._inflater.unused_data:
+                    # A gzip stream may hold several members back to back
+                    chunk = self._inflater.unused_data
+                    self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                else:
+                    break
+        except zlib.error as e:
+            raise IngestError(f"Invalid gzip body: {str(e)}")
+        return b"".join(parts)
+
+    def _error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": self.line_number, "error": message})
+
+    def _parse(self, lines: List[bytes]) -> List[Dict[str, Any]]:
+        events = []
+        for line in lines:
+            self.line_number += 1
+            if not line.strip():
+                continue
+            try:
+                event = json_loads(line)
+            except ValueError as e:
+                self._error(f"Invalid JSON: {str(e)}")
+                continue
+            if isinstance(event, dict):
+                events.append(event)
+            else:
+                self._error("Event must be a JSON object")
+        return events
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        """Decode a chunk of the body and return the complete events it finished."""
+        if self._inflater is not None:
+            self._received = self._received or bool(chunk)
+            chunk = self._inflate(chunk)
+        if not chunk:
+            return []
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        if len(self._buffer) > self.max_line_bytes:
+            raise IngestError(f"Line {self.line_number + len(lines) + 1} exceeds {self.max_line_bytes} bytes")
+        return self._parse(lines)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Decode whatever is left once the body has ended."""
+        if self._inflater is not None and self._received and not self._inflater.eof:
+            raise IngestError("Truncated gzip body")
+        lines, self._buffer = [self._buffer], b""
+        return self._parse(lines)
+
+class IngestionPipeline:
+    """
+    Bounded in-process queue between the ingest endpoint and the database.
+
+    Requests submit lists of decoded events. Worker tasks collect them into
+    batches of up to INGEST_BATCH_SIZE events, or whatever arrived within
+    INGEST_BATCH_MS, run the registered processors on the batch (e.g. rule
+    evaluation) and write it with one executemany INSERT. Once
+    INGEST_QUEUE_MAX_EVENTS events are waiting, submit() waits briefly for
+    room and then raises IngestQueueFull so the endpoint can answer 429.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]] = write_events):
+        self.write_batch = write_batch
+        self.processors: List[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = []
+        self.max_pending = settings.INGEST_QUEUE_MAX_EVENTS
+        self.batch_size = settings.INGEST_BATCH_SIZE
+        self.batch_seconds = settings.INGEST_BATCH_MS / 1000
+        self.worker_count = settings.INGEST_WORKERS
+        self.pending = 0
+        self.queue: Optional[asyncio.Queue] = None
+        self._space: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self.stats = {"accepted": 0, "written": 0, "failed": 0, "batches": 0, "rejected": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def add_processor(self, processor: Callable[[List[Dict[str, Any]]], Awaitable[None]]) -> None:
+        """Register a coroutine called with every batch of raw events before it is written."""
+        self.processors.append(processor)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.queue = asyncio.Queue()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def stop(self) -> None:
+        """Write everything still queued, then stop the workers."""
+        if not self.running:
+            return
+        for _ in self._workers:
+            self.queue.put_nowait(None)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, events: List[Dict[str, Any]], source: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """
+        Queue decoded events for writing.
+
+        Args:
+            events: The events to queue
+            source: Default source for events that do not name one
+            timeout: Seconds to wait for queue space (defaults to INGEST_ENQUEUE_TIMEOUT)
+
+        Raises:
+            IngestQueueFull: If the pipeline is stopped or stays full for the timeout
+        """
+        if not events:
+            return
+        if not self.running:
+            raise IngestQueueFull("Ingestion pipeline is not running")
+        timeout = settings.INGEST_ENQUEUE_TIMEOUT if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # A single oversized submission is let through once the queue is empty
+        while self.pending and self.pending + len(events) > self.max_pending:
+            self._space.clear()
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._space.wait(), remaining)
+            except asyncio.TimeoutError:
+                self.stats["rejected"] += len(events)
+                raise IngestQueueFull("Ingestion queue is full")
+        self.pending += len(events)
+        self.stats["accepted"] += len(events)
+        self.queue.put_nowait((events, source))
+
+    async def _worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[Dict[str, Any], Optional[str]]] = []
+        deadline = 0.0
+        while True:
+            try:
+                if batch:
+                    item = await asyncio.wait_for(self.queue.get(), max(0.0, deadline - loop.time()))
+                else:
+                    item = await self.queue.get()
+            except asyncio.TimeoutError:
+                item = ()
+
+            if item is None:
+                if batch:
+                    await self._flush(batch)
+                return
+            if item:
+                events, source = item
+                if not batch:
+                    deadline = loop.time() + self.batch_seconds
+                batch.extend((event, source) for event in events)
+            if batch and (len(batch) >= self.batch_size or not item or loop.time() >= deadline):
+                await self._flush(batch)
+                batch = []
+
+    async def _flush(self, batch: List[Tuple[Dict[str, Any], Optional[str]]]) -> None:
+        try:
+            if self.processors:
+                events = [event for event, _ in batch]
+                for processor in self.processors:
+                    try:
+                        await processor(events)
+                    except Exception as e:
+                        print(f"Error in ingestion processor: {str(e)}")
+            rows = [normalize_event(event, source) for event, source in batch]
+            await self.write_batch(rows)
+            self.stats["written"] += len(rows)
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            print(f"Error writing ingested events: {str(e)}")
+        finally:
+            self.stats["batches"] += 1
+            self.pending -= len(batch)
+            self._space.set()
@@ -0,0 +1,311 @@
+import asyncio
+import os
+import socket
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from config import settings
+
+# Event fields holding the address to enrich, in order of preference
+SOURCE_IP_FIELDS = ("source_ip", "sourceIp", "src_ip")
+LIST_SUFFIXES = (".txt", ".csv", ".list")
+
+def parse_ip(value: Any) -> Optional[Tuple[int, int]]:
+    """(version, integer) of an IPv4 or IPv6 address, or None if it is not one."""
+    if not isinstance(value, str):
+        return None
+    try:
+        if ":" not in value:
+            if value.count(".") != 3:
+                return None
+            return 4, int.from_bytes(socket.inet_aton(value), "big")
+        return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, value.split("%", 1)[0]), "big")
+    except (OSError, TypeError):
+        return None
+
+class IntervalSet:
+    """
+    Disjoint address intervals with a label each, in sorted arrays.
+
+    Nested CIDRs are flattened so the most specific one wins; a lookup is
+    one binary search. IPv4 bounds are kept in array('I'), IPv6 bounds in
+    lists of ints.
+    """
+
+    __slots__ = ("starts", "ends", "labels", "label_ids")
+
+    def __init__(self, version: int, ranges: Iterable[Tuple[int, int, str]]):
+        self.labels: List[str] = []
+        ids: Dict[str, int] = {}
+        starts: List[int] = []
+        ends: List[int] = []
+        label_ids: List[int] = []
+
+        def emit(start: int, end: int, label: str) -> None:
+            if start > end:
+                return
+            label_id = ids.get(label)
+            if label_id is None:
+                label_id = ids[label] = len(self.labels)
+                self.labels.append(label)
+            # Merge with the previous segment when adjacent and equally labelled
+            if ends and ends[-1] + 1 == start and label_ids[-1] == label_id:
+                ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+                label_ids.append(label_id)
+
+        # Sweep over CIDRs sorted by start, widest first; CIDRs either nest
+        # or are disjoint, so a stack of the enclosing ones is enough
+        stack: List[Tuple[int, str]] = []
+        cursor = 0
+        for start, end, label in sorted(ranges, key=lambda r: (r[0], -r[1])):
+            while stack and stack[-1][0] < start:
+                top_end, top_label = stack.pop()
+                emit(cursor, top_end, top_label)
+                cursor = max(cursor, top_end + 1)
+            if stack:
+                emit(cursor, start - 1, stack[-1][1])
+            if stack and end > stack[-1][0]:
+                # Partially overlapping range (not a CIDR): clip it
+                end = stack[-1][0]
+            stack.append((end, label))
+            cursor = start
+        while stack:
+            top_end, top_label = stack.pop()
+            emit(cursor, top_end, top_label)
+            cursor = max(cursor, top_end + 1)
+
+        if version == 4:
+            self.starts: Sequence[int] = array("I", starts)
+            self.ends: Sequence[int] = array("I", ends)
+        else:
+            self.starts = starts
+            self.ends = ends
+        self.label_ids = array("I", label_ids)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def get(self, address: int) -> Optional[str]:
+        index = bisect_right(self.starts, address) - 1
+        if index >= 0 and address <= self.ends[index]:
+            return self.labels[self.label_ids[index]]
+        return None
+
+    def get_sorted(self, addresses: Sequence[int]) -> List[Optional[str]]:
+        """Labels for ascending addresses, narrowing each search to what follows the previous hit."""
+        found: List[Optional[str]] = []
+        starts, ends, labels, label_ids = self.starts, self.ends, self.labels, self.label_ids
+        low = 0
+        for address in addresses:
+            index = bisect_right(starts, address, low) - 1
+            if index >= 0 and address <= ends[index]:
+                found.append(labels[label_ids[index]])
+            else:
+                found.append(None)
+            low = max(index, 0)
+        return found
+
+class IPIntelIndex:
+    """An immutable snapshot of every list, per IP version."""
+
+    def __init__(self, lists: Dict[str, Dict[int, IntervalSet]], sources: Dict[str, float]):
+        self.lists = lists
+        # File path -> modification time, to detect changes
+        self.sources = sources
+
+    @property
+    def entry_count(self) -> int:
+        return sum(len(intervals) for versions in self.lists.values() for intervals in versions.values())
+
+    def lookup(self, ip: Any) -> Dict[str, str]:
+        """The label of every list containing the address, by list name."""
+        parsed = parse_ip(ip)
+        if parsed is None:
+            return {}
+        version, address = parsed
+        tags = {}
+        for name, versions in self.lists.items():
+            intervals = versions.get(version)
+            if intervals is not None:
+                label = intervals.get(address)
+                if label is not None:
+                    tags[name] = label
+        return tags
+
+    def lookup_many(self, ips: Sequence[Any]) -> List[Dict[str, str]]:
+        """
+        Look up a batch of addresses.
+
+        Addresses are parsed once, sorted per IP version and walked through
+        each list in order, which is faster than one search per address and
+        list for ingestion-sized batches.
+        """
+        results: List[Dict[str, str]] = [{} for _ in ips]
+        by_version: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for position, ip in enumerate(ips):
+            parsed = parse_ip(ip)
+            if parsed is not None:
+                by_version[parsed[0]].append((parsed[1], position))
+        for version, entries in by_version.items():
+            if not entries:
+                continue
+            entries.sort()
+            addresses = [address for address, _ in entries]
+            for name, versions in self.lists.items():
+                intervals = versions.get(version)
+                if intervals is None:
+                    continue
+                for (_, position), label in zip(entries, intervals.get_sorted(addresses)):
+                    if label is not None:
+                        results[position][name] = label
+        return results
+
+def parse_network(value: str) -> Optional[Tuple[int, int, int]]:
+    """(version, first, last address) of a CIDR or a single address, or None."""
+    address, _, prefix = value.partition("/")
+    parsed = parse_ip(address)
+    if parsed is None:
+        return None
+    version, start = parsed
+    bits = 32 if version == 4 else 128
+    try:
+        length = int(prefix) if prefix else bits
+    except ValueError:
+        return None
+    if not 0 <= length <= bits:
+        return None
+    host_mask = (1 << (bits - length)) - 1
+    start &= ~host_mask
+    return version, start, start | host_mask
+
+def read_list(path: Path, default_label: str) -> Dict[int, List[Tuple[int, int, str]]]:
+    """
+    Parse a list file: one CIDR or address per line, optionally followed by
+    a label (comma, tab or space separated). # starts a comment.
+    """
+    ranges: Dict[int, List[Tuple[int, int, str]]] = {4: [], 6: []}
+    with open(path, encoding="utf-8", errors="replace") as handle:
+        for line in handle:
+            if "#" in line:
+                line = line.split("#", 1)[0]
+            parts = line.replace(",", " ").replace("\t", " ").split(None, 1)
+            if not parts:
+                continue
+            network = parse_network(parts[0])
+            if network is None:
+                continue
+            label = parts[1].strip() if len(parts) > 1 else default_label
+            version, start, end = network
+            ranges[version].append((start, end, label or default_label))
+    return ranges
+
+def list_files(directory: Optional[str]) -> Dict[str, Path]:
+    """List name (file stem) -> path for the list files in a directory."""
+    if not directory or not os.path.isdir(directory):
+        return {}
+    return {
+        path.stem: path for path in sorted(Path(directory).iterdir())
+        if path.is_file() and path.suffix in LIST_SUFFIXES
+    }
+
+def build_index(directory: Optional[str]) -> IPIntelIndex:
+    lists: Dict[str, Dict[int, IntervalSet]] = {}
+    sources: Dict[str, float] = {}
+    for name, path in list_files(directory).items():
+        sources[str(path)] = path.stat().st_mtime
+        ranges = read_list(path, name)
+        lists[name] = {version: IntervalSet(version, entries) for version, entries in ranges.items() if entries}
+    return IPIntelIndex(lists, sources)
+
+class IPIntel:
+    """
+    IP enrichment from the CIDR lists in IP_INTEL_DIR.
+
+    Each file is one list named after its stem (allowlist.txt,
+    blocklist.txt, internal.txt, assets.csv, ...). Lists are compiled into
+    an immutable IPIntelIndex off the event loop and swapped in with a
+    single assignment, so lookups never see a half-loaded index. A watcher
+    reloads the lists when a file changes.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.IP_INTEL_DIR
+        self.index = IPIntelIndex({}, {})
+        self._watcher: Optional[asyncio.Task] = None
+        self._reload_lock = asyncio.Lock()
+        self.stats = {"reloads": 0, "lookups": 0, "tagged": 0}
+
+    def load(self) -> IPIntelIndex:
+        """Load the lists synchronously (for scripts and startup)."""
+        self.index = build_index(self.directory)
+        self.stats["reloads"] += 1
+        return self.index
+
+    async def reload(self) -> IPIntelIndex:
+        async with self._reload_lock:
+            index = await asyncio.to_thread(build_index, self.directory)
+            self.index = index
+            self.stats["reloads"] += 1
+            return index
+
+    def _changed(self) -> bool:
+        current = {str(path): path.stat().st_mtime for path in list_files(self.directory).values()}
+        return current != self.index.sources
+
+    async def start(self) -> None:
+        try:
+            await self.reload()
+        except Exception as e:
+            print(f"Error loading IP intelligence lists: {str(e)}")
+        if self._watcher is None and settings.IP_INTEL_RELOAD_SECONDS > 0:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(settings.IP_INTEL_RELOAD_SECONDS)
+            try:
+                if await asyncio.to_thread(self._changed):
+                    await self.reload()
+            except Exception as e:
+                print(f"Error reloading IP intelligence lists: {str(e)}")
+
+    def lookup(self, ip: Any) -> Dict[str, str]:
+        self.stats["lookups"] += 1
+        return self.index.lookup(ip)
+
+    def lookup_many(self, ips: Sequence[Any]) -> List[Dict[str, str]]:
+        self.stats["lookups"] += len(ips)
+        return self.index.lookup_many(ips)
+
+    def tag_events(self, events: List[Dict[str, Any]]) -> None:
+        """Add an "ip_intel" dict to the events whose source address is on a list."""
+        index = self.index
+        if not index.lists or not events:
+            return
+        ips = [next((event[field] for field in SOURCE_IP_FIELDS if event.get(field)), None) for event in events]
+        for event, tags in zip(events, index.lookup_many(ips)):
+            if tags:
+                event["ip_intel"] = tags
+                self.stats["tagged"] += 1
+        self.stats["lookups"] += len(events)
+
+    def get_stats(self) -> Dict[str, Any]:
+        index = self.index
+        return dict(
+            self.stats,
+            lists={
+                name: {f"ipv{version}": len(intervals) for version, intervals in versions.items()}
+                for name, versions in index.lists.items()
+            },
+            intervals=index.entry_count
+        )
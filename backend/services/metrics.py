@@ -0,0 +1,251 @@
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds; spans a fast cached read up to a slow report
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class Counter:
+    """
+    A monotonically increasing count per label set.
+
+    Updates are plain dict arithmetic without a lock: the API runs on one
+    event loop thread, and a rare lost increment from a worker thread is
+    an acceptable price for keeping the hot path at a dict lookup.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, labels: Tuple = (), amount: float = 1) -> None:
+        values = self._values
+        values[labels] = values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+class Gauge:
+    """A value read when /metrics is scraped, from a callback (queue depths and the like)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self) -> Iterable[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return
+        if value is not None:
+            yield f"{self.name} {_number(value)}"
+
+class Histogram:
+    """
+    Observations counted into fixed buckets per label set.
+
+    Each label set holds a list of per-bucket counts (not cumulative), the
+    sum and the count; observing is one bisect and two additions.
+    Cumulative counts are only computed when rendering.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, labels: Tuple = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.bounds) + 2)
+        series[bisect_left(self.bounds, value)] += 1
+        series[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        names = self.labelnames
+        for labels, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), series):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(names, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(names, labels)} {cumulative}"
+
+class MetricsRegistry:
+    """The metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _add(self, metric: Any) -> Any:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        """Register (or replace) a gauge read from a callback."""
+        gauge = Gauge(name, help, read)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = metrics.histogram(
+    "http_request_duration_seconds", "Time until the response headers were sent", ("method", "route")
+)
+db_latency = metrics.histogram("db_query_duration_seconds", "Database statement execution time", ("operation",))
+db_errors = metrics.counter("db_query_errors_total", "Database statements that raised", ("operation",))
+slack_latency = metrics.histogram(
+    "slack_delivery_duration_seconds", "Slack webhook call time by outcome", ("outcome",)
+)
+slack_messages = metrics.counter("slack_messages_total", "Slack messages by final outcome", ("outcome",))
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request.
+
+    The route label is the matched path template (/api/incidents/{incident_id}),
+    so ids do not multiply the series; unmatched paths share one label.
+    Latency is measured up to the response start, which for streaming
+    responses is the time to the first byte rather than the stream's life.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+        timed = [False]
+
+        def record() -> None:
+            timed[0] = True
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", None) or "unmatched")
+            http_latency.observe(time.perf_counter() - start, labels)
+            http_requests.inc(labels + (status[0],))
+
+        async def send_timed(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                record()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            if not timed[0]:
+                record()
+
+# Statement labels; anything else is OTHER so odd statements cannot add series
+OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "DROP", "ALTER", "PRAGMA"))
+
+def _operation(statement: str) -> str:
+    word = statement.lstrip()[:8].split(None, 1)
+    operation = word[0].upper() if word else ""
+    return operation if operation in OPERATIONS else "OTHER"
+
+def instrument_engine(engine: Any) -> None:
+    """
+    Time the statements of a (sync) SQLAlchemy engine; for an async engine
+    pass its sync_engine. Statements are labelled by their first keyword.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            db_latency.observe(time.perf_counter() - starts.pop(), (_operation(statement),))
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+        db_errors.inc((_operation(context.statement or ""),))
+
+def sample_stacks(seconds: float, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None) -> str:
+    """
+    Sample the stacks of the running threads for a while.
+
+    Runs on the calling thread (call it through asyncio.to_thread), so it
+    sees the event loop thread at work. The result is in the folded format
+    read by flamegraph.pl and speedscope: one "frame;frame;frame count" line
+    per distinct stack, outermost frame first.
+    """
+    me = threading.get_ident()
+    only = set(thread_ids) if thread_ids is not None else None
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks: _Tally = _Tally()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (only is not None and ident not in only):
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,218 @@
+import json
+import os
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import settings
+
+DEFAULT_MITRE_MAP_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "src", "data", "mitre-map.json"
+)
+
+# ATT&CK identifiers for the tactic and technique names used in mitre-map.json
+TACTIC_IDS = {
+    "Reconnaissance": "TA0043",
+    "Resource Development": "TA0042",
+    "Initial Access": "TA0001",
+    "Execution": "TA0002",
+    "Persistence": "TA0003",
+    "Privilege Escalation": "TA0004",
+    "Defense Evasion": "TA0005",
+    "Credential Access": "TA0006",
+    "Discovery": "TA0007",
+    "Lateral Movement": "TA0008",
+    "Collection": "TA0009",
+    "Command and Control": "TA0011",
+    "Exfiltration": "TA0010",
+    "Impact": "TA0040"
+}
+
+TECHNIQUE_IDS = {
+    "Drive-by Compromise": "T1189",
+    "Phishing": "T1566",
+    "PowerShell": "T1059.001",
+    "Command and Scripting Interpreter": "T1059",
+    "Registry Run Keys / Startup Folder": "T1547.001",
+    "Valid Accounts": "T1078",
+    "Obfuscated Files or Information": "T1027",
+    "Brute Force": "T1110",
+    "Credential Dumping": "T1003",
+    "System Information Discovery": "T1082",
+    "Network Service Scanning": "T1046",
+    "Remote Services": "T1021",
+    "Clipboard Data": "T1115",
+    "Application Layer Protocol": "T1071",
+    "Exfiltration Over Web Service": "T1567",
+    "Data Destruction": "T1485"
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric tokens."""
+    return _TOKEN.findall(text.lower())
+
+class MitreTagger:
+    """
+    Tags free text with MITRE ATT&CK tactics and techniques.
+
+    All keywords from the MITRE map are compiled into a single Aho-Corasick
+    automaton over word tokens, so a text is tagged in one pass over its
+    tokens whatever the number of keywords, and keywords only match whole
+    words ("sh" does not match inside "ssh"). Adding keywords extends the
+    existing trie and recomputes the failure links on the next lookup
+    instead of rebuilding from the map.
+    """
+
+    def __init__(self, mitre_map: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        # State 0 is the root; each state has transitions, a failure link
+        # and the (technique key, keyword) pairs that end there
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        # Outputs including those inherited through failure links
+        self._matches: List[List[Tuple[int, str]]] = [[]]
+        self._dirty = False
+        self.techniques: List[Dict[str, Any]] = []
+        self._technique_index: Dict[Tuple[str, str], int] = {}
+        self.keyword_count = 0
+        if mitre_map:
+            self.load_map(mitre_map)
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None) -> "MitreTagger":
+        """Build a tagger from a mitre-map.json file."""
+        path = path or settings.MITRE_MAP_PATH or DEFAULT_MITRE_MAP_PATH
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def load_map(self, mitre_map: Dict[str, Dict[str, List[str]]]) -> int:
+        """
+        Add every keyword of a tactic -> technique -> keywords map.
+
+        Returns:
+            int: Number of keywords added
+        """
+        added = 0
+        for tactic, techniques in mitre_map.items():
+            for technique, keywords in techniques.items():
+                added += self.add_keywords(tactic, technique, keywords)
+        return added
+
+    def _technique(self, tactic: str, technique: str) -> int:
+        key = (tactic, technique)
+        index = self._technique_index.get(key)
+        if index is None:
+            index = len(self.techniques)
+            self._technique_index[key] = index
+            self.techniques.append({
+                "tactic": tactic,
+                "tactic_id": TACTIC_IDS.get(tactic),
+                "technique": technique,
+                "technique_id": TECHNIQUE_IDS.get(technique)
+            })
+        return index
+
+    def add_keywords(self, tactic: str, technique: str, keywords: Iterable[str]) -> int:
+        """
+        Add keywords for a technique to the automaton.
+
+        Returns:
+            int: Number of keywords that were not already present
+        """
+        index = self._technique(tactic, technique)
+        added = 0
+        for keyword in keywords:
+            tokens = tokenize(keyword)
+            if not tokens:
+                continue
+            state = 0
+            for token in tokens:
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][token] = next_state
+                    self._dirty = True
+                state = next_state
+            entry = (index, keyword)
+            if entry not in self._out[state]:
+                self._out[state].append(entry)
+                self.keyword_count += 1
+                self._dirty = True
+                added += 1
+        return added
+
+    def _build_failure_links(self) -> None:
+        # Outputs are stored per state without the inherited suffix outputs,
+        # so the links can be recomputed after every batch of additions
+        self._matches = [list(out) for out in self._out]
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._matches[child].extend(self._matches[self._fail[child]])
+        self._dirty = False
+
+    def match(self, text: str) -> List[Tuple[int, str]]:
+        """Return (technique index, keyword) for every keyword occurrence in text."""
+        if self._dirty:
+            self._build_failure_links()
+        goto, fail, out = self._goto, self._fail, self._matches
+        state = 0
+        found = []
+        for token in _TOKEN.findall(text.lower()):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if out[state]:
+                found.extend(out[state])
+        return found
+
+    def tag(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Tag a text with the techniques whose keywords it contains.
+
+        Returns:
+            list: One entry per technique with its tactic, ATT&CK ids and
+                the keywords that matched
+        """
+        matched: Dict[int, List[str]] = {}
+        for index, keyword in self.match(text):
+            keywords = matched.setdefault(index, [])
+            if keyword not in keywords:
+                keywords.append(keyword)
+        return [dict(self.techniques[index], keywords=keywords) for index, keywords in matched.items()]
+
+    def tag_many(self, texts: Iterable[str]) -> List[List[Dict[str, Any]]]:
+        """Tag a batch of texts, returning one list of tags per text."""
+        return [self.tag(text) for text in texts]
+
+    def tag_incident(self, title: str, description: Optional[str], details: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Tag an incident from its title, description and flattened details."""
+        parts = [title or "", description or ""]
+        if details:
+            parts.extend(str(value) for value in flatten_values(details))
+        return self.tag("\n".join(parts))
+
+def flatten_values(value: Any) -> Iterable[Any]:
+    """Yield the scalar values of nested dicts and lists."""
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from flatten_values(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from flatten_values(item)
+    elif value is not None:
+        yield value
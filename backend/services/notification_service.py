@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.slack_notification import SlackNotificationRecord
+from services.crud import CrudService
+
+class NotificationService(CrudService):
+    model = SlackNotificationRecord
+
+    async def create_notification(self, db: AsyncSession, notification: BaseModel) -> SlackNotificationRecord:
+        return await self.create(db, notification)
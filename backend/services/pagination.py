@@ -0,0 +1,138 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from fastapi import Query
+from sqlalchemy import String, and_, or_, select, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+class PaginationError(ValueError):
+    """Raised for an invalid cursor, filter or field projection."""
+
+class PageQuery:
+    """
+    Query parameters shared by the list endpoints.
+
+    Used as a FastAPI dependency: ``page: PageQuery = Depends()``.
+    """
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="Cursor returned in X-Next-Cursor"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+        severity: Optional[str] = None,
+        status: Optional[str] = None,
+        agent_id: Optional[int] = None,
+        created_after: Optional[datetime] = None,
+        created_before: Optional[datetime] = None
+    ):
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        self.filters = {
+            name: value for name, value in (
+                ("severity", severity), ("status", status), ("agent_id", agent_id)
+            ) if value is not None
+        }
+        self.created_after = created_after
+        self.created_before = created_before
+
+def _utc(value: datetime) -> datetime:
+    # SQLite drops the offset of a bound datetime; stored times are UTC
+    return value.astimezone(timezone.utc) if value.tzinfo is not None else value
+
+def encode_cursor(created_at: Any, row_id: Any) -> str:
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor")
+    return created_at, row_id
+
+async def paginate(
+    db: AsyncSession,
+    model: Any,
+    page: PageQuery,
+    names: Optional[Sequence[str]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page of rows, newest first, using keyset pagination.
+
+    Rows are ordered by (created_at, id) descending and the next page starts
+    strictly after the last row of this one, so every page is an index
+    range scan whatever its depth. Rows are returned as plain dicts of
+    column values without going through the ORM.
+
+    Args:
+        db: The database session
+        model: The ORM model to list
+        page: Cursor, page size, filters and field projection
+        names: The columns a page returns and fields may select (default: all)
+
+    Returns:
+        tuple: The rows and the cursor of the next page (None on the last page)
+
+    Raises:
+        PaginationError: If the cursor, a filter or a field is invalid for the model
+    """
+    columns = model.__table__.c
+    returned = [columns[name] for name in names] if names is not None else list(columns)
+    if page.fields:
+        allowed = {column.name for column in returned}
+        unknown = [name for name in page.fields if name not in allowed]
+        if unknown:
+            raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+        selected = [columns[name] for name in page.fields]
+    else:
+        selected = returned
+
+    # SQLite stores datetimes as text, all in one format (see database.utc_now),
+    # so the order of the text is the order of the times; compare the cursor
+    # against the stored text rather than a re-rendered datetime so rows are
+    # never skipped or repeated
+    sqlite = db.bind.dialect.name == "sqlite"
+    created_at = type_coerce(model.created_at, String) if sqlite else model.created_at
+    query = select(*selected, created_at.label("_cursor_created_at"), model.id.label("_cursor_id"))
+
+    for name, value in page.filters.items():
+        if name not in columns:
+            raise PaginationError(f"Filter '{name}' is not supported here")
+        query = query.where(columns[name] == value)
+    if page.created_after is not None:
+        query = query.where(model.created_at >= _utc(page.created_after))
+    if page.created_before is not None:
+        query = query.where(model.created_at < _utc(page.created_before))
+
+    if page.cursor:
+        cursor_created_at, cursor_id = decode_cursor(page.cursor)
+        if not sqlite:
+            try:
+                cursor_created_at = datetime.fromisoformat(cursor_created_at)
+            except (TypeError, ValueError):
+                raise PaginationError("Invalid cursor")
+        query = query.where(or_(
+            created_at < cursor_created_at,
+            and_(created_at == cursor_created_at, model.id < cursor_id)
+        ))
+
+    query = query.order_by(model.created_at.desc(), model.id.desc()).limit(page.limit + 1)
+    rows = (await db.execute(query)).all()
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last["_cursor_created_at"], last["_cursor_id"])
+
+    names = [column.name for column in selected]
+    return [{name: row._mapping[name] for name in names} for row in rows], next_cursor
@@ -0,0 +1,383 @@
+import asyncio
+import random
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import bindparam, update
+from config import settings
+from database import async_engine
+from models.task import Task
+
+class PlaybookDefinitionError(ValueError):
+    """Raised for playbook steps that do not form a valid DAG."""
+
+class PlaybookStep:
+    __slots__ = ("name", "action", "parameters", "depends_on", "timeout")
+
+    def __init__(self, name: str, action: str, parameters: Dict[str, Any], depends_on: List[str], timeout: Optional[float]):
+        self.name = name
+        self.action = action
+        self.parameters = parameters
+        self.depends_on = depends_on
+        self.timeout = timeout
+
+def build_dag(steps: List[Dict[str, Any]]) -> List[PlaybookStep]:
+    """
+    Validate playbook steps and resolve their dependencies.
+
+    Steps may list the names of the steps they need in ``depends_on``.
+    When no step of the playbook declares ``depends_on`` the steps run one
+    after the other, in order, as playbooks always have.
+
+    Returns:
+        list: The steps in a valid execution order
+
+    Raises:
+        PlaybookDefinitionError: For missing actions, duplicate or unknown
+            step names, or dependency cycles
+    """
+    if not isinstance(steps, list) or not steps:
+        raise PlaybookDefinitionError("Playbook has no steps")
+    sequential = not any(isinstance(step, dict) and "depends_on" in step for step in steps)
+    parsed: Dict[str, PlaybookStep] = {}
+    previous = None
+    for index, step in enumerate(steps):
+        if not isinstance(step, dict) or not step.get("action"):
+            raise PlaybookDefinitionError(f"Step {index} has no action")
+        name = step.get("name") or f"step_{index}"
+        if name in parsed:
+            raise PlaybookDefinitionError(f"Duplicate step name '{name}'")
+        if sequential:
+            depends_on = [previous] if previous else []
+        else:
+            depends_on = step.get("depends_on") or []
+            if isinstance(depends_on, str):
+                depends_on = [depends_on]
+        timeout = step.get("timeout")
+        parsed[name] = PlaybookStep(name, step["action"], step.get("parameters") or {}, list(depends_on), timeout)
+        previous = name
+
+    for step in parsed.values():
+        unknown = [name for name in step.depends_on if name not in parsed]
+        if unknown:
+            raise PlaybookDefinitionError(f"Step '{step.name}' depends on unknown steps: {', '.join(unknown)}")
+
+    # Kahn's algorithm, which also detects cycles
+    remaining = {name: len(set(step.depends_on)) for name, step in parsed.items()}
+    dependents: Dict[str, List[str]] = {name: [] for name in parsed}
+    for step in parsed.values():
+        for dependency in set(step.depends_on):
+            dependents[dependency].append(step.name)
+    ready = [name for name, count in remaining.items() if count == 0]
+    ordered = []
+    while ready:
+        name = ready.pop(0)
+        ordered.append(parsed[name])
+        for child in dependents[name]:
+            remaining[child] -= 1
+            if remaining[child] == 0:
+                ready.append(child)
+    if len(ordered) != len(parsed):
+        cyclic = sorted(name for name, count in remaining.items() if count)
+        raise PlaybookDefinitionError(f"Dependency cycle between steps: {', '.join(cyclic)}")
+    return ordered
+
+class StepContext:
+    """What an action handler gets to work with."""
+
+    __slots__ = ("task_id", "agent_id", "step", "action", "parameters", "task_parameters", "inputs")
+
+    def __init__(self, task_id: Any, agent_id: Any, step: PlaybookStep, task_parameters: Dict[str, Any], inputs: Dict[str, Any]):
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.step = step.name
+        self.action = step.action
+        self.parameters = step.parameters
+        self.task_parameters = task_parameters
+        # Results of the steps this one depends on, by step name
+        self.inputs = inputs
+
+ActionHandler = Callable[[StepContext], Awaitable[Optional[Dict[str, Any]]]]
+
+async def simulated_action(context: StepContext) -> Dict[str, Any]:
+    """Offline backend: pretend to run the action after a short delay."""
+    delay = settings.PLAYBOOK_SIMULATED_DELAY_SECONDS
+    if delay:
+        await asyncio.sleep(random.uniform(0.5 * delay, 1.5 * delay))
+    return {"simulated": True, "action": context.action, "agent_id": context.agent_id, "parameters": context.parameters}
+
+class ActionRegistry:
+    """
+    Action handlers with a concurrency limit and timeout per action type.
+
+    Limits default to PLAYBOOK_ACTION_CONCURRENCY / PLAYBOOK_ACTION_TIMEOUT
+    and can be set per action in PLAYBOOK_ACTION_LIMITS /
+    PLAYBOOK_ACTION_TIMEOUTS or when registering. Actions without a handler
+    run against the simulated backend when PLAYBOOK_SIMULATE_ACTIONS is set.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, ActionHandler] = {}
+        self._limits: Dict[str, int] = dict(settings.PLAYBOOK_ACTION_LIMITS)
+        self._timeouts: Dict[str, float] = dict(settings.PLAYBOOK_ACTION_TIMEOUTS)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def register(self, action: str, handler: ActionHandler, concurrency: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        self._handlers[action] = handler
+        if concurrency is not None:
+            self._limits[action] = concurrency
+            self._semaphores.pop(action, None)
+        if timeout is not None:
+            self._timeouts[action] = timeout
+
+    def handler(self, action: str) -> Optional[ActionHandler]:
+        handler = self._handlers.get(action)
+        if handler is None and settings.PLAYBOOK_SIMULATE_ACTIONS:
+            return simulated_action
+        return handler
+
+    def semaphore(self, action: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(action)
+        if semaphore is None:
+            limit = self._limits.get(action, settings.PLAYBOOK_ACTION_CONCURRENCY)
+            semaphore = self._semaphores[action] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def timeout(self, action: str) -> float:
+        return self._timeouts.get(action, settings.PLAYBOOK_ACTION_TIMEOUT)
+
+class TaskProgressWriter:
+    """
+    Writes playbook progress back to the tasks table.
+
+    Intermediate progress is coalesced per task and written with one
+    batched UPDATE every PLAYBOOK_PROGRESS_FLUSH_MS; the start and the end
+    of a run are written immediately.
+    """
+
+    def __init__(self):
+        self._dirty: Dict[Any, Dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        # Serializes writes so an older flush never lands after a newer write
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def update(self, task_id: Any, **values: Any) -> None:
+        """Queue column values for the next flush."""
+        self._dirty.setdefault(task_id, {}).update(values)
+
+    async def write(self, task_id: Any, **values: Any) -> None:
+        """Write column values now, along with anything still queued for the task."""
+        values = {**self._dirty.pop(task_id, {}), **values}
+        await self._execute([(task_id, values)])
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        await self._execute(list(dirty.items()))
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(settings.PLAYBOOK_PROGRESS_FLUSH_MS / 1000)
+            await self.flush()
+
+    async def _execute(self, rows: List[Any]) -> None:
+        # Group by the set of columns so each group is one executemany UPDATE
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for task_id, values in rows:
+            groups.setdefault(tuple(sorted(values)), []).append({"task_id": task_id, **{f"v_{k}": v for k, v in values.items()}})
+        table = Task.__table__
+        try:
+            async with self._lock, async_engine.begin() as conn:
+                for columns, params in groups.items():
+                    statement = (
+                        update(table)
+                        .where(table.c.id == bindparam("task_id"))
+                        .values({column: bindparam(f"v_{column}") for column in columns})
+                    )
+                    await conn.execute(statement, params)
+        except Exception as e:
+            print(f"Error writing task progress: {str(e)}")
+
+class PlaybookEngine:
+    """
+    Runs playbooks as DAGs of steps on the event loop.
+
+    Each run is one asyncio task; its steps start as soon as the steps they
+    depend on have completed, so independent steps run concurrently, each
+    within its action's concurrency limit and timeout. When a step fails,
+    the steps depending on it are skipped and the run fails once the
+    remaining steps finish. At most PLAYBOOK_MAX_CONCURRENT_RUNS runs
+    execute at once; the rest wait their turn.
+    """
+
+    def __init__(self, registry: Optional[ActionRegistry] = None, progress: Optional[TaskProgressWriter] = None):
+        self.registry = registry or ActionRegistry()
+        self.progress = progress or TaskProgressWriter()
+        self._runs: Dict[Any, asyncio.Task] = {}
+        self._run_slots: Optional[asyncio.Semaphore] = None
+        self.stats = {"started": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    @property
+    def active_runs(self) -> int:
+        return len(self._runs)
+
+    def is_running(self, task_id: Any) -> bool:
+        return task_id in self._runs
+
+    async def start(self) -> None:
+        self._run_slots = asyncio.Semaphore(settings.PLAYBOOK_MAX_CONCURRENT_RUNS)
+        await self.progress.start()
+
+    async def stop(self) -> None:
+        """Cancel the active runs and write their final state."""
+        runs = list(self._runs.values())
+        for run in runs:
+            run.cancel()
+        await asyncio.gather(*runs, return_exceptions=True)
+        await self.progress.stop()
+
+    def submit(
+        self,
+        task_id: Any,
+        steps: List[Dict[str, Any]],
+        parameters: Optional[Dict[str, Any]] = None,
+        agent_id: Any = None
+    ) -> asyncio.Task:
+        """
+        Start running a playbook for a task in the background.
+
+        Raises:
+            PlaybookDefinitionError: If the steps are not a valid DAG
+            ValueError: If the task is already running
+        """
+        if task_id in self._runs:
+            raise ValueError(f"Task {task_id} is already running")
+        dag = build_dag(steps)
+        run = asyncio.create_task(self._run(task_id, dag, parameters or {}, agent_id))
+        self._runs[task_id] = run
+        run.add_done_callback(lambda _: self._runs.pop(task_id, None))
+        return run
+
+    def cancel(self, task_id: Any) -> bool:
+        run = self._runs.get(task_id)
+        if run is None:
+            return False
+        run.cancel()
+        return True
+
+    async def _run(self, task_id: Any, dag: List[PlaybookStep], parameters: Dict[str, Any], agent_id: Any) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"steps": {step.name: {"status": "pending"} for step in dag}}
+        steps = {step.name: step for step in dag}
+        try:
+            async with self._run_slots:
+                self.stats["started"] += 1
+                await self.progress.write(task_id, status="running", started_at=_now(), completed_at=None, result=result)
+                await self._execute(task_id, steps, parameters, agent_id, result)
+        except asyncio.CancelledError:
+            for state in result["steps"].values():
+                if state["status"] in ("pending", "running"):
+                    state["status"] = "cancelled"
+            result["status"] = "cancelled"
+            self.stats["cancelled"] += 1
+            await self.progress.write(task_id, status="failed", completed_at=_now(), result=result)
+            raise
+
+        failed = any(state["status"] in ("failed", "skipped") for state in result["steps"].values())
+        result["status"] = "failed" if failed else "completed"
+        self.stats[result["status"]] += 1
+        await self.progress.write(task_id, status=result["status"], completed_at=_now(), result=result)
+        return result
+
+    async def _execute(
+        self,
+        task_id: Any,
+        steps: Dict[str, PlaybookStep],
+        parameters: Dict[str, Any],
+        agent_id: Any,
+        result: Dict[str, Any]
+    ) -> None:
+        states = result["steps"]
+        waiting = {name: set(step.depends_on) for name, step in steps.items()}
+        dependents: Dict[str, List[str]] = {name: [] for name in steps}
+        for name, step in steps.items():
+            for dependency in waiting[name]:
+                dependents[dependency].append(name)
+        outputs: Dict[str, Any] = {}
+        running: Dict[asyncio.Task, str] = {}
+
+        def launch(name: str) -> None:
+            step = steps[name]
+            inputs = {dependency: outputs.get(dependency) for dependency in step.depends_on}
+            context = StepContext(task_id, agent_id, step, parameters, inputs)
+            running[asyncio.create_task(self._run_step(context, step, states[name], task_id, result))] = name
+
+        def skip(name: str) -> None:
+            for child in dependents[name]:
+                if states[child]["status"] == "pending":
+                    states[child] = {"status": "skipped", "reason": f"dependency '{name}' did not complete"}
+                    skip(child)
+
+        try:
+            for name, dependencies in waiting.items():
+                if not dependencies:
+                    launch(name)
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    name = running.pop(finished)
+                    if states[name]["status"] != "completed":
+                        skip(name)
+                        continue
+                    outputs[name] = states[name].get("output")
+                    for child in dependents[name]:
+                        waiting[child].discard(name)
+                        if not waiting[child] and states[child]["status"] == "pending":
+                            launch(child)
+        finally:
+            for pending in running:
+                pending.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def _run_step(
+        self,
+        context: StepContext,
+        step: PlaybookStep,
+        state: Dict[str, Any],
+        task_id: Any,
+        result: Dict[str, Any]
+    ) -> None:
+        handler = self.registry.handler(step.action)
+        if handler is None:
+            state.update(status="failed", error=f"No handler for action '{step.action}'")
+            self.progress.update(task_id, result=result)
+            return
+        timeout = step.timeout or self.registry.timeout(step.action)
+        async with self.registry.semaphore(step.action):
+            state.update(status="running", started_at=_now().isoformat())
+            self.progress.update(task_id, result=result)
+            try:
+                output = await asyncio.wait_for(handler(context), timeout)
+                state.update(status="completed", output=output)
+            except asyncio.TimeoutError:
+                state.update(status="failed", error=f"Timed out after {timeout}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                state.update(status="failed", error=str(e))
+            state["completed_at"] = _now().isoformat()
+        self.progress.update(task_id, result=result)
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
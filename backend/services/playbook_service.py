@@ -0,0 +1,20 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.playbook import Playbook
+from services.crud import CrudService
+
+class PlaybookService(CrudService):
+    model = Playbook
+
+    async def create_playbook(self, db: AsyncSession, playbook: BaseModel) -> Playbook:
+        return await self.create(db, playbook)
+
+    async def get_playbook(self, db: AsyncSession, playbook_id: int) -> Optional[Playbook]:
+        return await self.get(db, playbook_id)
+
+    async def update_playbook(self, db: AsyncSession, playbook_id: int, playbook: BaseModel) -> Optional[Playbook]:
+        return await self.update(db, playbook_id, playbook)
+
+    async def delete_playbook(self, db: AsyncSession, playbook_id: int) -> bool:
+        return await self.delete(db, playbook_id)
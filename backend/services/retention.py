@@ -0,0 +1,444 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import and_, column, delete, event, insert, literal_column, or_, select, table as table_clause
+from config import settings
+from database import async_engine, engine, is_sqlite, SQLALCHEMY_DATABASE_URL
+from models.incident import Incident
+from models.task import Task
+from models import SecurityAlert
+from services.fast_json import dumps
+from services.search import ARCHIVE_SCHEMA, ARCHIVE_SEARCH_TABLE, COLUMNS as SEARCH_COLUMNS, DOCUMENTS, SEARCH_TABLE, ensure_archive_search_index
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; segments are gzip without it
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker only
+    fcntl = None
+
+TABLES = {
+    "incidents": Incident.__table__,
+    "tasks": Task.__table__,
+    "security_alerts": SecurityAlert.__table__,
+}
+# A row is archived once every one of these is older than the cutoff (or unset)
+TIME_COLUMNS = {
+    "incidents": ("created_at", "updated_at", "resolved_at"),
+    "tasks": ("created_at", "updated_at", "completed_at"),
+    "security_alerts": ("created_at", "updated_at"),
+}
+
+LIVE_INDEX = table_clause(SEARCH_TABLE, *(column(name) for name in SEARCH_COLUMNS))
+ARCHIVE_INDEX = table_clause(ARCHIVE_SEARCH_TABLE, *(column(name) for name in SEARCH_COLUMNS), schema=ARCHIVE_SCHEMA)
+
+# Sidecar index entry: rows are sorted by id and point at their compressed block
+INDEX_ENTRY = np.dtype([
+    ("id", "<i8"),
+    ("created_at", "<f8"),  # Epoch seconds, NaN when unset
+    ("offset", "<u8"),  # Block start in the segment file
+    ("length", "<u4"),  # Compressed block size
+    ("line", "<u4"),  # Row within the block
+])
+
+class ArchiveError(Exception):
+    """Raised when an archive segment cannot be read."""
+
+def _compress(payload: bytes) -> Tuple[bytes, str]:
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=settings.ARCHIVE_ZSTD_LEVEL).compress(payload), ".jsonl.zst"
+    return gzip.compress(payload, compresslevel=settings.ARCHIVE_GZIP_LEVEL, mtime=0), ".jsonl.gz"
+
+def _decompress(block: bytes, suffix: str) -> bytes:
+    if suffix == ".jsonl.zst":
+        if zstandard is None:
+            raise ArchiveError("Segment is zstd-compressed and the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(block)
+    return gzip.decompress(block)
+
+def _epoch(value: Any) -> float:
+    if not isinstance(value, datetime):
+        return float("nan")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _fsync_rename(source: str, target: str) -> None:
+    with open(source, "rb") as handle:
+        os.fsync(handle.fileno())
+    os.replace(source, target)
+
+class Segment:
+    """
+    One immutable archive segment: a data file and its sidecar index.
+
+    The data file is a sequence of independently compressed blocks of
+    JSON lines, so the whole file is still a valid .jsonl.gz (or .jsonl.zst)
+    stream for command line tools, while a lookup only decompresses the
+    block holding the row. The index is memory-mapped and binary-searched.
+    """
+
+    def __init__(self, directory: str, index_name: str):
+        self.data_path = os.path.join(directory, index_name[:-len(".idx")])
+        self.index_path = os.path.join(directory, index_name)
+        first, last, written = index_name.split(".", 1)[0].split("-")
+        self.first, self.last, self.written = int(first), int(last), int(written)
+        self.suffix = ".jsonl.zst" if self.data_path.endswith(".zst") else ".jsonl.gz"
+        self._index: Optional[np.ndarray] = None
+
+    @property
+    def index(self) -> np.ndarray:
+        if self._index is None:
+            self._index = np.memmap(self.index_path, dtype=INDEX_ENTRY, mode="r")
+        return self._index
+
+    def release(self) -> None:
+        self._index = None
+
+    def locate(self, row_id: int) -> Optional[np.void]:
+        index = self.index
+        position = int(np.searchsorted(index["id"], row_id))
+        if position < len(index) and index["id"][position] == row_id:
+            return index[position]
+        return None
+
+    def contains(self, row_ids: np.ndarray) -> np.ndarray:
+        return np.isin(row_ids, self.index["id"])
+
+    def read_block(self, offset: int, length: int) -> List[bytes]:
+        with open(self.data_path, "rb") as handle:
+            handle.seek(offset)
+            block = handle.read(length)
+        if len(block) != length:
+            raise ArchiveError(f"Segment {self.data_path} is truncated")
+        return _decompress(block, self.suffix).splitlines()
+
+    @classmethod
+    def write(cls, directory: str, rows: List[Dict[str, Any]]) -> "Segment":
+        """
+        Write rows (sorted by id) as a new segment.
+
+        The data file and then the index are written under temporary names,
+        synced and renamed; an index file marks a complete segment.
+        """
+        entries = np.zeros(len(rows), dtype=INDEX_ENTRY)
+        written = time.time_ns()
+        stem = f"{rows[0]['id']:012d}-{rows[-1]['id']:012d}-{written}"
+        block_rows = settings.ARCHIVE_BLOCK_ROWS
+        offset = 0
+        suffix = None
+        data_part = os.path.join(directory, f".{stem}.part")
+        with open(data_part, "wb") as handle:
+            for start in range(0, len(rows), block_rows):
+                block = rows[start:start + block_rows]
+                compressed, suffix = _compress(b"\n".join(dumps(row) for row in block) + b"\n")
+                handle.write(compressed)
+                for line, row in enumerate(block):
+                    entries[start + line] = (row["id"], _epoch(row.get("created_at")), offset, len(compressed), line)
+                offset += len(compressed)
+        index_part = os.path.join(directory, f".{stem}.idx.part")
+        entries.tofile(index_part)
+        data_name = stem + suffix
+        _fsync_rename(data_part, os.path.join(directory, data_name))
+        _fsync_rename(index_part, os.path.join(directory, data_name + ".idx"))
+        return cls(directory, data_name + ".idx")
+
+class Archive:
+    """
+    The archive segments of one table.
+
+    Segments are listed from the directory and re-listed when it changes,
+    so segments written by another worker are found too. Id ranges of
+    segments may overlap (rows become eligible out of id order); the newest
+    segment holding an id wins.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.segments: List[Segment] = []
+        self._firsts = np.empty(0, dtype=np.int64)
+        self._lasts = np.empty(0, dtype=np.int64)
+        self._listed: Optional[int] = None
+        self._open: "OrderedDict[str, Segment]" = OrderedDict()
+        self._blocks: "OrderedDict[Tuple[str, int], List[bytes]]" = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "block_reads": 0}
+
+    def refresh(self) -> None:
+        try:
+            listed = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if listed == self._listed:
+            return
+        known = {segment.index_path: segment for segment in self.segments}
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".idx") and not name.startswith("."):
+                path = os.path.join(self.directory, name)
+                segments.append(known.get(path) or Segment(self.directory, name))
+        # Newest first, so a row archived twice resolves to its latest copy
+        segments.sort(key=lambda segment: segment.written, reverse=True)
+        self.segments = segments
+        self._firsts = np.array([segment.first for segment in segments], dtype=np.int64)
+        self._lasts = np.array([segment.last for segment in segments], dtype=np.int64)
+        self._listed = listed
+
+    def _candidates(self, low: int, high: int) -> List[Segment]:
+        """Segments whose id range overlaps [low, high], newest first."""
+        positions = np.flatnonzero((self._firsts <= high) & (self._lasts >= low))
+        return [self._touch(self.segments[position]) for position in positions]
+
+    def _touch(self, segment: Segment) -> Segment:
+        # Bound the memory maps held open
+        self._open[segment.index_path] = segment
+        self._open.move_to_end(segment.index_path)
+        while len(self._open) > settings.ARCHIVE_OPEN_SEGMENTS:
+            _, oldest = self._open.popitem(last=False)
+            oldest.release()
+        return segment
+
+    def get(self, row_id: int) -> Optional[Dict[str, Any]]:
+        """The archived row with this id, None if it is not archived."""
+        self.refresh()
+        self.stats["lookups"] += 1
+        for segment in self._candidates(row_id, row_id):
+            entry = segment.locate(row_id)
+            if entry is None:
+                continue
+            key = (segment.data_path, int(entry["offset"]))
+            lines = self._blocks.get(key)
+            if lines is None:
+                lines = segment.read_block(int(entry["offset"]), int(entry["length"]))
+                self.stats["block_reads"] += 1
+                self._blocks[key] = lines
+                if len(self._blocks) > settings.ARCHIVE_BLOCK_CACHE:
+                    self._blocks.popitem(last=False)
+            else:
+                self._blocks.move_to_end(key)
+            self.stats["hits"] += 1
+            return json.loads(lines[int(entry["line"])])
+        return None
+
+    def archived(self, row_ids: Iterable[int]) -> np.ndarray:
+        """Which of these ids (sorted) are already in a segment."""
+        self.refresh()
+        ids = np.fromiter(row_ids, dtype=np.int64)
+        found = np.zeros(len(ids), dtype=bool)
+        if len(ids):
+            for segment in self._candidates(int(ids.min()), int(ids.max())):
+                found |= segment.contains(ids)
+        return found
+
+    def write(self, rows: List[Dict[str, Any]]) -> Segment:
+        segment = Segment.write(self.directory, rows)
+        self._listed = None
+        return segment
+
+    def get_stats(self) -> Dict[str, Any]:
+        self.refresh()
+        rows = data_bytes = 0
+        for segment in self.segments:
+            try:
+                rows += os.path.getsize(segment.index_path) // INDEX_ENTRY.itemsize
+                data_bytes += os.path.getsize(segment.data_path)
+            except OSError:
+                continue
+        return dict(self.stats, segments=len(self.segments), rows=rows, bytes=data_bytes)
+
+class RetentionManager:
+    """
+    Moves old finished rows out of the live database into compressed archive segments.
+
+    Every RETENTION_INTERVAL_SECONDS, rows of incidents, tasks and
+    security_alerts whose status is in RETENTION_STATUSES and whose
+    timestamps are all older than RETENTION_DAYS are read in id order,
+    RETENTION_BATCH_ROWS at a time. Each batch is written as one segment
+    under ARCHIVE_DIR/<table>/ and then deleted in transactions of
+    RETENTION_DELETE_ROWS with a pause in between, so writers are never
+    locked out for long. A row still eligible at delete time has its
+    search document moved to the archive search index in the same
+    transaction. A crash between writing and deleting leaves rows in both
+    places; the next run finds them archived and only deletes them.
+
+    With several workers, one run at a time holds ARCHIVE_DIR/.lock.
+    The directories are created by start(), not on construction.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or settings.ARCHIVE_DIR
+        self.archives = {table: Archive(os.path.join(self.directory, table)) for table in TABLES}
+        self.search_path = os.path.join(self.directory, "search.db")
+        self._task: Optional[asyncio.Task] = None
+        self.running = False
+        self.searchable = False
+        self.last_run: Optional[Dict[str, Any]] = None
+        self.stats = {"runs": 0, "skipped_runs": 0, "archived": 0, "deleted": 0, "segments_written": 0, "errors": 0}
+        self._attached = False
+
+    def _attach(self, dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (self.search_path,))
+        cursor.close()
+
+    def get(self, table: str, row_id: int) -> Optional[Dict[str, Any]]:
+        """An archived row (blocking; the block is read from disk on a cache miss)."""
+        return self.archives[table].get(row_id)
+
+    def _eligible(self, table: str, cutoff: datetime):
+        columns = TABLES[table].c
+        conditions = [columns.status.in_(settings.RETENTION_STATUSES[table]), columns.created_at.isnot(None)]
+        for name in TIME_COLUMNS[table]:
+            column = columns[name]
+            # Naive columns (security_alerts) hold UTC without a zone
+            bound = cutoff if getattr(column.type, "timezone", False) else cutoff.replace(tzinfo=None)
+            conditions.append(or_(column.is_(None), column < bound))
+        return and_(*conditions)
+
+    async def _delete(self, table: str, row_ids: List[int], eligible) -> int:
+        """Delete archived rows that are still eligible, moving their search documents along."""
+        db_table = TABLES[table]
+        deleted = 0
+        for start in range(0, len(row_ids), settings.RETENTION_DELETE_ROWS):
+            chunk = row_ids[start:start + settings.RETENTION_DELETE_ROWS]
+            still_eligible = and_(db_table.c.id.in_(chunk), eligible)
+            async with async_engine.begin() as conn:
+                if self.searchable and table in DOCUMENTS:
+                    # Before the delete, whose trigger drops the live documents
+                    rowids = (
+                        select(literal_column(DOCUMENTS[table]["rowid"].format(row=table)))
+                        .select_from(db_table)
+                        .where(still_eligible)
+                    )
+                    await conn.execute(delete(ARCHIVE_INDEX).where(ARCHIVE_INDEX.c.rowid.in_(rowids)))
+                    await conn.execute(insert(ARCHIVE_INDEX).from_select(
+                        SEARCH_COLUMNS,
+                        select(*(LIVE_INDEX.c[name] for name in SEARCH_COLUMNS)).where(LIVE_INDEX.c.rowid.in_(rowids))
+                    ))
+                result = await conn.execute(delete(db_table).where(still_eligible))
+                deleted += result.rowcount or 0
+            await asyncio.sleep(settings.RETENTION_PAUSE_MS / 1000)
+        return deleted
+
+    async def archive_table(self, table: str, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Archive one table's eligible rows.
+
+        Returns:
+            dict: Rows archived (written to new segments) and deleted
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=settings.RETENTION_DAYS[table])
+        db_table = TABLES[table]
+        archive = self.archives[table]
+        eligible = self._eligible(table, cutoff)
+        counts = {"archived": 0, "deleted": 0}
+        after = 0
+        while True:
+            async with async_engine.connect() as conn:
+                rows = [dict(row) for row in (await conn.execute(
+                    select(db_table)
+                    .where(db_table.c.id > after, eligible)
+                    .order_by(db_table.c.id)
+                    .limit(settings.RETENTION_BATCH_ROWS)
+                )).mappings()]
+            if not rows:
+                return counts
+            after = rows[-1]["id"]
+            done = archive.archived(row["id"] for row in rows)
+            pending = [row for row, present in zip(rows, done) if not present]
+            if pending:
+                # Compression and fsync off the event loop
+                await asyncio.to_thread(archive.write, pending)
+                self.stats["segments_written"] += 1
+                counts["archived"] += len(pending)
+            counts["deleted"] += await self._delete(table, [row["id"] for row in rows], eligible)
+
+    def _try_lock(self) -> Optional[int]:
+        fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+        return fd
+
+    async def run_once(self) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Archive every table once.
+
+        Returns:
+            dict: Per table counts, or None when another run (in this or
+                another worker) is in progress
+        """
+        if self.running:
+            self.stats["skipped_runs"] += 1
+            return None
+        fd = self._try_lock()
+        if fd is None:
+            self.stats["skipped_runs"] += 1
+            return None
+        self.running = True
+        started = time.time()
+        results = {}
+        try:
+            for table in TABLES:
+                try:
+                    results[table] = await self.archive_table(table)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"Error archiving {table}: {str(e)}")
+                    continue
+                self.stats["archived"] += results[table]["archived"]
+                self.stats["deleted"] += results[table]["deleted"]
+        finally:
+            self.running = False
+            os.close(fd)
+        self.stats["runs"] += 1
+        self.last_run = {"started_at": started, "seconds": round(time.time() - started, 3), "tables": results}
+        return results
+
+    async def start(self) -> None:
+        for archive in self.archives.values():
+            os.makedirs(archive.directory, exist_ok=True)
+        if is_sqlite(SQLALCHEMY_DATABASE_URL) and not self._attached:
+            # Every connection sees the archive search index as archive.*
+            event.listen(engine, "connect", self._attach)
+            event.listen(async_engine.sync_engine, "connect", self._attach)
+            self._attached = True
+            # Connections pooled before now were opened without it
+            await async_engine.dispose()
+            engine.dispose()
+        async with async_engine.begin() as conn:
+            self.searchable = await ensure_archive_search_index(conn)
+        if self._task is None and settings.RETENTION_ENABLED:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+            await self.run_once()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            running=self.running,
+            last_run=self.last_run,
+            codec="zstd" if zstandard is not None else "gzip",
+            tables={table: archive.get_stats() for table, archive in self.archives.items()}
+        )
@@ -0,0 +1,482 @@
+import asyncio
+import math
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import or_, select
+from config import settings
+from database import async_engine
+from models.agent import Agent
+from models.incident import Incident
+from services.incident_correlation import OPEN_STATUSES
+from services.ip_intel import SOURCE_IP_FIELDS, parse_ip
+
+# Score inputs, each scaled to 0..1 (higher is riskier), in matrix column order
+FEATURES = ("severity", "asset_criticality", "tactic", "recurrence", "ip_reputation", "agent_distrust")
+
+SEVERITY_SCORES = {"low": 0.25, "medium": 0.5, "high": 0.75, "critical": 1.0}
+
+# Later stages of an intrusion weigh more
+TACTIC_WEIGHTS = {
+    "Reconnaissance": 0.2,
+    "Resource Development": 0.2,
+    "Discovery": 0.4,
+    "Initial Access": 0.5,
+    "Execution": 0.6,
+    "Persistence": 0.6,
+    "Defense Evasion": 0.6,
+    "Collection": 0.7,
+    "Privilege Escalation": 0.75,
+    "Credential Access": 0.75,
+    "Lateral Movement": 0.8,
+    "Command and Control": 0.85,
+    "Exfiltration": 0.95,
+    "Impact": 1.0,
+}
+DEFAULT_TACTIC_WEIGHT = 0.3
+
+# Agent status -> trust in what it reports; agents can override with configuration.trust
+AGENT_TRUST = {"active": 1.0, "maintenance": 0.7, "inactive": 0.5}
+UNKNOWN_AGENT_TRUST = 0.8
+
+# Reputation of a source address on no list
+PUBLIC_IP_REPUTATION = 0.3
+PRIVATE_IP_REPUTATION = 0.1
+NO_IP_REPUTATION = 0.2
+
+LEVELS = ("low", "medium", "high", "critical")
+
+PRUNE_CHUNK = 10000  # Queued ids checked per query when pruning deleted incidents
+LEVEL_THRESHOLDS = np.array([35.0, 60.0, 80.0])  # Scores from which medium, high and critical start
+
+RECOMMENDATIONS = {
+    "severity": "Escalate to the on-call analyst",
+    "asset_criticality": "Prioritize containment of the affected critical asset",
+    "tactic": "Hunt for related activity from the same MITRE tactic",
+    "recurrence": "Investigate why this incident keeps recurring and fix the root cause",
+    "ip_reputation": "Block the source IP address at the perimeter",
+    "agent_distrust": "Verify the health and integrity of the reporting agent",
+}
+
+# Raw input columns: what is read from an incident, before the agent join and scaling
+_SEVERITY, _ASSET, _TACTIC, _COUNT, _IP, _AGENT = range(6)
+
+_PRIVATE_V4 = (
+    (0x0A000000, 0xFF000000),  # 10.0.0.0/8
+    (0xAC100000, 0xFFF00000),  # 172.16.0.0/12
+    (0xC0A80000, 0xFFFF0000),  # 192.168.0.0/16
+    (0x7F000000, 0xFF000000),  # 127.0.0.0/8
+)
+
+def _scaled(value: Any, default: float) -> float:
+    """A 0..1 number, or a low/medium/high/critical level, as a float."""
+    if isinstance(value, str):
+        return SEVERITY_SCORES.get(value.lower(), default)
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+        return min(max(float(value), 0.0), 1.0)
+    return default
+
+def ip_reputation(details: Dict[str, Any], source_ip: Any) -> float:
+    """
+    Risk of the source address: an explicit details.ip_reputation, else the
+    highest weight of the IP intelligence lists it was tagged with (see
+    RISK_IP_LIST_WEIGHTS), else a baseline for public or private addresses.
+    """
+    explicit = details.get("ip_reputation")
+    if explicit is not None:
+        return _scaled(explicit, NO_IP_REPUTATION)
+    tags = details.get("ip_intel")
+    if tags:
+        weights = settings.RISK_IP_LIST_WEIGHTS
+        return max(weights.get(name, settings.RISK_IP_LISTED_DEFAULT) for name in tags)
+    parsed = parse_ip(source_ip)
+    if parsed is None:
+        return NO_IP_REPUTATION
+    version, address = parsed
+    if version == 4 and any(address & mask == network for network, mask in _PRIVATE_V4):
+        return PRIVATE_IP_REPUTATION
+    return PUBLIC_IP_REPUTATION
+
+def tactic_weight(details: Dict[str, Any]) -> float:
+    tags = details.get("mitre") or []
+    weights = [TACTIC_WEIGHTS.get(tag.get("tactic"), DEFAULT_TACTIC_WEIGHT) for tag in tags if isinstance(tag, dict)]
+    tactic = details.get("mitreTactic")
+    if tactic:
+        weights.append(TACTIC_WEIGHTS.get(tactic, DEFAULT_TACTIC_WEIGHT))
+    return max(weights) if weights else DEFAULT_TACTIC_WEIGHT
+
+def incident_inputs(incident: Dict[str, Any]) -> Tuple[float, ...]:
+    """
+    The raw score inputs of an incident (a serialized row or an inline dict).
+
+    Asset criticality comes from details.asset_criticality when set (NaN
+    otherwise, to fall back on the agent's); the agent id is kept so agent
+    criticality and trust can be joined in for the whole batch at once.
+    """
+    details = incident.get("details") or {}
+    source_ip = next((details[field] for field in SOURCE_IP_FIELDS if details.get(field)), None)
+    asset = details.get("asset_criticality")
+    agent_id = incident.get("agent_id")
+    try:
+        agent = float(int(agent_id)) if agent_id is not None else -1.0
+    except (TypeError, ValueError):
+        agent = -1.0
+    return (
+        SEVERITY_SCORES.get(str(incident.get("severity", "")).lower(), SEVERITY_SCORES["medium"]),
+        _scaled(asset, math.nan) if asset is not None else math.nan,
+        tactic_weight(details),
+        float(incident.get("occurrence_count") or 1),
+        ip_reputation(details, source_ip),
+        agent,
+    )
+
+def weight_vector(weights: Dict[str, float]) -> np.ndarray:
+    """Feature weights in column order, normalized to sum to 1."""
+    unknown = set(weights) - set(FEATURES)
+    if unknown:
+        raise ValueError(f"Unknown risk features: {', '.join(sorted(unknown))}")
+    vector = np.array([max(float(weights.get(name, 0.0)), 0.0) for name in FEATURES])
+    if vector.sum() <= 0:
+        raise ValueError("At least one risk weight must be positive")
+    return vector / vector.sum()
+
+class AgentTable:
+    """Agent criticality and trust in arrays sorted by agent id, for vectorized joins."""
+
+    def __init__(self, rows: Iterable[Tuple[int, Optional[str], Optional[Dict[str, Any]]]] = ()):
+        entries = []
+        for agent_id, status, configuration in rows:
+            configuration = configuration or {}
+            criticality = _scaled(configuration.get("asset_criticality"), settings.RISK_DEFAULT_ASSET_CRITICALITY)
+            trust = _scaled(configuration.get("trust"), AGENT_TRUST.get(status, UNKNOWN_AGENT_TRUST))
+            entries.append((agent_id, criticality, trust))
+        entries.sort()
+        self.ids = np.array([entry[0] for entry in entries], dtype=np.float64)
+        self.criticality = np.array([entry[1] for entry in entries])
+        self.trust = np.array([entry[2] for entry in entries])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __eq__(self, other: Any) -> bool:
+        return (isinstance(other, AgentTable) and np.array_equal(self.ids, other.ids)
+                and np.array_equal(self.criticality, other.criticality) and np.array_equal(self.trust, other.trust))
+
+    def join(self, agent_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Criticality and trust per row; defaults for rows without a (known) agent."""
+        criticality = np.full(len(agent_ids), settings.RISK_DEFAULT_ASSET_CRITICALITY)
+        trust = np.full(len(agent_ids), UNKNOWN_AGENT_TRUST)
+        if len(self.ids) and len(agent_ids):
+            positions = np.minimum(np.searchsorted(self.ids, agent_ids), len(self.ids) - 1)
+            found = self.ids[positions] == agent_ids
+            criticality[found] = self.criticality[positions[found]]
+            trust[found] = self.trust[positions[found]]
+        return criticality, trust
+
+def feature_matrix(raw: np.ndarray, agents: AgentTable) -> np.ndarray:
+    """Scale raw input rows into the 0..1 feature matrix (one column per FEATURES entry)."""
+    criticality, trust = agents.join(raw[:, _AGENT])
+    features = np.empty((len(raw), len(FEATURES)))
+    features[:, 0] = raw[:, _SEVERITY]
+    features[:, 1] = np.where(np.isnan(raw[:, _ASSET]), criticality, raw[:, _ASSET])
+    features[:, 2] = raw[:, _TACTIC]
+    # 1 occurrence -> 0, RISK_RECURRENCE_CAP or more -> 1, logarithmic in between
+    features[:, 3] = np.minimum(np.log(np.maximum(raw[:, _COUNT], 1.0)) / math.log(max(settings.RISK_RECURRENCE_CAP, 2)), 1.0)
+    features[:, 4] = raw[:, _IP]
+    features[:, 5] = 1.0 - trust
+    return features
+
+def risk_levels(scores: np.ndarray) -> List[str]:
+    return [LEVELS[index] for index in np.searchsorted(LEVEL_THRESHOLDS, scores, side="right")]
+
+class RiskScorer:
+    """
+    Risk scores (0-100) for incidents, computed in batches with NumPy.
+
+    score() scores any list of incidents at once: the inputs are read into
+    a matrix, agent criticality and trust are joined in by agent id, and
+    the scores are one matrix-vector product with the feature weights.
+
+    The scorer also keeps the open incident queue ranked: refresh() reads
+    only the incidents created or changed since the previous refresh (and
+    the agents, when they changed), compares their inputs with the stored
+    rows and rescores just the rows that differ. Closed incidents leave the
+    queue, and every RISK_PRUNE_SECONDS the queued ids are checked against
+    the table so incidents deleted elsewhere (another worker, retention)
+    leave it too. It runs every RISK_REFRESH_SECONDS.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        agents_generation: Optional[Callable[[], int]] = None
+    ):
+        self.weights = weight_vector(weights or settings.RISK_WEIGHTS)
+        self.agents = AgentTable()
+        self.agents_generation = agents_generation
+        self._agents_loaded: Optional[Tuple[Any, float]] = None
+        self._rows: Dict[int, int] = {}
+        self._ids = np.empty(0, dtype=np.int64)
+        self._raw = np.empty((0, len(FEATURES)))
+        self._scores = np.empty(0)
+        self._size = 0
+        self._watermark: Any = None
+        self._pruned_at = time.monotonic()
+        self._refresh_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed_at: Optional[float] = None
+        self.stats = {"scored": 0, "refreshes": 0, "rescored": 0, "unchanged": 0, "removed": 0, "refresh_errors": 0}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _scores_of(self, features: np.ndarray) -> np.ndarray:
+        return np.round(features @ self.weights * 100.0, 2)
+
+    def score(self, incidents: Sequence[Dict[str, Any]], explain: bool = True) -> List[Dict[str, Any]]:
+        """
+        Score a batch of incidents.
+
+        Returns:
+            list: One {"risk_score", "risk_level", "recommendations"} per
+                incident in order, plus the per-feature contributions when
+                explain is set
+        """
+        if not incidents:
+            return []
+        raw = np.array([incident_inputs(incident) for incident in incidents], dtype=np.float64)
+        features = feature_matrix(raw, self.agents)
+        scores = self._scores_of(features)
+        contributions = features * self.weights * 100.0
+        # Recommend for the two inputs that add the most, if they add a fair share
+        top = np.argsort(-contributions, axis=1)[:, :2]
+        fair_share = 100.0 / len(FEATURES)
+        self.stats["scored"] += len(incidents)
+        results = []
+        for index, (incident, level) in enumerate(zip(incidents, risk_levels(scores))):
+            recommendations = list((incident.get("details") or {}).get("recommendations") or [])
+            for column in top[index]:
+                if contributions[index, column] >= fair_share:
+                    text = RECOMMENDATIONS[FEATURES[column]]
+                    if text not in recommendations:
+                        recommendations.append(text)
+            result = {"risk_score": float(scores[index]), "risk_level": level, "recommendations": recommendations}
+            if explain:
+                result["factors"] = {
+                    name: round(float(contributions[index, column]), 2) for column, name in enumerate(FEATURES)
+                }
+            results.append(result)
+        return results
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        ids = np.empty(capacity, dtype=np.int64)
+        raw = np.empty((capacity, len(FEATURES)))
+        scores = np.empty(capacity)
+        ids[:self._size] = self._ids[:self._size]
+        raw[:self._size] = self._raw[:self._size]
+        scores[:self._size] = self._scores[:self._size]
+        self._ids, self._raw, self._scores = ids, raw, scores
+
+    def upsert(self, incidents: Sequence[Dict[str, Any]]) -> int:
+        """
+        Add incidents to the queue or update them; only rows whose inputs changed are rescored.
+
+        Returns:
+            int: Number of rows scored
+        """
+        latest = {int(incident["id"]): incident for incident in incidents}
+        if not latest:
+            return 0
+        ids = np.fromiter(latest.keys(), dtype=np.int64, count=len(latest))
+        raw = np.array([incident_inputs(incident) for incident in latest.values()], dtype=np.float64)
+        positions = np.fromiter((self._rows.get(incident_id, -1) for incident_id in latest), dtype=np.int64, count=len(latest))
+        existing = positions >= 0
+        changed = ~existing
+        if existing.any():
+            old = self._raw[positions[existing]]
+            new = raw[existing]
+            same = np.all((old == new) | (np.isnan(old) & np.isnan(new)), axis=1)
+            changed[existing] = ~same
+        added = int((~existing).sum())
+        if added:
+            self._grow(self._size + added)
+            positions[~existing] = np.arange(self._size, self._size + added)
+            self._ids[self._size:self._size + added] = ids[~existing]
+            for incident_id, position in zip(ids[~existing].tolist(), positions[~existing].tolist()):
+                self._rows[incident_id] = position
+            self._size += added
+        rows = positions[changed]
+        if len(rows):
+            self._raw[rows] = raw[changed]
+            self._scores[rows] = self._scores_of(feature_matrix(raw[changed], self.agents))
+        self.stats["rescored"] += len(rows)
+        self.stats["unchanged"] += len(latest) - len(rows)
+        return len(rows)
+
+    def remove(self, incident_ids: Iterable[int]) -> int:
+        """Drop incidents from the queue (the last row moves into each freed slot)."""
+        removed = 0
+        for incident_id in incident_ids:
+            position = self._rows.pop(incident_id, None)
+            if position is None:
+                continue
+            last = self._size - 1
+            if position != last:
+                moved = int(self._ids[last])
+                self._ids[position] = moved
+                self._raw[position] = self._raw[last]
+                self._scores[position] = self._scores[last]
+                self._rows[moved] = position
+            self._size = last
+            removed += 1
+        self.stats["removed"] += removed
+        return removed
+
+    def set_agents(self, agents: AgentTable) -> int:
+        """
+        Replace the agent table and rescore the rows it changes.
+
+        Returns:
+            int: Number of rows rescored
+        """
+        if agents == self.agents:
+            return 0
+        raw = self._raw[:self._size]
+        before = feature_matrix(raw, self.agents)
+        self.agents = agents
+        after = feature_matrix(raw, agents)
+        changed = np.flatnonzero(np.any(before != after, axis=1))
+        if len(changed):
+            self._scores[changed] = self._scores_of(after[changed])
+        self.stats["rescored"] += len(changed)
+        return len(changed)
+
+    def ranked(self, limit: int = 100, offset: int = 0, min_score: float = 0.0) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        The open incidents by descending risk.
+
+        Returns:
+            tuple: One page of {"incident_id", "risk_score", "risk_level"}
+                and the number of incidents at or above min_score
+        """
+        scores = self._scores[:self._size]
+        rows = np.flatnonzero(scores >= min_score) if min_score > 0 else np.arange(self._size)
+        total = len(rows)
+        end = min(offset + limit, total)
+        if offset >= end:
+            return [], total
+        selected = scores[rows]
+        if end < total:
+            # Only the first `end` need ordering: those scoring at least the end-th highest (ties included)
+            cutoff = -np.partition(-selected, end - 1)[end - 1]
+            head = np.flatnonzero(selected >= cutoff)
+            order = head[np.lexsort((self._ids[rows[head]], -selected[head]))]
+        else:
+            order = np.lexsort((self._ids[rows], -selected))
+        page = rows[order[offset:end]]
+        page_scores = self._scores[page]
+        return [
+            {"incident_id": int(incident_id), "risk_score": float(score), "risk_level": level}
+            for incident_id, score, level in zip(self._ids[page], page_scores, risk_levels(page_scores))
+        ], total
+
+    async def _load_agents(self, conn) -> None:
+        generation = self.agents_generation() if self.agents_generation else None
+        if self._agents_loaded is not None:
+            loaded_generation, loaded_at = self._agents_loaded
+            # Status flips by heartbeat tracking do not move the generation, so reload now and then too
+            if loaded_generation == generation and time.monotonic() - loaded_at < settings.RISK_AGENT_RELOAD_SECONDS:
+                return
+        rows = (await conn.execute(select(Agent.id, Agent.status, Agent.configuration))).all()
+        self.set_agents(AgentTable(rows))
+        self._agents_loaded = (generation, time.monotonic())
+
+    async def _prune(self, conn) -> int:
+        """Drop queued incidents that are no longer in the table."""
+        queued = self._ids[:self._size].tolist()
+        missing = []
+        for start in range(0, len(queued), PRUNE_CHUNK):
+            chunk = queued[start:start + PRUNE_CHUNK]
+            found = set((await conn.execute(select(Incident.id).where(Incident.id.in_(chunk)))).scalars())
+            missing.extend(incident_id for incident_id in chunk if incident_id not in found)
+        self._pruned_at = time.monotonic()
+        return self.remove(missing)
+
+    async def refresh(self) -> Dict[str, int]:
+        """
+        Bring the queue up to date with the database.
+
+        The first refresh reads every open incident; later ones read those
+        created, updated or seen since the previous one (with an overlap of
+        RISK_REFRESH_OVERLAP_SECONDS for transactions that committed late).
+        Deleted incidents are pruned every RISK_PRUNE_SECONDS.
+
+        Returns:
+            dict: Rows read, rescored and removed
+        """
+        table = Incident.__table__
+        columns = [table.c.id, table.c.severity, table.c.status, table.c.agent_id, table.c.details,
+                   table.c.occurrence_count, table.c.created_at, table.c.updated_at, table.c.last_seen_at]
+        async with self._refresh_lock:
+            query = select(*columns)
+            if self._watermark is None:
+                query = query.where(table.c.status.in_(OPEN_STATUSES))
+            else:
+                since = self._watermark - timedelta(seconds=settings.RISK_REFRESH_OVERLAP_SECONDS)
+                query = query.where(or_(table.c.created_at > since, table.c.updated_at > since, table.c.last_seen_at > since))
+            async with async_engine.connect() as conn:
+                await self._load_agents(conn)
+                rows = (await conn.execute(query)).mappings().all()
+                pruned = 0
+                if self._watermark is not None and time.monotonic() - self._pruned_at >= settings.RISK_PRUNE_SECONDS:
+                    pruned = await self._prune(conn)
+            watermark = self._watermark
+            open_rows, closed = [], []
+            for row in rows:
+                (open_rows if row["status"] in OPEN_STATUSES else closed).append(row)
+                for column in ("created_at", "updated_at", "last_seen_at"):
+                    value = row[column]
+                    if value is not None and (watermark is None or value > watermark):
+                        watermark = value
+            rescored = self.upsert(open_rows)
+            removed = self.remove(row["id"] for row in closed) + pruned
+            self._watermark = watermark
+            self.refreshed_at = time.time()
+            self.stats["refreshes"] += 1
+            return {"read": len(rows), "rescored": rescored, "removed": removed}
+
+    async def start(self) -> None:
+        if self._task is None and settings.RISK_REFRESH_SECONDS > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                print(f"Error refreshing risk scores: {str(e)}")
+            await asyncio.sleep(settings.RISK_REFRESH_SECONDS)
+
+    def get_stats(self) -> Dict[str, Any]:
+        scores = self._scores[:self._size]
+        levels = np.bincount(np.searchsorted(LEVEL_THRESHOLDS, scores, side="right"), minlength=len(LEVELS))
+        return dict(
+            self.stats,
+            queued=self._size,
+            agents=len(self.agents),
+            by_level={level: int(count) for level, count in zip(LEVELS, levels)},
+            refreshed_at=self.refreshed_at,
+            weights={name: round(float(weight), 4) for name, weight in zip(FEATURES, self.weights)}
+        )
@@ -0,0 +1,245 @@
+import asyncio
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from sqlalchemy import select
+from config import settings
+from database import engine
+from models.event import Event
+from models.incident import Incident
+from services.rule_engine import RuleEngine
+from services.window_counter import WindowCounterStore
+
+SOURCES = ("events", "incidents")
+
+def _utc(value: Union[datetime, str]) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+def _init_worker() -> None:
+    # A forked worker must not share the parent's pooled connections
+    engine.dispose(close=False)
+
+def stream_history(source: str, start: datetime, end: datetime) -> Iterator[Tuple[Any, datetime, Dict[str, Any]]]:
+    """
+    Yield (id, time, event) for stored events or incidents in [start, end), oldest first.
+
+    Rows are fetched BACKTEST_CHUNK_ROWS at a time on a server-side cursor
+    where the driver has one, so a partition is never loaded whole.
+    Incidents are presented as events: their details plus the incident columns.
+    """
+    if source == "incidents":
+        table = Incident.__table__
+        columns = [table.c.id, table.c.created_at, table.c.title, table.c.description, table.c.severity,
+                   table.c.status, table.c.source, table.c.agent_id, table.c.details]
+    else:
+        table = Event.__table__
+        columns = [table.c.id, table.c.created_at, table.c.data]
+    query = (
+        select(*columns)
+        .where(table.c.created_at >= start, table.c.created_at < end)
+        .order_by(table.c.created_at, table.c.id)
+    )
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=settings.BACKTEST_CHUNK_ROWS).execute(query)
+        for rows in result.partitions():
+            for row in rows:
+                if source == "incidents":
+                    event = dict(row.details or {})
+                    event.update(
+                        incident_id=row.id, title=row.title, description=row.description, severity=row.severity,
+                        status=row.status, source=row.source, agent_id=row.agent_id
+                    )
+                else:
+                    event = dict(row.data or {})
+                yield row.id, _utc(row.created_at), event
+
+def backtest_partition(
+    rules: List[Dict[str, Any]],
+    source: str,
+    start: datetime,
+    end: datetime,
+    lead_in: float,
+    origin: datetime,
+    samples: int
+) -> Dict[str, Any]:
+    """
+    Replay one time partition through a private rule engine (runs in a pool process).
+
+    Threshold rules count events in sliding windows, so the partition is
+    read from lead_in seconds before its start: those events only fill the
+    window counters, and matches are counted from start on.
+
+    Returns:
+        dict: Rows read, and per rule the matches, matches per hour since
+            origin (sparse) and the first samples hits
+    """
+    rule_engine = RuleEngine(counters=WindowCounterStore())
+    for rule in rules:
+        rule_engine.upsert_rule(rule["id"], rule["name"], rule["conditions"], rule.get("actions") or [])
+    results = {rule["id"]: {"matches": 0, "hours": {}, "samples": []} for rule in rules}
+    rows = 0
+    for row_id, created_at, event in stream_history(source, start - timedelta(seconds=lead_in), end):
+        timestamp = event.get("timestamp")
+        if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+            # Threshold windows run on event time, which must not be the replay's wall clock
+            event["timestamp"] = created_at.timestamp()
+        matches = rule_engine.evaluate(event)
+        if created_at < start:
+            continue
+        rows += 1
+        if not matches:
+            continue
+        hour = int((created_at - origin).total_seconds() // 3600)
+        for match in matches:
+            result = results[match.rule_id]
+            result["matches"] += 1
+            result["hours"][hour] = result["hours"].get(hour, 0) + 1
+            if len(result["samples"]) < samples:
+                result["samples"].append({"id": row_id, "time": created_at.isoformat(), "event": event})
+    return {"rows": rows, "rules": results}
+
+def hourly_summary(hourly: List[int]) -> Dict[str, Any]:
+    """Mean, 95th percentile and peak of matches per hour."""
+    ordered = sorted(hourly)
+    peak = max(range(len(hourly)), key=hourly.__getitem__) if hourly else None
+    return {
+        "mean": round(sum(hourly) / len(hourly), 2) if hourly else 0.0,
+        "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] if ordered else 0,
+        "max": hourly[peak] if hourly else 0,
+        "peak_hour": peak,
+    }
+
+class RuleBacktester:
+    """
+    Replays stored history through a candidate rule set.
+
+    The time range is cut into partitions of BACKTEST_PARTITION_HOURS that
+    are evaluated in parallel on a process pool of BACKTEST_WORKERS, each
+    worker streaming its rows from the database in chunks and running its
+    own rule engine. The per-partition counts are then merged into match
+    totals, samples and the estimated alert volume per hour.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.BACKTEST_WORKERS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.running = 0
+        self.stats = {"runs": 0, "failed": 0, "partitions": 0, "rows": 0, "seconds": 0.0}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self._pool
+
+    @staticmethod
+    def partitions(start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        size = timedelta(hours=settings.BACKTEST_PARTITION_HOURS)
+        bounds = []
+        while start < end:
+            bounds.append((start, min(start + size, end)))
+            start += size
+        return bounds
+
+    async def run(
+        self,
+        rules: List[Dict[str, Any]],
+        start: Union[datetime, str],
+        end: Union[datetime, str],
+        source: str = "events",
+        samples: int = 5
+    ) -> Dict[str, Any]:
+        """
+        Backtest rules over [start, end).
+
+        Args:
+            rules: Rules as {"id", "name", "conditions", "actions"}
+            start: Start of the range (ISO 8601 or datetime; naive is UTC)
+            end: End of the range, exclusive
+            source: Replay stored "events" or "incidents"
+            samples: Hits kept per rule, earliest first
+
+        Returns:
+            dict: Rows replayed and, per rule, the matches, matches per
+                hour (hourly, from start) with their mean, p95 and peak,
+                and sample hits
+
+        Raises:
+            ValueError: If the range or source is invalid
+        """
+        start, end = _utc(start), _utc(end)
+        if end <= start:
+            raise ValueError("end must be after start")
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+        lead_in = max((float(rule["conditions"].get("timeframe") or 0) for rule in rules), default=0.0)
+        bounds = self.partitions(start, end)
+        began = time.monotonic()
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            pool = self._executor()
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, backtest_partition, rules, source, part_start, part_end, lead_in, start, samples)
+                for part_start, part_end in bounds
+            ))
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            self._pool = None
+            self.stats["failed"] += 1
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.running -= 1
+
+        hours = math.ceil((end - start).total_seconds() / 3600)
+        merged = []
+        for rule in rules:
+            hourly = [0] * hours
+            matches = 0
+            hits: List[Dict[str, Any]] = []
+            # Partitions are in time order, so the first samples are the earliest hits
+            for result in results:
+                partition = result["rules"][rule["id"]]
+                matches += partition["matches"]
+                for hour, count in partition["hours"].items():
+                    hourly[hour] += count
+                if len(hits) < samples:
+                    hits.extend(partition["samples"][:samples - len(hits)])
+            merged.append({
+                "rule_id": rule["id"],
+                "name": rule["name"],
+                "matches": matches,
+                "per_hour": hourly_summary(hourly),
+                "hourly": hourly,
+                "samples": hits,
+            })
+        rows = sum(result["rows"] for result in results)
+        elapsed = time.monotonic() - began
+        self.stats["runs"] += 1
+        self.stats["partitions"] += len(bounds)
+        self.stats["rows"] += rows
+        self.stats["seconds"] += elapsed
+        return {
+            "source": source,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "rows": rows,
+            "partitions": len(bounds),
+            "seconds": round(elapsed, 3),
+            "rules": merged,
+        }
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, running=self.running, workers=self.workers)
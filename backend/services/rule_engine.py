@@ -0,0 +1,593 @@
+import asyncio
+import re
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from services.window_counter import WindowCounterStore
+
+# Condition keys that configure how a rule is evaluated rather than naming
+# an event field (see the "Brute Force Prevention" sample rule)
+WINDOW_KEYS = {"timeframe", "group_by", "threshold"}
+
+DEFAULT_GROUP_BY = "source_ip"
+
+_MISSING = object()
+
+class RuleCompileError(ValueError):
+    """Raised when a rule's conditions cannot be compiled."""
+
+def make_getter(field: str) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Build a fast accessor for a (possibly dotted) event field.
+
+    Returns _MISSING when the field is not present.
+    """
+    parts = field.split(".")
+    if len(parts) == 1:
+        return lambda event: event.get(field, _MISSING)
+
+    def get_path(event):
+        value = event
+        for part in parts:
+            if not isinstance(value, dict):
+                return _MISSING
+            value = value.get(part, _MISSING)
+            if value is _MISSING:
+                return _MISSING
+        return value
+    return get_path
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _anchor_values(op: str, expected: Any) -> Optional[Tuple[Any, ...]]:
+    """Return the values an equality-style condition pins a field to."""
+    try:
+        if op == "$eq":
+            hash(expected)
+            return (expected,)
+        if op == "$in":
+            return tuple(frozenset(expected))
+    except TypeError:
+        pass
+    return None
+
+class Node:
+    """
+    A node of a compiled predicate tree.
+
+    Attributes:
+        expr: Python expression evaluating the node; event fields are read
+            from local variables assigned before the expression runs
+        required: Fields that must be present for the node to match
+        anchors: (field, values) equality constraints usable for indexing
+    """
+
+    def __init__(self, expr: str, required=frozenset(), anchors=()):
+        self.expr = expr
+        self.required = frozenset(required)
+        self.anchors = tuple(anchors)
+
+class _FieldTable:
+    """Assigns every event field a stable local variable name for generated code."""
+
+    def __init__(self):
+        self._names: Dict[str, str] = {}
+        self.getters: Dict[str, Callable] = {}
+
+    def name(self, field: str) -> str:
+        name = self._names.get(field)
+        if name is None:
+            name = f"_f{len(self._names)}"
+            self._names[field] = name
+            if "." in field:
+                self.getters[f"_g{name}"] = make_getter(field)
+        return name
+
+    def load(self, field: str) -> str:
+        """Return the statement that loads a field into its local variable."""
+        name = self.name(field)
+        if "." in field:
+            return f"{name} = _g{name}(e)"
+        return f"{name} = e.get({field!r}, _MISSING)"
+
+class _Compiler:
+    """
+    Turns a conditions dict into a predicate tree of Node expressions.
+
+    Constants (thresholds, member sets, regexes) are bound by name in a
+    namespace, prefixed per rule so that the expressions of many rules can
+    be linked into one generated function.
+    """
+
+    def __init__(self, fields: _FieldTable, prefix: str):
+        self.fields = fields
+        self.prefix = prefix
+        self.namespace: Dict[str, Any] = {}
+        self.used_fields: List[str] = []
+
+    def const(self, value: Any) -> str:
+        name = f"_{self.prefix}c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def lookup(self, field: str) -> str:
+        if field not in self.used_fields:
+            self.used_fields.append(field)
+        return self.fields.name(field)
+
+    def compare(self, field: str, op: str, expected: Any) -> str:
+        value = self.lookup(field)
+        if op == "$eq":
+            if isinstance(expected, bool):
+                return f"{value} is {expected!r}"
+            return f"{value} == {self.const(expected)}"
+        if op == "$ne":
+            return f"{value} != {self.const(expected)}"
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if not _is_number(expected):
+                raise RuleCompileError(f"{op} expects a number, got {expected!r}")
+            symbol = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[op]
+            # type() rather than isinstance() so that booleans never compare as numbers
+            return f"type({value}) in _NUMBER and {value} {symbol} {self.const(expected)}"
+        if op in ("$in", "$nin"):
+            if not isinstance(expected, (list, tuple, set)):
+                raise RuleCompileError(f"{op} expects a list, got {expected!r}")
+            try:
+                members = self.const(frozenset(expected))
+            except TypeError:
+                raise RuleCompileError(f"{op} values must be hashable")
+            test = f"{value}.__hash__ is not None and {value} in {members}"
+            if op == "$in":
+                return test
+            return f"not ({test})"
+        if op == "$contains":
+            needle = self.const(str(expected).lower())
+            raw = self.const(expected)
+            return (f"({needle} in {value}.lower() if type({value}) is str "
+                    f"else isinstance({value}, (list, tuple, set)) and {raw} in {value})")
+        if op == "$regex":
+            try:
+                pattern = re.compile(expected, re.IGNORECASE)
+            except (re.error, TypeError) as exc:
+                raise RuleCompileError(f"Invalid $regex {expected!r}: {exc}")
+            search = self.const(pattern.search)
+            return f"type({value}) is str and {search}({value}) is not None"
+        if op == "$exists":
+            return f"{value} is {'not ' if expected else ''}_MISSING"
+        raise RuleCompileError(f"Unknown operator {op!r}")
+
+    def field(self, field: str, spec: Any) -> Node:
+        """
+        Compile the condition for a single event field.
+
+        Args:
+            field: Event field name, dotted for nested values (e.g. "details.source_ip")
+            spec: Either an operator dict ({"$gte": 5}), a list (membership), a
+                number (threshold, value >= number) or any other scalar (equality)
+
+        Returns:
+            Node: The compiled predicate node
+        """
+        if isinstance(spec, dict):
+            if not spec:
+                raise RuleCompileError(f"Empty condition for field {field!r}")
+            ops = list(spec.items())
+        elif isinstance(spec, (list, tuple, set)):
+            ops = [("$in", list(spec))]
+        elif _is_number(spec):
+            ops = [("$gte", spec)]
+        else:
+            ops = [("$eq", spec)]
+
+        exprs = [f"({self.compare(field, op, expected)})" for op, expected in ops]
+        anchors = []
+        for op, expected in ops:
+            values = _anchor_values(op, expected)
+            if values:
+                anchors.append((field, values))
+                break
+        # $ne / $nin / $exists: false also hold when the field is absent
+        required = {field} if any(
+            op not in ("$ne", "$nin", "$exists") or (op == "$exists" and expected) for op, expected in ops
+        ) else set()
+        return Node(" and ".join(exprs), required, anchors)
+
+    def conditions(self, conditions: Any) -> Node:
+        if not isinstance(conditions, dict):
+            raise RuleCompileError("Conditions must be a dict")
+
+        nodes = []
+        for key, spec in conditions.items():
+            if key in WINDOW_KEYS:
+                continue
+            if key == "$all":
+                nodes.extend(self.conditions(sub) for sub in spec)
+            elif key == "$any":
+                children = [self.conditions(sub) for sub in spec]
+                if not children:
+                    raise RuleCompileError("$any needs at least one condition")
+                required = frozenset.intersection(*(c.required for c in children))
+                nodes.append(Node(" or ".join(f"({c.expr})" for c in children), required))
+            elif key == "$not":
+                child = self.conditions(spec)
+                nodes.append(Node(f"not ({child.expr})"))
+            elif key.startswith("$"):
+                raise RuleCompileError(f"Unknown logical operator {key!r}")
+            else:
+                nodes.append(self.field(key, spec))
+
+        if not nodes:
+            return Node("True")
+        if len(nodes) == 1:
+            return nodes[0]
+        required = frozenset().union(*(n.required for n in nodes))
+        anchors = [anchor for n in nodes for anchor in n.anchors]
+        return Node(" and ".join(f"({n.expr})" for n in nodes), required, anchors)
+
+def _link(name: str, rules: List["CompiledRule"], fields: _FieldTable, single: bool = False) -> Callable:
+    """
+    Generate one Python function evaluating several compiled rules.
+
+    Every field used by the rules is loaded once into a local variable, then
+    each rule's expression is tested inline. With single=True the function
+    returns the rule's result; otherwise it calls hit(rule) for each match.
+    """
+    namespace: Dict[str, Any] = {"_MISSING": _MISSING, "_NUMBER": (int, float)}
+    namespace.update(fields.getters)
+    used = []
+    for rule in rules:
+        namespace.update(rule.namespace)
+        used.extend(f for f in rule.fields if f not in used)
+
+    lines = [f"def {name}(e{'' if single else ', hit'}):"]
+    lines.extend(f"    {fields.load(field)}" for field in used)
+    if single:
+        lines.append(f"    return bool({rules[0].expr})")
+    else:
+        for i, rule in enumerate(rules):
+            namespace[f"_r{i}"] = rule
+            lines.append(f"    if {rule.expr}: hit(_r{i})")
+        lines.append("    return None")
+    exec("\n".join(lines), namespace)
+    return namespace[name]
+
+def compile_conditions(conditions: Any, fields: Optional[_FieldTable] = None, prefix: str = "") -> Tuple[Node, _Compiler]:
+    """
+    Compile a rule's conditions dict into a predicate tree.
+
+    Every key of the dict must hold for the rule to match. Besides field
+    names, the logical keys "$all", "$any" (lists of condition dicts) and
+    "$not" (a condition dict) are supported. Keys listed in WINDOW_KEYS are
+    skipped; they configure windowed counting rather than event matching.
+
+    Raises:
+        RuleCompileError: If the conditions are invalid
+    """
+    compiler = _Compiler(fields or _FieldTable(), prefix)
+    return compiler.conditions(conditions), compiler
+
+class CompiledRule:
+    """A rule whose conditions have been compiled once for repeated evaluation."""
+
+    __slots__ = ("rule_id", "name", "seq", "expr", "namespace", "fields", "predicate", "conditions",
+                 "actions", "required", "anchor", "window", "timeframe", "threshold", "group_by", "group_by_getter")
+
+    def __init__(
+        self,
+        rule_id: str,
+        name: str,
+        seq: int,
+        conditions: Dict[str, Any],
+        actions: List[Dict[str, Any]],
+        fields: Optional[_FieldTable] = None
+    ):
+        fields = fields or _FieldTable()
+        node, compiler = compile_conditions(conditions, fields, prefix=f"r{seq}")
+        self.rule_id = rule_id
+        self.name = name
+        self.seq = seq
+        self.expr = node.expr
+        self.namespace = compiler.namespace
+        self.fields = compiler.used_fields
+        self.conditions = conditions
+        self.actions = list(actions or [])
+        self.required = node.required
+        self.window = {k: conditions[k] for k in WINDOW_KEYS if k in conditions}
+        self.timeframe = conditions.get("timeframe")
+        self.threshold = conditions.get("threshold", 1)
+        self.group_by = conditions.get("group_by", DEFAULT_GROUP_BY)
+        self.group_by_getter = None
+        if self.timeframe is not None:
+            if not _is_number(self.timeframe) or self.timeframe <= 0:
+                raise RuleCompileError("timeframe must be a positive number of seconds")
+            if not _is_number(self.threshold) or self.threshold < 1:
+                raise RuleCompileError("threshold must be a positive number")
+            self.group_by_getter = make_getter(self.group_by)
+        # Index on the first equality constraint, else on any required field
+        if node.anchors:
+            self.anchor = node.anchors[0]
+        elif node.required:
+            self.anchor = (min(node.required), None)
+        else:
+            self.anchor = None
+        self.predicate = _link("_predicate", [self], fields, single=True)
+
+class RuleMatch:
+    """A rule that matched an event, with the actions to dispatch."""
+
+    __slots__ = ("rule_id", "name", "actions", "event")
+
+    def __init__(self, rule: CompiledRule, event: Dict[str, Any]):
+        self.rule_id = rule.rule_id
+        self.name = rule.name
+        self.actions = rule.actions
+        self.event = event
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rule_id": self.rule_id, "name": self.name, "actions": self.actions}
+
+class ActionDispatcher:
+    """
+    Routes the actions of matched rules to handlers by action type.
+
+    Handlers are registered per action "type" and may be plain functions or
+    coroutines. Actions without a handler are kept in a bounded list of
+    recent actions so they can still be inspected.
+    """
+
+    def __init__(self, history: int = 1000):
+        self._handlers: Dict[str, Callable] = {}
+        self.recent = deque(maxlen=history)
+
+    def register(self, action_type: str, handler: Callable) -> None:
+        """Register handler(action, match) for an action type."""
+        self._handlers[action_type] = handler
+
+    async def dispatch(self, matches: Iterable[RuleMatch]) -> int:
+        """
+        Run the handlers for every action of the given matches.
+
+        Returns:
+            int: Number of actions dispatched
+        """
+        count = 0
+        for match in matches:
+            for action in match.actions:
+                count += 1
+                handler = self._handlers.get(action.get("type"))
+                if handler is None:
+                    self.recent.append({"rule_id": match.rule_id, "action": action})
+                    continue
+                try:
+                    result = handler(action, match)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    print(f"Error dispatching action {action.get('type')} for rule {match.rule_id}: {str(e)}")
+        return count
+
+class _Bucket:
+    """Rules indexed under the same key, linked into one function on demand."""
+
+    __slots__ = ("rules", "fn")
+
+    def __init__(self):
+        self.rules: List[CompiledRule] = []
+        self.fn: Optional[Callable] = None
+
+class RuleEngine:
+    """
+    Evaluates events against the active rules.
+
+    Rules are compiled once on create/update. Each compiled rule is indexed
+    under one field it requires: by (field, value) when the rule pins that
+    field with an equality or membership test, otherwise by field presence.
+    An event is then only checked against the buckets for values it actually
+    carries, plus the few rules that require no field at all. The rules of a
+    bucket are linked into a single generated function that reads each event
+    field once, and relinked lazily after the bucket changes.
+
+    Rules with a "timeframe" are threshold rules: events matching the other
+    conditions are counted per "group_by" field (source_ip by default) in a
+    sliding window, and the rule matches when the count reaches "threshold".
+    Without a counter store such rules match on every qualifying event.
+    """
+
+    def __init__(self, dispatcher: Optional[ActionDispatcher] = None, counters: Optional[WindowCounterStore] = None):
+        self.dispatcher = dispatcher or ActionDispatcher()
+        self.counters = counters
+        self._fields = _FieldTable()
+        self._rules: Dict[str, CompiledRule] = {}
+        self._seq = 0
+        self._eq_index: Dict[str, Dict[Any, _Bucket]] = {}
+        self._field_index: Dict[str, _Bucket] = {}
+        self._unindexed = _Bucket()
+        self._getters: Optional[List[Tuple[Callable, Optional[Dict], Optional[_Bucket]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._rules)
+
+    def get_rule(self, rule_id: str) -> Optional[CompiledRule]:
+        return self._rules.get(rule_id)
+
+    def upsert_rule(
+        self,
+        rule_id: str,
+        name: str,
+        conditions: Dict[str, Any],
+        actions: List[Dict[str, Any]],
+        is_active: bool = True
+    ) -> Optional[CompiledRule]:
+        """
+        Compile and index a rule, replacing any previous version.
+
+        Inactive rules are removed from the engine.
+
+        Raises:
+            RuleCompileError: If the conditions are invalid (the previous
+                version of the rule is kept in that case)
+        """
+        if not is_active:
+            self.remove_rule(rule_id)
+            return None
+        previous = self._rules.get(rule_id)
+        seq = previous.seq if previous else self._next_seq()
+        compiled = CompiledRule(rule_id, name, seq, conditions, actions, self._fields)
+        if previous:
+            self._unindex(previous)
+            if self.counters is not None and previous.window != compiled.window:
+                self.counters.drop(rule_id)
+        self._rules[rule_id] = compiled
+        self._index(compiled)
+        return compiled
+
+    def load_rule(self, rule: Any) -> Optional[CompiledRule]:
+        """Compile a Rule model (anything with the RuleBase attributes)."""
+        return self.upsert_rule(
+            str(rule.id), rule.name, rule.conditions, rule.actions, getattr(rule, "is_active", True)
+        )
+
+    def sync_rules(self, rules: Iterable[Any]) -> Tuple[int, int]:
+        """
+        Make the engine hold exactly these rules (Rule models).
+
+        Rules whose name, conditions and actions are unchanged are not
+        recompiled, so their window counters are kept. A rule that fails to
+        compile keeps its previous version.
+
+        Returns:
+            tuple: Number of rules compiled and removed
+        """
+        compiled = 0
+        wanted = set()
+        for rule in rules:
+            rule_id = str(rule.id)
+            if not getattr(rule, "is_active", True):
+                continue
+            wanted.add(rule_id)
+            current = self._rules.get(rule_id)
+            if (current is not None and current.name == rule.name
+                    and current.conditions == rule.conditions and current.actions == list(rule.actions or [])):
+                continue
+            try:
+                self.load_rule(rule)
+                compiled += 1
+            except RuleCompileError as e:
+                print(f"Error compiling rule {rule_id}: {str(e)}")
+        removed = [rule_id for rule_id in self._rules if rule_id not in wanted]
+        for rule_id in removed:
+            self.remove_rule(rule_id)
+        return compiled, len(removed)
+
+    def remove_rule(self, rule_id: str) -> bool:
+        compiled = self._rules.pop(rule_id, None)
+        if compiled is None:
+            return False
+        self._unindex(compiled)
+        if self.counters is not None:
+            self.counters.drop(rule_id)
+        return True
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def _buckets(self, rule: CompiledRule, create: bool) -> List[Tuple[Dict, Any]]:
+        """Return (container, key) pairs locating the buckets of a rule."""
+        if rule.anchor is None:
+            return [({None: self._unindexed}, None)]
+        field, values = rule.anchor
+        if values is None:
+            return [(self._field_index, field)]
+        if create:
+            by_value = self._eq_index.setdefault(field, {})
+        else:
+            by_value = self._eq_index[field]
+        return [(by_value, value) for value in values]
+
+    def _index(self, rule: CompiledRule) -> None:
+        for container, key in self._buckets(rule, create=True):
+            bucket = container.get(key)
+            if bucket is None:
+                bucket = container[key] = _Bucket()
+            bucket.rules.append(rule)
+            bucket.fn = None
+        self._getters = None
+
+    def _unindex(self, rule: CompiledRule) -> None:
+        for container, key in self._buckets(rule, create=False):
+            bucket = container[key]
+            bucket.rules.remove(rule)
+            bucket.fn = None
+            if not bucket.rules and bucket is not self._unindexed:
+                del container[key]
+        if rule.anchor and rule.anchor[1] is not None and not self._eq_index[rule.anchor[0]]:
+            del self._eq_index[rule.anchor[0]]
+        self._getters = None
+
+    def _link(self, bucket: _Bucket) -> Callable:
+        bucket.fn = _link("_bucket", bucket.rules, self._fields)
+        return bucket.fn
+
+    def _index_getters(self) -> List[Tuple[Callable, Optional[Dict], Optional[_Bucket]]]:
+        fields = set(self._eq_index) | set(self._field_index)
+        self._getters = [
+            (make_getter(field), self._eq_index.get(field), self._field_index.get(field))
+            for field in sorted(fields)
+        ]
+        return self._getters
+
+    def evaluate(self, event: Dict[str, Any], count: bool = True) -> List[RuleMatch]:
+        """
+        Evaluate an event against the active rules.
+
+        Args:
+            event: The event
+            count: Count the event in the threshold rules' windows; with
+                False a threshold rule matches if the event would cross its
+                threshold, and the windows are left as they were
+
+        Returns:
+            list: Matches in rule creation order
+        """
+        matched: List[CompiledRule] = []
+        hit = matched.append
+        unindexed = self._unindexed
+        if unindexed.rules:
+            (unindexed.fn or self._link(unindexed))(event, hit)
+        for getter, by_value, present in self._getters if self._getters is not None else self._index_getters():
+            value = getter(event)
+            if value is _MISSING:
+                continue
+            if present is not None:
+                (present.fn or self._link(present))(event, hit)
+            if by_value is not None and value.__hash__ is not None:
+                bucket = by_value.get(value)
+                if bucket is not None:
+                    (bucket.fn or self._link(bucket))(event, hit)
+        if len(matched) > 1:
+            matched.sort(key=lambda rule: rule.seq)
+        if self.counters is not None:
+            return [RuleMatch(rule, event) for rule in matched
+                    if rule.timeframe is None or self._threshold_reached(rule, event, count)]
+        return [RuleMatch(rule, event) for rule in matched]
+
+    def _threshold_reached(self, rule: CompiledRule, event: Dict[str, Any], count: bool = True) -> bool:
+        """Count the event for a threshold rule; true when the count crosses the threshold."""
+        key = rule.group_by_getter(event)
+        if key is _MISSING or key is None:
+            return False
+        timestamp = event.get("timestamp")
+        now = timestamp if _is_number(timestamp) else None
+        counter = self.counters.counter(rule.rule_id, rule.timeframe)
+        if not count:
+            return counter.would_reach(str(key), rule.threshold, now=now)
+        # Fire once when the threshold is crossed rather than on every later event
+        return counter.reached(str(key), rule.threshold, now=now)
+
+    async def process(self, event: Dict[str, Any]) -> List[RuleMatch]:
+        """Evaluate an event and dispatch the actions of every matching rule."""
+        matches = self.evaluate(event)
+        if matches:
+            await self.dispatcher.dispatch(matches)
+        return matches
@@ -0,0 +1,20 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.rule import Rule
+from services.crud import CrudService
+
+class RuleService(CrudService):
+    model = Rule
+
+    async def create_rule(self, db: AsyncSession, rule: BaseModel) -> Rule:
+        return await self.create(db, rule)
+
+    async def get_rule(self, db: AsyncSession, rule_id: int) -> Optional[Rule]:
+        return await self.get(db, rule_id)
+
+    async def update_rule(self, db: AsyncSession, rule_id: int, rule: BaseModel) -> Optional[Rule]:
+        return await self.update(db, rule_id, rule)
+
+    async def delete_rule(self, db: AsyncSession, rule_id: int) -> bool:
+        return await self.delete(db, rule_id)
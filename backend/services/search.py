@@ -0,0 +1,355 @@
+"""
+Full-text search over incidents and alerts with SQLite FTS5.
+
+Rebuild the index from the incidents and security_alerts tables:
+
+    python -m services.search
+"""
+import argparse
+import html
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection
+from database import engine
+from services.pagination import decode_cursor, encode_cursor, PaginationError
+
+SEARCH_TABLE = "search_index"
+# Documents of archived rows, in a database attached to each connection (see services/retention.py)
+ARCHIVE_SCHEMA = "archive"
+ARCHIVE_SEARCH_TABLE = "archive_search_index"
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+SNIPPET_CHARS = 160
+# bm25 weights per column: the unindexed columns, title, body and tags
+RANK_WEIGHTS = "0, 0, 0, 0, 0, 0, 10.0, 1.0, 0"
+FACETS = ("kind", "severity", "status")
+FILTERS = ("kind", "severity", "status", "agent_id")
+FTS_OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+_TERM = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+class SearchError(ValueError):
+    """Raised for a query the index cannot run."""
+
+class SearchUnavailable(Exception):
+    """Raised when the database has no FTS5 index (it is not SQLite)."""
+
+# Each document is one FTS row; incidents and alerts get distinct rowids so
+# the triggers can update and delete them by rowid
+DOCUMENTS = {
+    "incidents": {
+        "rowid": "{row}.id * 2",
+        "kind": "'incident'",
+        "severity": "{row}.severity",
+        "status": "{row}.status",
+        "agent_id": "{row}.agent_id",
+        "title": "{row}.title",
+        "body": (
+            "coalesce({row}.description, '') || ' ' || coalesce({row}.source, '') || ' ' || "
+            "coalesce(CASE WHEN json_valid({row}.details) THEN "
+            "(SELECT group_concat(value, ' ') FROM json_tree({row}.details) WHERE type NOT IN ('object', 'array')) "
+            "END, '')"
+        ),
+        "watched": "title, description, source, details, severity, status, agent_id",
+        "tags": "'kind incident severity ' || coalesce({row}.severity, '') || ' status ' || coalesce({row}.status, '') || ' agent_id ' || coalesce({row}.agent_id, '')",
+    },
+    "security_alerts": {
+        "rowid": "{row}.id * 2 + 1",
+        "kind": "'alert'",
+        "severity": "lower({row}.severity)",
+        "status": "{row}.status",
+        "agent_id": "NULL",
+        "title": "replace(lower({row}.alert_type), '_', ' ')",
+        "body": "{row}.message",
+        "watched": "message, alert_type, severity, status",
+        "tags": "'kind alert severity ' || lower(coalesce({row}.severity, '')) || ' status ' || coalesce({row}.status, '') || ' agent_id '",
+    },
+}
+COLUMNS = ("rowid", "kind", "ref_id", "severity", "status", "agent_id", "created_at", "title", "body", "tags")
+
+def _select(table: str, row: str) -> str:
+    document = DOCUMENTS[table]
+    values = {name: document[name] for name in ("rowid", "kind", "severity", "status", "agent_id", "title", "body", "tags")}
+    values["ref_id"] = "{row}.id"
+    values["created_at"] = "{row}.created_at"
+    return ", ".join(values[name].format(row=row) for name in COLUMNS)
+
+def create_statement(name: str = SEARCH_TABLE) -> str:
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} USING fts5("
+        "kind UNINDEXED, ref_id UNINDEXED, severity UNINDEXED, status UNINDEXED, "
+        "agent_id UNINDEXED, created_at UNINDEXED, title, body, tags, "
+        "prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+
+def index_statements() -> List[str]:
+    """DDL for the FTS5 table and the triggers that keep it in sync."""
+    statements = [create_statement()]
+    insert = f"INSERT INTO {SEARCH_TABLE}({', '.join(COLUMNS)})"
+    for table, document in DOCUMENTS.items():
+        delete = f"DELETE FROM {SEARCH_TABLE} WHERE rowid = {document['rowid'].format(row='OLD')};"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN "
+            f"{insert} SELECT {_select(table, 'NEW')}; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {document['watched']} ON {table} BEGIN "
+            f"{delete} {insert} SELECT {_select(table, 'NEW')}; END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        ]
+    return statements
+
+def backfill_statements() -> List[str]:
+    insert = f"INSERT INTO {SEARCH_TABLE}({', '.join(COLUMNS)})"
+    return [f"{insert} SELECT {_select(table, table)} FROM {table}" for table in DOCUMENTS]
+
+async def ensure_search_index(conn: AsyncConnection) -> bool:
+    """
+    Create the index and its triggers, filling it from the existing rows
+    the first time.
+
+    Returns:
+        bool: False when the database is not SQLite and has no index
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    created = not (await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": SEARCH_TABLE}
+    )).first()
+    for statement in index_statements():
+        await conn.execute(text(statement))
+    if created:
+        for statement in backfill_statements():
+            await conn.execute(text(statement))
+    return True
+
+async def ensure_archive_search_index(conn: AsyncConnection) -> bool:
+    """
+    Create the index of archived documents in the attached archive database.
+
+    Returns:
+        bool: False when the database is not SQLite or has no archive attached
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    schemas = {row.name for row in (await conn.execute(text("PRAGMA database_list"))).fetchall()}
+    if ARCHIVE_SCHEMA not in schemas:
+        return False
+    await conn.execute(text(create_statement(f"{ARCHIVE_SCHEMA}.{ARCHIVE_SEARCH_TABLE}")))
+    return True
+
+def query_terms(query: str, syntax: str = "simple") -> List[Tuple[str, bool]]:
+    """The (term, is prefix) pairs of a query, without FTS5 operators."""
+    terms = [
+        (term, bool(star)) for term, star in _TERM.findall(query)
+        if syntax == "simple" or term not in FTS_OPERATORS
+    ]
+    if syntax == "simple" and terms:
+        # Search-as-you-type: the last term may be incomplete
+        terms[-1] = (terms[-1][0], True)
+    return terms
+
+def match_expression(query: str, filters: Dict[str, Any], syntax: str = "simple") -> str:
+    """
+    The FTS5 MATCH expression for a query and filters.
+
+    A simple query requires every term. The query is restricted to the
+    title and body, and filters match the tags column, so FTS5 intersects
+    the filters with the query instead of checking rows one by one.
+    """
+    if syntax == "simple":
+        # Each whitespace-separated word is a phrase of its tokens, so
+        # "10.0.3.7" or "svc_backup" match as written
+        phrases = [" ".join(term for term, _ in _TERM.findall(word)) for word in query.split()]
+        phrases = [phrase for phrase in phrases if phrase]
+        if not phrases:
+            raise SearchError("Query has no searchable terms")
+        query = " ".join(f'"{phrase}"' for phrase in phrases) + "*"
+    expression = f"{{title body}} : ({query})"
+    for name in FILTERS:
+        value = filters.get(name)
+        if value is not None:
+            tokens = " ".join(term for term, _ in _TERM.findall(f"{name} {value}"))
+            expression += f' AND tags : "{tokens}"'
+    return expression
+
+def _pattern(terms: List[Tuple[str, bool]]) -> Optional["re.Pattern"]:
+    if not terms:
+        return None
+    parts = sorted({re.escape(term) + (r"\w*" if prefix else "") for term, prefix in terms}, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(parts) + r")\b", re.IGNORECASE | re.UNICODE)
+
+def highlight(value: Optional[str], pattern: Optional["re.Pattern"]) -> str:
+    """HTML-escape a text and wrap the matched terms in <mark>."""
+    if not value:
+        return ""
+    if pattern is None:
+        return html.escape(value)
+    parts, last = [], 0
+    for found in pattern.finditer(value):
+        parts.append(html.escape(value[last:found.start()]))
+        parts.append(HIGHLIGHT_OPEN + html.escape(found.group()) + HIGHLIGHT_CLOSE)
+        last = found.end()
+    parts.append(html.escape(value[last:]))
+    return "".join(parts)
+
+def snippet(value: Optional[str], pattern: Optional["re.Pattern"]) -> str:
+    """About SNIPPET_CHARS characters of a text around its first match, highlighted."""
+    if not value:
+        return ""
+    found = pattern.search(value) if pattern is not None else None
+    start = max(0, found.start() - SNIPPET_CHARS // 3) if found else 0
+    if start:
+        space = value.find(" ", start)
+        start = space + 1 if 0 <= space < start + 20 else start
+    end = min(len(value), start + SNIPPET_CHARS)
+    if end < len(value):
+        space = value.rfind(" ", start, end)
+        end = space if space > start else end
+    text_part = highlight(value[start:end], pattern)
+    return ("…" if start else "") + text_part + ("…" if end < len(value) else "")
+
+async def search(
+    conn: AsyncConnection,
+    query: str,
+    filters: Optional[Dict[str, Any]] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    syntax: str = "simple",
+    archive: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[Dict[str, Dict[str, int]]]]:
+    """
+    Search incidents and alerts, best matches first.
+
+    Matches in the title weigh ten times matches in the body. Pages are
+    keyset-paginated on (rank, rowid). The page is ranked first and only
+    its rows are then read and highlighted. Facet counts per kind,
+    severity and status are returned with the first page only. With
+    archive, archived documents are ranked together with the live ones
+    and flagged as archived.
+
+    Args:
+        conn: A connection to the SQLite database
+        query: Free text, or an FTS5 query when syntax is "fts"
+        filters: Exact values for kind, severity, status and agent_id
+        limit: Page size
+        cursor: Cursor of the next page from a previous call
+        syntax: "simple" or "fts"
+        archive: Also search the archive index (see ensure_archive_search_index)
+
+    Returns:
+        tuple: The results (with highlighted title and snippet), the next
+            page cursor or None, and the facets or None
+
+    Raises:
+        SearchUnavailable: If the database is not SQLite
+        SearchError: For an invalid query or cursor
+    """
+    if conn.dialect.name != "sqlite":
+        raise SearchUnavailable("Full-text search needs the SQLite database")
+    match = match_expression(query, filters or {}, syntax)
+    params: Dict[str, Any] = {"match": match}
+    where = ""
+    if cursor is not None:
+        try:
+            params["rank"], params["after"] = decode_cursor(cursor)
+        except PaginationError as e:
+            raise SearchError(str(e))
+        where = "WHERE score > :rank OR (score = :rank AND rowid > :after)"
+    # (table, name in MATCH and bm25, archived)
+    indexes = [(SEARCH_TABLE, SEARCH_TABLE, 0)]
+    if archive:
+        indexes.append((f"{ARCHIVE_SCHEMA}.{ARCHIVE_SEARCH_TABLE}", ARCHIVE_SEARCH_TABLE, 1))
+    matches = " UNION ALL ".join(
+        f"SELECT rowid, bm25({name}, {RANK_WEIGHTS}) AS score, {archived} AS archived, {', '.join(FACETS)} "
+        f"FROM {table} WHERE {name} MATCH :match"
+        for table, name, archived in indexes
+    )
+
+    try:
+        ranked = (await conn.execute(text(
+            f"SELECT rowid, score, archived FROM ({matches}) {where} "
+            f"ORDER BY score, rowid LIMIT {int(limit) + 1}"
+        ), params)).fetchall()
+        facets = None
+        if cursor is None:
+            facets = {name: {} for name in FACETS}
+            facet_rows = (await conn.execute(text(
+                f"SELECT {', '.join(FACETS)}, count(*) AS hits FROM ({matches}) GROUP BY {', '.join(FACETS)}"
+            ), {"match": match})).fetchall()
+            for row in facet_rows:
+                for name in FACETS:
+                    value = getattr(row, name)
+                    if value is not None:
+                        facets[name][value] = facets[name].get(value, 0) + row.hits
+    except OperationalError as e:
+        # FTS5 reports query syntax errors as OperationalError
+        if "fts5" in str(e).lower() or "syntax error" in str(e).lower() or "unterminated" in str(e).lower():
+            raise SearchError(f"Invalid search query: {query}")
+        raise
+
+    next_cursor = None
+    if len(ranked) > limit:
+        ranked = ranked[:limit]
+        next_cursor = encode_cursor(ranked[-1].score, ranked[-1].rowid)
+    if not ranked:
+        return [], None, facets
+
+    # Plain rowid lookups, outside the full-text query
+    documents = {}
+    for table, _, archived in indexes:
+        ids = ", ".join(str(int(row.rowid)) for row in ranked if row.archived == archived)
+        if not ids:
+            continue
+        for row in (await conn.execute(text(
+            f"SELECT rowid, kind, ref_id, severity, status, agent_id, created_at, title, body "
+            f"FROM {table} WHERE rowid IN ({ids})"
+        ))).fetchall():
+            documents[(archived, row.rowid)] = row
+    pattern = _pattern(query_terms(query, syntax))
+    results = []
+    for row in ranked:
+        document = documents.get((row.archived, row.rowid))
+        if document is None:
+            continue
+        results.append({
+            "kind": document.kind,
+            "id": document.ref_id,
+            "title": highlight(document.title, pattern),
+            "snippet": snippet(document.body, pattern),
+            "severity": document.severity,
+            "status": document.status,
+            "agent_id": document.agent_id,
+            "created_at": document.created_at,
+            "score": -row.score,
+            "archived": bool(row.archived),
+        })
+    return results, next_cursor, facets
+
+def rebuild() -> int:
+    """
+    Recreate the index from the incidents and security_alerts tables and
+    merge its segments.
+
+    Returns:
+        int: Number of documents indexed
+    """
+    if engine.dialect.name != "sqlite":
+        raise SearchUnavailable("Full-text search needs the SQLite database")
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+        for statement in index_statements():
+            conn.execute(text(statement))
+        for statement in backfill_statements():
+            conn.execute(text(statement))
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+        return conn.execute(text(f"SELECT count(*) FROM {SEARCH_TABLE}")).scalar()
+
+def main():
+    argparse.ArgumentParser(description="Rebuild the full-text search index").parse_args()
+    started = time.perf_counter()
+    count = rebuild()
+    print(f"Indexed {count} documents in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import asyncio
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional
+from config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker only
+    fcntl = None
+
+SLOTS = 64
+SLOT = struct.Struct("=Q")
+
+_MISSING = object()
+
+def slot_of(namespace: str) -> int:
+    # Stable across processes; two namespaces sharing a slot only cost extra refreshes
+    return zlib.crc32(namespace.encode()) % SLOTS
+
+class GenerationCounters:
+    """
+    Per-namespace change counters shared by the worker processes of a host.
+
+    The counters live in a small memory-mapped file, so reading one is a
+    memory read (no syscall, no database round trip). Increments take an
+    exclusive flock on the file, which also serves as a cross-process lock
+    for one-off work such as seeding. Without a path (or where the file
+    cannot be mapped) the counters are private to the process.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.shared = False
+        self._fd: Optional[int] = None
+        self._thread_lock = threading.Lock()
+        self._map: Any = bytearray(SLOTS * SLOT.size)
+        if path:
+            try:
+                self._open(path)
+            except (OSError, ValueError) as e:
+                print(f"Error mapping shared state file {path}, state is per process: {str(e)}")
+
+    def _open(self, path: str) -> None:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < SLOTS * SLOT.size:
+                    os.ftruncate(fd, SLOTS * SLOT.size)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(fd, SLOTS * SLOT.size)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self.shared = fcntl is not None
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Hold the lock shared by all processes using the file (blocking)."""
+        with self._thread_lock:
+            if self._fd is not None and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                yield
+
+    def read(self, namespace: str) -> int:
+        return SLOT.unpack_from(self._map, slot_of(namespace) * SLOT.size)[0]
+
+    def bump(self, namespace: str) -> int:
+        """Increment a namespace's counter; returns the new value."""
+        offset = slot_of(namespace) * SLOT.size
+        with self.locked():
+            value = SLOT.unpack_from(self._map, offset)[0] + 1
+            SLOT.pack_into(self._map, offset, value)
+        return value
+
+    def close(self) -> None:
+        if self._fd is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._fd = None
+            self._map = bytearray(SLOTS * SLOT.size)
+            self.shared = False
+
+class _Namespace:
+    __slots__ = ("refresh", "seen", "lock")
+
+    def __init__(self, refresh: Optional[Callable[[], Awaitable[Any]]]):
+        self.refresh = refresh
+        self.seen: Optional[int] = None
+        self.lock = asyncio.Lock()
+
+class ReadThroughCache:
+    """
+    Records of one namespace cached in front of the database.
+
+    A lookup first compares the namespace's generation with the one the
+    entries were loaded at and drops them all when it moved, so a write
+    in any worker is seen by the next read in every worker. Misses (and
+    records that do not exist) are loaded with the loader; a value loaded
+    while a write happened is returned but not kept.
+    """
+
+    def __init__(
+        self,
+        state: "SharedState",
+        namespace: str,
+        loader: Callable[[Hashable], Awaitable[Any]],
+        max_entries: int
+    ):
+        self.state = state
+        self.namespace = namespace
+        self.loader = loader
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._generation = state.generation(namespace)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    async def get(self, key: Hashable) -> Any:
+        generation = self.state.generation(self.namespace)
+        if generation != self._generation:
+            self._entries.clear()
+            self._generation = generation
+            self.stats["invalidations"] += 1
+        value = self._entries.get(key, _MISSING)
+        if value is not _MISSING:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+        self.stats["misses"] += 1
+        value = await self.loader(key)
+        if self.state.generation(self.namespace) == generation == self._generation:
+            self._entries[key] = value
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, entries=len(self._entries))
+
+class SharedState:
+    """
+    Keeps per-process state consistent across uvicorn workers.
+
+    The database stays the source of truth. Each namespace ("rules",
+    "playbooks", ...) has a generation counter in SHARED_STATE_PATH;
+    writers bump it after committing, and readers compare it with the
+    generation their in-memory state was built from:
+
+    - namespaces registered with a refresh callback (compiled rules) are
+      rebuilt by sync(), called before reads that must see the latest
+      writes and every SHARED_STATE_POLL_MS in the background;
+    - read-through caches drop their entries when the generation moves.
+
+    Checking costs one memory read, so it is done on every lookup.
+    Generations are shared by the workers of one host (the file is local),
+    not across hosts.
+    """
+
+    def __init__(self, path: Optional[str] = None, poll_seconds: Optional[float] = None):
+        self.counters = GenerationCounters(path if path is not None else settings.SHARED_STATE_PATH)
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.SHARED_STATE_POLL_MS / 1000
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._caches: Dict[str, ReadThroughCache] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"refreshes": 0, "refresh_errors": 0, "changes": 0}
+
+    def register(self, namespace: str, refresh: Callable[[], Awaitable[Any]]) -> None:
+        """Rebuild some in-memory state with refresh() whenever the namespace changes."""
+        self._namespaces[namespace] = _Namespace(refresh)
+
+    def cache(
+        self,
+        namespace: str,
+        loader: Callable[[Hashable], Awaitable[Any]],
+        max_entries: Optional[int] = None
+    ) -> ReadThroughCache:
+        cache = ReadThroughCache(self, namespace, loader, max_entries or settings.SHARED_STATE_CACHE_ENTRIES)
+        self._caches[namespace] = cache
+        return cache
+
+    def generation(self, namespace: str) -> int:
+        return self.counters.read(namespace)
+
+    def locked(self):
+        """Context manager holding the cross-process lock (blocking; use from a thread)."""
+        return self.counters.locked()
+
+    async def sync(self, namespace: str) -> bool:
+        """
+        Refresh a namespace's state if another worker (or a write here) changed it.
+
+        Returns:
+            bool: Whether a refresh ran
+
+        Raises:
+            Exception: Whatever the refresh callback raised (the state is
+                left as it was and retried on the next sync)
+        """
+        entry = self._namespaces[namespace]
+        if self.counters.read(namespace) == entry.seen:
+            return False
+        async with entry.lock:
+            generation = self.counters.read(namespace)
+            if generation == entry.seen:
+                return False
+            try:
+                await entry.refresh()
+            except Exception:
+                self.stats["refresh_errors"] += 1
+                raise
+            entry.seen = generation
+            self.stats["refreshes"] += 1
+        return True
+
+    async def changed(self, namespace: str) -> None:
+        """
+        Record a committed write, so the other workers pick it up.
+
+        Call after updating this process's own state: unless another worker
+        wrote in between, this process is not refreshed again.
+        """
+        generation = self.counters.bump(namespace)
+        self.stats["changes"] += 1
+        entry = self._namespaces.get(namespace)
+        if entry is not None and entry.seen == generation - 1 and not entry.lock.locked():
+            entry.seen = generation
+
+    async def sync_all(self) -> None:
+        for namespace in list(self._namespaces):
+            try:
+                await self.sync(namespace)
+            except Exception as e:
+                print(f"Error refreshing shared state {namespace}: {str(e)}")
+
+    async def start(self) -> None:
+        await self.sync_all()
+        if self._task is None and self.poll_seconds > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.counters.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            await self.sync_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            pid=os.getpid(),
+            shared=self.counters.shared,
+            path=self.counters.path,
+            generations={
+                namespace: {"current": self.counters.read(namespace), "loaded": entry.seen}
+                for namespace, entry in self._namespaces.items()
+            },
+            caches={namespace: cache.get_stats() for namespace, cache in self._caches.items()}
+        )
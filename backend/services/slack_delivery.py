@@ -0,0 +1,277 @@
+import asyncio
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from config import settings
+from services.metrics import slack_latency, slack_messages
+from services.slack_service import SlackService, SEVERITY_EMOJI, truncate_text
+
+class SlackQueueFull(Exception):
+    """Raised when the delivery queue cannot accept more messages."""
+
+class _Batch:
+    """Messages for one (channel, severity) pair collected during a window."""
+
+    def __init__(self, channel: Optional[str], severity: str, deadline: float):
+        self.channel = channel
+        self.severity = severity
+        self.deadline = deadline
+        self.messages: List[Dict[str, Any]] = []
+
+class SlackDeliveryPipeline:
+    """
+    Background Slack delivery with batching and rate-limit handling.
+
+    Messages are pushed onto a bounded in-process queue and return a delivery
+    id immediately. A collector task groups queued messages per channel and
+    severity for up to SLACK_BATCH_WINDOW_SECONDS and hands each group to a
+    pool of sender tasks, which post a single digest message over the shared
+    SlackService session. Slack 429 responses pause every sender for the
+    Retry-After delay without using up a retry (up to
+    SLACK_MAX_RATE_LIMIT_SECONDS of waiting per batch); other failures are
+    retried with exponential backoff. Digests longer than
+    SLACK_MAX_MESSAGE_CHARS end with a count of the messages left out.
+    """
+
+    def __init__(self, slack_service: SlackService):
+        self.slack_service = slack_service
+        self.window = settings.SLACK_BATCH_WINDOW_SECONDS
+        self.max_batch_size = settings.SLACK_MAX_BATCH_SIZE
+        self.max_retries = settings.SLACK_MAX_RETRIES
+        self.worker_count = settings.SLACK_SENDER_WORKERS
+        self.queue: Optional[asyncio.Queue] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._buckets: Dict[Tuple[Optional[str], str], _Batch] = {}
+        self._deliveries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._paused_until = 0.0
+        self.stats = {"enqueued": 0, "rejected": 0, "sent": 0, "failed": 0, "batches": 0, "rate_limited": 0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Start the collector and sender tasks."""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=settings.SLACK_QUEUE_SIZE)
+        self._outbox = asyncio.Queue(maxsize=self.worker_count * 2)
+        self._tasks.append(asyncio.create_task(self._collect()))
+        for _ in range(self.worker_count):
+            self._tasks.append(asyncio.create_task(self._send_loop()))
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Flush pending messages and stop the background tasks.
+
+        Args:
+            timeout: Maximum number of seconds to wait for the queue to drain
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            print("Slack delivery pipeline stopped with undelivered messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self) -> None:
+        await self.queue.join()
+        for key in list(self._buckets):
+            await self._flush(key)
+        await self._outbox.join()
+
+    def enqueue(
+        self,
+        message: str,
+        channel: Optional[str] = None,
+        type: str = "alert",
+        severity: str = "medium"
+    ) -> str:
+        """
+        Queue a message for background delivery.
+
+        Args:
+            message: The message to send
+            channel: Optional channel to send to (defaults to SLACK_DEFAULT_CHANNEL)
+            type: Type of notification (alert, info, warning, etc.)
+            severity: Severity level (low, medium, high, critical)
+
+        Returns:
+            str: Delivery id that can be passed to get_delivery
+
+        Raises:
+            SlackQueueFull: If the pipeline is not running or the queue is full
+        """
+        if not self.running:
+            raise SlackQueueFull("Slack delivery pipeline is not running")
+        delivery_id = str(uuid.uuid4())
+        item = {
+            "id": delivery_id,
+            "message": message,
+            "channel": channel,
+            "type": type,
+            "severity": severity.lower()
+        }
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            slack_messages.inc(("rejected",))
+            raise SlackQueueFull("Slack delivery queue is full")
+        self.stats["enqueued"] += 1
+        self._record(delivery_id, status="queued", attempts=0, error=None,
+                     queued_at=time.time(), sent_at=None, batch_size=None)
+        return delivery_id
+
+    def get_delivery(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        """Return the status record of a delivery, or None if unknown or expired."""
+        record = self._deliveries.get(delivery_id)
+        return dict(record) if record else None
+
+    def _record(self, delivery_id: str, **fields) -> None:
+        record = self._deliveries.get(delivery_id)
+        if record is None:
+            record = {"id": delivery_id}
+            self._deliveries[delivery_id] = record
+            # Only keep the most recent deliveries around for polling
+            while len(self._deliveries) > settings.SLACK_DELIVERY_HISTORY:
+                self._deliveries.popitem(last=False)
+        record.update(fields)
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None
+            if self._buckets:
+                next_deadline = min(batch.deadline for batch in self._buckets.values())
+                timeout = max(0.0, next_deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+
+            if item is not None:
+                try:
+                    key = (item["channel"], item["severity"])
+                    batch = self._buckets.get(key)
+                    if batch is None:
+                        batch = _Batch(item["channel"], item["severity"], loop.time() + self.window)
+                        self._buckets[key] = batch
+                    batch.messages.append(item)
+                    if len(batch.messages) >= self.max_batch_size or self.window <= 0:
+                        await self._flush(key)
+                finally:
+                    self.queue.task_done()
+
+            now = loop.time()
+            for key in [k for k, b in self._buckets.items() if b.deadline <= now]:
+                await self._flush(key)
+
+    async def _flush(self, key: Tuple[Optional[str], str]) -> None:
+        batch = self._buckets.pop(key, None)
+        if batch and batch.messages:
+            await self._outbox.put(batch)
+
+    def _format_batch(self, batch: _Batch) -> str:
+        if len(batch.messages) == 1:
+            item = batch.messages[0]
+            return self.slack_service.format_message(item["message"], item["type"], item["severity"])
+
+        types = {item["type"] for item in batch.messages}
+        title = types.pop().upper() if len(types) == 1 else "ALERTS"
+        emoji = SEVERITY_EMOJI.get(batch.severity, "ℹ️")
+        lines = [f"{emoji} *{title} DIGEST* ({len(batch.messages)} {batch.severity} messages)"]
+        # Room for the header, the newlines and a closing "and N more" line
+        room = settings.SLACK_MAX_MESSAGE_CHARS - len(lines[0]) - 40
+        shown = 0
+        for item in batch.messages:
+            line = f"• {item['message']}"
+            if len(line) + 1 > room:
+                if not shown:
+                    lines.append(truncate_text(line, room))
+                    shown = 1
+                break
+            lines.append(line)
+            room -= len(line) + 1
+            shown += 1
+        if shown < len(batch.messages):
+            lines.append(f"… and {len(batch.messages) - shown} more")
+        return "\n".join(lines)
+
+    async def _send_loop(self) -> None:
+        while True:
+            batch = await self._outbox.get()
+            try:
+                await self._deliver(batch)
+            except Exception as e:
+                print(f"Error delivering Slack batch: {str(e)}")
+            finally:
+                self._outbox.task_done()
+
+    async def _deliver(self, batch: _Batch) -> None:
+        ids = [item["id"] for item in batch.messages]
+        payload = self.slack_service.build_payload(self._format_batch(batch), batch.channel)
+        self.stats["batches"] += 1
+        error = None
+        attempt = 0
+        rate_limited_for = 0.0
+
+        while attempt < self.max_retries:
+            for delivery_id in ids:
+                self._record(delivery_id, status="sending", attempts=attempt + 1)
+
+            # Honour a rate limit reported to any sender
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            started = time.perf_counter()
+            try:
+                status, retry_after = await self.slack_service.post_payload(payload)
+            except Exception as e:
+                status, retry_after, error = None, None, str(e)
+            outcome = {None: "error", 200: "sent", 429: "rate_limited"}.get(status, "http_error")
+            slack_latency.observe(time.perf_counter() - started, (outcome,))
+
+            if status == 200:
+                sent_at = time.time()
+                for delivery_id in ids:
+                    self._record(delivery_id, status="sent", error=None, sent_at=sent_at, batch_size=len(ids))
+                self.stats["sent"] += len(ids)
+                slack_messages.inc(("sent",), len(ids))
+                return
+
+            if status == 429:
+                self.stats["rate_limited"] += 1
+                error = "rate limited by Slack"
+                # At least a second, so a Retry-After of 0 cannot spin
+                wait = max(retry_after, 1.0)
+                self._paused_until = max(self._paused_until, time.monotonic() + wait)
+                rate_limited_for += wait
+                if rate_limited_for <= settings.SLACK_MAX_RATE_LIMIT_SECONDS:
+                    # Slack said when to come back; that is not a failed attempt
+                    continue
+                break
+
+            attempt += 1
+            if status is not None:
+                error = f"Slack responded with HTTP {status}"
+                if 400 <= status < 500:
+                    # Client errors will not succeed on retry
+                    break
+
+            if attempt < self.max_retries:
+                backoff = min(settings.SLACK_MAX_BACKOFF_SECONDS, 2 ** (attempt - 1))
+                await asyncio.sleep(backoff * (0.5 + random.random() / 2))
+
+        for delivery_id in ids:
+            self._record(delivery_id, status="failed", error=error, batch_size=len(ids))
+        self.stats["failed"] += len(ids)
+        slack_messages.inc(("failed",), len(ids))
@@ -1,15 +1,91 @@
 import aiohttp
-from typing import Optional
-import os
+from typing import Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 from config import settings
 
 load_dotenv()
 
+SEVERITY_EMOJI = {
+    "low": "ℹ️",
+    "medium": "⚠️",
+    "high": "🚨",
+    "critical": "🔥"
+}
+
+TRUNCATED_SUFFIX = "… (truncated)"
+
+def truncate_text(text: str, limit: Optional[int] = None) -> str:
+    """Cut text to Slack's message length limit (SLACK_MAX_MESSAGE_CHARS), marking the cut."""
+    limit = limit or settings.SLACK_MAX_MESSAGE_CHARS
+    if len(text) <= limit:
+        return text
+    return text[:max(limit - len(TRUNCATED_SUFFIX), 0)] + TRUNCATED_SUFFIX
+
 class SlackService:
     def __init__(self):
         self.webhook_url = settings.SLACK_WEBHOOK_URL
         self.default_channel = settings.SLACK_DEFAULT_CHANNEL
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Return the shared HTTP session, creating it on first use.
+
+        The session keeps a pool of keep-alive connections to Slack so that
+        consecutive messages reuse the same TCP+TLS connection.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.SLACK_POOL_SIZE,
+                ttl_dns_cache=300,
+                keepalive_timeout=settings.SLACK_KEEPALIVE_SECONDS
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=settings.SLACK_REQUEST_TIMEOUT)
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the shared HTTP session and its pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def format_message(self, message: str, type: str = "alert", severity: str = "medium") -> str:
+        """Prefix a message with its severity emoji and notification type."""
+        severity_emoji = SEVERITY_EMOJI.get(severity.lower(), "ℹ️")
+        return truncate_text(f"{severity_emoji} *{type.upper()}*\n{message}")
+
+    def build_payload(self, text: str, channel: Optional[str] = None) -> Dict[str, Any]:
+        """Build the webhook payload for an already formatted message."""
+        return {
+            "text": text,
+            "channel": channel or self.default_channel
+        }
+
+    async def post_payload(self, payload: Dict[str, Any]) -> Tuple[int, Optional[float]]:
+        """
+        Post a payload to the Slack webhook over the pooled session.
+
+        Args:
+            payload: The webhook payload to send
+
+        Returns:
+            tuple: HTTP status code and the Retry-After delay in seconds
+                (only set when Slack answers 429)
+        """
+        session = await self.get_session()
+        async with session.post(self.webhook_url, json=payload) as response:
+            retry_after = None
+            if response.status == 429:
+                try:
+                    retry_after = float(response.headers.get("Retry-After", 1))
+                except ValueError:
+                    retry_after = 1.0
+            # Drain the body so the connection can go back to the pool
+            await response.read()
+            return response.status, retry_after
 
     async def send_message(
         self,
@@ -20,38 +96,36 @@ class SlackService:
     ) -> bool:
         """
         Send a message to Slack using webhook.
-        
+
         Args:
             message: The message to send
             channel: Optional channel to send to (defaults to SLACK_DEFAULT_CHANNEL)
             type: Type of notification (alert, info, warning, etc.)
             severity: Severity level (low, medium, high, critical)
-            
+
         Returns:
             bool: True if message was sent successfully, False otherwise
         """
         try:
-            # Format message with severity emoji
-            severity_emoji = {
-                "low": "ℹ️",
-                "medium": "⚠️",
-                "high": "🚨",
-                "critical": "🔥"
-            }.get(severity.lower(), "ℹ️")
-
-            formatted_message = f"{severity_emoji} *{type.upper()}*\n{message}"
-            
+            formatted_message = self.format_message(message, type, severity)
+
             # Prepare the payload
-            payload = {
-                "text": formatted_message,
-                "channel": channel or self.default_channel
-            }
-            
-            # Send message to Slack using webhook
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.webhook_url, json=payload) as response:
-                    return response.status == 200
-            
+            payload = self.build_payload(formatted_message, channel)
+
+            # Send message to Slack using the pooled webhook session
+            status, _ = await self.post_payload(payload)
+            return status == 200
+
         except Exception as e:
             print(f"Error sending message to Slack: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    async def send_alert(
+        self,
+        message: str,
+        channel: Optional[str] = None,
+        alert_type: str = "alert",
+        severity: str = "medium"
+    ) -> bool:
+        """Send an alert to Slack (alias of send_message used by /api/slack/send)."""
+        return await self.send_message(message=message, channel=channel, type=alert_type, severity=severity)
@@ -0,0 +1,396 @@
+"""
+Syslog receiver (RFC 3164 and RFC 5424 over UDP and TCP).
+
+Runs inside the API process when SYSLOG_ENABLED is set, or on its own:
+    python -m services.syslog_receiver --udp-port 5514 --tcp-port 5514
+
+On its own, events are written to the events table but not evaluated
+against the rules, which are loaded by the API process.
+"""
+import argparse
+import asyncio
+import re
+import socket
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from config import settings
+from services.ingestion import IngestionPipeline, IngestQueueFull
+from services.ip_intel import parse_ip
+
+# Syslog severities 0 (emergency) to 7 (debug) mapped onto alert severities
+SEVERITY_NAMES = ["critical", "critical", "critical", "high", "medium", "low", "low", "low"]
+
+MONTHS = {
+    b"Jan": 1, b"Feb": 2, b"Mar": 3, b"Apr": 4, b"May": 5, b"Jun": 6,
+    b"Jul": 7, b"Aug": 8, b"Sep": 9, b"Oct": 10, b"Nov": 11, b"Dec": 12
+}
+
+# Datagrams read per readiness callback before yielding to other tasks
+UDP_READS_PER_WAKEUP = 512
+
+NIL = b"-"
+BOM = b"\xef\xbb\xbf"
+
+# Structured data params naming the originating address ("ip" is the RFC 5424 origin param)
+SOURCE_IP_PARAM = re.compile(rb'(?:^|[ \[])(?:source_ip|sourceIp|src_ip|srcip|src|ip)="([^"\\]*)"')
+
+class SyslogParseError(ValueError):
+    """Raised for a message that is not valid syslog."""
+
+def _text(value: bytes) -> Optional[str]:
+    if not value or value == NIL:
+        return None
+    return value.decode("utf-8", "replace")
+
+def _rfc3164_timestamp(value: bytes) -> Optional[str]:
+    # "Mmm dd hh:mm:ss" carries no year or zone; assume the current year, UTC
+    month = MONTHS.get(value[:3])
+    if month is None:
+        return None
+    try:
+        day = int(value[4:6])
+        hour, minute, second = int(value[7:9]), int(value[10:12]), int(value[13:15])
+        return datetime(datetime.now(timezone.utc).year, month, day, hour, minute, second, tzinfo=timezone.utc).isoformat()
+    except ValueError:
+        return None
+
+def _split_structured_data(rest: bytes):
+    """Split the RFC 5424 STRUCTURED-DATA field from the message that follows it."""
+    if rest[:1] != b"[":
+        return None, rest[2:] if rest[:1] == b"-" else rest
+    pos = 0
+    length = len(rest)
+    while pos < length and rest[pos:pos + 1] == b"[":
+        # Scan to the closing bracket, skipping escaped characters in param values
+        pos += 1
+        while pos < length:
+            char = rest[pos:pos + 1]
+            if char == b"\\":
+                pos += 2
+                continue
+            pos += 1
+            if char == b"]":
+                break
+        else:
+            raise SyslogParseError("Unterminated structured data")
+    return rest[:pos], rest[pos + 1:]
+
+def _source_ip(structured_data: Optional[bytes], hostname: Optional[bytes]) -> Optional[str]:
+    """The originating address stated by the message: a structured data param, else an IP hostname."""
+    if structured_data:
+        for match in SOURCE_IP_PARAM.finditer(structured_data):
+            address = match.group(1).decode("ascii", "replace")
+            if parse_ip(address) is not None:
+                return address
+    if hostname and hostname != NIL:
+        address = hostname.decode("ascii", "replace")
+        if parse_ip(address) is not None:
+            return address
+    return None
+
+def parse_syslog(data: bytes, peer: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parse one syslog message into an event.
+
+    Fields are located with find/slice on the raw bytes and only the ones
+    kept are decoded, so a message is parsed without tokenizing it.
+
+    Args:
+        data: The raw message, without transport framing
+        peer: Address of the sender, kept as the event's relay_ip (it is
+            often a relay or collector rather than the originating host)
+
+    Returns:
+        dict: The event, shaped like the events handled by the rule engine
+
+    Raises:
+        SyslogParseError: If the message has no valid PRI part or header
+    """
+    if data[:1] != b"<":
+        raise SyslogParseError("Missing PRI")
+    end = data.find(b">", 1, 5)
+    if end < 2:
+        raise SyslogParseError("Invalid PRI")
+    try:
+        pri = int(data[1:end])
+    except ValueError:
+        raise SyslogParseError("Invalid PRI")
+    if pri > 191:
+        raise SyslogParseError("Invalid PRI")
+    facility, severity = divmod(pri, 8)
+    pos = end + 1
+
+    if data[pos:pos + 2] == b"1 ":
+        # RFC 5424: VERSION SP TIMESTAMP SP HOSTNAME SP APP-NAME SP PROCID SP MSGID SP SD [SP MSG]
+        fields = data[pos + 2:].split(b" ", 5)
+        if len(fields) < 6:
+            if len(fields) < 5:
+                raise SyslogParseError("Truncated RFC 5424 header")
+            fields.append(NIL)
+        timestamp, hostname, app_name, procid, msgid, rest = fields
+        structured_data, message = _split_structured_data(rest)
+        if message.startswith(BOM):
+            message = message[3:]
+        timestamp = _text(timestamp)
+    else:
+        # RFC 3164: TIMESTAMP SP HOSTNAME SP TAG[PID]: MSG, with every part optional in practice
+        msgid = structured_data = None
+        timestamp = None
+        if data[pos + 3:pos + 4] == b" " and data[pos:pos + 3] in MONTHS:
+            timestamp = _rfc3164_timestamp(data[pos:pos + 15])
+            pos += 16
+        hostname = None
+        space = data.find(b" ", pos)
+        if timestamp is not None and space != -1 and data[space - 1:space] != b":":
+            hostname = data[pos:space]
+            pos = space + 1
+        app_name = procid = None
+        message = data[pos:]
+        colon = data.find(b":", pos, pos + 64)
+        if colon != -1 and data.find(b" ", pos, colon) == -1:
+            tag = data[pos:colon]
+            bracket = tag.find(b"[")
+            if bracket != -1:
+                app_name, procid = tag[:bracket], tag[bracket + 1:].rstrip(b"]")
+            else:
+                app_name = tag
+            message = data[colon + 1:].lstrip(b" ")
+
+    return {
+        "event_type": "syslog",
+        "source": "syslog",
+        "severity": SEVERITY_NAMES[severity],
+        "source_ip": _source_ip(structured_data, hostname),
+        "relay_ip": peer,
+        "hostname": _text(hostname),
+        "program": _text(app_name),
+        "pid": _text(procid),
+        "msgid": _text(msgid),
+        "facility": facility,
+        "syslog_severity": severity,
+        "timestamp": timestamp,
+        "structured_data": _text(structured_data),
+        "message": message.rstrip(b"\r\n").decode("utf-8", "replace")
+    }
+
+class _SyslogStreamProtocol(asyncio.Protocol):
+    """
+    One TCP connection.
+
+    Supports both RFC 6587 framings: octet counting ("LEN SP MSG") and
+    newline-terminated messages, detected per message.
+    """
+
+    def __init__(self, receiver: "SyslogReceiver"):
+        self.receiver = receiver
+        self.buffer = bytearray()
+        self.peer = None
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        peername = transport.get_extra_info("peername")
+        self.peer = peername[0] if peername else None
+
+    def data_received(self, data: bytes) -> None:
+        buffer = self.buffer
+        buffer += data
+        view = memoryview(buffer)
+        length = len(buffer)
+        pos = 0
+        try:
+            while pos < length:
+                if 48 <= buffer[pos] <= 57:
+                    space = buffer.find(b" ", pos, pos + 11)
+                    if space == -1:
+                        if length - pos > 10:
+                            raise SyslogParseError("Invalid octet count")
+                        break
+                    end = space + 1 + int(buffer[pos:space])
+                    if end > length:
+                        break
+                    frame = bytes(view[space + 1:end])
+                    pos = end
+                else:
+                    newline = buffer.find(b"\n", pos)
+                    if newline == -1:
+                        break
+                    frame = bytes(view[pos:newline])
+                    pos = newline + 1
+                if frame.strip():
+                    self.receiver.accept(frame, self.peer)
+        except (SyslogParseError, ValueError) as e:
+            self.receiver.count(self.peer, "parse_errors")
+            print(f"Closing syslog connection from {self.peer}: {str(e)}")
+            self.transport.close()
+            pos = length
+        finally:
+            view.release()
+        del buffer[:pos]
+        if len(buffer) > self.receiver.max_message_bytes:
+            self.receiver.count(self.peer, "parse_errors")
+            print(f"Closing syslog connection from {self.peer}: message too long")
+            self.transport.close()
+            buffer.clear()
+
+class SyslogReceiver:
+    """
+    Receives syslog over UDP and TCP and feeds it to the ingestion pipeline.
+
+    Parsed events are collected in memory and handed to the pipeline every
+    SYSLOG_FLUSH_MS milliseconds or SYSLOG_FLUSH_EVENTS events, so the
+    datagram callback never waits on the database. The UDP socket gets a
+    large kernel receive buffer (SYSLOG_UDP_RCVBUF) to absorb bursts while
+    a flush is in progress. If the pipeline stays full, or more than
+    SYSLOG_MAX_PENDING events are waiting, events are dropped and counted
+    against their source.
+    """
+
+    def __init__(
+        self,
+        pipeline: IngestionPipeline,
+        host: Optional[str] = None,
+        udp_port: Optional[int] = None,
+        tcp_port: Optional[int] = None
+    ):
+        self.pipeline = pipeline
+        self.host = host or settings.SYSLOG_HOST
+        self.udp_port = settings.SYSLOG_UDP_PORT if udp_port is None else udp_port
+        self.tcp_port = settings.SYSLOG_TCP_PORT if tcp_port is None else tcp_port
+        self.max_message_bytes = settings.SYSLOG_MAX_MESSAGE_BYTES
+        self.max_pending = settings.SYSLOG_MAX_PENDING
+        self.flush_events = settings.SYSLOG_FLUSH_EVENTS
+        self.flush_seconds = settings.SYSLOG_FLUSH_MS / 1000
+        self.sources: Dict[Optional[str], Dict[str, int]] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._udp_socket: Optional[socket.socket] = None
+        self._tcp_server = None
+
+    def count(self, peer: Optional[str], counter: str, amount: int = 1) -> None:
+        counters = self.sources.get(peer)
+        if counters is None:
+            counters = self.sources[peer] = {"received": 0, "parse_errors": 0, "dropped": 0}
+        counters[counter] += amount
+
+    def accept(self, data: bytes, peer: Optional[str]) -> None:
+        """Parse a received message and queue it for the next flush."""
+        self.count(peer, "received")
+        if len(self._pending) >= self.max_pending:
+            self.count(peer, "dropped")
+            return
+        try:
+            self._pending.append(parse_syslog(data, peer))
+        except SyslogParseError:
+            self.count(peer, "parse_errors")
+            return
+        if len(self._pending) >= self.flush_events:
+            self._wake.set()
+
+    def _read_datagrams(self) -> None:
+        # Drain the socket on every wakeup rather than reading one datagram
+        # per event loop iteration as asyncio's datagram transport does
+        recvfrom = self._udp_socket.recvfrom
+        size = self.max_message_bytes
+        for _ in range(UDP_READS_PER_WAKEUP):
+            try:
+                data, addr = recvfrom(size)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"Error receiving syslog datagram: {str(e)}")
+                return
+            self.accept(data, addr[0])
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        if self.udp_port:
+            family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, settings.SYSLOG_UDP_RCVBUF)
+            except OSError as e:
+                print(f"Error setting syslog UDP receive buffer: {str(e)}")
+            sock.bind((self.host, self.udp_port))
+            sock.setblocking(False)
+            self._udp_socket = sock
+            loop.add_reader(sock.fileno(), self._read_datagrams)
+        if self.tcp_port:
+            self._tcp_server = await loop.create_server(
+                lambda: _SyslogStreamProtocol(self), self.host, self.tcp_port, reuse_address=True
+            )
+
+    async def stop(self) -> None:
+        """Close the listeners and hand the remaining events to the pipeline."""
+        if self._udp_socket is not None:
+            asyncio.get_running_loop().remove_reader(self._udp_socket.fileno())
+            self._udp_socket.close()
+            self._udp_socket = None
+        if self._tcp_server is not None:
+            self._tcp_server.close()
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self._flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        try:
+            await self.pipeline.submit(events, "syslog")
+        except IngestQueueFull:
+            for event in events:
+                self.count(event["source_ip"], "dropped")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "sources": {peer or "unknown": dict(counters) for peer, counters in self.sources.items()}
+        }
+
+async def serve(host: Optional[str], udp_port: Optional[int], tcp_port: Optional[int]) -> None:
+    from database import init_db, close_db
+
+    await init_db()
+    pipeline = IngestionPipeline()
+    receiver = SyslogReceiver(pipeline, host=host, udp_port=udp_port, tcp_port=tcp_port)
+    await pipeline.start()
+    await receiver.start()
+    print(f"Listening for syslog on {receiver.host} (udp {receiver.udp_port or 'off'}, tcp {receiver.tcp_port or 'off'})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await receiver.stop()
+        await pipeline.stop()
+        await close_db()
+
+def main():
+    parser = argparse.ArgumentParser(description="Receive syslog and write it to the events table")
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--udp-port", type=int, default=None, help="0 disables UDP")
+    parser.add_argument("--tcp-port", type=int, default=None, help="0 disables TCP")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.udp_port, args.tcp_port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
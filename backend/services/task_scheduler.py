@@ -0,0 +1,363 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, or_, select, update
+from config import settings
+from database import async_engine
+from models.task import Task
+
+CLAIMED_COLUMNS = ("id", "name", "priority", "agent_id", "playbook_id", "parameters", "attempts", "schedule_key")
+
+class PermanentTaskError(Exception):
+    """Raised by handlers for failures a retry cannot fix."""
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter for a task that failed `attempts` times."""
+    ceiling = min(settings.TASK_RETRY_MAX_SECONDS, settings.TASK_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return random.uniform(0.5 * ceiling, ceiling)
+
+class TaskScheduler:
+    """
+    Claims pending tasks from the tasks table and runs them.
+
+    Tasks are claimed in schedule_key order (see models.task.schedule_key)
+    with a single UPDATE ... RETURNING whose candidate subquery walks the
+    (status, schedule_key) index, with FOR UPDATE SKIP LOCKED on Postgres;
+    on SQLite the write lock makes the claim atomic. Claimed tasks are
+    leased to this scheduler for TASK_LEASE_SECONDS and the lease is
+    renewed while they run; a lease that expires (the worker crashed) puts
+    the task back in the queue. Failed tasks are retried with exponential
+    backoff up to TASK_MAX_ATTEMPTS.
+
+    Handlers are registered by name and picked by the task's
+    parameters["handler"], or "playbook" for tasks with a playbook. They
+    run as asyncio tasks on TASK_WORKERS slots, plus TASK_CRITICAL_WORKERS
+    slots kept free for critical tasks; handlers registered with
+    process=True run in a process pool instead. No agent runs more than
+    TASK_AGENT_CONCURRENCY tasks at once.
+    """
+
+    def __init__(self, workers: Optional[int] = None, critical_workers: Optional[int] = None):
+        self.workers = workers or settings.TASK_WORKERS
+        self.critical_workers = settings.TASK_CRITICAL_WORKERS if critical_workers is None else critical_workers
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, Tuple[Callable, bool]] = {}
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._running: Dict[Any, asyncio.Task] = {}
+        self._agent_running: Dict[Any, int] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self.stats = {"claimed": 0, "completed": 0, "retried": 0, "failed": 0, "cancelled": 0, "leases_expired": 0}
+
+    @property
+    def active(self) -> int:
+        return len(self._running)
+
+    def register(self, name: str, handler: Callable, process: bool = False) -> None:
+        """
+        Register a task handler.
+
+        Args:
+            name: Handler name, matched against parameters["handler"]
+            handler: Coroutine function taking the claimed task as a dict and
+                returning the task result, or with process=True a picklable
+                module-level function doing the same synchronously
+            process: Run the handler in the process pool
+        """
+        self._handlers[name] = (handler, process)
+
+    def notify(self) -> None:
+        """Wake the dispatcher, e.g. after a task was queued in this process."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks.append(asyncio.create_task(self._dispatch_loop()))
+        self._tasks.append(asyncio.create_task(self._lease_loop()))
+
+    async def stop(self) -> None:
+        """Stop claiming and put the tasks still running back in the queue."""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    def cancel(self, task_id: Any) -> bool:
+        task = self._running.get(task_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    async def run_now(self, task_id: Any) -> bool:
+        """
+        Claim one pending task and run it immediately, ignoring queue order
+        and the worker and agent limits.
+
+        Returns:
+            bool: False if the task is not pending
+        """
+        claimed = await self._claim(1, task_id=task_id)
+        for row in claimed:
+            self._launch(row)
+        return bool(claimed)
+
+    # Claiming
+
+    async def _claim(self, limit: int, critical_only: bool = False, task_id: Any = None) -> List[Dict[str, Any]]:
+        table = Task.__table__
+        now = time.time()
+        candidates = select(table.c.id).where(table.c.status == "pending")
+        if task_id is not None:
+            candidates = candidates.where(table.c.id == task_id)
+        else:
+            saturated = (
+                select(table.c.agent_id)
+                .where(table.c.status == "running", table.c.agent_id.isnot(None), table.c.lease_expires_at > now)
+                .group_by(table.c.agent_id)
+                .having(func.count() >= settings.TASK_AGENT_CONCURRENCY)
+            )
+            if critical_only:
+                candidates = candidates.where(table.c.priority == "critical")
+            candidates = (
+                candidates
+                .where(or_(table.c.not_before.is_(None), table.c.not_before <= now))
+                .where(or_(table.c.agent_id.is_(None), table.c.agent_id.notin_(saturated)))
+                .order_by(table.c.schedule_key, table.c.id)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+        statement = (
+            update(table)
+            .where(table.c.id.in_(candidates.scalar_subquery()), table.c.status == "pending")
+            .values(
+                status="running",
+                lease_owner=self.owner,
+                lease_expires_at=now + settings.TASK_LEASE_SECONDS,
+                attempts=table.c.attempts + 1,
+                started_at=func.coalesce(table.c.started_at, datetime.now(timezone.utc)),
+                completed_at=None
+            )
+            .returning(*(table.c[column] for column in CLAIMED_COLUMNS))
+        )
+        async with async_engine.begin() as conn:
+            rows = [dict(row._mapping) for row in (await conn.execute(statement)).fetchall()]
+        if task_id is not None:
+            return rows
+        # The claim only excludes agents that were already saturated; a batch
+        # can still hold more tasks for one agent than it has room for
+        claimed, released = [], []
+        taken: Dict[Any, int] = {}
+        for row in sorted(rows, key=lambda row: (row["schedule_key"] or 0.0, row["id"])):
+            agent_id = row["agent_id"]
+            if agent_id is not None:
+                taken[agent_id] = taken.get(agent_id, 0) + 1
+                if self._agent_running.get(agent_id, 0) + taken[agent_id] > settings.TASK_AGENT_CONCURRENCY:
+                    released.append(row["id"])
+                    continue
+            claimed.append(row)
+        if released:
+            await self._release(released, refund=True)
+        return claimed
+
+    async def _release(self, task_ids: List[Any], refund: bool = False) -> None:
+        """Put leased tasks back in the queue, without counting the attempt if refund is set."""
+        table = Task.__table__
+        values = {"status": "pending", "lease_owner": None, "lease_expires_at": None}
+        if refund:
+            values["attempts"] = table.c.attempts - 1
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                update(table)
+                .where(table.c.id.in_(task_ids), table.c.lease_owner == self.owner)
+                .values(**values)
+            )
+
+    async def _dispatch_loop(self) -> None:
+        while True:
+            try:
+                free = self.workers - self.active
+                if free > 0:
+                    claimed = await self._claim(free)
+                else:
+                    critical_free = self.workers + self.critical_workers - self.active
+                    claimed = await self._claim(critical_free, critical_only=True) if critical_free > 0 else []
+                self.stats["claimed"] += len(claimed)
+                for row in claimed:
+                    self._launch(row)
+                if claimed and self.active < self.workers + self.critical_workers:
+                    # There may be more waiting; claim again straight away
+                    continue
+            except Exception as e:
+                print(f"Error claiming tasks: {str(e)}")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.TASK_POLL_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+
+    # Execution
+
+    def _launch(self, row: Dict[str, Any]) -> None:
+        agent_id = row["agent_id"]
+        if agent_id is not None:
+            self._agent_running[agent_id] = self._agent_running.get(agent_id, 0) + 1
+        task = asyncio.create_task(self._execute(row))
+        self._running[row["id"]] = task
+        task.add_done_callback(lambda _: self._finished(row))
+
+    def _finished(self, row: Dict[str, Any]) -> None:
+        self._running.pop(row["id"], None)
+        agent_id = row["agent_id"]
+        if agent_id is not None:
+            remaining = self._agent_running.get(agent_id, 1) - 1
+            if remaining > 0:
+                self._agent_running[agent_id] = remaining
+            else:
+                self._agent_running.pop(agent_id, None)
+        # A slot is free
+        self.notify()
+
+    def _handler_for(self, row: Dict[str, Any]) -> Optional[Tuple[Callable, bool]]:
+        name = (row["parameters"] or {}).get("handler")
+        if name is None and row["playbook_id"] is not None:
+            name = "playbook"
+        return self._handlers.get(name)
+
+    async def _call(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        entry = self._handler_for(row)
+        if entry is None:
+            raise PermanentTaskError("No handler for task")
+        handler, process = entry
+        if not process:
+            return await handler(row)
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=settings.TASK_PROCESS_WORKERS)
+        return await asyncio.get_running_loop().run_in_executor(self._process_pool, handler, row)
+
+    async def _execute(self, row: Dict[str, Any]) -> None:
+        task_id = row["id"]
+        try:
+            result = await self._call(row)
+        except asyncio.CancelledError:
+            if self._stopping:
+                await self._release([task_id])
+            else:
+                self.stats["cancelled"] += 1
+                await self._finish(task_id, status="failed", last_error="Cancelled")
+            raise
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            if isinstance(e, PermanentTaskError) or row["attempts"] >= settings.TASK_MAX_ATTEMPTS:
+                self.stats["failed"] += 1
+                await self._finish(task_id, status="failed", last_error=error)
+            else:
+                self.stats["retried"] += 1
+                await self._finish(
+                    task_id,
+                    status="pending",
+                    not_before=time.time() + retry_delay(row["attempts"]),
+                    last_error=error
+                )
+            return
+        self.stats["completed"] += 1
+        values = {"status": "completed", "last_error": None}
+        if result is not None:
+            values["result"] = result
+        await self._finish(task_id, **values)
+
+    async def _finish(self, task_id: Any, **values: Any) -> None:
+        """Write the outcome of a run, unless the lease was lost to another worker."""
+        table = Task.__table__
+        if values["status"] != "pending":
+            values["completed_at"] = datetime.now(timezone.utc)
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(
+                    update(table)
+                    .where(table.c.id == task_id, table.c.lease_owner == self.owner)
+                    .values(lease_owner=None, lease_expires_at=None, **values)
+                )
+        except Exception as e:
+            print(f"Error writing task {task_id} outcome: {str(e)}")
+
+    # Leases
+
+    async def _lease_loop(self) -> None:
+        """Renew the leases of running tasks and requeue the tasks of crashed workers."""
+        while True:
+            await asyncio.sleep(settings.TASK_LEASE_SECONDS / 3)
+            try:
+                await self._renew_leases()
+                self.stats["leases_expired"] += await self._expire_leases()
+            except Exception as e:
+                print(f"Error maintaining task leases: {str(e)}")
+
+    async def _renew_leases(self) -> None:
+        if not self._running:
+            return
+        table = Task.__table__
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                update(table)
+                .where(table.c.lease_owner == self.owner, table.c.status == "running")
+                .where(table.c.id.in_(list(self._running)))
+                .values(lease_expires_at=time.time() + settings.TASK_LEASE_SECONDS)
+            )
+
+    async def _expire_leases(self) -> int:
+        table = Task.__table__
+        now = time.time()
+        expired = (table.c.status == "running") & (table.c.lease_expires_at < now)
+        async with async_engine.begin() as conn:
+            failed = await conn.execute(
+                update(table)
+                .where(expired, table.c.attempts >= settings.TASK_MAX_ATTEMPTS)
+                .values(
+                    status="failed",
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    completed_at=datetime.now(timezone.utc),
+                    last_error="Lease expired"
+                )
+            )
+            requeued = await conn.execute(
+                update(table)
+                .where(expired)
+                .values(
+                    status="pending",
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    not_before=now + settings.TASK_RETRY_BASE_SECONDS,
+                    last_error="Lease expired"
+                )
+            )
+        return failed.rowcount + requeued.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            owner=self.owner,
+            running=self.active,
+            workers=self.workers,
+            critical_workers=self.critical_workers,
+            agents=len(self._agent_running)
+        )
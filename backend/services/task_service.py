@@ -0,0 +1,41 @@
+from typing import Optional
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from models.task import Task
+from services.crud import CrudService
+
+def _head_start(priority) -> float:
+    priority = getattr(priority, "value", priority) or "medium"
+    return settings.TASK_PRIORITY_HEAD_START.get(priority, 0.0)
+
+class TaskService(CrudService):
+    model = Task
+
+    async def create_task(self, db: AsyncSession, task: BaseModel) -> Task:
+        return await self.create(db, task)
+
+    async def get_task(self, db: AsyncSession, task_id: int) -> Optional[Task]:
+        return await self.get(db, task_id)
+
+    async def update_task(self, db: AsyncSession, task_id: int, task: BaseModel) -> Optional[Task]:
+        """
+        Update a task; a new priority moves it in the claim order.
+
+        The schedule_key is shifted by the difference in head starts, so the
+        task keeps the time it has already waited (see models.task.schedule_key).
+        """
+        record = await db.get(Task, task_id)
+        if record is None:
+            return None
+        values = self._values(task.model_dump(exclude_unset=True))
+        if "priority" in values and values["priority"] != record.priority and record.schedule_key is not None:
+            record.schedule_key += _head_start(record.priority) - _head_start(values["priority"])
+        for name, value in values.items():
+            setattr(record, name, value)
+        await db.commit()
+        await db.refresh(record)
+        return record
+
+    async def delete_task(self, db: AsyncSession, task_id: int) -> bool:
+        return await self.delete(db, task_id)
@@ -0,0 +1,421 @@
+import operator
+import sqlite3
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import settings
+
+# Per-key state layout: [last bucket index, total, count of each bucket...]
+_LAST = 0
+_TOTAL = 1
+_COUNTS = 2
+
+class WindowedCountMinSketch:
+    """
+    Count-min sketch over a sliding window.
+
+    Keeps one depth x width table of counters per time bucket plus a running
+    total of the live buckets, so estimates read only depth counters. When a
+    bucket falls out of the window its table is subtracted from the total.
+    Estimates never undercount; they may overcount when keys collide in
+    every row. Memory is fixed at (buckets + 1) * depth * width * 4 bytes.
+    """
+
+    def __init__(self, buckets: int, width: int, depth: int):
+        self.buckets = buckets
+        self.width = width
+        self.depth = depth
+        self.current = -1
+        self.bucket_ids = array("q", [-1] * buckets)
+        self.tables = [self._empty() for _ in range(buckets)]
+        self.total = self._empty()
+
+    def _empty(self) -> array:
+        return array("I", bytes(4 * self.width * self.depth))
+
+    def _cells(self, key: str):
+        data = key.encode()
+        h1 = zlib.crc32(data)
+        h2 = zlib.adler32(data) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def _rotate(self, bucket: int) -> None:
+        """Drop the buckets that fell out of the window ending at bucket."""
+        oldest = bucket - self.buckets
+        for slot, bucket_id in enumerate(self.bucket_ids):
+            if bucket_id != -1 and bucket_id <= oldest:
+                self.total = array("I", map(operator.sub, self.total, self.tables[slot]))
+                self.tables[slot] = self._empty()
+                self.bucket_ids[slot] = -1
+        self.current = bucket
+
+    def rebuild_total(self) -> None:
+        """Recompute the running total from the bucket tables (after a restore)."""
+        total = self._empty()
+        for slot, bucket_id in enumerate(self.bucket_ids):
+            if bucket_id != -1:
+                total = array("I", map(operator.add, total, self.tables[slot]))
+        self.total = total
+        self.current = max(self.bucket_ids)
+
+    def add(self, key: str, bucket: int, amount: int = 1) -> int:
+        if bucket > self.current:
+            self._rotate(bucket)
+        else:
+            # Late events are counted in the newest bucket
+            bucket = self.current
+        slot = bucket % self.buckets
+        self.bucket_ids[slot] = bucket
+        table = self.tables[slot]
+        total = self.total
+        estimate = None
+        for cell in self._cells(key):
+            table[cell] += amount
+            total[cell] += amount
+            if estimate is None or total[cell] < estimate:
+                estimate = total[cell]
+        return estimate
+
+    def estimate(self, key: str, bucket: int) -> int:
+        if bucket > self.current:
+            self._rotate(bucket)
+        total = self.total
+        return min(total[cell] for cell in self._cells(key))
+
+class SlidingWindowCounter:
+    """
+    Per-key event counts over a sliding time window.
+
+    The window is split into fixed-width time buckets and every key keeps a
+    small ring of bucket counts plus a running total, so increment and count
+    are O(1). Keys are kept in least-recently-used order and keys that have
+    been idle for a whole window are evicted. Once max_keys exact keys are
+    tracked and none of them is idle, new keys are counted approximately in
+    a windowed count-min sketch of fixed size instead.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float,
+        buckets: Optional[int] = None,
+        max_keys: Optional[int] = None,
+        sketch_width: Optional[int] = None,
+        sketch_depth: Optional[int] = None
+    ):
+        if window_seconds <= 0:
+            raise ValueError("window_seconds must be positive")
+        self.window_seconds = float(window_seconds)
+        self.buckets = buckets or settings.WINDOW_COUNTER_BUCKETS
+        self.bucket_width = self.window_seconds / self.buckets
+        self.max_keys = max_keys or settings.WINDOW_COUNTER_MAX_KEYS
+        self._keys: "OrderedDict[str, array]" = OrderedDict()
+        self._sketch: Optional[WindowedCountMinSketch] = None
+        self._sketch_width = sketch_width or settings.WINDOW_COUNTER_SKETCH_WIDTH
+        self._sketch_depth = sketch_depth or settings.WINDOW_COUNTER_SKETCH_DEPTH
+        # Approximate keys that crossed a threshold -> bucket they crossed in
+        self._fired: "OrderedDict[str, int]" = OrderedDict()
+        self.evicted = 0
+        self.approximate_increments = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def approximate(self) -> bool:
+        """True once keys have overflowed into the count-min sketch."""
+        return self._sketch is not None
+
+    def _bucket(self, now: Optional[float]) -> int:
+        return int((time.time() if now is None else now) // self.bucket_width)
+
+    def _advance(self, state: array, bucket: int) -> None:
+        last = state[_LAST]
+        if bucket <= last:
+            return
+        if bucket - last >= self.buckets:
+            for i in range(_COUNTS, _COUNTS + self.buckets):
+                state[i] = 0
+            state[_TOTAL] = 0
+        else:
+            for b in range(last + 1, bucket + 1):
+                slot = _COUNTS + b % self.buckets
+                state[_TOTAL] -= state[slot]
+                state[slot] = 0
+        state[_LAST] = bucket
+
+    def _evict_one(self, bucket: int) -> bool:
+        if not self._keys:
+            return False
+        key, state = next(iter(self._keys.items()))
+        if state[_LAST] > bucket - self.buckets:
+            return False
+        del self._keys[key]
+        self.evicted += 1
+        return True
+
+    def increment(self, key: str, amount: int = 1, now: Optional[float] = None) -> int:
+        """
+        Count an event for a key.
+
+        Args:
+            key: The key to count (source IP, user, agent id, ...)
+            amount: Number of events to add
+            now: Event time in epoch seconds (defaults to the current time)
+
+        Returns:
+            int: The key's count in the window, including this event
+        """
+        return self._add(key, amount, self._bucket(now))[1]
+
+    def reached(self, key: str, threshold: float, amount: int = 1, now: Optional[float] = None) -> bool:
+        """
+        Count an event for a key and report whether it crossed a threshold.
+
+        An exact key crosses when its count goes from below threshold to
+        threshold or more, which also holds when the count steps over a
+        fractional threshold. A sketch estimate can jump past the threshold
+        (other keys share its cells), so an approximate key crosses the first
+        time its estimate is at or above threshold within a window.
+
+        Returns:
+            bool: True once per crossing
+        """
+        bucket = self._bucket(now)
+        previous, count, approximate = self._add(key, amount, bucket)
+        if not approximate:
+            return previous < threshold <= count
+        if count < threshold:
+            return False
+        fired = self._fired.get(key)
+        if fired is not None and fired > bucket - self.buckets:
+            return False
+        self._fired[key] = bucket
+        self._fired.move_to_end(key)
+        if len(self._fired) > self.max_keys:
+            self._fired.popitem(last=False)
+        return True
+
+    def would_reach(self, key: str, threshold: float, amount: int = 1, now: Optional[float] = None) -> bool:
+        """
+        Report whether counting an event for a key would cross a threshold,
+        without counting it (the read-only counterpart of reached()).
+
+        Returns:
+            bool: What reached() would return for the event
+        """
+        bucket = self._bucket(now)
+        count = self.count(key, now)
+        if key in self._keys or self._sketch is None:
+            return count < threshold <= count + amount
+        if count + amount < threshold:
+            return False
+        fired = self._fired.get(key)
+        return fired is None or fired <= bucket - self.buckets
+
+    def _add(self, key: str, amount: int, bucket: int) -> Tuple[int, int, bool]:
+        """Count an event; returns the key's count before and after it and whether it is approximate."""
+        state = self._keys.get(key)
+        if state is None:
+            if len(self._keys) >= self.max_keys and not self._evict_one(bucket):
+                count = self._sketch_add(key, bucket, amount)
+                return count - amount, count, True
+            state = array("q", [bucket, 0] + [0] * self.buckets)
+            self._keys[key] = state
+        else:
+            self._keys.move_to_end(key)
+            self._advance(state, bucket)
+        previous = state[_TOTAL]
+        # Late events are counted in the key's newest bucket
+        state[_COUNTS + max(bucket, state[_LAST]) % self.buckets] += amount
+        state[_TOTAL] += amount
+        return previous, state[_TOTAL], False
+
+    def _sketch_add(self, key: str, bucket: int, amount: int) -> int:
+        if self._sketch is None:
+            self._sketch = WindowedCountMinSketch(self.buckets, self._sketch_width, self._sketch_depth)
+        self.approximate_increments += 1
+        return self._sketch.add(key, bucket, amount)
+
+    def count(self, key: str, now: Optional[float] = None) -> int:
+        """Return the number of events for a key in the window ending at now."""
+        bucket = self._bucket(now)
+        state = self._keys.get(key)
+        if state is not None:
+            self._advance(state, bucket)
+            return state[_TOTAL]
+        if self._sketch is not None:
+            return self._sketch.estimate(key, bucket)
+        return 0
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Drop keys that have had no events for a whole window.
+
+        Returns:
+            int: Number of keys evicted
+        """
+        bucket = self._bucket(now)
+        evicted = 0
+        while self._evict_one(bucket):
+            evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "window_seconds": self.window_seconds,
+            "keys": len(self._keys),
+            "max_keys": self.max_keys,
+            "evicted": self.evicted,
+            "approximate": self.approximate,
+            "approximate_increments": self.approximate_increments
+        }
+
+class WindowCounterStore:
+    """
+    Named sliding-window counters that can be snapshotted to SQLite.
+
+    Counters are created on demand (typically one per windowed rule) and can
+    be written to and restored from a SQLite file so that counts survive a
+    restart.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None):
+        self.snapshot_path = snapshot_path or settings.WINDOW_COUNTER_SNAPSHOT_PATH
+        self._counters: Dict[str, SlidingWindowCounter] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._counters
+
+    def counter(self, name: str, window_seconds: float) -> SlidingWindowCounter:
+        """Return the named counter, (re)creating it if the window changed."""
+        counter = self._counters.get(name)
+        if counter is None or counter.window_seconds != float(window_seconds):
+            counter = SlidingWindowCounter(window_seconds)
+            self._counters[name] = counter
+        return counter
+
+    def drop(self, name: str) -> bool:
+        return self._counters.pop(name, None) is not None
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        return sum(counter.evict_idle(now) for counter in self._counters.values())
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {name: counter.stats() for name, counter in self._counters.items()}
+
+    def export_rows(self) -> Tuple[list, list]:
+        """
+        Copy the counter state into plain rows for snapshot().
+
+        This runs on the caller's thread so the copy is consistent; writing
+        the rows can then happen on a worker thread.
+        """
+        meta, keys = [], []
+        for name, counter in self._counters.items():
+            sketch = counter._sketch
+            meta.append((
+                name,
+                counter.window_seconds,
+                counter.buckets,
+                sketch.bucket_ids.tobytes() if sketch else None,
+                b"".join(t.tobytes() for t in sketch.tables) if sketch else None,
+                sketch.width if sketch else None,
+                sketch.depth if sketch else None
+            ))
+            keys.extend((name, key, state.tobytes()) for key, state in counter._keys.items())
+        return meta, keys
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.snapshot_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS window_counters ("
+            "name TEXT PRIMARY KEY, window_seconds REAL NOT NULL, buckets INTEGER NOT NULL, "
+            "sketch_ids BLOB, sketch BLOB, sketch_width INTEGER, sketch_depth INTEGER)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS window_counter_keys ("
+            "name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key))"
+        )
+        return conn
+
+    def snapshot(self, rows: Optional[Tuple[list, list]] = None) -> int:
+        """
+        Write all counters to the snapshot database, replacing the previous snapshot.
+
+        Args:
+            rows: Rows from export_rows(); exported now if not given
+
+        Returns:
+            int: Number of exact keys written
+        """
+        meta, keys = rows if rows is not None else self.export_rows()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM window_counters")
+                conn.execute("DELETE FROM window_counter_keys")
+                conn.executemany("INSERT INTO window_counters VALUES (?, ?, ?, ?, ?, ?, ?)", meta)
+                conn.executemany("INSERT INTO window_counter_keys VALUES (?, ?, ?)", keys)
+        finally:
+            conn.close()
+        return len(keys)
+
+    def load(self) -> Dict[str, SlidingWindowCounter]:
+        """
+        Read the counters of the snapshot database without installing them.
+
+        The store is not touched, so this can run on a worker thread while
+        events are counted; install() then swaps the counters in on the
+        thread that counts. Stale buckets are dropped on first access, so
+        loading an old snapshot is safe.
+
+        Returns:
+            dict: The snapshotted counters by name
+        """
+        conn = self._connect()
+        counters: Dict[str, SlidingWindowCounter] = {}
+        try:
+            for name, window_seconds, buckets, sketch_ids, sketch, width, depth in conn.execute(
+                "SELECT name, window_seconds, buckets, sketch_ids, sketch, sketch_width, sketch_depth "
+                "FROM window_counters"
+            ):
+                counter = SlidingWindowCounter(window_seconds, buckets=buckets)
+                if sketch is not None:
+                    cms = WindowedCountMinSketch(buckets, width, depth)
+                    cms.bucket_ids = array("q", sketch_ids)
+                    size = 4 * width * depth
+                    cms.tables = [array("I", sketch[i * size:(i + 1) * size]) for i in range(buckets)]
+                    cms.rebuild_total()
+                    counter._sketch = cms
+                counters[name] = counter
+            for name, key, state in conn.execute(
+                "SELECT name, key, state FROM window_counter_keys ORDER BY rowid"
+            ):
+                counter = counters.get(name)
+                if counter is not None and len(counter) < counter.max_keys:
+                    counter._keys[key] = array("q", state)
+        finally:
+            conn.close()
+        return counters
+
+    def install(self, counters: Dict[str, SlidingWindowCounter]) -> int:
+        """
+        Replace the named counters with loaded ones.
+
+        Returns:
+            int: Number of exact keys installed
+        """
+        self._counters.update(counters)
+        return sum(len(counter) for counter in counters.values())
+
+    def restore(self) -> int:
+        """
+        Load counters from the snapshot database and install them.
+
+        Returns:
+            int: Number of exact keys restored
+        """
+        return self.install(self.load())
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read when config is imported, so point every path at a
+# scratch directory before the app is loaded.
+STATE_DIR = tempfile.mkdtemp(prefix="soc-backend-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{STATE_DIR}/test.db",
+    "SLACK_WEBHOOK_URL": "http://127.0.0.1:9/slack",
+    "SEED_SAMPLE_DATA": "false",
+    "TASK_SCHEDULER_ENABLED": "false",
+    "SYSLOG_ENABLED": "false",
+    "SHARED_STATE_PATH": f"{STATE_DIR}/shared_state.bin",
+    "WINDOW_COUNTER_SNAPSHOT_PATH": f"{STATE_DIR}/window_counters.db",
+    "ANOMALY_STATE_PATH": f"{STATE_DIR}/anomaly_state.bin",
+    "ARCHIVE_DIR": f"{STATE_DIR}/archive",
+    "IP_INTEL_DIR": f"{STATE_DIR}/ip_intel",
+})
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def agent(client):
+    response = client.post("/api/agents", json={
+        "name": "Test Agent",
+        "agent_type": "endpoint",
+        "status": "active",
+        "version": "1.0.0"
+    })
+    assert response.status_code == 200
+    return response.json()
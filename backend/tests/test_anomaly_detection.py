@@ -0,0 +1,42 @@
+from services.anomaly_detection import AnomalyDetector
+
+def test_state_is_mapped_on_open_not_on_construction(tmp_path):
+    path = tmp_path / "anomaly_state.bin"
+    detector = AnomalyDetector(path=str(path), max_entities=64, bucket_seconds=60)
+    assert not path.exists()
+    assert len(detector) == 0
+
+    detector.open()
+    try:
+        assert path.exists()
+        assert detector.get_stats()["path"] == str(path)
+    finally:
+        detector.close()
+
+def test_each_worker_persists_to_its_own_file(tmp_path):
+    path = str(tmp_path / "anomaly_state.bin")
+    first = AnomalyDetector(path=path, max_entities=64, bucket_seconds=60)
+    second = AnomalyDetector(path=path, max_entities=64, bucket_seconds=60)
+    first.open()
+    second.open()
+    try:
+        assert first.persistent and second.persistent
+        assert first.state_path == path
+        assert second.state_path == str(tmp_path / "anomaly_state.1.bin")
+    finally:
+        first.close()
+        second.close()
+
+def test_baselines_survive_reopening(tmp_path):
+    path = str(tmp_path / "anomaly_state.bin")
+    detector = AnomalyDetector(path=path, max_entities=64, bucket_seconds=60)
+    detector.open()
+    detector.observe([{"agent_id": 7, "timestamp": 600.0}] * 3)
+    detector.close()
+
+    reopened = AnomalyDetector(path=path, max_entities=64, bucket_seconds=60)
+    reopened.open()
+    try:
+        assert reopened.baseline("agent", 7)["current_count"] == 3
+    finally:
+        reopened.close()
@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database import Base
+from models.agent import Agent
+from models.case import IncidentCase
+from models.incident import Incident
+from services.incident_correlation import IncidentCorrelator
+
+def incident_create(description, agent_id="1", severity="medium"):
+    return SimpleNamespace(
+        title="Suspicious login",
+        description=description,
+        severity=severity,
+        status="open",
+        source="tests",
+        agent_id=agent_id,
+        details={},
+        fingerprint=None,
+        case_id=None
+    )
+
+def run(tmp_path, scenario):
+    """Run a scenario against its own database: scenario(session_factory, statements)."""
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/correlation.db")
+        statements = []
+        event.listen(
+            engine.sync_engine, "before_cursor_execute",
+            lambda conn, cursor, statement, parameters, context, executemany:
+                statements.append((statement, parameters))
+        )
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            db.add(Agent(name="agent", agent_type="endpoint", status="active", version="1.0.0"))
+            await db.commit()
+        try:
+            return await scenario(sessions, statements)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+def inserter(db, incident):
+    async def create():
+        record = Incident(**{
+            name: getattr(incident, name)
+            for name in ("title", "description", "severity", "status", "source", "details", "fingerprint", "case_id")
+        }, agent_id=int(incident.agent_id))
+        db.add(record)
+        await db.commit()
+        await db.refresh(record)
+        return record
+    return create
+
+async def count(db, model):
+    return (await db.execute(select(func.count()).select_from(model))).scalar()
+
+def test_duplicates_fold_into_the_open_incident(tmp_path):
+    async def scenario(sessions, statements):
+        correlator = IncidentCorrelator()
+        async with sessions() as db:
+            first = incident_create("Failed login from 10.0.0.5 at 12:00:01")
+            created, duplicate = await correlator.submit(db, first, inserter(db, first))
+            assert not duplicate
+            repeat = incident_create("Failed login from 10.0.0.5 at 12:00:07")
+            folded, duplicate = await correlator.submit(db, repeat, inserter(db, repeat))
+            assert duplicate
+            assert folded["id"] == created["id"]
+            assert folded["occurrence_count"] == 2
+            assert await count(db, Incident) == 1
+    run(tmp_path, scenario)
+
+def test_incidents_from_one_agent_share_a_case(tmp_path):
+    async def scenario(sessions, statements):
+        async with sessions() as db:
+            first = incident_create("Port scan detected", severity="low")
+            created, _ = await IncidentCorrelator().submit(db, first, inserter(db, first))
+            # A fresh correlator has no cached cases, so the case is found in the database
+            second = incident_create("Malware quarantined", severity="high")
+            statements.clear()
+            grouped, _ = await IncidentCorrelator().submit(db, second, inserter(db, second))
+            assert grouped["case_id"] == created["case_id"]
+            assert await count(db, IncidentCase) == 1
+        # The agent id is bound as an integer, as the column is
+        case_lookup = [parameters for statement, parameters in statements if "incident_cases" in statement]
+        assert 1 in case_lookup[0] and "1" not in case_lookup[0]
+    run(tmp_path, scenario)
+
+def test_failed_insert_leaves_no_empty_case(tmp_path):
+    async def scenario(sessions, statements):
+        correlator = IncidentCorrelator()
+        async with sessions() as db:
+            async def failing_create():
+                raise RuntimeError("insert failed")
+
+            with pytest.raises(RuntimeError):
+                await correlator.submit(db, incident_create("Ransomware note found"), failing_create)
+            assert await count(db, IncidentCase) == 0
+
+            # Nothing was cached for the failed case either
+            retry = incident_create("Ransomware note found")
+            created, duplicate = await correlator.submit(db, retry, inserter(db, retry))
+            assert not duplicate
+            case = await db.get(IncidentCase, created["case_id"])
+            assert case is not None
+            assert correlator.get_stats()["cases_created"] == 1
+    run(tmp_path, scenario)
@@ -0,0 +1,55 @@
+def create_incident(client, agent, **fields):
+    payload = {
+        "title": "Suspicious login",
+        "description": "Repeated failed logins followed by a success",
+        "severity": "high",
+        "status": "open",
+        "source": "tests",
+        "agent_id": agent["id"],
+        "details": {},
+    }
+    payload.update(fields)
+    response = client.post("/api/incidents", json=payload)
+    assert response.status_code == 200
+    return response.json()
+
+def test_resolving_an_incident_stamps_resolved_at(client, agent):
+    incident = create_incident(client, agent, title="Resolve me")
+    assert incident["resolved_at"] is None
+
+    response = client.put(f"/api/incidents/{incident['id']}", json={"status": "resolved"})
+
+    assert response.status_code == 200
+    resolved = response.json()
+    assert resolved["status"] == "resolved"
+    assert resolved["resolved_at"] is not None
+    assert resolved["updated_at"] is not None
+    fetched = client.get(f"/api/incidents/{incident['id']}").json()
+    assert fetched["resolved_at"] is not None
+
+def test_closing_keeps_the_first_resolved_at(client, agent):
+    incident = create_incident(client, agent, title="Close me")
+    resolved = client.put(f"/api/incidents/{incident['id']}", json={"status": "resolved"}).json()
+
+    response = client.put(f"/api/incidents/{incident['id']}", json={"status": "closed"})
+
+    assert response.status_code == 200
+    assert response.json()["resolved_at"] == resolved["resolved_at"]
+
+def test_updating_a_missing_incident_is_404(client):
+    response = client.put("/api/incidents/999999", json={"status": "resolved"})
+    assert response.status_code == 404
+
+def test_repeats_fold_into_the_open_incident_until_it_is_resolved(client, agent):
+    description = "Beaconing to 203.0.113.9 every 60 seconds"
+    first = create_incident(client, agent, title="Beaconing", description=description)
+    repeat = create_incident(client, agent, title="Beaconing", description=description)
+    assert repeat["id"] == first["id"]
+    assert repeat["occurrence_count"] == 2
+
+    client.put(f"/api/incidents/{first['id']}", json={"status": "resolved"})
+
+    # A resolved incident no longer absorbs repeats
+    recurrence = create_incident(client, agent, title="Beaconing", description=description)
+    assert recurrence["id"] != first["id"]
+    assert recurrence["resolved_at"] is None
@@ -0,0 +1,45 @@
+SCHEDULER_COLUMNS = {"schedule_key", "not_before", "attempts", "lease_owner", "lease_expires_at", "last_error"}
+
+def create_task(client, agent):
+    playbook = client.post("/api/playbooks", json={
+        "name": "Contain host",
+        "description": "Isolate and scan",
+        "version": "1.0.0",
+        "steps": [{"name": "isolate", "action": "isolate"}]
+    }).json()
+    response = client.post("/api/tasks", json={
+        "name": "Contain",
+        "description": "Contain the host",
+        "status": "pending",
+        "priority": "high",
+        "agent_id": agent["id"],
+        "playbook_id": playbook["id"]
+    })
+    assert response.status_code == 200
+    return response.json()
+
+def test_reads_have_the_shape_of_writes(client, agent):
+    task = create_task(client, agent)
+
+    fetched = client.get(f"/api/tasks/{task['id']}").json()
+    listed = next(row for row in client.get("/api/tasks").json() if row["id"] == task["id"])
+
+    assert set(fetched) == set(task) == set(listed)
+    for row in (task, fetched, listed):
+        assert isinstance(row["id"], str)
+        assert isinstance(row["agent_id"], str)
+        assert isinstance(row["playbook_id"], str)
+    assert client.get(f"/api/agents/{agent['id']}").json() == agent
+
+def test_task_reads_do_not_expose_scheduler_columns(client, agent):
+    task = create_task(client, agent)
+
+    assert not SCHEDULER_COLUMNS & set(client.get(f"/api/tasks/{task['id']}").json())
+    for row in client.get("/api/tasks").json():
+        assert not SCHEDULER_COLUMNS & set(row)
+    assert client.get("/api/tasks", params={"fields": "id,schedule_key"}).status_code == 400
+
+def test_field_projection_keeps_string_ids(client, agent):
+    rows = client.get("/api/agents", params={"fields": "id,name"}).json()
+
+    assert {"id": agent["id"], "name": agent["name"]} in rows
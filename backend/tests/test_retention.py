@@ -0,0 +1,48 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import update
+
+from database import engine
+from models.incident import Incident
+from services.retention import TABLES, RetentionManager
+
+def test_constructing_creates_no_directories(tmp_path):
+    directory = tmp_path / "archive"
+    RetentionManager(str(directory))
+    assert not directory.exists()
+
+def test_archive_directories_are_created_at_startup(client):
+    for table in TABLES:
+        assert os.path.isdir(os.path.join(os.environ["ARCHIVE_DIR"], table))
+
+def test_archived_incident_is_still_readable(client, agent):
+    incident = client.post("/api/incidents", json={
+        "title": "Old phishing report",
+        "description": "Archived after resolution",
+        "severity": "low",
+        "status": "open",
+        "source": "tests",
+        "agent_id": agent["id"]
+    }).json()
+    client.put(f"/api/incidents/{incident['id']}", json={"status": "resolved"})
+    long_ago = datetime.now(timezone.utc) - timedelta(days=400)
+    with engine.begin() as conn:
+        conn.execute(
+            update(Incident)
+            .where(Incident.id == int(incident["id"]))
+            .values(created_at=long_ago, updated_at=long_ago, resolved_at=long_ago)
+        )
+
+    response = client.post("/api/retention/run")
+    assert response.status_code == 200
+    assert response.json()["tables"]["incidents"]["deleted"] >= 1
+
+    archived = client.get(f"/api/incidents/{incident['id']}")
+    assert archived.status_code == 200
+    assert archived.headers["X-Archived"] == "true"
+    assert archived.json()["id"] == incident["id"]
+    assert archived.json()["title"] == "Old phishing report"
+
+    results = client.get("/api/search", params={"q": "phishing"}).json()["results"]
+    assert any(result.get("archived") for result in results)
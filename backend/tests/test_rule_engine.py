@@ -0,0 +1,110 @@
+import pytest
+
+from services.rule_engine import RuleCompileError, RuleEngine
+from services.window_counter import WindowCounterStore
+
+NOW = 1_700_000_000.0
+
+def matched(engine, event):
+    return [match.rule_id for match in engine.evaluate(event)]
+
+def test_condition_forms():
+    engine = RuleEngine()
+    engine.upsert_rule("equality", "Equality", {"event_type": "dns"}, [])
+    engine.upsert_rule("membership", "Membership", {"details.port": [22, 3389]}, [])
+    engine.upsert_rule("number", "Number is a minimum", {"severity_score": 7}, [])
+    engine.upsert_rule("operators", "Operators", {"user": {"$ne": "svc"}, "bytes": {"$gt": 100, "$lt": 200}}, [])
+    engine.upsert_rule("regex", "Regex", {"process": {"$regex": "^power(shell)?"}}, [])
+
+    assert matched(engine, {"event_type": "dns"}) == ["equality"]
+    assert matched(engine, {"details": {"port": 3389}}) == ["membership"]
+    assert matched(engine, {"details": {"port": 80}}) == []
+    assert matched(engine, {"severity_score": 9}) == ["number"]
+    assert matched(engine, {"severity_score": 5}) == []
+    assert matched(engine, {"bytes": 150}) == ["operators"]
+    assert matched(engine, {"bytes": 150, "user": "svc"}) == []
+    assert matched(engine, {"process": "powershell.exe"}) == ["regex"]
+
+def test_logical_operators():
+    engine = RuleEngine()
+    engine.upsert_rule("1", "Remote shell", {
+        "$any": [{"process": "cmd.exe"}, {"process": "powershell.exe"}],
+        "$not": {"user": "admin"}
+    }, [])
+
+    assert matched(engine, {"process": "cmd.exe", "user": "bob"}) == ["1"]
+    assert matched(engine, {"process": "powershell.exe"}) == ["1"]
+    assert matched(engine, {"process": "cmd.exe", "user": "admin"}) == []
+    assert matched(engine, {"process": "bash"}) == []
+
+def test_matches_are_in_rule_creation_order():
+    engine = RuleEngine()
+    engine.upsert_rule("b", "Any DNS", {"event_type": "dns"}, [])
+    engine.upsert_rule("a", "Long query", {"query_length": 50}, [])
+    engine.upsert_rule("c", "Unindexed", {"$not": {"event_type": "http"}}, [])
+
+    assert matched(engine, {"event_type": "dns", "query_length": 80}) == ["b", "a", "c"]
+
+def test_updated_and_removed_rules_are_reindexed():
+    engine = RuleEngine()
+    engine.upsert_rule("1", "Rule", {"event_type": "dns"}, [])
+    engine.upsert_rule("1", "Rule v2", {"event_type": "http"}, [])
+
+    assert matched(engine, {"event_type": "dns"}) == []
+    assert matched(engine, {"event_type": "http"}) == ["1"]
+    assert engine.remove_rule("1")
+    assert matched(engine, {"event_type": "http"}) == []
+    engine.upsert_rule("1", "Inactive", {"event_type": "http"}, [], is_active=False)
+    assert len(engine) == 0
+
+def test_invalid_conditions_keep_the_previous_version():
+    engine = RuleEngine()
+    engine.upsert_rule("1", "Rule", {"event_type": "dns"}, [])
+
+    with pytest.raises(RuleCompileError):
+        engine.upsert_rule("1", "Broken", {"event_type": {"$bogus": 1}}, [])
+
+    assert engine.get_rule("1").name == "Rule"
+    assert matched(engine, {"event_type": "dns"}) == ["1"]
+
+def brute_force_engine():
+    engine = RuleEngine(counters=WindowCounterStore())
+    engine.upsert_rule("1", "Brute force", {
+        "event_type": "failed_login", "timeframe": 60, "threshold": 3
+    }, [])
+    return engine
+
+def failed_login(second):
+    return {"event_type": "failed_login", "source_ip": "10.0.0.1", "timestamp": NOW + second}
+
+def test_threshold_rule_fires_on_the_crossing():
+    engine = brute_force_engine()
+
+    fired = [len(engine.evaluate(failed_login(second))) for second in range(4)]
+
+    assert fired == [0, 0, 1, 0]
+
+def test_threshold_counts_per_group_by_key():
+    engine = RuleEngine(counters=WindowCounterStore())
+    engine.upsert_rule("1", "Password spray", {
+        "event_type": "failed_login", "timeframe": 60, "threshold": 2, "group_by": "details.user"
+    }, [])
+
+    def attempt(user, second):
+        return {"event_type": "failed_login", "details": {"user": user}, "timestamp": NOW + second}
+
+    fired = [len(engine.evaluate(attempt(user, i))) for i, user in enumerate(["alice", "bob", "alice", "bob"])]
+    assert fired == [0, 0, 1, 1]
+    # Events without the group_by field are not counted
+    assert engine.evaluate({"event_type": "failed_login", "timestamp": NOW}) == []
+
+def test_dry_run_does_not_count_the_event():
+    engine = brute_force_engine()
+    engine.evaluate(failed_login(0))
+
+    # Dry runs report whether the next event would cross, however often they run
+    assert [len(engine.evaluate(failed_login(1), count=False)) for _ in range(5)] == [0] * 5
+    engine.evaluate(failed_login(1))
+    assert len(engine.evaluate(failed_login(2), count=False)) == 1
+    assert engine.counters.counter("1", 60).count("10.0.0.1", now=NOW + 2) == 2
+    assert len(engine.evaluate(failed_login(2))) == 1
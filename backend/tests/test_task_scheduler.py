@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import settings
+from database import Base
+from models.task import Task
+from services import task_scheduler
+from services.task_scheduler import TaskScheduler
+
+tasks = Task.__table__
+
+def run(tmp_path, monkeypatch, scenario):
+    """Run scenario(engine) with the scheduler writing to its own database."""
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/tasks.db")
+        monkeypatch.setattr(task_scheduler, "async_engine", engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            return await scenario(engine)
+        finally:
+            await engine.dispose()
+    return asyncio.run(main())
+
+async def queue(engine, *rows):
+    async with engine.begin() as conn:
+        for row in rows:
+            await conn.execute(insert(tasks).values(status="pending", priority="medium", **row))
+
+async def task_rows(engine):
+    async with engine.connect() as conn:
+        result = await conn.execute(select(tasks).order_by(tasks.c.id))
+        return {row.name: row for row in result}
+
+def test_claim_follows_schedule_order_and_leases_the_tasks(tmp_path, monkeypatch):
+    async def scenario(engine):
+        await queue(engine, {"name": "late", "schedule_key": 30.0}, {"name": "early", "schedule_key": 10.0},
+                    {"name": "middle", "schedule_key": 20.0})
+        scheduler = TaskScheduler(workers=2)
+
+        claimed = await scheduler._claim(2)
+
+        assert [row["name"] for row in claimed] == ["early", "middle"]
+        rows = await task_rows(engine)
+        assert rows["early"].status == "running"
+        assert rows["early"].lease_owner == scheduler.owner
+        assert rows["early"].lease_expires_at > time.time()
+        assert rows["early"].attempts == 1
+        assert rows["late"].status == "pending"
+    run(tmp_path, monkeypatch, scenario)
+
+def test_concurrent_claims_never_share_a_task(tmp_path, monkeypatch):
+    async def scenario(engine):
+        await queue(engine, *({"name": f"task-{i}", "schedule_key": float(i)} for i in range(20)))
+        schedulers = [TaskScheduler(workers=5) for _ in range(4)]
+
+        batches = await asyncio.gather(*(scheduler._claim(5) for scheduler in schedulers))
+
+        ids = [row["id"] for batch in batches for row in batch]
+        assert len(ids) == len(set(ids)) == 20
+    run(tmp_path, monkeypatch, scenario)
+
+def test_claim_respects_agent_concurrency(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TASK_AGENT_CONCURRENCY", 2)
+
+    async def scenario(engine):
+        await queue(engine, *({"name": f"scan-{i}", "schedule_key": float(i), "agent_id": 7} for i in range(4)))
+        scheduler = TaskScheduler(workers=10)
+
+        claimed = await scheduler._claim(10)
+
+        assert [row["name"] for row in claimed] == ["scan-0", "scan-1"]
+        rows = await task_rows(engine)
+        # The tasks over the limit go back to the queue without using up an attempt
+        assert (rows["scan-2"].status, rows["scan-2"].attempts, rows["scan-2"].lease_owner) == ("pending", 0, None)
+        # A saturated agent is skipped by the next claim
+        assert await TaskScheduler(workers=10)._claim(10) == []
+    run(tmp_path, monkeypatch, scenario)
+
+def test_expired_lease_requeues_the_task_or_fails_it(tmp_path, monkeypatch):
+    async def scenario(engine):
+        await queue(engine, {"name": "crashed", "schedule_key": 1.0}, {"name": "exhausted", "schedule_key": 2.0})
+        scheduler = TaskScheduler(workers=2)
+        await scheduler._claim(2)
+        async with engine.begin() as conn:
+            await conn.execute(update(tasks).values(lease_expires_at=time.time() - 1))
+            await conn.execute(
+                update(tasks).where(tasks.c.name == "exhausted").values(attempts=settings.TASK_MAX_ATTEMPTS)
+            )
+
+        assert await scheduler._expire_leases() == 2
+
+        rows = await task_rows(engine)
+        assert (rows["crashed"].status, rows["crashed"].lease_owner) == ("pending", None)
+        assert rows["crashed"].not_before > time.time()
+        assert (rows["exhausted"].status, rows["exhausted"].last_error) == ("failed", "Lease expired")
+    run(tmp_path, monkeypatch, scenario)
+
+def test_outcome_is_dropped_once_the_lease_is_lost(tmp_path, monkeypatch):
+    async def scenario(engine):
+        await queue(engine, {"name": "slow", "schedule_key": 1.0})
+        first, second = TaskScheduler(workers=1), TaskScheduler(workers=1)
+        [row] = await first._claim(1)
+        # The lease expires and another worker claims the task again
+        async with engine.begin() as conn:
+            await conn.execute(update(tasks).values(status="pending", lease_owner=None))
+        assert len(await second._claim(1)) == 1
+
+        await first._finish(row["id"], status="completed", result={"late": True})
+
+        rows = await task_rows(engine)
+        assert (rows["slow"].status, rows["slow"].lease_owner, rows["slow"].result) == ("running", second.owner, None)
+    run(tmp_path, monkeypatch, scenario)
+
+def test_failed_run_is_retried_with_backoff_then_completes(tmp_path, monkeypatch):
+    async def scenario(engine):
+        await queue(engine, {"name": "flaky", "schedule_key": 1.0, "parameters": {"handler": "flaky"}})
+        calls = []
+
+        async def flaky(task):
+            calls.append(task["attempts"])
+            if len(calls) == 1:
+                raise RuntimeError("agent unreachable")
+            return {"ok": True}
+
+        scheduler = TaskScheduler(workers=1)
+        scheduler.register("flaky", flaky)
+        [row] = await scheduler._claim(1)
+        await scheduler._execute(row)
+
+        rows = await task_rows(engine)
+        assert (rows["flaky"].status, rows["flaky"].last_error) == ("pending", "agent unreachable")
+        assert rows["flaky"].not_before > time.time()
+
+        assert await scheduler.run_now(row["id"])
+        await asyncio.gather(*scheduler._running.values())
+        rows = await task_rows(engine)
+        assert (rows["flaky"].status, rows["flaky"].result, rows["flaky"].attempts) == ("completed", {"ok": True}, 2)
+        assert calls == [1, 2]
+    run(tmp_path, monkeypatch, scenario)
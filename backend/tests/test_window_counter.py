@@ -0,0 +1,43 @@
+from services.window_counter import SlidingWindowCounter, WindowCounterStore
+
+NOW = 1_700_000_000.0
+
+def test_reached_fires_once_on_the_crossing():
+    counter = SlidingWindowCounter(60)
+
+    fired = [counter.reached("10.0.0.1", 3, now=NOW + second) for second in range(5)]
+
+    assert fired == [False, False, True, False, False]
+
+def test_reached_fires_again_after_the_window_slides():
+    counter = SlidingWindowCounter(60)
+    for second in range(3):
+        counter.reached("10.0.0.1", 3, now=NOW + second)
+
+    fired = [counter.reached("10.0.0.1", 3, now=NOW + 300 + second) for second in range(3)]
+
+    assert fired == [False, False, True]
+
+def test_snapshot_round_trip(tmp_path):
+    store = WindowCounterStore(str(tmp_path / "counters.db"))
+    counter = store.counter("rule-1", 60)
+    for _ in range(4):
+        counter.increment("10.0.0.1", now=NOW)
+    store.snapshot()
+
+    restored = WindowCounterStore(str(tmp_path / "counters.db"))
+    assert restored.restore() == 1
+    assert restored.counter("rule-1", 60).count("10.0.0.1", now=NOW) == 4
+
+def test_load_leaves_the_store_alone_until_install(tmp_path):
+    path = str(tmp_path / "counters.db")
+    saved = WindowCounterStore(path)
+    saved.counter("rule-1", 60).increment("10.0.0.1", now=NOW)
+    saved.snapshot()
+    store = WindowCounterStore(path)
+
+    loaded = store.load()
+
+    assert "rule-1" not in store
+    store.install(loaded)
+    assert store.counter("rule-1", 60).count("10.0.0.1", now=NOW) == 1
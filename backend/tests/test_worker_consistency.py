@@ -0,0 +1,31 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("uvicorn")
+pytest.importorskip("aiohttp")
+
+from benchmarks.load import stop_process, wait_ready  # noqa: E402
+from benchmarks.worker_consistency import check, start_server  # noqa: E402
+
+WORKERS = 2
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def test_workers_never_serve_stale_rules_or_playbooks(tmp_path):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = start_server(str(tmp_path), port, WORKERS)
+    try:
+        asyncio.run(wait_ready(url, server))
+        checker = asyncio.run(check(url, rounds=3, reads=8))
+    finally:
+        stop_process(server)
+
+    assert checker.stale == []
+    assert checker.checked > 0
+    assert len(checker.pids) == WORKERS